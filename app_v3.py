@@ -20,7 +20,12 @@ import re
 from datetime import timedelta, datetime
 from perplexity_ai_integration import generate_blog_post_ideas, query_management
 from openai_integration_v4 import create_blog_post_with_images_v4  # V4 modular pipeline
-from wordpress_integration import create_wordpress_post
+from wordpress_integration import create_wordpress_post, resolve_wordpress_site, invalidate_wordpress_credentials
+from job_settings import get_job_settings, invalidate_job_settings
+from pipeline_metrics import track_stage, aggregate_metrics, render_prometheus, METRICS_WINDOW_DAYS
+from research_cache import research_cache_stats
+from schedule_slots import sync_schedule_slots, is_valid_schedule
+from layout_engine import preload_layouts, available_layouts, DEFAULT_LAYOUT
 from email_notification import send_email_notification
 from email_verification import generate_verification_code, get_code_expiry, send_verification_email, verify_code
 from purchase_receipt_email import send_purchase_receipt_email
@@ -28,13 +33,10 @@ import traceback
 import stripe
 from credit_system import (
     check_sufficient_credits,
-    deduct_credits,
-    refund_credits,
     add_credits_manual,
     add_welcome_credit,
     get_transaction_history,
     ARTICLE_COST,
-    WELCOME_CREDIT,
     MIN_PURCHASE
 )
 
@@ -83,6 +85,9 @@ else:
 db = SQLAlchemy(app)  # type: ignore[var-annotated]
 migrate = Migrate(app, db)
 
+# Parse and compile the article layouts once, before the first request
+preload_layouts()
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'serve_auth'  # type: ignore[assignment] - Redirect to /auth page instead of API endpoint
 
@@ -110,6 +115,9 @@ class User(UserMixin, db.Model):  # type: ignore[misc,name-defined]
     brand_primary_color = db.Column(db.String(7), default='#6B5DD3')  # type: ignore[var-annotated]  # Purple
     brand_accent_color = db.Column(db.String(7), default='#FF6B4A')  # type: ignore[var-annotated]  # Coral
     use_default_branding = db.Column(db.Boolean, default=True)  # type: ignore[var-annotated]
+    article_layout = db.Column(db.String(50), default='premium_magazine')  # type: ignore[var-annotated]  # layouts/<name>.html
+    premium_formatting = db.Column(db.Boolean, default=False)  # type: ignore[var-annotated]  # Claude formatter instead of template
+    fresh_research = db.Column(db.Boolean, default=False)  # type: ignore[var-annotated]  # Skip the shared Perplexity research cache
 
     # 2FA email verification fields
     email_verified = db.Column(db.Boolean, default=False)  # type: ignore[var-annotated]
@@ -136,13 +144,23 @@ class User(UserMixin, db.Model):  # type: ignore[misc,name-defined]
         return check_password_hash(self.password_hash, password)
 
 class CompletedJob(db.Model):  # type: ignore[misc,name-defined]
+    """Run of one schedule slot, leased by the scheduler instance generating it (see scheduled_jobs.py)"""
     id = db.Column(db.Integer, primary_key=True)  # type: ignore[var-annotated]
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # type: ignore[var-annotated]
     scheduled_time = db.Column(db.DateTime(timezone=True), nullable=False)  # type: ignore[var-annotated]
     completed_time = db.Column(db.DateTime(timezone=True), nullable=True)  # type: ignore[var-annotated]
     post_title = db.Column(db.String(255), nullable=False)  # type: ignore[var-annotated]
-
-    __table_args__ = (db.UniqueConstraint('user_id', 'scheduled_time', name='_user_scheduled_time_uc'),)  # type: ignore[assignment]
+    due_at = db.Column(db.DateTime, index=True)  # type: ignore[var-annotated] - Slot time in UTC
+    status = db.Column(db.String(20), nullable=False, default='completed')  # type: ignore[var-annotated] - 'running', 'held', 'publishing', 'completed', 'failed'
+    owner = db.Column(db.String(255))  # type: ignore[var-annotated] - host:pid:nonce of the scheduler holding the lease
+    heartbeat_at = db.Column(db.DateTime)  # type: ignore[var-annotated] - UTC
+    lease_expires_at = db.Column(db.DateTime)  # type: ignore[var-annotated] - UTC; other schedulers take over after this
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # type: ignore[var-annotated]
+
+    __table_args__ = (  # type: ignore[assignment]
+        db.UniqueConstraint('user_id', 'scheduled_time', name='_user_scheduled_time_uc'),
+        db.Index('idx_completed_job_status_lease', 'status', 'lease_expires_at'),
+    )
 
 class CreditTransaction(db.Model):  # type: ignore[misc,name-defined]
     """Transaction history for credit purchases and usage"""
@@ -155,6 +173,7 @@ class CreditTransaction(db.Model):  # type: ignore[misc,name-defined]
     balance_after = db.Column(db.Float, nullable=False)  # type: ignore[var-annotated]
     description = db.Column(db.String(500))  # type: ignore[var-annotated]
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # type: ignore[var-annotated]
+    idempotency_key = db.Column(db.String(255), unique=True)  # type: ignore[var-annotated] - e.g. 'stripe:<payment intent>'; a change is recorded once per key
 
 class Article(db.Model):  # type: ignore[misc,name-defined]
     """Generated articles with metadata"""
@@ -192,6 +211,87 @@ class Image(db.Model):  # type: ignore[misc,name-defined]
     tags = db.Column(db.JSON)  # type: ignore[var-annotated] - Optional tags for categorization
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # type: ignore[var-annotated]
 
+class GenerationJob(db.Model):  # type: ignore[misc,name-defined]
+    """Queued article generation request - processed by generation_worker.py"""
+    __tablename__ = 'generation_jobs'
+    id = db.Column(db.String(32), primary_key=True)  # type: ignore[var-annotated] - uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)  # type: ignore[var-annotated]
+    status = db.Column(db.String(20), nullable=False, default='queued')  # type: ignore[var-annotated] - 'queued', 'running', 'succeeded', 'failed'
+    params = db.Column(db.JSON)  # type: ignore[var-annotated] - Request parameters (topic, system_prompt, writing_style, local_mode)
+    result = db.Column(db.JSON)  # type: ignore[var-annotated] - API response payload once succeeded
+    error = db.Column(db.Text)  # type: ignore[var-annotated]
+    credit_status = db.Column(db.String(20), nullable=False, default='none')  # type: ignore[var-annotated] - 'none', 'charged', 'consumed', 'refunded'
+    attempt = db.Column(db.Integer, nullable=False, default=1)  # type: ignore[var-annotated] - Incremented by each resume; keys the attempt's credit changes
+    worker_id = db.Column(db.String(255))  # type: ignore[var-annotated] - host:pid of the worker that claimed the job
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # type: ignore[var-annotated]
+    started_at = db.Column(db.DateTime)  # type: ignore[var-annotated]
+    heartbeat_at = db.Column(db.DateTime)  # type: ignore[var-annotated] - Renewed by the running worker
+    finished_at = db.Column(db.DateTime)  # type: ignore[var-annotated]
+
+    __table_args__ = (db.Index('idx_generation_jobs_status_created', 'status', 'created_at'),)  # type: ignore[assignment]
+
+class ScheduleSlot(db.Model):  # type: ignore[misc,name-defined]
+    """One enabled time slot of a user's weekly schedule with its next run time (see schedule_slots.py)"""
+    __tablename__ = 'schedule_slots'
+    id = db.Column(db.Integer, primary_key=True)  # type: ignore[var-annotated]
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # type: ignore[var-annotated]
+    weekday = db.Column(db.Integer, nullable=False)  # type: ignore[var-annotated] - 0 = Monday
+    slot = db.Column(db.String(10), nullable=False)  # type: ignore[var-annotated] - 'time1', 'time2'
+    local_time = db.Column(db.String(5), nullable=False)  # type: ignore[var-annotated] - HH:MM in SCHEDULE_TIMEZONE
+    next_run_at = db.Column(db.DateTime, nullable=False, index=True)  # type: ignore[var-annotated] - UTC
+    last_run_at = db.Column(db.DateTime)  # type: ignore[var-annotated] - UTC time of the last claimed run
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'weekday', 'slot', name='_user_weekday_slot_uc'),)  # type: ignore[assignment]
+
+class PipelineCheckpoint(db.Model):  # type: ignore[misc,name-defined]
+    """Persisted stage outputs of a generation run - lets a failed job resume"""
+    __tablename__ = 'pipeline_checkpoints'
+    id = db.Column(db.Integer, primary_key=True)  # type: ignore[var-annotated]
+    run_id = db.Column(db.String(64), nullable=False, index=True)  # type: ignore[var-annotated] - GenerationJob.id
+    stage = db.Column(db.String(100), nullable=False)  # type: ignore[var-annotated]
+    artifact = db.Column(db.JSON, nullable=False)  # type: ignore[var-annotated] - Stage outputs keyed by name
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # type: ignore[var-annotated]
+
+    __table_args__ = (db.UniqueConstraint('run_id', 'stage', name='_run_stage_uc'),)  # type: ignore[assignment]
+
+class ArticleMetrics(db.Model):  # type: ignore[misc,name-defined]
+    """Latency, token, cost and transfer measurements of one generation run (see pipeline_metrics.py)"""
+    __tablename__ = 'article_metrics'
+    id = db.Column(db.Integer, primary_key=True)  # type: ignore[var-annotated]
+    article_id = db.Column(db.Integer, db.ForeignKey('articles.id'), nullable=True, index=True)  # type: ignore[var-annotated] - None if the run failed before saving
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # type: ignore[var-annotated]
+    run_id = db.Column(db.String(64))  # type: ignore[var-annotated] - GenerationJob.id for queued runs
+    status = db.Column(db.String(20), nullable=False)  # type: ignore[var-annotated] - 'succeeded', 'failed'
+    mode = db.Column(db.String(20))  # type: ignore[var-annotated] - 'wordpress', 'local'
+    total_seconds = db.Column(db.Float)  # type: ignore[var-annotated]
+    stage_seconds = db.Column(db.JSON)  # type: ignore[var-annotated] - {stage: seconds}
+    llm_calls = db.Column(db.JSON)  # type: ignore[var-annotated] - [{label, model, input_tokens, output_tokens, seconds, cost_usd}]
+    replicate_predictions = db.Column(db.JSON)  # type: ignore[var-annotated] - [{id, status, predict_seconds}]
+    input_tokens = db.Column(db.Integer, default=0)  # type: ignore[var-annotated]
+    output_tokens = db.Column(db.Integer, default=0)  # type: ignore[var-annotated]
+    llm_cost_usd = db.Column(db.Float, default=0.0)  # type: ignore[var-annotated]
+    image_cost_usd = db.Column(db.Float, default=0.0)  # type: ignore[var-annotated]
+    replicate_seconds = db.Column(db.Float, default=0.0)  # type: ignore[var-annotated]
+    bytes_downloaded = db.Column(db.BigInteger, default=0)  # type: ignore[var-annotated]
+    bytes_uploaded = db.Column(db.BigInteger, default=0)  # type: ignore[var-annotated]
+    image_bytes_original = db.Column(db.BigInteger, default=0)  # type: ignore[var-annotated] - before recompression
+    image_bytes_optimized = db.Column(db.BigInteger, default=0)  # type: ignore[var-annotated] - after recompression
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)  # type: ignore[var-annotated]
+
+class ResearchCache(db.Model):  # type: ignore[misc,name-defined]
+    """Perplexity research shared by all users and workers (see research_cache.py)"""
+    __tablename__ = 'research_cache'
+    id = db.Column(db.Integer, primary_key=True)  # type: ignore[var-annotated]
+    cache_key = db.Column(db.String(64), nullable=False, unique=True)  # type: ignore[var-annotated] - sha256 of normalized (query, style, recency, model)
+    query_text = db.Column(db.Text, nullable=False)  # type: ignore[var-annotated] - Latest query stored under this key (not normalized)
+    writing_style = db.Column(db.String(255))  # type: ignore[var-annotated]
+    recency = db.Column(db.String(20))  # type: ignore[var-annotated] - Perplexity search_recency_filter
+    content = db.Column(db.Text, nullable=False)  # type: ignore[var-annotated]
+    hit_count = db.Column(db.Integer, default=0, nullable=False)  # type: ignore[var-annotated]
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # type: ignore[var-annotated]
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)  # type: ignore[var-annotated] - LRU eviction order
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # type: ignore[var-annotated]
+
 # Global error handler
 @app.errorhandler(Exception)
 def handle_exception(e):
@@ -218,33 +318,17 @@ def options_handler(path=''):
 def load_user(user_id):
     return User.query.get(int(user_id))  # type: ignore[attr-defined]
 
+# Legacy function for backward compatibility
 def generate_env_file(user):
     """
-    Generate per-user environment file - ONLY WordPress credentials.
+    Legacy - per-user .env.user_N files are no longer written or read.
 
-    OpenAI, Perplexity, and Replicate API keys are centralized in main .env file.
-    This prevents user env files from overriding the admin's centralized keys.
+    Stages get their settings from job_settings.get_job_settings() and
+    WordPress credentials from wordpress_integration.resolve_wordpress_site().
+    Kept for backward compatibility; only drops the user's cached settings.
     """
-    from wordpress_integration import normalize_wordpress_url
-
-    # Normalize WordPress URL
-    wordpress_url = ''
-    if user.wordpress_rest_api_url:
-        wordpress_url = normalize_wordpress_url(user.wordpress_rest_api_url)
-
-    # Use email username as WordPress username
-    wordpress_username = user.email.split('@')[0] if user.email else ''
-
-    env_content = f"""# WordPress credentials (per-user) - Application Password Method
-WORDPRESS_REST_API_URL="{wordpress_url}"
-WORDPRESS_APP_PASSWORD="{user.wordpress_app_password or ''}"
-WORDPRESS_USERNAME="{wordpress_username}"
-
-# NOTE: OpenAI, Perplexity, and Replicate keys are centralized in main .env
-# Do NOT add them here - they will override the system keys!
-"""
-    with open(f'.env.user_{user.id}', 'w') as f:
-        f.write(env_content)
+    invalidate_job_settings(user.id)
+    invalidate_wordpress_credentials(user.id)
 
 def is_valid_openai_api_key(api_key):
     """Validate OpenAI API key format"""
@@ -301,12 +385,10 @@ def has_wordpress_configured(user):
         user.wordpress_rest_api_url and
         user.wordpress_rest_api_url.strip() and
         user.wordpress_app_password and
-        user.wordpress_app_password.strip() and
-        user.wordpress_username and
-        user.wordpress_username.strip()
+        user.wordpress_app_password.strip()
     )
 
-def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, manual_writing_style=None, local_mode=False, is_scheduled=False):
+def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, manual_writing_style=None, local_mode=False, is_scheduled=False, run_id=None, settings=None):
     """
     V3.0 / V4.0: State-of-the-art blog post creation with:
     - GPT-5 / GPT-5-mini with reasoning (medium effort)
@@ -322,17 +404,33 @@ def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, m
         manual_writing_style: Optional writing style for article generation
         local_mode: If True, creates downloadable HTML with base64 images (no WordPress)
         is_scheduled: If True, this is a scheduled post (not manual) - affects error handling
+        run_id: Optional generation run ID - research and pipeline stages are
+            checkpointed under it so a failed run can be resumed
+        settings: Optional JobSettings for this job (built once and passed to
+            every stage; looked up from user_id if omitted)
     """
+    from pipeline_checkpoints import CheckpointStore
+
     user = User.query.get(user_id)  # type: ignore[attr-defined]
     if not user:
         logger.error(f"User {user_id} not found")
         return None, "User not found"
 
+    settings = settings or get_job_settings(user_id)
+
+    checkpoints = CheckpointStore(run_id) if run_id else None
+    saved_research = checkpoints.get("research") if checkpoints else None
+
     # Use manual topic if provided, otherwise rotate through saved topics
     if manual_topic:
         logger.info(f"[V3] Using manual topic (bypassing saved topics): {manual_topic[:100]}...")
         blog_post_idea = manual_topic
         writing_style = manual_writing_style  # Use writing style from UI
+    elif saved_research:
+        # Resumed run - don't rotate to the next saved topic or re-query Perplexity
+        logger.info(f"[V3] Resuming with checkpointed Perplexity research")
+        blog_post_idea = saved_research["research"]
+        writing_style = saved_research.get("writing_style")
     else:
         query, writing_style = query_management(user_id)
         if not query:
@@ -342,12 +440,14 @@ def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, m
         logger.info(f"[V3] Using saved topic query for user {user_id}: {query}")
         logger.info(f"[V3] Writing style: {writing_style or 'Default'}")
 
-        blog_post_ideas = generate_blog_post_ideas(query, user_id, writing_style)
+        blog_post_ideas = generate_blog_post_ideas(query, user_id, writing_style, settings=settings)
         if not blog_post_ideas:
             logger.error(f"No blog post ideas generated for user {user_id}")
             return None, "No blog post ideas generated"
 
         blog_post_idea = blog_post_ideas[0]
+        if checkpoints:
+            checkpoints.save("research", {"research": blog_post_idea, "writing_style": writing_style})
 
     # Use manual system prompt if provided, otherwise use saved prompt
     if manual_system_prompt:
@@ -363,13 +463,19 @@ def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, m
     logger.info(f"[V4] Mode: {mode_label}")
     logger.info(f"Perplexity research: {blog_post_idea[:100]}...")
 
+    # Resolve WordPress credentials once; every upload and the post reuse the site
+    wordpress_site = None if local_mode else resolve_wordpress_site(user_id)
+
     # Use V4 modular pipeline with writing style and local_mode flag
     processed_post, error = create_blog_post_with_images_v4(
         perplexity_research=blog_post_idea,
         user_id=user_id,
         user_system_prompt=system_prompt,
         writing_style=writing_style,  # Pass writing style through to V4
-        local_mode=local_mode  # Enable local mode if WordPress not configured or user chose it
+        local_mode=local_mode,  # Enable local mode if WordPress not configured or user chose it
+        run_id=run_id,  # Checkpoint stages so a failed run can resume
+        wordpress_site=wordpress_site,
+        settings=settings
     )
     if error:
         logger.error(f"Error in V4 pipeline for user {user_id}: {error}")
@@ -388,18 +494,18 @@ def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, m
     # FINAL VALIDATION: Check article completeness before posting
     logger.info("[V3] Performing final validation before WordPress posting...")
 
-    # Check 1: Inline styling present (V4 uses inline styles, not <style> tags)
-    if 'style="' not in blog_post_content:
-        logger.error("CRITICAL: Inline styling missing from article content")
+    # Check 1: Styling present (inline styles, or a template layout's <style> block)
+    if 'style="' not in blog_post_content and '<style' not in blog_post_content:
+        logger.error("CRITICAL: Styling missing from article content")
         # EMERGENCY: Save article before rejecting
-        _save_emergency_article(blog_post_content, title, current_user.id)  # type: ignore[attr-defined]
+        _save_emergency_article(blog_post_content, title, user_id)
         return None, "Article missing magazine styling"
 
-    # Check 2: Hero section present (now uses inline styles with background-image)
-    if 'background-image' not in blog_post_content or hero_image_url not in blog_post_content:
+    # Check 2: Hero image present (<img> or background-image, depending on layout)
+    if hero_image_url not in blog_post_content:
         logger.error("CRITICAL: Hero section missing from article content")
         # EMERGENCY: Save article before rejecting
-        _save_emergency_article(blog_post_content, title, current_user.id)  # type: ignore[attr-defined]
+        _save_emergency_article(blog_post_content, title, user_id)
         return None, "Article missing hero section"
 
     # Check 3: Images embedded in content
@@ -438,15 +544,16 @@ def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, m
         logger.info("✓✓✓ Sending email with downloadable article attachment")
 
         from email_notification import send_article_notification_with_attachment
-        email_sent = send_article_notification_with_attachment(
-            title=title,
-            article_html=blog_post_content,
-            hero_image_url=hero_image_url,
-            user_email=user.email,
-            mode="local",  # Use local mode email template
-            wordpress_url=None,
-            post_id=None
-        )
+        with track_stage("email"):
+            email_sent = send_article_notification_with_attachment(
+                title=title,
+                article_html=blog_post_content,
+                hero_image_url=hero_image_url,
+                user_email=user.email,
+                mode="local",  # Use local mode email template
+                wordpress_url=None,
+                post_id=None
+            )
 
         if email_sent:
             logger.info(f"✓ Local mode article emailed to {user.email}")
@@ -471,7 +578,19 @@ def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, m
 
     # WORDPRESS MODE: Try WordPress post creation with comprehensive error handling
     try:
-        post = create_wordpress_post(title, blog_post_content, user_id, hero_image_url)
+        saved_post = checkpoints.get("wordpress_post") if checkpoints else None
+        if saved_post:
+            # A resumed run already created its draft - never publish it twice
+            logger.info(f"[V3] WordPress post already created by an earlier attempt (ID: {saved_post['post']['id']})")
+            post = saved_post["post"]
+        else:
+            with track_stage("wordpress_post"):
+                # The hero is already in the media library - feature it by ID
+                post = create_wordpress_post(title, blog_post_content, user_id, hero_image_url,
+                                             site=wordpress_site,
+                                             featured_media_id=processed_post.get('hero_media_id'))  # type: ignore[union-attr]
+            if post and checkpoints:
+                checkpoints.save("wordpress_post", {"post": post})
 
         if not post:
             # WordPress upload failed - send failure email with article attachment
@@ -519,15 +638,16 @@ def create_blog_post_v3(user_id, manual_topic=None, manual_system_prompt=None, m
         logger.info(f"✓ WordPress post created successfully: ID {post.get('id')}")
 
         from email_notification import send_article_notification_with_attachment
-        email_sent = send_article_notification_with_attachment(
-            title=post['title']['rendered'],
-            article_html=blog_post_content,
-            hero_image_url=hero_image_url,
-            user_email=user.email,
-            mode="wordpress",
-            wordpress_url=wordpress_url,
-            post_id=post['id']
-        )
+        with track_stage("email"):
+            email_sent = send_article_notification_with_attachment(
+                title=post['title']['rendered'],
+                article_html=blog_post_content,
+                hero_image_url=hero_image_url,
+                user_email=user.email,
+                mode="wordpress",
+                wordpress_url=wordpress_url,
+                post_id=post['id']
+            )
 
         if not email_sent:
             logger.warning(f"Failed to send success email notification for user {user_id}")
@@ -655,7 +775,7 @@ def register():
             last_name=data.get('last_name', ''),
             email_verified=False,  # Not verified yet
             stripe_customer_id=stripe_customer.id if stripe_customer else None,
-            credit_balance=WELCOME_CREDIT  # Add welcome credit
+            credit_balance=0  # add_welcome_credit() adds the welcome credits below
         )
         user.set_password(data['password'])
 
@@ -854,7 +974,6 @@ def verify_login():
         if success:
             # Code is valid - log user in
             login_user(user, remember=True)
-            generate_env_file(user)  # Generate user-specific .env file
 
             # Clear verification code
             user.verification_code = None
@@ -937,7 +1056,11 @@ def profile():  # type: ignore[return]
             "schedule": current_user.schedule or [],
             "brand_primary_color": current_user.brand_primary_color,
             "brand_accent_color": current_user.brand_accent_color,
-            "use_default_branding": current_user.use_default_branding
+            "use_default_branding": current_user.use_default_branding,
+            "article_layout": current_user.article_layout or DEFAULT_LAYOUT,
+            "premium_formatting": bool(current_user.premium_formatting),
+            "fresh_research": bool(current_user.fresh_research),
+            "available_layouts": available_layouts()
         })
     elif request.method == 'POST':
         try:
@@ -954,8 +1077,13 @@ def profile():  # type: ignore[return]
             for field in fields_to_update:
                 if field in data:  # type: ignore[operator]
                     setattr(current_user, field, data[field])  # type: ignore[index]
+            if 'schedule' in data:
+                sync_schedule_slots(current_user.id, data['schedule'])
+            if 'fresh_research' in data:
+                current_user.fresh_research = bool(data['fresh_research'])
             db.session.commit()  # type: ignore[attr-defined]
-            generate_env_file(current_user)
+            invalidate_wordpress_credentials(current_user.id)
+            invalidate_job_settings(current_user.id)
             return jsonify({"message": "Profile updated successfully!"})
         except Exception as e:
             db.session.rollback()
@@ -976,6 +1104,7 @@ def test_wordpress():
 
         # Temporarily set credentials for testing (don't save yet)
         from wordpress_integration import normalize_wordpress_url, construct_api_endpoint, create_auth_header
+        from wordpress_client import get_wordpress_client
         import requests as req
 
         base_url = normalize_wordpress_url(wordpress_url)
@@ -986,7 +1115,7 @@ def test_wordpress():
         headers = create_auth_header(username, app_password)
 
         # Test connection
-        response = req.get(endpoint, headers=headers, timeout=10)
+        response = get_wordpress_client(base_url).get(endpoint, headers=headers, timeout=10)
 
         if response.status_code == 200:
             return jsonify({"message": "Connection successful! Your WordPress site is ready."}), 200
@@ -1032,7 +1161,8 @@ def update_integrations():
     if updated_fields:
         try:
             db.session.commit()
-            generate_env_file(current_user)
+            invalidate_wordpress_credentials(current_user.id)
+            invalidate_job_settings(current_user.id)
             return jsonify({"message": f"Updated: {', '.join(updated_fields)}"}), 200
         except Exception as e:
             db.session.rollback()
@@ -1066,6 +1196,15 @@ def update_brand_colors():
                 return jsonify({"error": "Invalid accent color format. Use #RRGGBB"}), 400
             current_user.brand_accent_color = color
 
+        # Article layout (template from layouts/) and premium Claude formatting
+        if 'article_layout' in data:
+            if data['article_layout'] not in available_layouts():
+                return jsonify({"error": f"Unknown layout. Choose one of: {', '.join(available_layouts())}"}), 400
+            current_user.article_layout = data['article_layout']
+
+        if 'premium_formatting' in data:
+            current_user.premium_formatting = bool(data['premium_formatting'])
+
         db.session.commit()
         return jsonify({"message": "Brand colors updated successfully!"}), 200
 
@@ -1097,7 +1236,11 @@ def save_schedule():
     if not data or 'schedule' not in data:
         return jsonify({"error": "No schedule provided"}), 400
 
+    if not is_valid_schedule(data['schedule']):
+        return jsonify({"error": "Schedule must list 7 days with times as HH:MM"}), 400
+
     current_user.schedule = data['schedule']
+    sync_schedule_slots(current_user.id, data['schedule'])  # Recompute next run times
     db.session.commit()
     return jsonify({"message": "Schedule saved successfully!"})
 
@@ -1112,11 +1255,140 @@ def system_prompt():
     db.session.commit()
     return jsonify({"message": "System prompt saved successfully!"})
 
+def run_test_post_generation(user_id, params, run_id=None):
+    """
+    Generate an article for a queued /api/create_test_post job.
+
+    Runs inside generation_worker.py, never in a web request.
+
+    Args:
+        user_id: User ID
+        params: Job parameters (blog_post_idea, system_prompt, writing_style, local_mode)
+        run_id: Job ID - completed stages are checkpointed under it, so a
+            resumed job continues where the failed attempt stopped
+
+    Returns:
+        Tuple of (response_data, error) - response_data is what the job
+        result endpoint returns to the dashboard
+    """
+    manual_topic = params.get('blog_post_idea', '')
+    manual_system_prompt = params.get('system_prompt', '')
+    manual_writing_style = params.get('writing_style', '')
+    local_mode = params.get('local_mode', False)
+
+    from pipeline_checkpoints import CheckpointStore
+
+    logger.info(f"[V3] Using GPT-5-mini with reasoning + SeeDream-4 2K images")
+    checkpoints = CheckpointStore(run_id) if run_id else None
+    settings = get_job_settings(user_id)  # Built once, passed to every stage
+
+    # Use manual inputs if provided, otherwise use saved topics
+    if manual_topic:
+        logger.info(f"[V3] Using manual topic from user: {manual_topic[:100]}...")
+        logger.info(f"[V3] Writing style from UI: {manual_writing_style or 'Default'}")
+
+        saved_research = checkpoints.get("research") if checkpoints else None
+        if saved_research:
+            logger.info(f"[V3] Resuming with checkpointed Perplexity research")
+            perplexity_research = saved_research["research"]
+        else:
+            # Call Perplexity with manual topic + writing style
+            logger.info(f"[V3] Getting Perplexity research for manual topic...")
+            perplexity_research_list = generate_blog_post_ideas(
+                query=manual_topic,
+                user_id=user_id,
+                writing_style=manual_writing_style or None,
+                settings=settings
+            )
+
+            if not perplexity_research_list:
+                return None, "Failed to get Perplexity research"
+
+            perplexity_research = perplexity_research_list[0]
+            logger.info(f"[V3] Perplexity research received: {len(perplexity_research)} chars")
+            if checkpoints:
+                checkpoints.save("research", {"research": perplexity_research})
+
+        # Now create post with Perplexity research
+        post, error = create_blog_post_v3(
+            user_id,
+            manual_topic=perplexity_research,  # Pass Perplexity research, not raw topic
+            manual_system_prompt=manual_system_prompt or None,
+            manual_writing_style=manual_writing_style or None,
+            local_mode=local_mode,  # Pass local_mode flag
+            is_scheduled=False,  # This is a manual post
+            run_id=run_id,
+            settings=settings
+        )
+    else:
+        logger.info(f"[V3] Using saved topics rotation")
+        post, error = create_blog_post_v3(
+            user_id,
+            local_mode=local_mode,  # Pass local_mode flag
+            is_scheduled=False,  # This is a manual post
+            run_id=run_id,
+            settings=settings
+        )
+
+    if error:
+        logger.error(f"Error creating V3 blog post for user {user_id}: {error}")
+        return None, error
+    if not post:
+        logger.error(f"Failed to create V3 test post for user {user_id}")
+        return None, "Failed to create the test post."
+
+    logger.info(f"[V3] Successfully created magazine-style post for user {user_id}")
+
+    # Handle response based on mode
+    if local_mode:
+        # Local mode response
+        logger.info(f"[V3] LOCAL MODE article created for user {user_id}")
+        response_data = {
+            "message": post.get('message', "Downloadable article created! Check your email for the HTML file."),
+            "title": post.get('title', 'Article'),
+            "mode": "local",
+            "email_sent": post.get('email_sent', False),
+            "version": "3.0",
+            "features": "GPT-5-mini reasoning + SeeDream-4 2K images + Local downloadable format"
+        }
+
+        if not post.get('email_sent'):
+            response_data["warning"] = "Article created, but email delivery failed. Please contact support."
+
+        return response_data, None
+
+    # WordPress mode response
+    logger.info(f"[V3] WORDPRESS article created for user {user_id}")
+    response_data = {
+        "message": "Magazine-style article created and published to WordPress!",
+        "title": post['title']['rendered'],
+        "content": post['content']['rendered'],
+        "image_url": post.get('_links', {}).get('wp:featuredmedia', [{}])[0].get('href'),
+        "mode": "wordpress",
+        "version": "3.0",
+        "features": "GPT-5-mini reasoning + SeeDream-4 2K images"
+    }
+
+    if not post.get('email_notification_sent', True):
+        response_data["warning"] = "Post created, but email notification failed to send."
+        logger.warning(f"Email notification failed to send for user {user_id}")
+
+    return response_data, None
+
 @app.route('/api/create_test_post', methods=['POST'])
 @login_required
 def create_test_post():
+    """
+    Queue an AI-powered magazine article for generation.
+
+    Returns 202 with a job id immediately - generation runs in
+    generation_worker.py. Poll /api/jobs/<job_id> for status and
+    /api/jobs/<job_id>/result for the outcome.
+    """
+    from generation_jobs import enqueue_generation_job
+
     try:
-        logger.info(f"[V3] Starting AI-powered magazine article creation for user {current_user.id}")
+        logger.info(f"[V3] Queueing AI-powered magazine article creation for user {current_user.id}")
 
         # Get request parameters first
         data = request.json or {}
@@ -1152,104 +1424,129 @@ def create_test_post():
                 "action_required": "purchase_credits"
             }), 402  # Payment Required status code
 
-        # DEDUCT CREDITS BEFORE GENERATION
-        if not deduct_credits(current_user, db):
-            logger.error(f"[Credits] Failed to deduct credits for user {current_user.id}")
-            return jsonify({"error": "Credit processing error. Please try again."}), 500
+        # Credits are deducted when the job is queued and refunded if it fails
+        job, error = enqueue_generation_job(current_user, {
+            "blog_post_idea": manual_topic,
+            "system_prompt": manual_system_prompt,
+            "writing_style": manual_writing_style,
+            "local_mode": local_mode
+        })
+        if error:
+            logger.error(f"[Jobs] Failed to queue generation for user {current_user.id}: {error}")
+            return jsonify({"error": error}), 500
 
-        logger.info(f"[V3] Credits deducted. Proceeding with article generation")
-        logger.info(f"[V3] Using GPT-5-mini with reasoning + SeeDream-4 2K images")
+        return jsonify({
+            "message": "Article generation queued",
+            "job_id": job.id,
+            "status": job.status,
+            "mode": "local" if local_mode else "wordpress",
+            "status_url": f"/api/jobs/{job.id}",
+            "result_url": f"/api/jobs/{job.id}/result"
+        }), 202
+    except Exception as e:
+        logger.error(f"Unexpected error in V3 create_test_post for user {current_user.id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-        # Use manual inputs if provided, otherwise use saved topics
-        if manual_topic:
-            logger.info(f"[V3] Using manual topic from user: {manual_topic[:100]}...")
-            logger.info(f"[V3] Writing style from UI: {manual_writing_style or 'Default'}")
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_generation_job(job_id):
+    """Get status of a queued article generation job"""
+    from generation_jobs import job_to_dict
 
-            # Call Perplexity with manual topic + writing style
-            logger.info(f"[V3] Getting Perplexity research for manual topic...")
-            perplexity_research_list = generate_blog_post_ideas(
-                query=manual_topic,
-                user_id=current_user.id,
-                writing_style=manual_writing_style or None
-            )
+    job = GenerationJob.query.filter_by(id=job_id, user_id=current_user.id).first()  # type: ignore[attr-defined]
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
 
-            if not perplexity_research_list:
-                return jsonify({"error": "Failed to get Perplexity research"}), 500
+    return jsonify(job_to_dict(job)), 200
 
-            perplexity_research = perplexity_research_list[0]
-            logger.info(f"[V3] Perplexity research received: {len(perplexity_research)} chars")
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+@login_required
+def get_generation_job_result(job_id):
+    """
+    Get the outcome of an article generation job.
 
-            # Now create post with Perplexity research
-            post, error = create_blog_post_v3(
-                current_user.id,
-                manual_topic=perplexity_research,  # Pass Perplexity research, not raw topic
-                manual_system_prompt=manual_system_prompt or None,
-                manual_writing_style=manual_writing_style or None,
-                local_mode=local_mode,  # Pass local_mode flag
-                is_scheduled=False  # This is a manual post
-            )
-        else:
-            logger.info(f"[V3] Using saved topics rotation")
-            post, error = create_blog_post_v3(
-                current_user.id,
-                local_mode=local_mode,  # Pass local_mode flag
-                is_scheduled=False  # This is a manual post
-            )
+    Returns 202 while queued/running, 200 with the article response once
+    succeeded, or 500 with the error once failed (credits already refunded).
+    """
+    from generation_jobs import job_to_dict, JOB_SUCCEEDED, JOB_FAILED
 
-        if error:
-            logger.error(f"Error creating V3 blog post for user {current_user.id}: {error}")
-            # REFUND credits on failure
-            refund_credits(current_user, db, reason=f"Article generation failed: {error}")
-            return jsonify({"error": error}), 500
-        if not post:
-            logger.error(f"Failed to create V3 test post for user {current_user.id}")
-            # REFUND credits on failure
-            refund_credits(current_user, db, reason="Article generation failed: No post created")
-            return jsonify({"error": "Failed to create the test post."}), 500
-
-        logger.info(f"[V3] Successfully created magazine-style post for user {current_user.id}")
-
-        # Handle response based on mode
-        if local_mode:
-            # Local mode response
-            logger.info(f"[V3] LOCAL MODE article created for user {current_user.id}")
-            response_data = {
-                "message": post.get('message', "Downloadable article created! Check your email for the HTML file."),
-                "title": post.get('title', 'Article'),
-                "mode": "local",
-                "email_sent": post.get('email_sent', False),
-                "version": "3.0",
-                "features": "GPT-5-mini reasoning + SeeDream-4 2K images + Local downloadable format"
-            }
+    job = GenerationJob.query.filter_by(id=job_id, user_id=current_user.id).first()  # type: ignore[attr-defined]
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
 
-            if not post.get('email_sent'):
-                response_data["warning"] = "Article created, but email delivery failed. Please contact support."
+    if job.status == JOB_SUCCEEDED:
+        return jsonify(job.result or {}), 200
+    if job.status == JOB_FAILED:
+        return jsonify({"error": job.error or "Article generation failed", "credits_refunded": job.credit_status == 'refunded'}), 500
+    return jsonify(job_to_dict(job)), 202
 
-            return jsonify(response_data), 200
-        else:
-            # WordPress mode response
-            logger.info(f"[V3] WORDPRESS article created for user {current_user.id}")
-            response_data = {
-                "message": "Magazine-style article created and published to WordPress!",
-                "title": post['title']['rendered'],
-                "content": post['content']['rendered'],
-                "image_url": post.get('_links', {}).get('wp:featuredmedia', [{}])[0].get('href'),
-                "mode": "wordpress",
-                "version": "3.0",
-                "features": "GPT-5-mini reasoning + SeeDream-4 2K images"
-            }
+@app.route('/api/jobs/<job_id>/resume', methods=['POST'])
+@login_required
+def resume_generation_job(job_id):
+    """
+    Re-queue a failed article generation job.
 
-            if not post.get('email_notification_sent', True):
-                response_data["warning"] = "Post created, but email notification failed to send."
-                logger.warning(f"Email notification failed to send for user {current_user.id}")
+    The job keeps its id, so the worker restores every checkpointed stage
+    (research, story, prompts, images, formatting) and restarts at the first
+    incomplete one. The credit refunded on failure is charged again.
+    """
+    from generation_jobs import requeue_failed_job, job_to_dict
+
+    job = GenerationJob.query.filter_by(id=job_id, user_id=current_user.id).first()  # type: ignore[attr-defined]
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    has_credits, credit_message = check_sufficient_credits(current_user)
+    if not has_credits:
+        return jsonify({
+            "error": credit_message,
+            "balance": current_user.credit_balance,
+            "required": ARTICLE_COST,
+            "action_required": "purchase_credits"
+        }), 402
+
+    error = requeue_failed_job(job, current_user)
+    if error:
+        return jsonify({"error": error}), 409
+
+    logger.info(f"[Jobs] User {current_user.id} resumed job {job_id}")
+    return jsonify(job_to_dict(job)), 202
+
+@app.route('/api/admin/metrics', methods=['GET'])
+@login_required
+def admin_pipeline_metrics():
+    """
+    Pipeline latency/token/cost percentiles for admins.
+
+    Query params:
+        days: Window size in days (default METRICS_WINDOW_DAYS)
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    days = request.args.get('days', METRICS_WINDOW_DAYS, type=int)
+    aggregate = aggregate_metrics(days=max(1, days))
+    aggregate["research_cache"] = research_cache_stats()
+    return jsonify(aggregate), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Pipeline metrics in the Prometheus text format.
+
+    Scrapers authenticate with "Authorization: Bearer $METRICS_TOKEN";
+    logged-in admins can open it in the browser.
+    """
+    token = os.getenv('METRICS_TOKEN')
+    authorized = bool(token) and request.headers.get('Authorization') == f"Bearer {token}"
+    if not authorized and not (current_user.is_authenticated and current_user.is_admin):
+        return jsonify({"error": "Unauthorized"}), 403
+
+    body = render_prometheus(aggregate_metrics())
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
-            return jsonify(response_data), 200
-    except Exception as e:
-        logger.error(f"Unexpected error in V3 create_test_post for user {current_user.id}: {str(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        # REFUND credits on unexpected error
-        refund_credits(current_user, db, reason=f"Unexpected error: {str(e)[:100]}")
-        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
 @app.route('/api/publish_post/<int:post_id>', methods=['POST'])
 @login_required
@@ -1278,6 +1575,63 @@ def publish_post(post_id):
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+# Post fields a bulk update may set, and the statuses it may move posts to
+BULK_UPDATE_FIELDS = {'status', 'date'}
+BULK_POST_STATUSES = {'publish', 'draft', 'pending', 'private', 'future'}
+MAX_BULK_POSTS = 500
+
+@app.route('/api/publish_posts', methods=['POST'])
+@login_required
+def publish_posts():
+    """
+    Publish (or otherwise update) many WordPress posts in one request.
+
+    Body: {"post_ids": [1, 2, ...], "updates": {"status": "publish"}}
+    "updates" is optional and defaults to publishing; it may set status and date.
+    Responds with one result per post.
+    """
+    data = request.get_json(silent=True) or {}
+    post_ids = data.get('post_ids')
+    updates = data.get('updates') or {'status': 'publish'}
+
+    if not isinstance(post_ids, list) or not post_ids:
+        return jsonify({"error": "post_ids must be a non-empty list"}), 400
+    if len(post_ids) > MAX_BULK_POSTS:
+        return jsonify({"error": f"At most {MAX_BULK_POSTS} posts per request"}), 400
+    if not all(isinstance(post_id, int) and not isinstance(post_id, bool) and post_id > 0 for post_id in post_ids):
+        return jsonify({"error": "post_ids must be positive integers"}), 400
+    if not isinstance(updates, dict) or not set(updates) <= BULK_UPDATE_FIELDS:
+        return jsonify({"error": f"updates may only set: {', '.join(sorted(BULK_UPDATE_FIELDS))}"}), 400
+    if 'status' in updates and updates['status'] not in BULK_POST_STATUSES:
+        return jsonify({"error": "Invalid post status"}), 400
+
+    try:
+        from wordpress_integration import bulk_update_wordpress_posts
+
+        post_ids = list(dict.fromkeys(post_ids))  # Drop duplicates, keep order
+        logger.info(f"User {current_user.id} requesting bulk update of {len(post_ids)} posts: {updates}")
+
+        results = bulk_update_wordpress_posts(post_ids, current_user.id, updates)
+        if results is None:
+            return jsonify({"error": "WordPress credentials not configured"}), 400
+
+        succeeded = sum(1 for result in results if result['success'])
+        body = {
+            "message": f"Updated {succeeded} of {len(results)} posts",
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
+        }
+        if succeeded == 0:
+            body["error"] = "Failed to update posts"
+            return jsonify(body), 502
+        return jsonify(body), 200
+
+    except Exception as e:
+        logger.error(f"Error in bulk post update: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
 # ============================================================================
 # CREDIT SYSTEM & STRIPE PAYMENT ENDPOINTS
 # ============================================================================
@@ -1446,6 +1800,28 @@ def stripe_webhook():
     return jsonify({"status": "success"}), 200
 
 
+@app.route('/webhook/replicate', methods=['POST'])
+def replicate_webhook():
+    """Handle Replicate prediction completion webhooks"""
+    from replicate_completion import verify_webhook_signature, record_completion
+
+    if not os.getenv('REPLICATE_WEBHOOK_SECRET'):
+        logger.error("[Replicate] Webhook secret not configured")
+        return jsonify({"error": "Webhook not configured"}), 500
+
+    payload = request.get_data()
+    if not verify_webhook_signature(request.headers, payload):
+        return jsonify({"error": "Invalid signature"}), 400
+
+    prediction = request.get_json(silent=True)
+    if not prediction or 'id' not in prediction:
+        logger.error("[Replicate] Invalid webhook payload")
+        return jsonify({"error": "Invalid payload"}), 400
+
+    record_completion(prediction)
+    return jsonify({"status": "success"}), 200
+
+
 def handle_checkout_completed(session):
     """Handle successful checkout session"""
     try:
@@ -1453,7 +1829,9 @@ def handle_checkout_completed(session):
         purchase_amount = float(session['metadata']['credit_amount'])  # Dollar amount paid
         payment_intent_id = session.get('payment_intent')
 
-        # Check for duplicate webhook (prevent processing same payment twice)
+        # Check for duplicate webhook (prevent processing same payment twice). Concurrent
+        # deliveries can both pass this check - add_credits_manual() credits each payment
+        # intent once regardless (idempotency key)
         existing = CreditTransaction.query.filter_by(
             stripe_payment_intent_id=payment_intent_id,
             transaction_type='purchase'
@@ -11,22 +11,19 @@ KEY ADVANTAGE: Claude makes smart decisions about:
 - Visual rhythm and pacing
 """
 
-import os
+import re
+import time
 import logging
 from typing import Dict, List, Optional
-from dotenv import load_dotenv
 import anthropic
+from pipeline_metrics import record_llm_call
+from provider_limits import provider_slot
+from job_settings import JobSettings, get_job_settings
+from layout_engine import get_layout, DEFAULT_LAYOUT
 
 logger = logging.getLogger(__name__)
 
 
-def load_user_env(user_id: int) -> None:
-    """Load user-specific environment variables."""
-    env_file = f".env.user_{user_id}"
-    if os.path.exists(env_file):
-        load_dotenv(env_file, override=True)
-
-
 def get_premium_layout_example() -> str:
     """
     Returns the Premium Magazine layout HTML as an example for Claude.
@@ -298,6 +295,115 @@ def get_premium_layout_example() -> str:
 </html>"""
 
 
+# Prompt caching: everything identical across articles (instructions + the
+# layout example) is the system prompt, marked cacheable. Only the compact
+# per-article payload is sent uncached. Cache reads cost 10% of normal input
+# tokens and skip most of the prefill latency.
+FORMATTER_MODEL = "claude-sonnet-4-20250514"  # Latest Sonnet 4.5
+FORMATTER_MAX_TOKENS = 8000  # Large enough for complete HTML
+
+HERO_PLACEHOLDER = "HERO_IMAGE_URL"
+SECTION_PLACEHOLDER = "SECTION_IMAGE_{n}_URL"
+
+
+def _layout_example(layout_style: str) -> str:
+    """Example HTML for a layout: the curated premium example, else the layouts/ sample."""
+    layout = get_layout(layout_style)
+    if layout is None or layout.name == DEFAULT_LAYOUT:
+        return get_premium_layout_example()
+    return layout.source
+
+
+def build_formatter_system_prompt(layout_style: str = DEFAULT_LAYOUT) -> str:
+    """
+    Static formatter instructions and layout example (the cacheable prefix).
+
+    Must not contain anything article-specific - any change here
+    invalidates the prompt cache for every article using this layout.
+    """
+    return f"""You are an expert magazine layout designer. Format article content into a beautiful magazine layout.
+
+LAYOUT EXAMPLE TO FOLLOW:
+{_layout_example(layout_style)}
+
+YOUR TASK (for each article you receive):
+1. Use the layout example above as your template structure
+2. Replace the --brand-color and --accent-color CSS variable values with the provided brand colors
+3. Insert the article title and content into the appropriate sections
+4. Use the hero image in the cover section: write the placeholder {HERO_PLACEHOLDER} exactly as given
+5. Create 2-3 section image blocks (the example's section-header / image markup), using the placeholders listed in the article
+   message (SECTION_IMAGE_1_URL, SECTION_IMAGE_2_URL, ...) exactly as given - never invent URLs
+   and never use more section placeholders than listed
+6. Intelligently insert, using the example's own component classes:
+   - 2-3 pull quotes (extract impactful quotes from content)
+   - 3-4 stat boxes (extract key metrics from content)
+   - 1-2 highlight boxes (e.g. case-study-box) for important highlights
+7. Break content into multiple content sections (2-3 sections total)
+8. Place full-width-image breaks between major sections
+9. Ensure visual rhythm and pacing - don't let text get too dense
+
+CRITICAL REQUIREMENTS:
+- Return ONLY the complete HTML document (no markdown code fences)
+- Use the EXACT CSS structure from the example
+- Use ONLY the image placeholders listed in the article message
+- Extract actual content from the article for pull quotes and stats
+- Maintain the example's grid structure (e.g. main column + sidebar)
+- Ensure mobile responsive (@media query is already in example)
+- WRAP all body content in: <div class="magazine-article-wrapper">...</div>
+- This wrapper is CRITICAL for WordPress/Elementor compatibility
+
+OUTPUT: Complete formatted HTML document ready for WordPress with wrapper div."""
+
+
+_SYSTEM_PROMPTS: Dict[str, str] = {}
+
+
+def _system_blocks(layout_style: str = DEFAULT_LAYOUT) -> List[Dict]:
+    """System prompt as a single cacheable content block (built once per layout and process)."""
+    if layout_style not in _SYSTEM_PROMPTS:
+        _SYSTEM_PROMPTS[layout_style] = build_formatter_system_prompt(layout_style)
+    return [{"type": "text", "text": _SYSTEM_PROMPTS[layout_style], "cache_control": {"type": "ephemeral"}}]
+
+
+def compact_html(html: str) -> str:
+    """Strip comments and line-break indentation from article HTML."""
+    html = re.sub(r"<!--.*?-->", "", html, flags=re.DOTALL)
+    html = re.sub(r">\s*\n\s*<", "><", html)
+    return re.sub(r"\s+", " ", html).strip()
+
+
+def build_article_message(
+    article_html: str,
+    title: str,
+    section_count: int,
+    primary_color: str,
+    accent_color: str
+) -> str:
+    """Compact per-article payload (the uncached suffix)."""
+    section_placeholders = ", ".join(SECTION_PLACEHOLDER.format(n=i + 1) for i in range(section_count)) or "none"
+    return f"""ARTICLE TITLE: {title}
+
+BRAND COLORS: primary {primary_color}, accent {accent_color}
+
+IMAGES: hero {HERO_PLACEHOLDER}; sections ({section_count}): {section_placeholders}
+
+ARTICLE CONTENT (raw HTML):
+{compact_html(article_html)}"""
+
+
+def fill_image_placeholders(html: str, hero_image_url: str, section_images: List[str]) -> str:
+    """
+    Swap image placeholders in Claude's output for the real URLs.
+
+    Images using a section placeholder with no matching image are removed.
+    """
+    html = html.replace(HERO_PLACEHOLDER, hero_image_url)
+    for i, url in enumerate(section_images):
+        html = html.replace(SECTION_PLACEHOLDER.format(n=i + 1), url)
+    html = re.sub(r"<img\b[^>]*SECTION_IMAGE_\d+_URL[^>]*>", "", html)
+    return re.sub(r"SECTION_IMAGE_\d+_URL", "", html)
+
+
 def format_article_with_claude(
     article_html: str,
     title: str,
@@ -305,115 +411,96 @@ def format_article_with_claude(
     section_images: List[str],
     user_id: int,
     brand_colors: Optional[Dict[str, str]] = None,
-    layout_style: str = "premium_magazine"
+    layout_style: str = DEFAULT_LAYOUT,
+    settings: Optional[JobSettings] = None
 ) -> Optional[str]:
     """
     Use Claude Sonnet 4.5 API to format article with intelligent layout decisions.
-    
+
+    The static instructions and layout example are sent as a cached system
+    prompt; the article travels as a compact user message with image
+    placeholders, which are replaced with the real URLs afterwards. Input
+    tokens, cache reads/writes and time-to-first-token are logged and
+    recorded in the run metrics.
+
     Args:
         article_html: Raw article HTML from story generation
         title: Article title
         hero_image_url: URL for hero cover image
         section_images: List of section image URLs
-        user_id: User ID for environment loading
+        user_id: User ID
         brand_colors: {"primary": "#color1", "accent": "#color2"}
-        layout_style: Layout template to use (currently only "premium_magazine")
-    
+        layout_style: Layout from layouts/ used as the example to follow
+        settings: The job's settings (Anthropic key); looked up from user_id if omitted
+
     Returns:
         Beautifully formatted HTML or None if error
     """
-    load_user_env(user_id)
-    
-    api_key = os.getenv("ANTHROPIC_API_KEY")
+    settings = settings or get_job_settings(user_id)
+
+    api_key = settings.anthropic_api_key
     if not api_key:
         logger.error("[Claude Formatter] ANTHROPIC_API_KEY not found")
         return None
-    
+
     # Default brand colors if not provided
     primary_color = brand_colors.get("primary", "#4a9d5f") if brand_colors else "#4a9d5f"
     accent_color = brand_colors.get("accent", "#8b7355") if brand_colors else "#8b7355"
-    
-    # Get layout example
-    layout_example = get_premium_layout_example()
-    
-    # Prepare image URLs list for prompt
-    section_image_urls = "\n".join([f"- {url}" for url in section_images])
-    
-    # Create prompt for Claude
-    prompt = f"""You are an expert magazine layout designer. Format the following article content into a beautiful Premium Magazine layout.
-
-ARTICLE TITLE: {title}
-
-ARTICLE CONTENT (raw HTML):
-{article_html}
-
-AVAILABLE IMAGES:
-Hero Image: {hero_image_url}
-Section Images:
-{section_image_urls}
-
-BRAND COLORS:
-Primary: {primary_color}
-Accent: {accent_color}
-
-LAYOUT EXAMPLE TO FOLLOW:
-{layout_example}
-
-YOUR TASK:
-1. Use the layout example above as your template structure
-2. Replace --brand-color and --accent-color CSS variables with the provided colors
-3. Insert the article title and content into the appropriate sections
-4. Use the hero image in the cover section (replace HERO_IMAGE_URL)
-5. Create 2-3 section-header divs with section images (replace SECTION_IMAGE_*_URL)
-6. Intelligently insert:
-   - 2-3 pull quotes in the main-column (extract impactful quotes from content)
-   - 3-4 stat-highlight boxes in sidebars (extract key metrics from content)
-   - 1-2 case-study-box for important highlights
-7. Break content into multiple content-area sections (2-3 sections total)
-8. Place full-width-image breaks between major sections
-9. Ensure visual rhythm and pacing - don't let text get too dense
 
-CRITICAL REQUIREMENTS:
-- Return ONLY the complete HTML document (no markdown code fences)
-- Use the EXACT CSS structure from the example
-- Replace ALL placeholder URLs with actual provided URLs
-- Extract actual content from the article for pull quotes and stats
-- Maintain the 2-column grid layout (main + sidebar)
-- Ensure mobile responsive (@media query is already in example)
-- WRAP all body content in: <div class="magazine-article-wrapper">...</div>
-- This wrapper is CRITICAL for WordPress/Elementor compatibility
-
-OUTPUT: Complete formatted HTML document ready for WordPress with wrapper div."""
+    article_message = build_article_message(article_html, title, len(section_images), primary_color, accent_color)
 
     try:
         logger.info(f"[Claude Formatter] Formatting article: {title[:60]}")
         logger.info(f"[Claude Formatter] Brand colors: {primary_color}, {accent_color}")
         logger.info(f"[Claude Formatter] Images: Hero + {len(section_images)} sections")
-        
+
         client = anthropic.Anthropic(api_key=api_key)
-        
-        # Call Claude API
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",  # Latest Sonnet 4.5
-            max_tokens=8000,  # Large enough for complete HTML
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+
+        # Stream so time-to-first-token can be measured
+        with provider_slot("anthropic"):
+            started = time.monotonic()
+            first_token_at = None
+            chunks = []
+            with client.messages.stream(
+                model=FORMATTER_MODEL,
+                max_tokens=FORMATTER_MAX_TOKENS,
+                system=_system_blocks(layout_style),
+                messages=[
+                    {"role": "user", "content": article_message}
+                ]
+            ) as stream:
+                for text in stream.text_stream:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    chunks.append(text)
+                message = stream.get_final_message()
+
+        ttft = (first_token_at or time.monotonic()) - started
+        record_llm_call("claude_formatter", FORMATTER_MODEL, message, time.monotonic() - started, ttft_seconds=ttft)
+
+        usage = message.usage
+        logger.info(
+            f"[Claude Formatter] Input tokens: {usage.input_tokens} uncached, "
+            f"{getattr(usage, 'cache_read_input_tokens', 0) or 0} cache read, "
+            f"{getattr(usage, 'cache_creation_input_tokens', 0) or 0} cache write; "
+            f"output {usage.output_tokens}; TTFT {ttft:.1f}s"
         )
-        
+
         # Extract response
-        formatted_html = message.content[0].text
-        
+        formatted_html = "".join(chunks)
+
         # Clean any markdown code fences if Claude added them
         if formatted_html.startswith("```html"):
             formatted_html = formatted_html.replace("```html\n", "").replace("\n```", "")
         elif formatted_html.startswith("```"):
             formatted_html = formatted_html.replace("```\n", "").replace("\n```", "")
-        
+
+        formatted_html = fill_image_placeholders(formatted_html, hero_image_url, section_images)
+
         logger.info(f"[Claude Formatter] Successfully formatted article ({len(formatted_html)} chars)")
-        
+
         return formatted_html.strip()
-        
+
     except Exception as e:
         logger.error(f"[Claude Formatter] Error formatting article: {e}")
         logger.debug(f"[Claude Formatter] Traceback: {e}", exc_info=True)
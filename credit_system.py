@@ -1,12 +1,19 @@
 """
 Credit System Module for EZWAI SMM
 Handles credit balance management, transactions, and Stripe integration
+
+Balances only change through conditional atomic UPDATEs
+(credit_balance = credit_balance - 1 WHERE credit_balance >= 1), committed
+together with an append-only CreditTransaction row. Rows may carry a
+unique idempotency key (e.g. the Stripe payment intent), so a change
+delivered twice - a retried webhook - is applied once.
 """
 import logging
 import os
 from typing import Tuple, Optional
 from datetime import datetime
 import stripe
+from sqlalchemy.exc import IntegrityError
 
 logger = logging.getLogger(__name__)
 
@@ -117,69 +124,140 @@ def check_sufficient_credits(user) -> Tuple[bool, str]:
         return False, f"Insufficient credits. You need {needed} more credit(s). Current balance: {credits} credits"
 
 
-def deduct_credits(user, db) -> bool:
+def _already_recorded(idempotency_key: Optional[str]):
     """
-    Deduct article cost from user's balance and log transaction
+    Ledger row already recorded under idempotency_key, if any
 
     Args:
-        user: User model instance
+        idempotency_key: Key of the credit change (None = not idempotent)
+
+    Returns:
+        CreditTransaction instance or None
+    """
+    from app_v3 import CreditTransaction
+
+    if not idempotency_key:
+        return None
+    return CreditTransaction.query.filter_by(idempotency_key=idempotency_key).first()
+
+
+def _change_balance(user_id: int, db, amount: float, articles: int = 0,
+                    spent: float = 0.0) -> Optional[Tuple[float, int]]:
+    """
+    Add amount to a balance with one conditional UPDATE (not committed)
+
+    A debit only applies if the balance covers it. The row stays locked
+    until the caller commits, so the balance read back is exactly this
+    change's balance_after.
+
+    Args:
+        user_id: User ID
         db: SQLAlchemy database instance
+        amount: Credits to add (negative to deduct)
+        articles: Change of total_articles_generated
+        spent: Dollars to add to total_spent
 
     Returns:
-        bool: True if successful, False otherwise
+        Tuple of (balance_after, total_articles_generated), or None if the balance does not cover a debit
+    """
+    from app_v3 import User
+
+    query = User.query.filter(User.id == user_id)  # type: ignore[attr-defined]
+    if amount < 0:
+        query = query.filter(User.credit_balance >= -amount)  # NULL (legacy) balances never cover a debit
+    updated = query.update({
+        "credit_balance": db.func.coalesce(User.credit_balance, 0) + amount,
+        "total_articles_generated": db.func.coalesce(User.total_articles_generated, 0) + articles,
+        "total_spent": db.func.coalesce(User.total_spent, 0) + spent
+    }, synchronize_session=False)
+    if updated != 1:
+        return None
+    return db.session.query(User.credit_balance, User.total_articles_generated).filter(User.id == user_id).one()
+
+
+def _append_transaction(db, **fields) -> bool:
+    """
+    Append a ledger row and commit it together with its balance change
+
+    Returns:
+        bool: False if a concurrent change with the same idempotency key won (everything rolled back)
     """
     from app_v3 import CreditTransaction
 
+    db.session.add(CreditTransaction(**fields))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        logger.warning(f"[Credits] Credit change {fields.get('idempotency_key')} of user {fields.get('user_id')} "
+                       f"was recorded concurrently - not applied twice")
+        return False
+    return True
+
+
+def deduct_credits(user, db, idempotency_key: Optional[str] = None) -> bool:
+    """
+    Deduct article cost from user's balance and log transaction
+
+    The balance is checked and deducted in one conditional UPDATE, so
+    concurrent generations can neither lose a charge nor overdraw it.
+    Commits the session - pending changes of the caller (e.g. the queued
+    job) land together with the charge, or not at all.
+
+    Args:
+        user: User model instance
+        db: SQLAlchemy database instance
+        idempotency_key: A charge already recorded under this key is not repeated
+
+    Returns:
+        bool: True if charged (or already charged under idempotency_key), False otherwise
+    """
+    user_id, is_admin = user.id, user.is_admin
     try:
-        # Handle legacy users with NULL fields
-        if user.credit_balance is None:
-            user.credit_balance = 0
-        if user.total_articles_generated is None:
-            user.total_articles_generated = 0
-        if user.total_spent is None:
-            user.total_spent = 0.00
-
-        # Convert float to int for credit-based system
-        if isinstance(user.credit_balance, float):
-            user.credit_balance = int(user.credit_balance)
+        if _already_recorded(idempotency_key):
+            db.session.commit()
+            logger.info(f"[Credits] Charge {idempotency_key} of user {user_id} already recorded")
+            return True
 
         # Admin users don't get charged (unlimited credits)
-        if not user.is_admin:
-            user.credit_balance -= ARTICLE_COST  # Deduct 1 credit
-            # Note: total_spent stays in dollars for accounting purposes
-            # We'll calculate it based on actual purchase amounts, not deductions
-
-        user.total_articles_generated += 1
-
-        # Log transaction
-        transaction = CreditTransaction(
-            user_id=user.id,
-            amount=-ARTICLE_COST if not user.is_admin else 0,  # -1 credit
-            transaction_type='article_generation' if not user.is_admin else 'admin_article_generation',
-            balance_after=user.credit_balance,
-            description=f'Article generation (#{user.total_articles_generated})' + (' [ADMIN - FREE]' if user.is_admin else '')
-        )
-        db.session.add(transaction)
-        db.session.commit()
+        amount = 0 if is_admin else -ARTICLE_COST
+        changed = _change_balance(user_id, db, amount, articles=1)
+        if changed is None:
+            db.session.rollback()
+            logger.warning(f"[Credits] User {user_id} has insufficient credits - not charged")
+            return False
+        balance_after, articles = changed
 
-        if user.is_admin:
-            logger.info(f"[Credits] ADMIN user {user.id} generated article (no charge). Balance unchanged: {user.credit_balance} credits")
+        if not _append_transaction(
+            db,
+            user_id=user_id,
+            amount=amount,  # -1 credit
+            transaction_type='admin_article_generation' if is_admin else 'article_generation',
+            balance_after=balance_after,
+            description=f'Article generation (#{articles})' + (' [ADMIN - FREE]' if is_admin else ''),
+            idempotency_key=idempotency_key
+        ):
+            return False
+
+        if is_admin:
+            logger.info(f"[Credits] ADMIN user {user_id} generated article (no charge). Balance unchanged: {balance_after} credits")
         else:
-            logger.info(f"[Credits] Deducted {ARTICLE_COST} credit from user {user.id}. New balance: {user.credit_balance} credits")
+            logger.info(f"[Credits] Deducted {ARTICLE_COST} credit from user {user_id}. New balance: {balance_after} credits")
 
         # Check if auto-recharge needed
-        if user.auto_recharge_enabled and user.credit_balance < user.auto_recharge_threshold:
-            logger.info(f"[Credits] User {user.id} balance ${user.credit_balance:.2f} below threshold ${user.auto_recharge_threshold:.2f}")
+        if user.auto_recharge_enabled and balance_after < user.auto_recharge_threshold:
+            logger.info(f"[Credits] User {user_id} balance ${balance_after:.2f} below threshold ${user.auto_recharge_threshold:.2f}")
             trigger_auto_recharge(user, db)
 
         return True
     except Exception as e:
-        logger.error(f"[Credits] Error deducting credits for user {user.id}: {e}")
+        logger.error(f"[Credits] Error deducting credits for user {user_id}: {e}")
         db.session.rollback()
         return False
 
 
-def refund_credits(user, db, reason: str = "Article generation failed") -> bool:
+def refund_credits(user, db, reason: str = "Article generation failed",
+                   idempotency_key: Optional[str] = None) -> bool:
     """
     Refund article cost if generation fails
 
@@ -187,43 +265,33 @@ def refund_credits(user, db, reason: str = "Article generation failed") -> bool:
         user: User model instance
         db: SQLAlchemy database instance
         reason: Reason for refund
+        idempotency_key: A refund already recorded under this key is not repeated
 
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if refunded (or already refunded under idempotency_key), False otherwise
     """
-    from app_v3 import CreditTransaction
-
+    user_id = user.id
     try:
-        # Handle legacy users with NULL fields
-        if user.credit_balance is None:
-            user.credit_balance = 0
-        if user.total_articles_generated is None:
-            user.total_articles_generated = 0
-        if user.total_spent is None:
-            user.total_spent = 0.00
-
-        # Convert float to int
-        if isinstance(user.credit_balance, float):
-            user.credit_balance = int(user.credit_balance)
-
-        user.credit_balance += ARTICLE_COST  # Add back 1 credit
-        user.total_articles_generated -= 1  # Reverse the increment
-
-        # Log refund transaction
-        transaction = CreditTransaction(
-            user_id=user.id,
+        if _already_recorded(idempotency_key):
+            logger.info(f"[Credits] Refund {idempotency_key} of user {user_id} already recorded")
+            return True
+
+        balance_after, _ = _change_balance(user_id, db, ARTICLE_COST, articles=-1)  # Reverse the increment
+        if not _append_transaction(
+            db,
+            user_id=user_id,
             amount=ARTICLE_COST,  # +1 credit
             transaction_type='refund',
-            balance_after=user.credit_balance,
-            description=f'Refund: {reason}'
-        )
-        db.session.add(transaction)
-        db.session.commit()
+            balance_after=balance_after,
+            description=f'Refund: {reason}',
+            idempotency_key=idempotency_key
+        ):
+            return False
 
-        logger.info(f"[Credits] Refunded {ARTICLE_COST} credit to user {user.id}. New balance: {user.credit_balance} credits")
+        logger.info(f"[Credits] Refunded {ARTICLE_COST} credit to user {user_id}. New balance: {balance_after} credits")
         return True
     except Exception as e:
-        logger.error(f"[Credits] Error refunding credits for user {user.id}: {e}")
+        logger.error(f"[Credits] Error refunding credits for user {user_id}: {e}")
         db.session.rollback()
         return False
 
@@ -236,7 +304,6 @@ def trigger_auto_recharge(user, db):
         user: User model instance
         db: SQLAlchemy database instance
     """
-    from app_v3 import CreditTransaction
     from email_notification import send_email_notification
 
     try:
@@ -270,19 +337,20 @@ def trigger_auto_recharge(user, db):
 
         if intent.status == 'succeeded':
             # Add credits
-            user.credit_balance += user.auto_recharge_amount
+            balance_after, _ = _change_balance(user.id, db, user.auto_recharge_amount)
 
             # Log transaction
-            transaction = CreditTransaction(
+            if not _append_transaction(
+                db,
                 user_id=user.id,
                 amount=user.auto_recharge_amount,
                 transaction_type='auto_recharge',
                 stripe_payment_intent_id=intent.id,
-                balance_after=user.credit_balance,
-                description=f'Auto-recharge ${user.auto_recharge_amount:.2f}'
-            )
-            db.session.add(transaction)
-            db.session.commit()
+                balance_after=balance_after,
+                description=f'Auto-recharge ${user.auto_recharge_amount:.2f}',
+                idempotency_key=f'stripe:{intent.id}'
+            ):
+                return
 
             logger.info(f"[Auto-Recharge] Successfully added ${user.auto_recharge_amount} to user {user.id}")
 
@@ -291,7 +359,7 @@ def trigger_auto_recharge(user, db):
                 send_email_notification(
                     user.email,
                     "Auto-Recharge Successful",
-                    f"Your account was automatically recharged with ${user.auto_recharge_amount:.2f}. New balance: ${user.credit_balance:.2f}"
+                    f"Your account was automatically recharged with ${user.auto_recharge_amount:.2f}. New balance: ${balance_after:.2f}"
                 )
             except Exception as email_error:
                 logger.error(f"[Auto-Recharge] Email notification failed: {email_error}")
@@ -316,6 +384,9 @@ def add_credits_manual(user_id: int, purchase_amount: float, payment_intent_id:
     """
     Add credits after successful manual purchase using tiered pricing
 
+    The payment intent is the idempotency key: a payment delivered twice
+    (e.g. concurrent webhook retries) is credited once.
+
     Args:
         user_id: User ID
         purchase_amount: Dollar amount of purchase (e.g., 25.00, 100.00, 500.00)
@@ -323,13 +394,12 @@ def add_credits_manual(user_id: int, purchase_amount: float, payment_intent_id:
         db: SQLAlchemy database instance
 
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if credited by this call, False otherwise (including already credited)
     """
-    from app_v3 import User, CreditTransaction
+    from app_v3 import User
 
     try:
-        user = User.query.get(user_id)
-        if not user:
+        if not User.query.get(user_id):
             logger.error(f"[Credits] User {user_id} not found")
             return False
 
@@ -340,32 +410,30 @@ def add_credits_manual(user_id: int, purchase_amount: float, payment_intent_id:
             logger.error(f"[Credits] Purchase amount ${purchase_amount:.2f} below minimum ${MIN_PURCHASE:.2f}")
             return False
 
-        # Convert float to int if needed
-        if isinstance(user.credit_balance, float):
-            user.credit_balance = int(user.credit_balance)
-
-        user.credit_balance += credits_to_add
+        idempotency_key = f'stripe:{payment_intent_id}'
+        if _already_recorded(idempotency_key):
+            logger.warning(f"[Credits] Payment {payment_intent_id} already credited to user {user_id}")
+            return False
 
         # Update total spent (in dollars for accounting)
-        if user.total_spent is None:
-            user.total_spent = 0.00
-        user.total_spent += purchase_amount
+        balance_after, _ = _change_balance(user_id, db, credits_to_add, spent=purchase_amount)
 
         # Get price per article for this tier
         price_per_article = get_price_per_article(purchase_amount)
 
-        transaction = CreditTransaction(
+        if not _append_transaction(
+            db,
             user_id=user_id,
             amount=credits_to_add,  # Store credits, not dollars
             transaction_type='purchase',
             stripe_payment_intent_id=payment_intent_id,
-            balance_after=user.credit_balance,
-            description=f'Purchased {credits_to_add} credits for ${purchase_amount:.2f} (${price_per_article:.2f}/article)'
-        )
-        db.session.add(transaction)
-        db.session.commit()
+            balance_after=balance_after,
+            description=f'Purchased {credits_to_add} credits for ${purchase_amount:.2f} (${price_per_article:.2f}/article)',
+            idempotency_key=idempotency_key
+        ):
+            return False
 
-        logger.info(f"[Credits] Added {credits_to_add} credits to user {user_id} (${purchase_amount:.2f} at ${price_per_article:.2f}/article). New balance: {user.credit_balance} credits")
+        logger.info(f"[Credits] Added {credits_to_add} credits to user {user_id} (${purchase_amount:.2f} at ${price_per_article:.2f}/article). New balance: {balance_after} credits")
         return True
     except Exception as e:
         logger.error(f"[Credits] Error adding credits to user {user_id}: {e}")
@@ -384,36 +452,32 @@ def add_welcome_credit(user_id: int, db) -> bool:
     Returns:
         bool: True if successful, False otherwise
     """
-    from app_v3 import User, CreditTransaction
+    from app_v3 import User
 
     try:
-        user = User.query.get(user_id)
-        if not user:
+        if not User.query.get(user_id):
             logger.error(f"[Credits] User {user_id} not found")
             return False
 
         # Check if welcome credit already given
-        existing_welcome = CreditTransaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='welcome'
-        ).first()
-
-        if existing_welcome:
+        idempotency_key = f'welcome:{user_id}'
+        if _already_recorded(idempotency_key):
             logger.warning(f"[Credits] User {user_id} already received welcome credit")
             return False
 
         # Add welcome credits (3 free articles)
-        user.credit_balance = WELCOME_CREDIT
+        balance_after, _ = _change_balance(user_id, db, WELCOME_CREDIT)
 
-        transaction = CreditTransaction(
+        if not _append_transaction(
+            db,
             user_id=user_id,
             amount=WELCOME_CREDIT,  # 3 credits
             transaction_type='welcome',
-            balance_after=WELCOME_CREDIT,
-            description=f'Welcome bonus: {WELCOME_CREDIT} free credits'
-        )
-        db.session.add(transaction)
-        db.session.commit()
+            balance_after=balance_after,
+            description=f'Welcome bonus: {WELCOME_CREDIT} free credits',
+            idempotency_key=idempotency_key
+        ):
+            return False
 
         logger.info(f"[Credits] Added {WELCOME_CREDIT} welcome credits to user {user_id}")
         return True
@@ -0,0 +1,107 @@
+"""
+deadline_executor.py - Earliest-Deadline-First Thread Pool
+
+The scheduler starts articles ahead of their slots. When more are waiting
+than there are workers, a FIFO pool runs them in submission order, so an
+article claimed early for a 9:30 slot can hold up one due at 9:05.
+EarliestDeadlineExecutor always starts the queued task whose deadline is
+nearest; tasks with equal deadlines run in submission order.
+
+    pool = EarliestDeadlineExecutor(max_workers=4)
+    future = pool.submit(due_at, run_article, user_id)
+"""
+
+import queue
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+class EarliestDeadlineExecutor:
+    """
+    Fixed-size thread pool whose queue is ordered by deadline.
+
+    Workers are started on demand, up to max_workers. Deadlines may be any
+    mutually comparable values (the scheduler uses naive UTC datetimes).
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "edf-worker"):
+        self.max_workers = max(max_workers, 1)
+        self.thread_name_prefix = thread_name_prefix
+        # Entries are (0, deadline, seq, future, fn, args, kwargs) for tasks and
+        # (1, seq) for the shutdown sentinels, which sort after every task
+        self._queue: "queue.PriorityQueue[tuple]" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._pending = 0  # Queued plus running
+
+    def submit(self, deadline: Any, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        """
+        Queue fn(*args, **kwargs) to run before any task with a later deadline.
+
+        Returns:
+            Future of the call's result
+
+        Raises:
+            RuntimeError if the executor has been shut down
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            self._queue.put((0, deadline, next(self._sequence), future, fn, args, kwargs))
+            self._pending += 1
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name=f"{self.thread_name_prefix}_{len(self._threads)}")
+                self._threads.append(thread)
+                thread.start()
+        return future
+
+    def pending(self) -> int:
+        """Tasks queued or running."""
+        with self._lock:
+            return self._pending
+
+    def idle_workers(self) -> int:
+        """Workers that would start a task submitted now."""
+        return max(self.max_workers - self.pending(), 0)
+
+    def _work(self) -> None:
+        while True:
+            entry = self._queue.get()
+            if entry[0] == 1:
+                return
+            _, _, _, future, fn, args, kwargs = entry
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop accepting tasks; queued tasks still run before the workers exit.
+
+        Args:
+            wait: Block until every queued and running task has finished
+        """
+        with self._lock:
+            threads = list(self._threads)
+            if not self._shutdown:
+                self._shutdown = True
+                for _ in threads:
+                    self._queue.put((1, next(self._sequence)))
+        if wait:
+            for thread in threads:
+                thread.join()
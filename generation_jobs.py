@@ -0,0 +1,377 @@
+"""
+generation_jobs.py - Persistent Article Generation Job Queue
+
+/api/create_test_post no longer runs the multi-minute V4 pipeline inside a
+gunicorn worker. It inserts a row into the generation_jobs table and returns
+the job id; generation_worker.py processes pick jobs up from the table.
+
+Job lifecycle:
+    queued -> running -> succeeded
+                      -> failed -> queued (resumed)
+
+Credits follow the job state:
+- Queued:    credit deducted (credit_status 'charged')
+- Succeeded: credit kept     (credit_status 'consumed')
+- Failed:    credit refunded (credit_status 'refunded')
+
+A resumed job keeps its id, which is also the pipeline checkpoint run_id
+(see pipeline_checkpoints.py), so it restarts at the first stage the failed
+attempt did not finish. Resuming starts the job's next attempt and charges
+the credit again.
+
+Every transition is a conditional UPDATE on the current status, so two
+workers can never claim the same job and a job is refunded at most once.
+
+A worker renews the heartbeat of its running job every
+GENERATION_HEARTBEAT_SECONDS. Only a job whose heartbeat is older than
+GENERATION_JOB_TIMEOUT is failed as abandoned - a slow pipeline (Replicate
+queueing, WordPress retries) keeps its job however long it takes.
+"""
+
+import os
+import uuid
+import socket
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+CREDIT_NONE = 'none'
+CREDIT_CHARGED = 'charged'
+CREDIT_CONSUMED = 'consumed'
+CREDIT_REFUNDED = 'refunded'
+
+# A running job whose heartbeat is older than this belongs to a dead worker
+JOB_HEARTBEAT_SECONDS = int(os.getenv('GENERATION_HEARTBEAT_SECONDS', '30'))
+JOB_TIMEOUT_SECONDS = int(os.getenv('GENERATION_JOB_TIMEOUT', '180'))
+CLAIM_BATCH_SIZE = 5
+
+
+def default_worker_id() -> str:
+    """Worker identity stored on claimed jobs (host:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def job_to_dict(job) -> Dict[str, Any]:
+    """
+    Serialize a GenerationJob for the status endpoint.
+
+    Args:
+        job: GenerationJob model instance
+
+    Returns:
+        Dict with id, status, timestamps and error (result is served separately)
+    """
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "mode": "local" if (job.params or {}).get("local_mode") else "wordpress",
+        "credit_status": job.credit_status,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "result_url": f"/api/jobs/{job.id}/result"
+    }
+
+
+def enqueue_generation_job(user, params: Dict[str, Any]) -> Tuple[Optional[Any], Optional[str]]:
+    """
+    Queue an article generation job and deduct its credit.
+
+    The job row and the credit transaction are committed together, so a
+    queued job always has its credit charged.
+
+    Args:
+        user: User model instance (caller has already checked credits)
+        params: Job parameters (blog_post_idea, system_prompt, writing_style, local_mode)
+
+    Returns:
+        Tuple of (job, error_message)
+    """
+    from app_v3 import db, GenerationJob
+    from credit_system import deduct_credits
+
+    job = GenerationJob(
+        id=uuid.uuid4().hex,
+        user_id=user.id,
+        status=JOB_QUEUED,
+        params=params,
+        credit_status=CREDIT_CHARGED,
+        attempt=1
+    )
+    db.session.add(job)
+
+    # deduct_credits() commits the session - job and transaction land together
+    if not deduct_credits(user, db, idempotency_key=_credit_key(job.id, "charge", 1)):
+        logger.error(f"[Jobs] Failed to deduct credits for user {user.id}")
+        return None, "Credit processing error. Please try again."
+
+    logger.info(f"[Jobs] Queued generation job {job.id} for user {user.id}")
+    return job, None
+
+
+def _transition(job_id: str, from_status: str, to_status: str, **fields: Any) -> bool:
+    """
+    Move a job between states only if it is still in from_status.
+
+    Returns:
+        True if this caller performed the transition
+    """
+    from app_v3 import db, GenerationJob
+
+    updated = GenerationJob.query.filter_by(id=job_id, status=from_status).update(  # type: ignore[attr-defined]
+        dict(status=to_status, **fields),
+        synchronize_session=False
+    )
+    db.session.commit()
+    return updated == 1
+
+
+def _credit_key(job_id: str, kind: str, attempt: int) -> str:
+    """
+    Ledger idempotency key of a job attempt's charge or refund.
+
+    Each resume starts a new attempt (GenerationJob.attempt) that is
+    charged (and maybe refunded) again: job:<id>:charge:1,
+    job:<id>:refund:1, job:<id>:charge:2, ... A retried change of the same
+    attempt reuses its key, so it is applied once.
+    """
+    return f"job:{job_id}:{kind}:{attempt}"
+
+
+def _settle_credit(job_id: str, user_id: int, attempt: int, to_credit_status: str, reason: str = "") -> bool:
+    """
+    Consume or refund the credit held by a job, exactly once.
+
+    A refund's credit_status change and its ledger row are committed in
+    one transaction, so a job is never marked refunded without the credit
+    being back on the user's balance.
+
+    Returns:
+        True if the credit changed state
+    """
+    from app_v3 import db, GenerationJob, User
+    from credit_system import refund_credits
+
+    updated = GenerationJob.query.filter_by(id=job_id, credit_status=CREDIT_CHARGED).update(  # type: ignore[attr-defined]
+        {"credit_status": to_credit_status},
+        synchronize_session=False
+    )
+    if updated != 1:
+        db.session.rollback()
+        return False
+
+    if to_credit_status == CREDIT_REFUNDED:
+        user = User.query.get(user_id)  # type: ignore[attr-defined]
+        # refund_credits() commits the session - status change and refund land together
+        if user and not refund_credits(user, db, reason=reason, idempotency_key=_credit_key(job_id, "refund", attempt)):
+            db.session.rollback()
+            logger.error(f"[Jobs] Refund of job {job_id} failed - credit left charged")
+            return False
+
+    db.session.commit()
+    return True
+
+
+def claim_next_job(worker_id: Optional[str] = None) -> Optional[str]:
+    """
+    Claim the oldest queued job for this worker.
+
+    Must be called inside an application context.
+
+    Returns:
+        Job ID, or None if the queue is empty
+    """
+    from app_v3 import GenerationJob
+
+    worker_id = worker_id or default_worker_id()
+    candidates = (
+        GenerationJob.query  # type: ignore[attr-defined]
+        .filter_by(status=JOB_QUEUED)
+        .order_by(GenerationJob.created_at)
+        .with_entities(GenerationJob.id)
+        .limit(CLAIM_BATCH_SIZE)
+        .all()
+    )
+
+    for (job_id,) in candidates:
+        now = datetime.utcnow()
+        if _transition(job_id, JOB_QUEUED, JOB_RUNNING, worker_id=worker_id, started_at=now, heartbeat_at=now):
+            logger.info(f"[Jobs] Worker {worker_id} claimed job {job_id}")
+            return job_id
+    return None
+
+
+def renew_heartbeats(worker_id: str) -> int:
+    """
+    Heartbeat: mark every job worker_id is running as alive, in one UPDATE.
+
+    Must be called inside an application context.
+
+    Returns:
+        Number of jobs renewed
+    """
+    from app_v3 import db, GenerationJob
+
+    renewed = GenerationJob.query.filter_by(worker_id=worker_id, status=JOB_RUNNING).update(  # type: ignore[attr-defined]
+        {"heartbeat_at": datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return renewed
+
+
+def complete_job(job_id: str, result: Dict[str, Any]) -> bool:
+    """Mark a running job succeeded, consume its credit and drop its checkpoints."""
+    from app_v3 import GenerationJob
+    from pipeline_checkpoints import CheckpointStore
+
+    if not _transition(job_id, JOB_RUNNING, JOB_SUCCEEDED, result=result, finished_at=datetime.utcnow()):
+        logger.warning(f"[Jobs] Job {job_id} was no longer running - result discarded")
+        return False
+
+    job = GenerationJob.query.get(job_id)  # type: ignore[attr-defined]
+    _settle_credit(job_id, job.user_id, job.attempt, CREDIT_CONSUMED)
+    CheckpointStore(job_id).clear()
+    logger.info(f"[Jobs] Job {job_id} succeeded")
+    return True
+
+
+def fail_job(job_id: str, error: str, from_status: str = JOB_RUNNING) -> bool:
+    """Mark a job failed and refund its credit."""
+    from app_v3 import GenerationJob
+
+    if not _transition(job_id, from_status, JOB_FAILED, error=error, finished_at=datetime.utcnow()):
+        return False
+
+    job = GenerationJob.query.get(job_id)  # type: ignore[attr-defined]
+    _settle_credit(job_id, job.user_id, job.attempt, CREDIT_REFUNDED, reason=f"Article generation failed: {error[:100]}")
+    logger.error(f"[Jobs] Job {job_id} failed: {error}")
+    return True
+
+
+def requeue_failed_job(job, user) -> Optional[str]:
+    """
+    Put a failed job back in the queue as its next attempt and charge its credit again.
+
+    The job keeps its id, so its pipeline checkpoints are reused.
+
+    Args:
+        job: Failed GenerationJob model instance
+        user: Job owner (caller has already checked credits)
+
+    Returns:
+        Error message, or None if the job was re-queued
+    """
+    from app_v3 import db, GenerationJob
+    from credit_system import deduct_credits
+
+    updated = GenerationJob.query.filter_by(id=job.id, status=JOB_FAILED).update(  # type: ignore[attr-defined]
+        {
+            "status": JOB_QUEUED,
+            "credit_status": CREDIT_CHARGED,
+            "attempt": GenerationJob.attempt + 1,
+            "error": None,
+            "result": None,
+            "worker_id": None,
+            "started_at": None,
+            "heartbeat_at": None,
+            "finished_at": None
+        },
+        synchronize_session=False
+    )
+    if updated != 1:
+        db.session.rollback()
+        return "Only failed jobs can be resumed"
+
+    attempt = db.session.query(GenerationJob.attempt).filter_by(id=job.id).scalar()
+    # deduct_credits() commits the session - re-queue and charge land together
+    if not deduct_credits(user, db, idempotency_key=_credit_key(job.id, "charge", attempt)):
+        db.session.rollback()
+        logger.error(f"[Jobs] Failed to deduct credits for user {user.id}")
+        return "Credit processing error. Please try again."
+
+    db.session.refresh(job)
+    logger.info(f"[Jobs] Re-queued failed job {job.id} for user {user.id}")
+    return None
+
+
+def run_generation_job(job_id: str) -> bool:
+    """
+    Run a claimed job through the article pipeline and record the outcome.
+
+    Must be called inside an application context.
+
+    Returns:
+        True if the job succeeded
+    """
+    from app_v3 import GenerationJob
+    from pipeline_metrics import collect_run_metrics
+    import app_v3
+
+    job = GenerationJob.query.get(job_id)  # type: ignore[attr-defined]
+    if not job or job.status != JOB_RUNNING:
+        logger.warning(f"[Jobs] Job {job_id} is not running - skipping")
+        return False
+
+    logger.info(f"[Jobs] Running job {job_id} for user {job.user_id}")
+    with collect_run_metrics(job.user_id, run_id=job_id) as metrics:
+        try:
+            result, error = app_v3.run_test_post_generation(job.user_id, job.params or {}, run_id=job_id)
+        except Exception as e:
+            logger.error(f"[Jobs] Job {job_id} raised: {e}", exc_info=True)
+            result, error = None, f"An unexpected error occurred: {str(e)}"
+        if result and not error:
+            metrics.status = "succeeded"
+
+    if error or not result:
+        fail_job(job_id, error or "Failed to create the test post.")
+        return False
+    return complete_job(job_id, result)
+
+
+def recover_stale_jobs(timeout_seconds: int = JOB_TIMEOUT_SECONDS) -> int:
+    """
+    Fail (and refund) running jobs whose worker stopped heartbeating, and
+    refund failed jobs whose refund did not go through.
+
+    Must be called inside an application context.
+
+    Returns:
+        Number of jobs recovered
+    """
+    from app_v3 import GenerationJob
+
+    unrefunded = (
+        GenerationJob.query  # type: ignore[attr-defined]
+        .filter_by(status=JOB_FAILED, credit_status=CREDIT_CHARGED)
+        .with_entities(GenerationJob.id, GenerationJob.user_id, GenerationJob.attempt, GenerationJob.error)
+        .all()
+    )
+    for job_id, user_id, attempt, error in unrefunded:
+        if _settle_credit(job_id, user_id, attempt, CREDIT_REFUNDED,
+                          reason=f"Article generation failed: {(error or '')[:100]}"):
+            logger.warning(f"[Jobs] Refunded failed job {job_id} on retry")
+
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout_seconds)
+    stale = (
+        GenerationJob.query  # type: ignore[attr-defined]
+        .filter(GenerationJob.status == JOB_RUNNING, GenerationJob.heartbeat_at < cutoff)
+        .with_entities(GenerationJob.id)
+        .all()
+    )
+
+    recovered = sum(
+        1 for (job_id,) in stale
+        if fail_job(job_id, "Generation timed out - worker stopped responding")
+    )
+    if recovered:
+        logger.warning(f"[Jobs] Recovered {recovered} stale running jobs")
+    return recovered
@@ -0,0 +1,150 @@
+"""
+EZWAI SMM Generation Worker Pool
+Processes queued article generation jobs (see generation_jobs.py) outside
+the gunicorn web workers.
+
+The supervisor starts GENERATION_WORKERS worker processes, restarts any
+that die, and periodically fails + refunds jobs whose worker stopped
+heartbeating and removes Replicate webhook completions nobody consumed.
+Each worker process runs one pipeline at a time.
+
+Run with: python generation_worker.py [--workers N]
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+import argparse
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv('GENERATION_WORKERS', '2'))
+POLL_INTERVAL_SECONDS = float(os.getenv('GENERATION_POLL_INTERVAL', '2'))
+RECOVERY_INTERVAL_SECONDS = 60
+
+
+def heartbeat_loop(worker_id: str, stop_event) -> None:
+    """Renew the heartbeat of this worker's running job until stop_event is set."""
+    from app_v3 import app
+    from generation_jobs import renew_heartbeats, JOB_HEARTBEAT_SECONDS
+
+    while not stop_event.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            with app.app_context():
+                renew_heartbeats(worker_id)
+        except Exception as e:
+            logger.error(f"[Worker] {worker_id} heartbeat failed: {e}")
+
+
+def worker_loop(stop_event) -> None:
+    """
+    Claim and run jobs until stop_event is set.
+
+    Runs in a child process - imports the app here so each process gets its
+    own database engine and connection pool.
+    """
+    from app_v3 import app
+    from generation_jobs import claim_next_job, run_generation_job, default_worker_id
+
+    # Ctrl+C / group signals reach every process - let the supervisor decide.
+    # A worker killed mid-wait would leave stop_event's lock held forever.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    worker_id = default_worker_id()
+    logger.info(f"[Worker] {worker_id} started")
+
+    # Own event: the pipeline thread may be mid-job when stop_event is set
+    heartbeat_stop = threading.Event()
+    threading.Thread(target=heartbeat_loop, args=(worker_id, heartbeat_stop), daemon=True,
+                     name="job-heartbeat").start()
+
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                job_id = claim_next_job(worker_id)
+                if job_id:
+                    run_generation_job(job_id)
+                    continue
+        except Exception as e:
+            logger.error(f"[Worker] {worker_id} error: {e}", exc_info=True)
+
+        stop_event.wait(POLL_INTERVAL_SECONDS)
+
+    heartbeat_stop.set()
+    logger.info(f"[Worker] {worker_id} stopped")
+
+
+def recover_stale_jobs() -> None:
+    """Fail and refund jobs abandoned by crashed workers, drop expired checkpoints and webhook completions."""
+    from app_v3 import app
+    from generation_jobs import recover_stale_jobs as _recover
+    from pipeline_checkpoints import cleanup_checkpoints
+    from replicate_completion import cleanup_completions
+
+    try:
+        with app.app_context():
+            _recover()
+            cleanup_checkpoints()
+            cleanup_completions()
+    except Exception as e:
+        logger.error(f"[Supervisor] Stale job recovery failed: {e}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="EZWAI SMM article generation worker pool")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Number of worker processes")
+    args = parser.parse_args()
+
+    # spawn: children must not inherit the supervisor's DB connections
+    ctx = multiprocessing.get_context('spawn')
+    stop_event = ctx.Event()
+    shutdown_requested = []
+
+    def _shutdown(signum, frame):
+        # Only flag here - stop_event's lock may be held by the interrupted wait
+        shutdown_requested.append(signum)
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    def _start(index: int):
+        process = ctx.Process(target=worker_loop, args=(stop_event,), name=f"generation-worker-{index}")
+        process.start()
+        return process
+
+    logger.info(f"[Supervisor] Starting {args.workers} generation workers")
+    workers = [_start(i) for i in range(args.workers)]
+    next_recovery = 0.0
+
+    while not shutdown_requested:
+        for i, process in enumerate(workers):
+            if not process.is_alive():
+                logger.warning(f"[Supervisor] {process.name} exited with code {process.exitcode} - restarting")
+                workers[i] = _start(i)
+
+        if time.monotonic() >= next_recovery:
+            recover_stale_jobs()
+            next_recovery = time.monotonic() + RECOVERY_INTERVAL_SECONDS
+
+        time.sleep(1)
+
+    logger.info(f"[Supervisor] Signal {shutdown_requested[0]} received - stopping workers")
+    stop_event.set()
+
+    # Running pipelines finish their current job before exiting
+    for process in workers:
+        process.join()
+    logger.info("[Supervisor] All workers stopped")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
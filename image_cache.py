@@ -0,0 +1,313 @@
+"""
+image_cache.py - Content-Addressed On-Disk Image Store
+
+Every component that needs image bytes - WordPress persistence, the
+featured image of create_wordpress_post, local-mode base64 embedding -
+reads them through this store, so an image is fetched from the network
+once per article instead of once per component, and no component writes
+its own temp files.
+
+Layout under IMAGE_CACHE_DIR:
+    blobs/<aa>/<sha256>.<ext>   image bytes, named by content hash
+    urls/<sha256 of url>        name of the blob the URL resolved to
+
+Identical bytes behind different URLs (e.g. a Replicate URL and the
+WordPress source_url the optimized copy was uploaded to) share one blob.
+The store is bounded by IMAGE_CACHE_MAX_MB: blob mtimes are touched on
+every read and the least recently used blobs are evicted first. Files are
+written atomically, so worker processes can share the directory.
+"""
+
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import requests
+
+from pipeline_metrics import record_bytes
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ezwai_image_cache'))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_MB', '512')) * 1024 * 1024
+DOWNLOAD_TIMEOUT = 30
+
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+CONTENT_TYPES = {ext: content_type for content_type, ext in EXTENSIONS.items()}
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class ImageCache:
+    """
+    Size-bounded, content-addressed image store shared by all pipeline stages.
+
+    Thread-safe; concurrent fetches of the same URL in one process share a
+    single download.
+    """
+
+    def __init__(self, root: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._blob_dir = os.path.join(root, 'blobs')
+        self._url_dir = os.path.join(root, 'urls')
+        os.makedirs(self._blob_dir, exist_ok=True)
+        os.makedirs(self._url_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self._size = sum(size for _, size, _ in self._scan_blobs())
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def path(self, url: str) -> Optional[str]:
+        """
+        Local file holding the image behind url, or None if not cached.
+
+        The file name carries the image extension, so it can be handed to
+        uploaders that derive the MIME type from it. Marks the blob as
+        recently used.
+        """
+        url_file = os.path.join(self._url_dir, _url_key(url))
+        try:
+            with open(url_file, 'r') as fh:
+                blob_name = fh.read().strip()
+        except OSError:
+            return None
+
+        blob_path = self._blob_path(blob_name)
+        try:
+            os.utime(blob_path)  # LRU: last use = mtime
+        except OSError:
+            # Blob was evicted (possibly by another process) - drop the stale mapping
+            self._remove(url_file)
+            return None
+        return blob_path
+
+    def get(self, url: str) -> Optional[Tuple[bytes, str]]:
+        """
+        Cached image behind url.
+
+        Returns:
+            (image bytes, content type), or None if not cached
+        """
+        blob_path = self.path(url)
+        if blob_path is None:
+            return None
+        try:
+            with open(blob_path, 'rb') as fh:
+                data = fh.read()
+        except OSError:
+            return None
+        return data, CONTENT_TYPES.get(blob_path.rsplit('.', 1)[-1], 'image/jpeg')
+
+    # ------------------------------------------------------------------
+    # Store
+    # ------------------------------------------------------------------
+
+    def put(self, data: bytes, content_type: str = 'image/jpeg', urls: Iterable[str] = ()) -> str:
+        """
+        Store image bytes and point urls at them.
+
+        Storing bytes that are already cached only adds the URL mappings.
+
+        Args:
+            data: Encoded image
+            content_type: MIME type of data (sets the blob extension)
+            urls: URLs that resolve to these bytes
+
+        Returns:
+            Local path of the blob
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        extension = EXTENSIONS.get(content_type.split(';')[0].strip().lower(), 'jpg')
+        blob_name = f"{digest}.{extension}"
+        blob_path = self._blob_path(blob_name)
+
+        if os.path.exists(blob_path):
+            os.utime(blob_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            self._write_atomic(blob_path, data)
+            with self._lock:
+                self._size += len(data)
+
+        for url in urls:
+            self._write_atomic(os.path.join(self._url_dir, _url_key(url)), blob_name.encode('utf-8'))
+
+        if self._size > self.max_bytes:
+            self.evict()
+        return blob_path
+
+    def fetch(self, url: str, timeout: int = DOWNLOAD_TIMEOUT) -> Tuple[bytes, str]:
+        """
+        Image behind url, downloading it only if it is not cached yet.
+
+        Raises:
+            requests.exceptions.RequestException if the download fails
+
+        Returns:
+            (image bytes, content type)
+        """
+        cached = self.get(url)
+        if cached is not None:
+            self._count_hit(url)
+            return cached
+
+        with self._url_lock(url):
+            try:
+                # Another thread may have downloaded it while we waited
+                cached = self.get(url)
+                if cached is not None:
+                    self._count_hit(url)
+                    return cached
+
+                response = requests.get(url, timeout=timeout)
+                response.raise_for_status()
+                data = response.content
+                content_type = response.headers.get('Content-Type', 'image/jpeg')
+                record_bytes(downloaded=len(data))
+                with self._lock:
+                    self.misses += 1
+
+                try:
+                    self.put(data, content_type, urls=[url])
+                except OSError as e:
+                    logger.warning(f"[ImageCache] Could not store {url[:80]}: {e}")
+                logger.info(f"[ImageCache] Downloaded {len(data) / 1024:.1f} KB from {url[:80]}")
+                return data, content_type
+            finally:
+                with self._lock:
+                    self._url_locks.pop(url, None)  # Later callers find the blob instead
+
+    # ------------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------------
+
+    def evict(self) -> int:
+        """
+        Delete least recently used blobs until the store fits in max_bytes.
+
+        Rescans the directory first, so blobs written by other processes
+        are counted too.
+
+        Returns:
+            Number of blobs deleted
+        """
+        with self._lock:
+            blobs = sorted(self._scan_blobs(), key=lambda blob: blob[2])  # Oldest mtime first
+            total = sum(size for _, size, _ in blobs)
+            evicted = 0
+            for blob_path, size, _ in blobs:
+                if total <= self.max_bytes:
+                    break
+                if self._remove(blob_path):
+                    total -= size
+                    evicted += 1
+            self._size = total
+
+        if evicted:
+            self._prune_urls()
+            logger.info(f"[ImageCache] Evicted {evicted} images, {total / 1024 / 1024:.1f} MB cached")
+        return evicted
+
+    def _prune_urls(self) -> None:
+        """Drop URL mappings whose blob was evicted."""
+        for name in os.listdir(self._url_dir):
+            url_file = os.path.join(self._url_dir, name)
+            try:
+                with open(url_file, 'r') as fh:
+                    blob_name = fh.read().strip()
+            except OSError:
+                continue
+            if not os.path.exists(self._blob_path(blob_name)):
+                self._remove(url_file)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _blob_path(self, blob_name: str) -> str:
+        return os.path.join(self._blob_dir, blob_name[:2], blob_name)
+
+    def _scan_blobs(self):
+        """(path, size, mtime) of every blob."""
+        for shard in os.listdir(self._blob_dir):
+            shard_dir = os.path.join(self._blob_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.startswith('.'):
+                    continue  # In-progress atomic write
+                try:
+                    stat = os.stat(os.path.join(shard_dir, name))
+                except OSError:
+                    continue
+                yield os.path.join(shard_dir, name), stat.st_size, stat.st_mtime
+
+    def _url_lock(self, url: str) -> threading.Lock:
+        with self._lock:
+            lock = self._url_locks.get(url)
+            if lock is None:
+                lock = threading.Lock()
+                self._url_locks[url] = lock
+            return lock
+
+    def _count_hit(self, url: str) -> None:
+        with self._lock:
+            self.hits += 1
+        logger.info(f"[ImageCache] Hit for {url[:80]}")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            ImageCache._remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+_cache: Optional[ImageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Process-wide image cache, created on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
+
+
+def fetch_image(url: str) -> Tuple[bytes, str]:
+    """
+    Image bytes behind url, from the cache or (once) from the network.
+
+    Raises:
+        requests.exceptions.RequestException if the download fails
+
+    Returns:
+        (image bytes, content type)
+    """
+    return get_image_cache().fetch(url)
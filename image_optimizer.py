@@ -0,0 +1,153 @@
+"""
+image_optimizer.py - Display-sized image variants
+
+SeeDream returns ~2K JPEGs at quality 90. Articles never display them that
+large, so before an image is embedded (local mode) or uploaded (WordPress)
+it is downscaled to the width it is shown at and re-encoded at a web
+quality. Smaller images shrink the base64 HTML stored in the articles
+table, the SendGrid attachment and the published page weight.
+
+Encoding is CPU-bound and holds the GIL, so it runs in a shared process
+pool; callers are the download/upload worker threads.
+"""
+
+import os
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from pipeline_metrics import record_image_optimization
+
+logger = logging.getLogger(__name__)
+
+IMAGE_OPTIMIZATION_ENABLED = os.getenv('IMAGE_OPTIMIZATION', 'true').lower() not in ('0', 'false', 'no')
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'jpeg').lower()  # 'jpeg' or 'webp'
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '82'))
+HERO_MAX_WIDTH = int(os.getenv('HERO_IMAGE_MAX_WIDTH', '1600'))
+SECTION_MAX_WIDTH = int(os.getenv('SECTION_IMAGE_MAX_WIDTH', '1400'))
+IMAGE_OPTIMIZE_WORKERS = int(os.getenv('IMAGE_OPTIMIZE_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+CONTENT_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+FILE_EXTENSIONS = {"image/jpeg": "jpg", "image/webp": "webp", "image/png": "png"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def file_extension(content_type: str) -> str:
+    """Media library file extension for a Content-Type (defaults to jpg)."""
+    return FILE_EXTENSIONS.get(content_type.split(';')[0].strip().lower(), "jpg")
+
+
+def output_content_type(image_format: str = IMAGE_FORMAT) -> str:
+    """Content-Type of images written in image_format."""
+    return CONTENT_TYPES.get(image_format, "image/jpeg")
+
+
+def resize_and_encode(data: bytes, max_width: int, image_format: str, quality: int) -> Tuple[bytes, str]:
+    """
+    Downscale an image to max_width and re-encode it.
+
+    Runs in a pool process, so it only takes and returns picklable values.
+    The original bytes are returned when re-encoding would not make them
+    smaller (e.g. an already small image).
+
+    Args:
+        data: Encoded source image
+        max_width: Display width in pixels (height keeps the aspect ratio)
+        image_format: 'jpeg' or 'webp'
+        quality: Encoder quality (1-95)
+
+    Returns:
+        (image bytes, content type)
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        source_type = Image.MIME.get(image.format or "", "image/jpeg")
+        image.load()
+        if image.width > max_width:
+            height = max(1, round(image.height * max_width / image.width))
+            image = image.resize((max_width, height), Image.LANCZOS)
+
+        if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")  # JPEG has no alpha channel
+
+        out = io.BytesIO()
+        if image_format == "webp":
+            image.save(out, format="WEBP", quality=quality, method=4)
+        else:
+            image.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+
+    optimized = out.getvalue()
+    if len(optimized) >= len(data):
+        return data, source_type
+    return optimized, output_content_type(image_format)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Shared encoder pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_OPTIMIZE_WORKERS)
+        return _pool
+
+
+def _reset_pool() -> None:
+    """Drop a broken pool so the next call starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def optimize_image(
+    data: bytes,
+    max_width: int,
+    content_type: str = "image/jpeg",
+    image_format: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY
+) -> Tuple[bytes, str]:
+    """
+    Produce the display-sized variant of a downloaded image.
+
+    Never raises - if optimization is disabled or the image cannot be
+    decoded, the original bytes are returned unchanged. Byte savings are
+    recorded in the current metrics run.
+
+    Args:
+        data: Downloaded image bytes
+        max_width: Display width (HERO_MAX_WIDTH or SECTION_MAX_WIDTH)
+        content_type: Content-Type of data, returned if it is kept as-is
+        image_format: Output format (defaults to IMAGE_FORMAT)
+        quality: Output quality (defaults to IMAGE_QUALITY)
+
+    Returns:
+        (image bytes, content type)
+    """
+    if not IMAGE_OPTIMIZATION_ENABLED or not data:
+        return data, content_type
+
+    try:
+        try:
+            optimized, optimized_type = _get_pool().submit(
+                resize_and_encode, data, max_width, image_format, quality
+            ).result()
+        except BrokenProcessPool:
+            logger.warning("[ImageOpt] Process pool broken - encoding inline")
+            _reset_pool()
+            optimized, optimized_type = resize_and_encode(data, max_width, image_format, quality)
+    except Exception as e:
+        logger.error(f"[ImageOpt] Failed to optimize image, keeping original: {e}")
+        return data, content_type
+
+    record_image_optimization(original=len(data), optimized=len(optimized))
+    saved = 1 - len(optimized) / len(data)
+    logger.info(f"[ImageOpt] {len(data) / 1024:.1f} KB -> {len(optimized) / 1024:.1f} KB "
+                f"({saved:.0%} smaller, max width {max_width}px, {optimized_type})")
+    return optimized, optimized_type
@@ -7,30 +7,43 @@ Uses GPT-5-mini to understand content and create prompts that match each section
 KEY FEATURE: Image prompts are contextually aware - they know what each section discusses.
 """
 
-import os
 import re
 import json
+import time
 import logging
 from typing import Dict, List, Optional, Any
-from dotenv import load_dotenv
 from openai import OpenAI
+from job_settings import JobSettings, get_job_settings
+from pipeline_metrics import record_llm_call
+from provider_limits import provider_slot
 
 logger = logging.getLogger(__name__)
 
 
-def load_user_env(user_id: int) -> None:
-    """Load user-specific environment variables."""
-    env_file = f".env.user_{user_id}"
-    if os.path.exists(env_file):
-        load_dotenv(env_file, override=True)  # CRITICAL: Override existing env vars
+VISUAL_STYLE_GUIDANCE = {
+    "Conversational/Personal": "Use warm, relatable imagery - human subjects, everyday settings, emotional connections",
+    "Authoritative/Expert": "Use professional settings, expert subjects, data visualization, corporate/medical/scientific environments",
+    "Narrative/Storytelling": "Use story-driven scenes, human subjects in meaningful moments, cinematic compositions",
+    "Listicle/Scannable": "Use clear, simple imagery - icons, clean backgrounds, easily identifiable subjects",
+    "Investigative/Journalistic": "Use documentary-style imagery, revealing details, evidence-focused, journalistic realism",
+    "How-to/Instructional": "Use process-focused imagery, step-by-step visuals, instructional clarity",
+    "Opinion/Commentary": "Use thought-provoking imagery, conceptual visuals, metaphorical subjects",
+    "Humorous/Satirical": "Use playful imagery, unexpected juxtapositions, clever visual humor"
+}
 
 
-def _get_openai_client() -> OpenAI:
-    """Get OpenAI client with API key."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+def _style_guidance(writing_style: Optional[str]) -> str:
+    """Visual style guidance block for a writing style (empty if none)."""
+    if not writing_style:
+        return ""
+    return f"\n\nVISUAL STYLE GUIDANCE: {VISUAL_STYLE_GUIDANCE.get(writing_style, '')}"
+
+
+def _get_openai_client(settings: JobSettings) -> OpenAI:
+    """Get OpenAI client with the job's API key."""
+    if not settings.openai_api_key:
         raise RuntimeError("OPENAI_API_KEY not set.")
-    return OpenAI(api_key=api_key)
+    return OpenAI(api_key=settings.openai_api_key)
 
 
 def extract_sections_from_html(html: str) -> List[Dict[str, str]]:
@@ -71,10 +84,14 @@ def extract_sections_from_html(html: str) -> List[Dict[str, str]]:
 def create_image_prompt_instruction(
     article_html: str,
     perplexity_summary: str,
-    writing_style: Optional[str] = None
+    writing_style: Optional[str] = None,
+    include_hero: bool = True
 ) -> str:
     """
     Create detailed prompt for GPT-5-mini to generate contextual image prompts.
+
+    With include_hero=False only section prompts are requested (the hero
+    prompt is generated separately by generate_hero_image_prompt()).
     """
 
     sections = extract_sections_from_html(article_html)
@@ -88,19 +105,11 @@ def create_image_prompt_instruction(
         for i, s in enumerate(sections)
     ])
 
-    style_guidance = ""
-    if writing_style:
-        style_map = {
-            "Conversational/Personal": "Use warm, relatable imagery - human subjects, everyday settings, emotional connections",
-            "Authoritative/Expert": "Use professional settings, expert subjects, data visualization, corporate/medical/scientific environments",
-            "Narrative/Storytelling": "Use story-driven scenes, human subjects in meaningful moments, cinematic compositions",
-            "Listicle/Scannable": "Use clear, simple imagery - icons, clean backgrounds, easily identifiable subjects",
-            "Investigative/Journalistic": "Use documentary-style imagery, revealing details, evidence-focused, journalistic realism",
-            "How-to/Instructional": "Use process-focused imagery, step-by-step visuals, instructional clarity",
-            "Opinion/Commentary": "Use thought-provoking imagery, conceptual visuals, metaphorical subjects",
-            "Humorous/Satirical": "Use playful imagery, unexpected juxtapositions, clever visual humor"
-        }
-        style_guidance = f"\n\nVISUAL STYLE GUIDANCE: {style_map.get(writing_style, '')}"
+    style_guidance = _style_guidance(writing_style)
+    hero_field = (
+        '\n  "hero_prompt": "Cinematic wide shot for hero image (16:9) - captures overall article theme",'
+        if include_hero else ""
+    )
 
     return f"""You are an expert photography art director for editorial magazines like National Geographic, TIME, and The Atlantic.
 
@@ -136,8 +145,7 @@ EXAMPLE (BAD):
 "Doctor with technology" ❌ Too generic!
 
 OUTPUT FORMAT (JSON):
-{{
-  "hero_prompt": "Cinematic wide shot for hero image (16:9) - captures overall article theme",
+{{{hero_field}
   "section_prompts": [
     {{
       "section_heading": "First Section Heading",
@@ -158,7 +166,9 @@ def generate_contextual_image_prompts(
     article_html: str,
     perplexity_summary: str,
     user_id: int,
-    writing_style: Optional[str] = None
+    writing_style: Optional[str] = None,
+    include_hero: bool = True,
+    settings: Optional[JobSettings] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Generate contextual image prompts using GPT-5-mini.
@@ -166,8 +176,11 @@ def generate_contextual_image_prompts(
     Args:
         article_html: Clean HTML from story_generation.py
         perplexity_summary: Summary from Perplexity research
-        user_id: User ID for environment loading
+        user_id: User ID
         writing_style: Optional writing style for visual approach
+        include_hero: If False, skip the hero prompt ("hero_prompt" is absent)
+        settings: The job's settings (API key, MODEL_FOR_PASS3); looked up
+            from user_id if omitted
 
     Returns:
         {
@@ -179,14 +192,14 @@ def generate_contextual_image_prompts(
         }
         or None if error
     """
-    load_user_env(user_id)
-    client = _get_openai_client()
+    settings = settings or get_job_settings(user_id)
+    client = _get_openai_client(settings)
 
     # STEP 2 is the image-prompt step, so use the PASS3 model
-    model = os.getenv("MODEL_FOR_PASS3", "gpt-5-mini")
+    model = settings.prompt_model
 
     try:
-        instruction = create_image_prompt_instruction(article_html, perplexity_summary, writing_style)
+        instruction = create_image_prompt_instruction(article_html, perplexity_summary, writing_style, include_hero)
 
         logger.info(f"[Image Prompts] Generating contextual prompts with {model}")
         logger.info(f"[Image Prompts] Writing style: {writing_style or 'Default'}")
@@ -199,11 +212,14 @@ def generate_contextual_image_prompts(
 
         # Use prompted JSON approach (response_format not supported in responses.create)
         # Increased token limit to prevent JSON truncation
-        resp = client.responses.create(
-            model=model,
-            input=messages,
-            max_output_tokens=4000  # Increased from 2000 to handle longer prompts
-        )
+        with provider_slot("openai"):
+            started = time.monotonic()
+            resp = client.responses.create(
+                model=model,
+                input=messages,
+                max_output_tokens=4000  # Increased from 2000 to handle longer prompts
+            )
+        record_llm_call("image_prompts" if include_hero else "section_prompts", model, resp, time.monotonic() - started)
 
         # Extract output text from response (same pattern as story_generation.py)
         result_text = getattr(resp, "output_text", "")
@@ -244,7 +260,7 @@ def generate_contextual_image_prompts(
         prompts_data = json.loads(json_text)
 
         # Validate structure
-        if "hero_prompt" not in prompts_data or "section_prompts" not in prompts_data:
+        if (include_hero and "hero_prompt" not in prompts_data) or "section_prompts" not in prompts_data:
             logger.error("[Image Prompts] Invalid JSON structure returned")
             return None
 
@@ -252,7 +268,8 @@ def generate_contextual_image_prompts(
         num_prompts = len(prompts_data["section_prompts"])
 
         logger.info(f"[Image Prompts] Generated {num_prompts} section prompts for {num_sections} sections")
-        logger.info(f"[Image Prompts] Hero prompt: {prompts_data['hero_prompt'][:100]}...")
+        if include_hero:
+            logger.info(f"[Image Prompts] Hero prompt: {prompts_data['hero_prompt'][:100]}...")
 
         return prompts_data
 
@@ -269,6 +286,89 @@ def generate_contextual_image_prompts(
         return None
 
 
+
+def create_hero_prompt_instruction(
+    title: str,
+    perplexity_summary: str,
+    writing_style: Optional[str] = None
+) -> str:
+    """
+    Create prompt for GPT-5-mini to generate the hero image prompt only.
+
+    Needs just the title and summary, so it can run before the section
+    prompts (which need the full article HTML) are ready.
+    """
+    return f"""You are an expert photography art director for editorial magazines like National Geographic, TIME, and The Atlantic.
+
+TASK: Write ONE photographic prompt for the hero image (16:9 cinematic wide shot) of this article.
+
+ARTICLE TITLE: {title}
+
+PERPLEXITY RESEARCH SUMMARY:
+{perplexity_summary}{_style_guidance(writing_style)}
+
+The prompt must capture the overall article theme and include:
+- Main subject/scene (specific to the article topic - never generic)
+- Camera & lens (e.g., "Canon R5, 24mm f/1.4")
+- Lighting, composition, mood/atmosphere and setting
+
+Return ONLY the prompt text - no JSON, no quotes, no explanations.
+"""
+
+
+def generate_hero_image_prompt(
+    title: str,
+    perplexity_summary: str,
+    user_id: int,
+    writing_style: Optional[str] = None,
+    settings: Optional[JobSettings] = None
+) -> Optional[str]:
+    """
+    Generate the hero image prompt using GPT-5-mini.
+
+    Args:
+        title: Article title
+        perplexity_summary: Summary from Perplexity research or executive summary
+        user_id: User ID
+        writing_style: Optional writing style for visual approach
+        settings: The job's settings; looked up from user_id if omitted
+
+    Returns:
+        Hero image prompt text, or None if error
+    """
+    settings = settings or get_job_settings(user_id)
+    client = _get_openai_client(settings)
+
+    model = settings.prompt_model
+
+    try:
+        logger.info(f"[Image Prompts] Generating hero prompt with {model}")
+
+        with provider_slot("openai"):
+            started = time.monotonic()
+            resp = client.responses.create(
+                model=model,
+                input=[
+                    {"role": "system", "content": "You are an expert photography art director. Return ONLY the image prompt text."},
+                    {"role": "user", "content": create_hero_prompt_instruction(title, perplexity_summary, writing_style)}
+                ],
+                max_output_tokens=2000
+            )
+        record_llm_call("hero_prompt", model, resp, time.monotonic() - started)
+
+        hero_prompt = getattr(resp, "output_text", "").strip().strip('"')
+        if not hero_prompt:
+            logger.error("[Image Prompts] Empty hero prompt from API")
+            return None
+
+        logger.info(f"[Image Prompts] Hero prompt: {hero_prompt[:100]}...")
+        return hero_prompt
+
+    except Exception as e:
+        logger.error(f"[Image Prompts] Error generating hero prompt: {e}")
+        logger.debug(f"[Image Prompts] Traceback: {e}", exc_info=True)
+        return None
+
 if __name__ == "__main__":
     # Test the module independently
     logging.basicConfig(level=logging.INFO)
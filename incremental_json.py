@@ -0,0 +1,178 @@
+"""
+incremental_json.py - Incremental Parser for Streamed JSON Objects
+
+GPT-5 streams the story JSON a few characters at a time. This parser is fed
+those chunks and reports each top-level field of the object as soon as its
+value is complete, instead of waiting for the closing brace.
+
+Long string fields can additionally be split into sections while they are
+still streaming (e.g. the article "html" split at every <h2>), so callers see
+finished sections before the field itself is complete.
+
+Only top-level fields are reported; nested values are reported whole when
+they close. Anything before the first "{" (such as a ```json fence) is
+skipped.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONParser:
+    """
+    Feed text chunks of one JSON object, get callbacks per completed field.
+
+    Args:
+        on_field: Called as on_field(name, value) when a top-level value closes
+        on_section: Called as on_section(name, index, text) for every finished
+            section of a sectioned string field
+        sections: {field_name: marker} - split that string field before each
+            occurrence of marker (e.g. {"html": "<h2"})
+
+    Usage:
+        parser = IncrementalJSONParser(on_field=handle)
+        for chunk in stream:
+            parser.feed(chunk)
+    """
+
+    def __init__(
+        self,
+        on_field: Callable[[str, Any], None],
+        on_section: Optional[Callable[[str, int, str], None]] = None,
+        sections: Optional[Dict[str, str]] = None
+    ):
+        self.on_field = on_field
+        self.on_section = on_section
+        self.sections = sections or {}
+        self.fields: Dict[str, Any] = {}
+
+        self._buffer = ""
+        self._pos = 0              # Next character to scan
+        self._started = False      # Seen the opening "{"
+        self._finished = False     # Seen the closing "}"
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self._expect_key = True
+
+        # Sectioned string field currently streaming
+        self._section_marker: Optional[str] = None
+        self._section_start = 0    # Raw offset of the current section
+        self._section_index = 0
+
+    def feed(self, chunk: str) -> None:
+        """Consume the next chunk of streamed text."""
+        if self._finished or not chunk:
+            return
+        self._buffer += chunk
+
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and not self._finished:
+            char = buffer[pos]
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = json.loads(buffer[self._key_start:pos + 1])
+                        self._key_start = None
+                    elif self._depth == 1 and self._value_start is not None:
+                        self._finish_section(buffer, pos, last=True)
+                        self._emit(buffer[self._value_start:pos + 1])
+                elif self._section_marker and char == self._section_marker[0]:
+                    marker = self._section_marker
+                    tail = buffer[pos:pos + len(marker)]
+                    if len(tail) < len(marker) and marker.startswith(tail):
+                        break  # Marker may continue in the next chunk
+                    if tail == marker:
+                        # Next section begins - the previous one is complete
+                        self._finish_section(buffer, pos, last=False)
+                pos += 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = pos
+                    self._expect_key = False
+                elif self._depth == 1 and self._value_start is None:
+                    self._value_start = pos
+                    marker = self.sections.get(self._key or "")
+                    if marker:
+                        self._section_marker = marker
+                        self._section_start = pos + 1
+                        self._section_index = 0
+            elif char in "{[":
+                if self._depth == 1 and self._value_start is None:
+                    self._value_start = pos
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._emit(buffer[self._value_start:pos + 1])
+                elif self._depth == 0:
+                    self._emit_scalar(buffer, pos)
+                    self._finished = True
+            elif self._depth == 1:
+                if char == ",":
+                    self._emit_scalar(buffer, pos)
+                    self._expect_key = True
+                elif char not in " \t\r\n:" and self._value_start is None and not self._expect_key:
+                    # Start of a number / true / false / null
+                    self._value_start = pos
+            pos += 1
+
+        self._pos = pos
+
+    def _emit_scalar(self, buffer: str, end: int) -> None:
+        """Emit a pending unquoted scalar value that ends before buffer[end]."""
+        if self._value_start is not None and self._key is not None:
+            self._emit(buffer[self._value_start:end].strip())
+
+    def _emit(self, raw: str) -> None:
+        name, self._key, self._value_start = self._key, None, None
+        self._section_marker = None
+        if name is None:
+            return
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"[Incremental JSON] Could not decode field '{name}': {e}")
+            return
+        self.fields[name] = value
+        self.on_field(name, value)
+
+    def _finish_section(self, buffer: str, end: int, last: bool) -> None:
+        """Report the section of the current string field ending at buffer[end]."""
+        if not self._section_marker or self.on_section is None:
+            return
+        raw = buffer[self._section_start:end]
+        self._section_start = end
+        if not raw.strip():
+            return
+        try:
+            text = json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            return
+        self.on_section(self._key or "", self._section_index, text)
+        self._section_index += 1
+        if last:
+            self._section_marker = None
@@ -0,0 +1,133 @@
+"""
+job_settings.py - Immutable Per-Job Settings
+
+Every stage of an article generation needs the same few settings: the
+OpenAI, Anthropic, Perplexity and Replicate credentials and the model for
+each pass. Stages used to re-read .env.user_{id} with
+load_dotenv(override=True) on every call, which hit the disk and mutated
+the process-wide os.environ - a race when two users' jobs run in parallel
+worker threads.
+
+A JobSettings is built once per user from the central configuration (the
+main .env, loaded at startup), cached, and passed explicitly down the
+pipeline. Stages only read its attributes; nothing touches the disk or
+os.environ while a job runs. WordPress credentials are resolved separately
+(see wordpress_integration.resolve_wordpress_site).
+"""
+
+import os
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORY_MODEL = "gpt-5"
+DEFAULT_PROMPT_MODEL = "gpt-5-mini"
+
+
+class JobSettings:
+    """
+    Read-only credentials and model choices for one user's generation job.
+
+    Attributes:
+        user_id: User the job runs for
+        openai_api_key: Key for story and image prompt generation
+        anthropic_api_key: Key for the Claude formatter
+        perplexity_api_token: Token for research queries
+        replicate_api_token: Token for SeeDream image generation
+        story_model: Model for the article pass (MODEL_FOR_PASS1)
+        prompt_model: Model for image prompts (MODEL_FOR_PASS3)
+    """
+
+    __slots__ = (
+        'user_id', 'openai_api_key', 'anthropic_api_key', 'perplexity_api_token',
+        'replicate_api_token', 'story_model', 'prompt_model'
+    )
+
+    def __init__(
+        self,
+        user_id: int,
+        openai_api_key: Optional[str] = None,
+        anthropic_api_key: Optional[str] = None,
+        perplexity_api_token: Optional[str] = None,
+        replicate_api_token: Optional[str] = None,
+        story_model: str = DEFAULT_STORY_MODEL,
+        prompt_model: str = DEFAULT_PROMPT_MODEL
+    ):
+        values = dict(
+            user_id=user_id,
+            openai_api_key=openai_api_key,
+            anthropic_api_key=anthropic_api_key,
+            perplexity_api_token=perplexity_api_token,
+            replicate_api_token=replicate_api_token,
+            story_model=story_model,
+            prompt_model=prompt_model
+        )
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("JobSettings is immutable - use replace() for a modified copy")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("JobSettings is immutable")
+
+    def replace(self, **changes: Any) -> 'JobSettings':
+        """Copy with some attributes changed (e.g. a different model for one run)."""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return JobSettings(**values)
+
+    def __repr__(self) -> str:
+        # Never print the secrets themselves
+        configured = [name for name in self.__slots__ if name.endswith(('_key', '_token')) and getattr(self, name)]
+        return (f"JobSettings(user_id={self.user_id}, story_model={self.story_model!r}, "
+                f"prompt_model={self.prompt_model!r}, configured={configured})")
+
+
+def load_job_settings(user_id: int) -> JobSettings:
+    """
+    Build settings for a user from the central configuration (uncached).
+
+    API keys are centralized in the main .env; per-user keys are not used,
+    so one user's settings can never leak into another's job.
+    """
+    return JobSettings(
+        user_id=user_id,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"),
+        perplexity_api_token=os.getenv("PERPLEXITY_AI_API_TOKEN"),
+        replicate_api_token=os.getenv("REPLICATE_API_TOKEN"),
+        story_model=os.getenv("MODEL_FOR_PASS1", DEFAULT_STORY_MODEL),
+        prompt_model=os.getenv("MODEL_FOR_PASS3", DEFAULT_PROMPT_MODEL)
+    )
+
+
+_settings_cache: Dict[int, JobSettings] = {}
+_settings_cache_lock = threading.Lock()
+
+
+def get_job_settings(user_id: int) -> JobSettings:
+    """
+    Settings for a user's job, built on first use and cached for the process.
+
+    Build once at the start of a job and pass the object to every stage;
+    this lookup is the fallback for stages called on their own.
+    """
+    with _settings_cache_lock:
+        settings = _settings_cache.get(user_id)
+        if settings is None:
+            settings = load_job_settings(user_id)
+            _settings_cache[user_id] = settings
+            logger.debug(f"[Settings] Built {settings}")
+        return settings
+
+
+def invalidate_job_settings(user_id: Optional[int] = None) -> None:
+    """Drop cached settings for one user (or everyone) after configuration changes."""
+    with _settings_cache_lock:
+        if user_id is None:
+            _settings_cache.clear()
+        else:
+            _settings_cache.pop(user_id, None)
@@ -0,0 +1,777 @@
+"""
+layout_engine.py - STEP 4 (Default): Compiled Template Layouts
+
+The layouts/ directory ships one sample article per design (bold_editorial,
+classic_magazine, tech_digital, ...). At startup every sample is parsed once
+and compiled into slot templates:
+- the document shell with its CSS (brand colors and hero image as slots)
+- hero, stats, pull quote, callout and image-break fragments
+- one or more section blocks (alternating variants, e.g. image left/right)
+
+Rendering an article only splits its HTML into <h2> sections and joins
+pre-compiled strings, so formatting takes milliseconds instead of a
+30-90 second Claude call. Claude formatting remains available as the
+premium mode (see claude_formatter.py).
+
+LAYOUT_SLOTS maps each design's CSS classes to the roles the engine fills.
+"""
+
+import os
+import re
+import copy
+import html
+import time
+import logging
+import threading
+from datetime import datetime
+from itertools import cycle
+from typing import Any, Dict, List, Optional
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "layouts")
+DEFAULT_LAYOUT = "premium_magazine"
+
+# Role -> CSS selector in the layout's sample markup.
+#   page:        container wrapping the whole article (children replaced)
+#   hero:        cover block holding the <h1>; subtitle/kicker are optional slots
+#   hero_image:  element carrying the hero image (<img> or background), inside
+#                or after the hero block
+#   stats/stat:  key-stat group and one stat item (.number + label/description)
+#   section:     block repeated per <h2> section; body receives the section HTML,
+#                section_image/aside are optional parts of the same block
+#   text_section/text_body: block used instead when a section block built
+#                around an image has no image to show
+#   image_break: standalone section image, optionally with a heading slot
+#   quote/callout: pull quote and highlighted box (case studies, sidebars)
+#   inline_components: components go inside the section body; otherwise they
+#                split the body into consecutive section blocks
+LAYOUT_SLOTS: Dict[str, Dict[str, Any]] = {
+    "premium_magazine": {
+        "page": ".magazine-container",
+        "hero": ".cover",
+        "hero_image": ".cover",
+        "subtitle": ".subtitle",
+        "kicker": ".edition",
+        "section": ".content-area",
+        "body": ".main-column",
+        "aside": ".sidebar",
+        "image_break": ".section-header",
+        "image_heading": "h2",
+        "stat": ".stat-highlight",
+        "quote": ".pull-quote",
+        "callout": ".case-study-box",
+        "inline_components": True,
+    },
+    "bold_editorial": {
+        "hero": ".cover",
+        "hero_image": ".cover",
+        "kicker": ".tag",
+        "subtitle": ".subtitle",
+        "stats": ".stats-dramatic",
+        "stat": ".stat-box",
+        "section": ".content-offset",
+        "body": ".content-offset",
+        "image_break": ".image-overlay-section",
+        "image_heading": "h2",
+        "quote": ".quote-huge",
+        "callout": ".impact-panel",
+        "inline_components": False,
+    },
+    "classic_magazine": {
+        "page": ".magazine-container",
+        "hero": ".header",
+        "kicker": ".issue-date",
+        "subtitle": ".subtitle",
+        "hero_image": ".featured-image-section",
+        "stats": ".stats-box",
+        "stat": ".stat",
+        "section": ".column-section",
+        "body": ".two-column",
+        "image_break": ".column-break",
+        "quote": ".quote-column-span",
+        "inline_components": True,
+    },
+    "creative_artistic": {
+        "hero": ".cover-chaos",
+        "hero_image": ".cover-chaos",
+        "subtitle": ".subtitle",
+        "remove": [".cover-badge"],
+        "stats": ".stats-fun",
+        "stat": ".stat-fun",
+        "section": ".scattered-container",
+        "body": ".text-scatter",
+        "image_break": ".collage-section",
+        "image_heading": ".collage-caption",
+        "quote": ".quote-crazy",
+        "inline_components": False,
+    },
+    "lifestyle_luxury": {
+        "hero": ".hero-full",
+        "hero_image": ".hero-image-bg",
+        "kicker": ".hero-category",
+        "subtitle": ".hero-subtitle",
+        "stats": ".stats-elegant",
+        "stat": ".stat-elegant",
+        "section": ".side-by-side",
+        "body": ".side-content",
+        "section_image": ".side-image",
+        "text_section": ".intro-statement",
+        "text_body": ".intro-statement",
+        "image_break": ".full-bleed",
+        "quote": ".quote-luxury",
+        "inline_components": False,
+    },
+    "modern_minimalist": {
+        "hero": ".container:has(> .hero)",
+        "hero_image": ".hero-image",
+        "subtitle": ".subtitle",
+        "stats": ".stat-float",
+        "stat": ".stat-item",
+        "section": ".container:has(> .content)",
+        "body": ".content",
+        "image_break": ".section-image",
+        "quote": ".quote",
+        "callout": ".highlight",
+        "inline_components": True,
+    },
+    "tech_digital": {
+        "hero": ".hero-split",
+        "hero_image": ".hero-image-side",
+        "kicker": ".tag",
+        "subtitle": ".subtitle",
+        "remove": [".meta-badges"],
+        "stats": ".data-section",
+        "stat": ".metric-card",
+        "section": ".feature-grid",
+        "body": ".feature-text",
+        "section_image": ".feature-image",
+        "text_section": ".card-grid",
+        "text_body": ".card",
+        "image_break": ".image-break",
+        "quote": ".quote-card",
+        "inline_components": False,
+    },
+}
+
+# Slot markers use private-use characters so they survive HTML serialization
+_SLOT_OPEN, _SLOT_CLOSE = "\ue000", "\ue001"
+_SLOT_PATTERN = re.compile(f"{_SLOT_OPEN}(\\w+){_SLOT_CLOSE}")
+_CSS_URL_PATTERN = re.compile(r"url\((['\"]?)(?!https://fonts\.)[^)'\"]*\1\)")
+_CSS_VAR_PATTERN = re.compile(r"(--(brand|accent)-color:\s*)(#[0-9a-fA-F]{3,8})")
+
+_FALLBACK_CALLOUT = f'<aside class="layout-callout"><h4>{_SLOT_OPEN}title{_SLOT_CLOSE}</h4>{_SLOT_OPEN}body{_SLOT_CLOSE}</aside>'
+
+
+class LayoutError(Exception):
+    """Raised when a layout sample cannot be compiled."""
+
+
+def _slot(name: str) -> str:
+    return f"{_SLOT_OPEN}{name}{_SLOT_CLOSE}"
+
+
+class _Template:
+    """Pre-split template: literal parts alternating with slot names."""
+
+    def __init__(self, source: str):
+        self.parts = _SLOT_PATTERN.split(source)
+
+    def render(self, **values: str) -> str:
+        parts = self.parts
+        return "".join(
+            part if i % 2 == 0 else values.get(part, "")
+            for i, part in enumerate(parts)
+        )
+
+
+def _find(element: Tag, selector: Optional[str]) -> Optional[Tag]:
+    """First match of selector - the element itself or a descendant."""
+    if not selector:
+        return None
+    if element.css.match(selector):
+        return element
+    return element.select_one(selector)
+
+
+def _fill_text_slot(element: Tag, name: str) -> None:
+    element.clear()
+    element.append(NavigableString(_slot(name)))
+
+
+def _fill_image_slot(element: Tag, name: str) -> None:
+    """Point an <img> (or a background-image element) at a URL slot."""
+    if element.name != "img":
+        img = element.find("img")
+        if img is None:
+            style = element.get("style", "")
+            if "url(" in style:
+                style = re.sub(r"url\([^)]*\)", f"url('{_slot(name)}')", style)
+            else:
+                style = f"background-image: url('{_slot(name)}'); {style}".strip()
+            element["style"] = style
+            return
+        element = img
+    element["src"] = _slot(name)
+    element["alt"] = _slot(f"{name}_alt")
+
+
+def _prune(root: Tag, keep: List[Tag]) -> None:
+    """Remove everything under root that is not a kept element or one of its ancestors."""
+    keep_ids = {id(element) for element in keep}
+    path_ids = set()
+    for element in keep:
+        for parent in element.parents:
+            if parent is root:
+                break
+            path_ids.add(id(parent))
+
+    def walk(node: Tag) -> None:
+        for child in list(node.children):
+            if isinstance(child, Tag):
+                if id(child) in keep_ids:
+                    continue
+                if id(child) in path_ids:
+                    walk(child)
+                else:
+                    child.decompose()
+            elif child.strip():
+                child.extract()
+
+    walk(root)
+
+
+class _SectionVariant:
+    """One section block compiled with and without its image and aside."""
+
+    def __init__(self, templates: Dict[tuple, str], has_image: bool):
+        self.templates = {key: _Template(source) for key, source in templates.items()}
+        self.has_image = has_image
+
+    def render(self, with_image: bool, with_aside: bool, **values: str) -> str:
+        return self.templates[(with_image, with_aside)].render(**values)
+
+
+class CompiledLayout:
+    """
+    One layout sample compiled into slot templates.
+
+    Args:
+        name: Layout name (file name without .html)
+        source: Sample HTML from layouts/
+        slots: Role selectors from LAYOUT_SLOTS
+    """
+
+    def __init__(self, name: str, source: str, slots: Dict[str, Any]):
+        self.name = name
+        self.source = source
+        self.inline_components = slots.get("inline_components", True)
+
+        soup = BeautifulSoup(source, "html.parser")
+        style = soup.find("style")
+        if style is None or soup.body is None:
+            raise LayoutError(f"{name}: sample has no <style> or <body>")
+
+        # Brand colors default to the layout's own palette
+        colors = {match.group(2): match.group(3) for match in _CSS_VAR_PATTERN.finditer(style.string or "")}
+        self.default_colors = {"primary": colors.get("brand", "#08b2c6"), "accent": colors.get("accent", "#ff6b11")}
+        css = _CSS_VAR_PATTERN.sub(lambda m: m.group(1) + _slot(f"{m.group(2)}_color"), style.string or "")
+        css = _CSS_URL_PATTERN.sub(f"url('{_slot('hero_image_url')}')", css)
+
+        self.document = _Template(
+            '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="UTF-8">\n'
+            '<meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+            f'<title>{_slot("title")}</title>\n<style>{css}</style>\n</head>\n<body>\n'
+            f'<div class="magazine-article-wrapper">{_slot("content")}</div>\n</body>\n</html>'
+        )
+
+        body = soup.body
+        self.page = self._compile_page(body, slots)
+        self.hero, self.hero_image = self._compile_hero(body, slots)
+        self.stats, self.stat = self._compile_stats(body, slots)
+        self.quote = self._compile_quote(body, slots)
+        self.callout = self._compile_callout(body, slots)
+        self.image_break, self.image_break_has_heading = self._compile_image_break(body, slots)
+        self.sections = self._compile_sections(body, slots)
+        self.text_sections = []
+        if slots.get("text_section"):
+            self.text_sections = self._compile_sections(
+                body, {"section": slots["text_section"], "body": slots["text_body"]}
+            )
+        self.has_aside = bool(slots.get("aside"))
+
+    # ----- compilation -----
+
+    @staticmethod
+    def _compile_page(body: Tag, slots: Dict[str, Any]) -> _Template:
+        page = body.select_one(slots["page"]) if slots.get("page") else None
+        if page is None:
+            return _Template(_slot("content"))
+        page = copy.copy(page)
+        _fill_text_slot(page, "content")
+        return _Template(str(page))
+
+    @staticmethod
+    def _compile_hero(body: Tag, slots: Dict[str, Any]):
+        hero = body.select_one(slots["hero"])
+        if hero is None or hero.find("h1") is None:
+            raise LayoutError(f"hero '{slots['hero']}' with an <h1> not found")
+        hero_image = _find(hero, slots.get("hero_image"))
+
+        hero = copy.copy(hero)
+        for selector in slots.get("remove", []):
+            for element in hero.select(selector):
+                element.decompose()
+        _fill_text_slot(hero.find("h1"), "title")
+        for role in ("subtitle", "kicker"):
+            element = _find(hero, slots.get(role))
+            if element is not None:
+                _fill_text_slot(element, role)
+
+        separate_image = None
+        if hero_image is not None:
+            _fill_image_slot(_find(hero, slots["hero_image"]), "hero_image_url")
+        elif slots.get("hero_image"):
+            # Hero image block follows the cover (e.g. a full-width <img>)
+            element = body.select_one(slots["hero_image"])
+            if element is None:
+                raise LayoutError(f"hero image '{slots['hero_image']}' not found")
+            element = copy.copy(element)
+            image = _find(element, "img") or element
+            _prune(element, [image])
+            _fill_image_slot(image, "hero_image_url")
+            separate_image = _Template(str(element))
+
+        leftover = hero.get_text(" ", strip=True).replace(_slot("title"), "")
+        for role in ("subtitle", "kicker"):
+            leftover = leftover.replace(_slot(role), "")
+        if re.search(r"\w", leftover):
+            logger.warning(f"[Layouts] Hero keeps sample text: {leftover[:80]}")
+
+        return _Template(str(hero)), separate_image
+
+    @staticmethod
+    def _compile_stat_item(element: Tag) -> _Template:
+        element = copy.copy(element)
+        number = element.select_one(".number")
+        label = element.select_one(".label, .description")
+        if number is None or label is None:
+            raise LayoutError("stat item needs .number and .label/.description")
+        _fill_text_slot(number, "number")
+        _fill_text_slot(label, "label")
+        return _Template(str(element))
+
+    def _compile_stats(self, body: Tag, slots: Dict[str, Any]):
+        stat = body.select_one(slots["stat"]) if slots.get("stat") else None
+        if stat is None:
+            return None, None
+        stat_template = self._compile_stat_item(stat)
+
+        group = body.select_one(slots["stats"]) if slots.get("stats") else None
+        if group is None:
+            return None, stat_template
+        group = copy.copy(group)
+        items = group.select(slots["stat"])
+        items[0].replace_with(NavigableString(_slot("items")))
+        for item in items[1:]:
+            item.decompose()
+        return _Template(str(group)), stat_template
+
+    @staticmethod
+    def _compile_quote(body: Tag, slots: Dict[str, Any]) -> Optional[_Template]:
+        quote = body.select_one(slots["quote"]) if slots.get("quote") else None
+        if quote is None:
+            return None
+        quote = copy.copy(quote)
+        _fill_text_slot(quote.find("blockquote") or quote, "text")
+        return _Template(str(quote))
+
+    @staticmethod
+    def _compile_callout(body: Tag, slots: Dict[str, Any]) -> _Template:
+        callout = body.select_one(slots["callout"]) if slots.get("callout") else None
+        if callout is None:
+            return _Template(_FALLBACK_CALLOUT)
+        callout = copy.copy(callout)
+        heading = callout.find(["h3", "h4"])
+        callout.clear()
+        if heading is not None:
+            heading.clear()
+            heading.append(NavigableString(_slot("title")))
+            callout.append(heading)
+        else:
+            heading = BeautifulSoup(f"<h4>{_slot('title')}</h4>", "html.parser").h4
+            callout.append(heading)
+        callout.append(NavigableString(_slot("body")))
+        return _Template(str(callout))
+
+    @staticmethod
+    def _compile_image_break(body: Tag, slots: Dict[str, Any]):
+        element = body.select_one(slots["image_break"]) if slots.get("image_break") else None
+        if element is None:
+            return None, False
+        element = copy.copy(element)
+        image = element.find("img") if element.name != "img" else element
+        heading = element.select_one(slots["image_heading"]) if slots.get("image_heading") else None
+        _prune(element, [el for el in (image, heading) if el is not None])
+        _fill_image_slot(image or element, "image_url")
+        if heading is not None:
+            _fill_text_slot(heading, "heading")
+        return _Template(str(element)), heading is not None
+
+    @staticmethod
+    def _compile_sections(body: Tag, slots: Dict[str, Any]) -> List[_SectionVariant]:
+        """Compile every distinct section block, with and without image/aside."""
+        variants: List[_SectionVariant] = []
+        seen = set()
+        for block in body.select(slots["section"]):
+            compiled = {}
+            for with_image in (True, False):
+                for with_aside in (True, False):
+                    clone = copy.copy(block)
+                    section_body = _find(clone, slots["body"])
+                    if section_body is None:
+                        break
+                    image = _find(clone, slots.get("section_image"))
+                    aside = _find(clone, slots.get("aside"))
+                    _prune(clone, [el for el in (section_body, image, aside) if el is not None])
+                    _fill_text_slot(section_body, "body")
+                    if image is not None:
+                        if with_image:
+                            _fill_image_slot(image, "image_url")
+                        else:
+                            image.decompose()
+                    if aside is not None:
+                        if with_aside:
+                            _fill_text_slot(aside, "aside")
+                        else:
+                            aside.decompose()
+                    compiled[(with_image, with_aside)] = str(clone)
+            signature = " ".join(compiled.get((True, True), "").split())
+            if len(compiled) < 4 or signature in seen:
+                continue
+            seen.add(signature)
+            variants.append(_SectionVariant(compiled, _find(block, slots.get("section_image")) is not None))
+
+        if not variants:
+            raise LayoutError(f"section '{slots['section']}' with body '{slots['body']}' not found")
+        return variants
+
+    # ----- rendering -----
+
+    def render(
+        self,
+        article_data: Dict[str, Any],
+        hero_image_url: str,
+        section_images: List[Dict[str, str]],
+        brand_colors: Optional[Dict[str, str]] = None,
+        kicker: Optional[str] = None
+    ) -> str:
+        """
+        Fill the compiled templates with one article.
+
+        Args:
+            article_data: Structured data from story_generation.py
+                (title, html, executive_summary, components)
+            hero_image_url: Hero image URL
+            section_images: [{"heading": "...", "url": "..."}]
+            brand_colors: Optional {"primary": "#...", "accent": "#..."}
+            kicker: Optional text for the layout's tag/date line
+
+        Returns:
+            Complete HTML document
+        """
+        colors = {**self.default_colors, **(brand_colors or {})}
+        title = article_data.get("title", "Article")
+        summary = article_data.get("executive_summary") or {}
+        esc = lambda text: html.escape(str(text or ""), quote=False)  # noqa: E731
+        # URLs stay verbatim (finalize swaps them by exact match); only quotes are encoded
+        url = lambda text: str(text or "").replace('"', "%22").replace("'", "%27")  # noqa: E731
+
+        parts = [self.hero.render(
+            title=esc(title),
+            subtitle=esc(summary.get("intro")),
+            kicker=esc(kicker or datetime.now().strftime("%B %Y")),
+            hero_image_url=url(hero_image_url),
+            hero_image_url_alt=esc(title)
+        )]
+        if self.hero_image:
+            parts.append(self.hero_image.render(hero_image_url=url(hero_image_url), hero_image_url_alt=esc(title)))
+
+        key_stats = [self._render_stat(stat) for stat in summary.get("key_stats") or []]
+        lead_aside = []
+        if key_stats:
+            if self.stats:
+                parts.append(self.stats.render(items="".join(key_stats)))
+            elif self.has_aside:
+                lead_aside = key_stats
+            else:
+                parts.append("".join(key_stats))
+
+        sections = _split_sections(article_data.get("html", ""), article_data.get("components") or [])
+        images = _match_section_images(sections, section_images)
+        variants = cycle(self.sections)
+        text_variants = cycle(self.text_sections) if self.text_sections else None
+        for index, (section, image_url) in enumerate(zip(sections, images)):
+            aside_items = lead_aside if index == 0 else []
+            parts.extend(self._render_section(section, image_url, aside_items, variants, text_variants, esc, url))
+
+        content = self.page.render(content="\n".join(parts))
+        return self.document.render(
+            title=esc(title),
+            brand_color=colors["primary"],
+            accent_color=colors["accent"],
+            hero_image_url=url(hero_image_url),
+            content=content
+        )
+
+    def _render_stat(self, stat: Dict[str, Any]) -> str:
+        number = html.escape(str(stat.get("number", "")), quote=False)
+        label = html.escape(str(stat.get("description", "")), quote=False)
+        if self.stat is None:
+            return f'<div class="stat-highlight"><div class="number">{number}</div><div class="description">{label}</div></div>'
+        return self.stat.render(number=number, label=label)
+
+    def _render_component(self, component: Dict[str, Any], esc) -> str:
+        kind = component.get("type")
+        if kind == "pull_quote":
+            text = esc(component.get("content"))
+            if self.quote is None:
+                return f"<blockquote>{text}</blockquote>"
+            return self.quote.render(text=text)
+        if kind == "stat_highlight":
+            stat = self._render_stat(component)
+            return self.stats.render(items=stat) if self.stats else stat
+        if kind == "case_study":
+            body = []
+            if component.get("profile"):
+                body.append(f"<p>{esc(component['profile'])}</p>")
+            body.append(f"<p><strong>Challenge:</strong> {esc(component.get('challenge'))}</p>")
+            body.append(f"<p><strong>Solution:</strong> {esc(component.get('solution'))}</p>")
+            if component.get("results"):
+                body.append("<ul>" + "".join(f"<li>{esc(r)}</li>" for r in component["results"]) + "</ul>")
+            if component.get("quote"):
+                body.append(f"<p><em>\"{esc(component['quote'])}\"</em></p>")
+            return self.callout.render(title=esc(component.get("title", "Case Study")), body="".join(body))
+        if kind == "sidebar":
+            # Sidebar content is HTML by contract (lists, paragraphs)
+            return self.callout.render(title=esc(component.get("title")), body=component.get("content", ""))
+        return ""
+
+    def _render_section(self, section: Dict[str, Any], image_url: Optional[str], aside_items: List[str],
+                        variants, text_variants, esc, url) -> List[str]:
+        heading_html = section["heading_html"]
+        out = []
+
+        # Standalone image break before the section (heading moves into it if it has a slot)
+        variant = next(variants)
+        image_in_block = bool(image_url) and variant.has_image
+        if image_url and not image_in_block and self.image_break:
+            out.append(self.image_break.render(
+                image_url=url(image_url), image_url_alt=esc(section["heading"]), heading=esc(section["heading"])
+            ))
+            if self.image_break_has_heading:
+                heading_html = ""
+
+        # Body runs separated by components; aside layouts collect stats/sidebars separately
+        aside = list(aside_items)
+        runs: List[tuple] = [("body", [heading_html])]
+        pending: List[str] = []  # Components that would separate a heading from its text
+        for item in section["items"]:
+            if isinstance(item, str):
+                runs[-1][1].append(item)
+                for rendered in pending:
+                    runs.extend([("component", rendered), ("body", [])])
+                pending = []
+                continue
+            rendered = self._render_component(item, esc)
+            if self.has_aside and item.get("type") in ("stat_highlight", "sidebar"):
+                aside.append(self._render_stat(item) if item.get("type") == "stat_highlight" else rendered)
+            elif self.inline_components:
+                runs[-1][1].append(rendered)
+            elif len(runs) == 1 and runs[0][1] == [heading_html]:
+                pending.append(rendered)
+            else:
+                runs.extend([("component", rendered), ("body", [])])
+        runs.extend(("component", rendered) for rendered in pending)
+
+        first = True
+        for kind, run in runs:
+            if kind == "component":
+                out.append(run)
+                continue
+            body = "".join(run).strip()
+            if not body:
+                continue
+            with_image = first and image_in_block
+            with_aside = first and bool(aside)
+            block = variant
+            if variant.has_image and not with_image and text_variants:
+                block = next(text_variants)
+            out.append(block.render(
+                with_image, with_aside,
+                body=body,
+                aside="".join(aside) if with_aside else "",
+                image_url=url(image_url) if with_image else "",
+                image_url_alt=esc(section["heading"])
+            ))
+            first = False
+            variant = next(variants)
+        return out
+
+
+def _split_sections(article_html: str, components: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Split article HTML at <h2> and attach components where they belong.
+
+    insert_after_paragraph counts <p> tags from the start of the article;
+    insert_after_heading matches an <h2> text. Components whose anchor is
+    missing go at the end of the last section.
+
+    Returns:
+        [{"heading": text, "heading_html": "<h2>..", "items": [html | component, ...]}]
+    """
+    soup = BeautifulSoup(article_html or "", "html.parser")
+    h1 = soup.find("h1")
+    if h1:
+        h1.decompose()
+
+    by_paragraph: Dict[int, List[Dict[str, Any]]] = {}
+    by_heading: Dict[str, List[Dict[str, Any]]] = {}
+    unplaced = []
+    for component in components:
+        if isinstance(component.get("insert_after_paragraph"), int):
+            by_paragraph.setdefault(component["insert_after_paragraph"], []).append(component)
+        elif component.get("insert_after_heading"):
+            by_heading.setdefault(component["insert_after_heading"].strip().lower(), []).append(component)
+        else:
+            unplaced.append(component)
+
+    sections: List[Dict[str, Any]] = [{"heading": "", "heading_html": "", "items": []}]
+    paragraphs = 0
+    for node in list(soup.children):
+        if isinstance(node, NavigableString):
+            if node.strip():
+                sections[-1]["items"].append(html.escape(str(node).strip(), quote=False))
+            continue
+        if node.name == "h2":
+            heading = node.get_text(strip=True)
+            sections.append({"heading": heading, "heading_html": str(node), "items": []})
+            sections[-1]["items"].extend(by_heading.pop(heading.lower(), []))
+            continue
+        sections[-1]["items"].append(str(node))
+        count = 1 if node.name == "p" else len(node.find_all("p"))
+        for _ in range(count):
+            paragraphs += 1
+            sections[-1]["items"].extend(by_paragraph.pop(paragraphs, []))
+
+    leftovers = [c for group in by_paragraph.values() for c in group]
+    leftovers += [c for group in by_heading.values() for c in group] + unplaced
+    if not sections[0]["items"]:
+        sections.pop(0)
+    if not sections:
+        sections.append({"heading": "", "heading_html": "", "items": []})
+    sections[-1]["items"].extend(leftovers)
+    return sections
+
+
+def _match_section_images(sections: List[Dict[str, Any]], section_images: List[Dict[str, str]]) -> List[Optional[str]]:
+    """Image URL per section - by heading text, then leftovers in order for headed sections."""
+    by_heading = {img["heading"].strip().lower(): img["url"] for img in section_images if img.get("url")}
+    images: List[Optional[str]] = [by_heading.pop(s["heading"].lower(), None) if s["heading"] else None for s in sections]
+    leftovers = [img["url"] for img in section_images if img.get("url") and img["url"] in by_heading.values()]
+    for i, section in enumerate(sections):
+        if leftovers and section["heading"] and images[i] is None:
+            images[i] = leftovers.pop(0)
+    return images
+
+
+_layouts: Optional[Dict[str, CompiledLayout]] = None
+_layouts_lock = threading.Lock()
+
+
+def load_layouts(layout_dir: str = LAYOUT_DIR) -> Dict[str, CompiledLayout]:
+    """
+    Parse and compile every layout sample that has a LAYOUT_SLOTS entry.
+
+    Layouts that fail to compile are logged and skipped.
+
+    Returns:
+        {layout_name: CompiledLayout}
+    """
+    started = time.monotonic()
+    layouts = {}
+    for name, slots in LAYOUT_SLOTS.items():
+        path = os.path.join(layout_dir, f"{name}.html")
+        try:
+            with open(path, encoding="utf-8") as f:
+                layouts[name] = CompiledLayout(name, f.read(), slots)
+        except (OSError, LayoutError) as e:
+            logger.error(f"[Layouts] Could not compile {name}: {e}")
+    logger.info(f"[Layouts] Compiled {len(layouts)} layouts in {(time.monotonic() - started) * 1000:.0f}ms")
+    return layouts
+
+
+def preload_layouts() -> Dict[str, CompiledLayout]:
+    """Compile the layouts once per process (called at startup, safe to call again)."""
+    global _layouts
+    if _layouts is None:
+        with _layouts_lock:
+            if _layouts is None:
+                _layouts = load_layouts()
+    return _layouts
+
+
+def available_layouts() -> List[str]:
+    """Names of the layouts that compiled successfully."""
+    return sorted(preload_layouts())
+
+
+def get_layout(layout_style: Optional[str]) -> Optional[CompiledLayout]:
+    """Compiled layout by name, falling back to DEFAULT_LAYOUT."""
+    layouts = preload_layouts()
+    layout = layouts.get(layout_style or DEFAULT_LAYOUT)
+    if layout is None:
+        if layout_style:
+            logger.warning(f"[Layouts] Unknown layout '{layout_style}', using {DEFAULT_LAYOUT}")
+        layout = layouts.get(DEFAULT_LAYOUT)
+    return layout
+
+
+def render_article_layout(
+    article_data: Dict[str, Any],
+    hero_image_url: str,
+    section_images: List[Dict[str, str]],
+    layout_style: str = DEFAULT_LAYOUT,
+    brand_colors: Optional[Dict[str, str]] = None
+) -> Optional[str]:
+    """
+    Format an article with a compiled template layout.
+
+    Args:
+        article_data: Structured data from story_generation.py
+        hero_image_url: URL for hero cover image
+        section_images: [{"heading": "...", "url": "..."}]
+        layout_style: Layout name from layouts/ (falls back to DEFAULT_LAYOUT)
+        brand_colors: {"primary": "#color1", "accent": "#color2"}, or None for
+            the layout's own palette
+
+    Returns:
+        Complete HTML document, or None if rendering failed
+    """
+    try:
+        layout = get_layout(layout_style)
+        if layout is None:
+            logger.error("[Layouts] No layouts available")
+            return None
+        started = time.monotonic()
+        formatted_html = layout.render(article_data, hero_image_url, section_images, brand_colors)
+        logger.info(
+            f"[Layouts] Rendered '{layout.name}' in {(time.monotonic() - started) * 1000:.1f}ms "
+            f"({len(formatted_html)} chars)"
+        )
+        return formatted_html
+    except Exception as e:
+        logger.error(f"[Layouts] Error rendering layout '{layout_style}': {e}")
+        logger.debug(f"[Layouts] Traceback: {e}", exc_info=True)
+        return None
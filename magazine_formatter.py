@@ -11,11 +11,9 @@ Takes structured article data and assembles complete magazine layout with:
 This is the final assembly step that produces WordPress-ready HTML.
 """
 
-import os
 import re
 import logging
 from typing import Dict, List, Optional, Any
-from dotenv import load_dotenv
 from bs4 import BeautifulSoup
 
 logger = logging.getLogger(__name__)
@@ -417,13 +415,6 @@ MAGAZINE_CSS_TEMPLATE = """
 """
 
 
-def load_user_env(user_id: int) -> None:
-    """Load user-specific environment variables."""
-    env_file = f".env.user_{user_id}"
-    if os.path.exists(env_file):
-        load_dotenv(env_file, override=True)  # CRITICAL: Override existing env vars
-
-
 def insert_component_after_paragraph(soup: BeautifulSoup, paragraph_index: int, component_html: str):
     """Insert component HTML after the Nth paragraph tag."""
     paragraphs = soup.find_all('p')
@@ -554,14 +545,12 @@ def apply_magazine_styling(
             }
         hero_image_url: WordPress URL for hero image
         section_images: [{"heading": "...", "url": "..."}]
-        user_id: User ID for environment
+        user_id: User ID (names the emergency backup file)
         brand_colors: Optional {"primary": "#08b2c6", "accent": "#ff6b11"}
 
     Returns:
         Complete styled HTML ready for WordPress
     """
-    load_user_env(user_id)
-
     try:
         title = article_data.get("title", "Article")
         html_content = article_data.get("html", "")
@@ -0,0 +1,58 @@
+"""
+Migration: Add article_layout and premium_formatting columns to user
+Run: python migrations/add_article_layout_preferences.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+COLUMNS = [
+    ("article_layout", "VARCHAR(50) DEFAULT 'premium_magazine'"),
+    ("premium_formatting", "BOOLEAN DEFAULT 0"),
+]
+
+
+def migrate():
+    """Add layout preference columns (template layout name, Claude premium formatting flag)"""
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    with engine.begin() as conn:  # Use begin() for auto-commit
+        print("Starting article layout preferences migration...")
+
+        for step, (column, definition) in enumerate(COLUMNS, start=1):
+            print(f"{step}. Adding {column} column...")
+            try:
+                conn.execute(text(f"ALTER TABLE user ADD COLUMN {column} {definition}"))
+                print("   [OK] Column added successfully")
+            except Exception as e:
+                if "Duplicate column name" in str(e) or "duplicate column" in str(e).lower():
+                    print("   [SKIP] Column already exists, skipping...")
+                else:
+                    raise
+
+        print("\n" + "=" * 60)
+        print("[SUCCESS] Migration completed successfully!")
+        print("=" * 60)
+        print("\nNEXT STEPS:")
+        print("1. Restart the app and worker pool - articles now use the compiled template layouts")
+        print("2. Users opt into Claude formatting with premium_formatting via /api/update_brand_colors")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,65 @@
+"""
+Migration: Add the attempt counter column to generation_jobs
+Run: python migrations/add_attempt_to_generation_jobs.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+
+def migrate():
+    """Key each job attempt's credit changes by its attempt number (see generation_jobs.py)"""
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    with engine.begin() as conn:  # Use begin() for auto-commit
+        print("Starting generation job attempt migration...")
+
+        print("1. Adding attempt column...")
+        try:
+            conn.execute(text("ALTER TABLE generation_jobs ADD COLUMN attempt INTEGER NOT NULL DEFAULT 1"))
+            print("   [OK] Column added successfully")
+        except Exception as e:
+            if "Duplicate column name" in str(e) or "duplicate column" in str(e).lower():
+                print("   [SKIP] Column already exists, skipping...")
+            else:
+                raise
+
+        print("2. Backfilling attempts of resumed jobs from their ledger charges...")
+        attempts = {}
+        rows = conn.execute(text(
+            "SELECT idempotency_key FROM credit_transactions WHERE idempotency_key LIKE 'job:%:charge:%'"
+        ))
+        for (key,) in rows:
+            _, job_id, _, number = key.split(":")
+            attempts[job_id] = max(attempts.get(job_id, 1), int(number))
+        resumed = {job_id: number for job_id, number in attempts.items() if number > 1}
+        for job_id, number in resumed.items():
+            conn.execute(text("UPDATE generation_jobs SET attempt = :attempt WHERE id = :id"),
+                         {"attempt": number, "id": job_id})
+        print(f"   [OK] {len(resumed)} resumed job(s) updated")
+
+        print("\n" + "=" * 60)
+        print("[SUCCESS] Migration completed successfully!")
+        print("=" * 60)
+        print("\nNEXT STEPS:")
+        print("1. Restart the app and the worker pool (stop_v3.sh, then start_v3_production.sh)")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,59 @@
+"""
+Migration: Add the worker heartbeat column to generation_jobs
+Run: python migrations/add_heartbeat_to_generation_jobs.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+
+def migrate():
+    """Let workers heartbeat their running jobs (see generation_jobs.py)"""
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    with engine.begin() as conn:  # Use begin() for auto-commit
+        print("Starting generation job heartbeat migration...")
+
+        print("1. Adding heartbeat_at column...")
+        try:
+            conn.execute(text("ALTER TABLE generation_jobs ADD COLUMN heartbeat_at DATETIME"))
+            print("   [OK] Column added successfully")
+        except Exception as e:
+            if "Duplicate column name" in str(e) or "duplicate column" in str(e).lower():
+                print("   [SKIP] Column already exists, skipping...")
+            else:
+                raise
+
+        print("2. Backfilling heartbeats of running jobs from their start time...")
+        result = conn.execute(text(
+            "UPDATE generation_jobs SET heartbeat_at = started_at "
+            "WHERE status = 'running' AND heartbeat_at IS NULL"
+        ))
+        print(f"   [OK] {result.rowcount} running job(s) updated")
+
+        print("\n" + "=" * 60)
+        print("[SUCCESS] Migration completed successfully!")
+        print("=" * 60)
+        print("\nNEXT STEPS:")
+        print("1. Restart the worker pool (stop_v3.sh, then start_v3_production.sh)")
+        print("2. Tune GENERATION_HEARTBEAT_SECONDS / GENERATION_JOB_TIMEOUT in .env")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
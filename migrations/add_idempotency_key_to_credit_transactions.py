@@ -0,0 +1,84 @@
+"""
+Migration: Add idempotency_key (unique) to credit_transactions
+Run: python migrations/add_idempotency_key_to_credit_transactions.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+def migrate():
+    """Give ledger rows an idempotency key so retried credit changes apply once (see credit_system.py)"""
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    with engine.begin() as conn:  # Use begin() for auto-commit
+        print("Starting credit ledger migration...")
+
+        print("1. Adding idempotency_key column...")
+        try:
+            conn.execute(text("ALTER TABLE credit_transactions ADD COLUMN idempotency_key VARCHAR(255)"))
+            print("   [OK] Column added successfully")
+        except Exception as e:
+            if "Duplicate column name" in str(e) or "duplicate column" in str(e).lower():
+                print("   [SKIP] Column already exists, skipping...")
+            else:
+                raise
+
+        # Key the first row of each existing payment and welcome bonus, so they are never applied again
+        print("2. Backfilling keys of existing payments and welcome credits...")
+        rows = conn.execute(text(
+            "SELECT id, user_id, transaction_type, stripe_payment_intent_id FROM credit_transactions "
+            "WHERE idempotency_key IS NULL AND (transaction_type = 'welcome' OR "
+            "(transaction_type IN ('purchase', 'auto_recharge') AND stripe_payment_intent_id IS NOT NULL)) "
+            "ORDER BY id"
+        )).fetchall()
+        keyed = set(key for (key,) in conn.execute(text(
+            "SELECT idempotency_key FROM credit_transactions WHERE idempotency_key IS NOT NULL"
+        )))
+        backfilled = 0
+        for row_id, user_id, transaction_type, payment_intent_id in rows:
+            key = f"welcome:{user_id}" if transaction_type == 'welcome' else f"stripe:{payment_intent_id}"
+            if key in keyed:
+                continue  # A duplicate of an earlier row - left unkeyed
+            conn.execute(text("UPDATE credit_transactions SET idempotency_key = :key WHERE id = :id"),
+                         {"key": key, "id": row_id})
+            keyed.add(key)
+            backfilled += 1
+        print(f"   [OK] {backfilled} row(s) keyed")
+
+        print("3. Creating unique index on idempotency_key...")
+        try:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX uq_credit_transactions_idempotency_key ON credit_transactions (idempotency_key)"
+            ))
+            print("   [OK] Index created successfully")
+        except Exception as e:
+            if "already exists" in str(e).lower() or "Duplicate key name" in str(e):
+                print("   [SKIP] Index already exists, skipping...")
+            else:
+                raise
+
+        print("\n" + "=" * 60)
+        print("[SUCCESS] Migration completed successfully!")
+        print("=" * 60)
+        print("\nNEXT STEPS:")
+        print("1. Restart the app, worker pool and scheduler - credit changes are now atomic and idempotent")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
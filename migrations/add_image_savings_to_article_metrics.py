@@ -0,0 +1,59 @@
+"""
+Migration: Add image_bytes_original and image_bytes_optimized columns to article_metrics
+Run: python migrations/add_image_savings_to_article_metrics.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+COLUMNS = [
+    ("image_bytes_original", "BIGINT DEFAULT 0"),
+    ("image_bytes_optimized", "BIGINT DEFAULT 0"),
+]
+
+
+def migrate():
+    """Add per-run image sizes before and after recompression"""
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    with engine.begin() as conn:  # Use begin() for auto-commit
+        print("Starting image savings migration...")
+
+        for step, (column, definition) in enumerate(COLUMNS, start=1):
+            print(f"{step}. Adding {column} column...")
+            try:
+                conn.execute(text(f"ALTER TABLE article_metrics ADD COLUMN {column} {definition}"))
+                print("   [OK] Column added successfully")
+            except Exception as e:
+                if "Duplicate column name" in str(e) or "duplicate column" in str(e).lower():
+                    print("   [SKIP] Column already exists, skipping...")
+                else:
+                    raise
+
+        print("\n" + "=" * 60)
+        print("[SUCCESS] Migration completed successfully!")
+        print("=" * 60)
+        print("\nNEXT STEPS:")
+        print("1. pip install -r requirements.txt (adds Pillow)")
+        print("2. Restart the app and worker pool - images are recompressed before embedding/uploading")
+        print("3. Tune IMAGE_FORMAT / IMAGE_QUALITY in .env; savings show in /api/admin/metrics")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
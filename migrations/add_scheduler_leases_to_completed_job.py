@@ -0,0 +1,89 @@
+"""
+Migration: Add lease columns (status, owner, heartbeat, lease expiry) to completed_job
+Run: python migrations/add_scheduler_leases_to_completed_job.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+COLUMNS = [
+    ("due_at", "DATETIME"),
+    ("status", "VARCHAR(20) NOT NULL DEFAULT 'completed'"),
+    ("owner", "VARCHAR(255)"),
+    ("heartbeat_at", "DATETIME"),
+    ("lease_expires_at", "DATETIME"),
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+INDEXES = [
+    ("idx_completed_job_status_lease", "status, lease_expires_at"),
+    ("ix_completed_job_due_at", "due_at"),
+]
+
+
+def migrate():
+    """Let several scheduler instances lease slot runs (see scheduled_jobs.py)"""
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    with engine.begin() as conn:  # Use begin() for auto-commit
+        print("Starting scheduler lease migration...")
+
+        step = 0
+        for column, definition in COLUMNS:
+            step += 1
+            print(f"{step}. Adding {column} column...")
+            try:
+                conn.execute(text(f"ALTER TABLE completed_job ADD COLUMN {column} {definition}"))
+                print("   [OK] Column added successfully")
+            except Exception as e:
+                if "Duplicate column name" in str(e) or "duplicate column" in str(e).lower():
+                    print("   [SKIP] Column already exists, skipping...")
+                else:
+                    raise
+
+        for index, columns in INDEXES:
+            step += 1
+            print(f"{step}. Creating index {index}...")
+            try:
+                conn.execute(text(f"CREATE INDEX {index} ON completed_job ({columns})"))
+                print("   [OK] Index created successfully")
+            except Exception as e:
+                if "already exists" in str(e).lower() or "Duplicate key name" in str(e):
+                    print("   [SKIP] Index already exists, skipping...")
+                else:
+                    raise
+
+        step += 1
+        print(f"{step}. Marking unfinished runs of the old scheduler as failed...")
+        result = conn.execute(text(
+            "UPDATE completed_job SET status = 'failed' WHERE completed_time IS NULL AND owner IS NULL"
+        ))
+        print(f"   [OK] {result.rowcount} run(s) marked failed")
+
+        print("\n" + "=" * 60)
+        print("[SUCCESS] Migration completed successfully!")
+        print("=" * 60)
+        print("\nNEXT STEPS:")
+        print("1. Restart the scheduler daemon (stop_v3.sh, then start_v3_production.sh)")
+        print("2. Optionally start scheduler_v3.py --daemon on more nodes sharing the database")
+        print("3. Tune SCHEDULER_LEASE_SECONDS / SCHEDULER_HEARTBEAT_SECONDS in .env")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,49 @@
+"""
+Migration: Create article_metrics table for per-run pipeline instrumentation
+Run: python migrations/create_article_metrics_table.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, inspect
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+def migrate():
+    """Create article_metrics table (with its article and created_at indexes) from the model definition"""
+    from app_v3 import ArticleMetrics
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    print("Starting pipeline metrics migration...")
+
+    print("1. Creating article_metrics table...")
+    if inspect(engine).has_table(ArticleMetrics.__tablename__):
+        print("   [SKIP] Table already exists, skipping...")
+    else:
+        ArticleMetrics.__table__.create(bind=engine)
+        print("   [OK] Table created successfully")
+
+    print("\n" + "=" * 60)
+    print("[SUCCESS] Migration completed successfully!")
+    print("=" * 60)
+    print("\nNEXT STEPS:")
+    print("1. Restart the app and worker pool - every run now records metrics")
+    print("2. Set METRICS_TOKEN in .env and scrape /metrics with 'Authorization: Bearer <token>'")
+    print("3. Admins can view percentiles at /api/admin/metrics?days=7")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
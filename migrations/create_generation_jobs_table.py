@@ -0,0 +1,48 @@
+"""
+Migration: Create generation_jobs table for the async article generation queue
+Run: python migrations/create_generation_jobs_table.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, inspect
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+def migrate():
+    """Create generation_jobs table (with its status index) from the model definition"""
+    from app_v3 import GenerationJob
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    print("Starting generation job queue migration...")
+
+    print("1. Creating generation_jobs table...")
+    if inspect(engine).has_table(GenerationJob.__tablename__):
+        print("   [SKIP] Table already exists, skipping...")
+    else:
+        GenerationJob.__table__.create(bind=engine)
+        print("   [OK] Table created successfully")
+
+    print("\n" + "=" * 60)
+    print("[SUCCESS] Migration completed successfully!")
+    print("=" * 60)
+    print("\nNEXT STEPS:")
+    print("1. Start the worker pool: python generation_worker.py")
+    print("2. Or restart with ./start_v3_production.sh (starts it automatically)")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,48 @@
+"""
+Migration: Create pipeline_checkpoints table for resumable generation runs
+Run: python migrations/create_pipeline_checkpoints_table.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, inspect
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+def migrate():
+    """Create pipeline_checkpoints table (with its run/stage unique constraint) from the model definition"""
+    from app_v3 import PipelineCheckpoint
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    print("Starting pipeline checkpoint migration...")
+
+    print("1. Creating pipeline_checkpoints table...")
+    if inspect(engine).has_table(PipelineCheckpoint.__tablename__):
+        print("   [SKIP] Table already exists, skipping...")
+    else:
+        PipelineCheckpoint.__table__.create(bind=engine)
+        print("   [OK] Table created successfully")
+
+    print("\n" + "=" * 60)
+    print("[SUCCESS] Migration completed successfully!")
+    print("=" * 60)
+    print("\nNEXT STEPS:")
+    print("1. Restart the worker pool so failed jobs can be resumed from checkpoints")
+    print("2. Optional: set CHECKPOINT_RETENTION_DAYS (default 7) in .env")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
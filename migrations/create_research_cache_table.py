@@ -0,0 +1,60 @@
+"""
+Migration: Create research_cache table and add the fresh_research opt-out to user
+Run: python migrations/create_research_cache_table.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, inspect, text
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+def migrate():
+    """Create research_cache table (unique cache key, LRU/expiry indexes) and the user.fresh_research column"""
+    from app_v3 import ResearchCache
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    print("Starting research cache migration...")
+
+    print("1. Creating research_cache table...")
+    if inspect(engine).has_table(ResearchCache.__tablename__):
+        print("   [SKIP] Table already exists, skipping...")
+    else:
+        ResearchCache.__table__.create(bind=engine)
+        print("   [OK] Table created successfully")
+
+    print("2. Adding fresh_research column to user...")
+    with engine.begin() as conn:  # Use begin() for auto-commit
+        try:
+            conn.execute(text("ALTER TABLE user ADD COLUMN fresh_research BOOLEAN DEFAULT 0"))
+            print("   [OK] Column added successfully")
+        except Exception as e:
+            if "Duplicate column name" in str(e) or "duplicate column" in str(e).lower():
+                print("   [SKIP] Column already exists, skipping...")
+            else:
+                raise
+
+    print("\n" + "=" * 60)
+    print("[SUCCESS] Migration completed successfully!")
+    print("=" * 60)
+    print("\nNEXT STEPS:")
+    print("1. Restart the app, worker pool and scheduler - Perplexity research is now shared")
+    print("2. Optional: set RESEARCH_CACHE_TTL / RESEARCH_CACHE_MAX_ENTRIES in .env")
+    print("3. Users who need fresh research every time set fresh_research via /api/profile")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
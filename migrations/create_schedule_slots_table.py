@@ -0,0 +1,54 @@
+"""
+Migration: Create schedule_slots table and fill it from existing user schedules
+Run: python migrations/create_schedule_slots_table.py
+"""
+
+import sys
+import os
+from sqlalchemy import create_engine, inspect
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Load environment variables
+load_dotenv()
+
+def migrate():
+    """Create schedule_slots table (indexed next_run_at) and compute next run times of every saved schedule"""
+    from app_v3 import app, ScheduleSlot
+    from schedule_slots import rebuild_all_schedule_slots
+
+    # Get database URI from environment or use SQLite default
+    database_uri = os.getenv('DATABASE_URL', 'sqlite:///ezwai_smm.db')
+    engine = create_engine(database_uri)
+
+    print("Starting schedule slots migration...")
+
+    print("1. Creating schedule_slots table...")
+    if inspect(engine).has_table(ScheduleSlot.__tablename__):
+        print("   [SKIP] Table already exists, skipping...")
+    else:
+        ScheduleSlot.__table__.create(bind=engine)
+        print("   [OK] Table created successfully")
+
+    print("2. Computing next run times from user schedules...")
+    with app.app_context():
+        slot_count = rebuild_all_schedule_slots()
+    print(f"   [OK] {slot_count} schedule slot(s) scheduled")
+
+    print("\n" + "=" * 60)
+    print("[SUCCESS] Migration completed successfully!")
+    print("=" * 60)
+    print("\nNEXT STEPS:")
+    print("1. Remove the */5 cron entry for run_scheduler_v3.sh")
+    print("2. Start the scheduler daemon: python scheduler_v3.py --daemon (start_v3_production.sh does this)")
+
+if __name__ == '__main__':
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
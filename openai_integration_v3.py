@@ -565,8 +565,8 @@ def generate_images_with_seedream(
 # ----------------------------------------------------------------------------
 # WordPress media persistence
 # ----------------------------------------------------------------------------
+from image_cache import get_image_cache
 from wordpress_integration import (
-    download_image as wp_download_image,
     get_jwt_token,
     load_user_env as wp_load_user_env,
 )
@@ -603,31 +603,20 @@ def _upload_media_to_wordpress(image_path: str, user_id: int) -> Optional[Dict[s
 
 def _persist_image_to_wordpress(tmp_url: Optional[str], user_id: int) -> Optional[str]:
     """
-    Download ephemeral Replicate URL to temp, upload to WP Media, return permanent source_url.
+    Read ephemeral Replicate URL through the image cache, upload to WP Media, return permanent source_url.
     """
-    import tempfile
-    import time
-
-    tmp_path: Optional[str] = None
     if not tmp_url:
         return None
 
     try:
         wp_load_user_env(user_id)
-        ts = int(time.time() * 1000)
-        tmp_path = os.path.join(tempfile.gettempdir(), f"ai_img_{user_id}_{ts}.jpg")
-        wp_download_image(tmp_url, tmp_path)
-        media = _upload_media_to_wordpress(tmp_path, user_id)
+        cache = get_image_cache()
+        cache.fetch(tmp_url)
+        media = _upload_media_to_wordpress(cache.path(tmp_url), user_id)
         return (media or {}).get("source_url")
     except Exception as e:
         logger.error("WP persist: %s", e)
         return None
-    finally:
-        try:
-            if tmp_path and os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
 
 # ----------------------------------------------------------------------------
 # HTML post-processing
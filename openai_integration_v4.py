@@ -5,38 +5,81 @@ Coordinates the 4-step modular pipeline:
 1. Story Generation (GPT-5) - Structured JSON with components
 2. Image Prompt Generation (GPT-5-mini) - Section-aligned prompts
 3. Image Generation (SeeDream-4 via Replicate)
-4. Magazine Formatting (GPT-5-mini) - Styled layout assembly
+4. Magazine Formatting - Compiled template layout (Claude in premium mode)
 
 V4 UPDATE: Now uses structured article generation with component metadata
 for reliable magazine layout assembly.
+
+The steps run as a stage graph (see pipeline_executor.py), so independent
+work - hero vs section images, WordPress uploads vs formatting - overlaps.
 """
 
 import os
 import logging
+import threading
+import contextvars
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple, Any
-from dotenv import load_dotenv
 import replicate
 
 # Import V4 modular components
+from job_settings import JobSettings, get_job_settings
+from provider_limits import provider_slot, PROVIDER_CONCURRENCY
 from story_generation import generate_clean_article
-from image_prompt_generator import generate_contextual_image_prompts
-from claude_formatter import format_article_with_claude
+from image_prompt_generator import generate_contextual_image_prompts, generate_hero_image_prompt
+from claude_formatter import format_article_with_claude  # Premium formatter
+from layout_engine import render_article_layout, DEFAULT_LAYOUT
 from magazine_formatter import apply_magazine_styling  # Fallback formatter
+from pipeline_executor import Stage, PipelineError, run_pipeline
+from pipeline_checkpoints import CheckpointStore, REPLICATE_URL_TTL_SECONDS
+from pipeline_metrics import (
+    current_run,
+    track_stage,
+    record_stage_timings,
+    record_replicate_prediction
+)
+from image_optimizer import (
+    optimize_image,
+    file_extension,
+    HERO_MAX_WIDTH,
+    SECTION_MAX_WIDTH
+)
+from image_cache import fetch_image, get_image_cache
+from replicate_completion import (
+    get_webhook_url,
+    webhooks_enabled,
+    get_completion,
+    wait_for_any,
+    discard_completion,
+    next_poll_delay
+)
 
 # Import shared utilities
-from wordpress_integration import download_image, upload_image_to_wordpress
+from wordpress_integration import (
+    upload_image_to_wordpress,
+    upload_image_bytes_to_wordpress,
+    resolve_wordpress_site,
+    WordPressSite
+)
 
 logger = logging.getLogger(__name__)
 
+# Max simultaneous image downloads in local mode (hero + section images)
+LOCAL_DOWNLOAD_CONCURRENCY = int(os.getenv('LOCAL_DOWNLOAD_CONCURRENCY', '5'))
+
 
-def _download_and_convert_to_base64(image_url: str) -> Optional[str]:
+def _download_and_convert_to_base64(image_url: str, max_width: int = SECTION_MAX_WIDTH) -> Optional[str]:
     """
     Download image from Replicate URL and convert to base64 data URI.
     Must be called within 60-minute Replicate expiry window.
 
+    The image is read through the shared image cache (see image_cache.py)
+    and downscaled to its display width and recompressed first (see
+    image_optimizer.py), so the embedded data URI stays small.
+
     Args:
         image_url: Replicate image URL (expires in 60 minutes)
+        max_width: Display width (HERO_MAX_WIDTH for the hero image)
 
     Returns:
         Base64 data URI string (e.g., "data:image/jpeg;base64,/9j/4AAQ...") or None if failed
@@ -48,18 +91,15 @@ def _download_and_convert_to_base64(image_url: str) -> Optional[str]:
     try:
         logger.info(f"[DOWNLOAD] Fetching image from: {image_url[:80]}...")
 
-        response = requests.get(image_url, timeout=30)
-        response.raise_for_status()
-
-        # Detect image type from Content-Type header
-        content_type = response.headers.get('Content-Type', 'image/jpeg')
+        image_bytes, content_type = fetch_image(image_url)
+        image_bytes, content_type = optimize_image(image_bytes, max_width, content_type=content_type)
         image_format = content_type.split('/')[-1]  # e.g., "jpeg", "png", "webp"
 
         # Convert to base64
-        image_data = base64.b64encode(response.content).decode('utf-8')
+        image_data = base64.b64encode(image_bytes).decode('utf-8')
         base64_uri = f"data:{content_type};base64,{image_data}"
 
-        size_kb = len(response.content) / 1024
+        size_kb = len(image_bytes) / 1024
         logger.info(f"[DOWNLOAD] ✅ Converted to base64 ({size_kb:.1f} KB, format: {image_format})")
 
         return base64_uri
@@ -72,6 +112,39 @@ def _download_and_convert_to_base64(image_url: str) -> Optional[str]:
         return None
 
 
+def download_images_as_base64(
+    image_urls: List[Optional[str]],
+    max_width: int = SECTION_MAX_WIDTH
+) -> List[Optional[str]]:
+    """
+    Download images concurrently and convert them to base64 data URIs.
+
+    Args:
+        image_urls: Replicate URLs in pipeline order (None entries are skipped)
+        max_width: Display width the images are downscaled to
+
+    Returns:
+        Data URIs in the same order (None where the download failed)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    results: List[Optional[str]] = [None] * len(image_urls)
+    work = [(i, url) for i, url in enumerate(image_urls) if url]
+    if not work:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(len(work), LOCAL_DOWNLOAD_CONCURRENCY)) as pool:
+        # copy_context: downloads record their bytes into the caller's metrics run
+        futures = {
+            index: pool.submit(contextvars.copy_context().run, _download_and_convert_to_base64, url, max_width)
+            for index, url in work
+        }
+        for index, future in futures.items():
+            results[index] = future.result()  # Never raises - failures return None
+
+    return results
+
+
 def _save_raw_article(article_data: Dict, user_id: int, stage: str) -> None:
     """
     Save raw article content to disk at various pipeline stages.
@@ -186,16 +259,6 @@ Status: FULLY FORMATTED with inline styles
         logger.error(f"[BACKUP] Failed to save formatted article: {e}")
 
 
-def _wp_base_url() -> str:
-    """Get WordPress base URL."""
-    base_url = os.getenv("WORDPRESS_REST_API_URL", "").rstrip("/")
-    if base_url.endswith("/wp-json/wp/v2"):
-        base_url = base_url[: -len("/wp-json/wp/v2")]
-    elif base_url.endswith("/wp-json"):
-        base_url = base_url[: -len("/wp-json")]
-    return base_url
-
-
 def _upload_media_to_wordpress(image_path: str, user_id: int):
     """Upload image to WordPress media library using Application Password authentication."""
     try:
@@ -214,169 +277,386 @@ def _upload_media_to_wordpress(image_path: str, user_id: int):
         return None
 
 
+# Per-image limits for SeeDream-4 predictions (sufficient for 2K output)
+SEEDREAM_TIMEOUT_SECONDS = 4 * 60
+SEEDREAM_MAX_RETRIES = 1  # Try once, retry once if timeout/error
+
+_replicate_clients: Dict[str, replicate.Client] = {}
+_replicate_clients_lock = threading.Lock()
+
+
+def _get_replicate_client(api_token: str) -> replicate.Client:
+    """Shared Replicate client per API token (keeps its connection pool)."""
+    with _replicate_clients_lock:
+        client = _replicate_clients.get(api_token)
+        if client is None:
+            client = replicate.Client(api_token=api_token)
+            _replicate_clients[api_token] = client
+        return client
+
+
+def _submit_seedream_prediction(job: Dict[str, Any]) -> bool:
+    """
+    Create a Replicate prediction for one image job.
+
+    Updates the job dict in place with the new prediction and its deadline.
+
+    Returns:
+        True if the prediction was created, False if creation failed
+    """
+    import time
+
+    image_num = job["index"] + 1
+    try:
+        if job["attempt"] > 0:
+            logger.info(f"[SeeDream] RETRY {job['attempt']}/{SEEDREAM_MAX_RETRIES} for image {image_num}")
+        else:
+            logger.info(f"[SeeDream] Submitting image {image_num}: {job['prompt'][:80]}...")
+
+        # Ask Replicate to call our webhook on completion (if configured)
+        webhook_params = {}
+        webhook_url = get_webhook_url()
+        if webhook_url:
+            webhook_params = {"webhook": webhook_url, "webhook_events_filter": ["completed"]}
+
+        prediction = job["client"].predictions.create(
+            model="bytedance/seedream-4",
+            input={
+                "prompt": job["prompt"],
+                "aspect_ratio": job["aspect_ratio"],
+                "output_format": "jpg",
+                "output_quality": 90,
+                "num_outputs": 1,
+                "guidance_scale": 5.0,
+                "num_inference_steps": 28,
+                "disable_safety_checker": False
+            },
+            **webhook_params
+        )
+
+        # Log prediction ID immediately for debugging
+        logger.info(f"[SeeDream] Created prediction ID: {prediction.id} (image {image_num})")
+
+        now = time.monotonic()
+        job["prediction"] = prediction
+        job["deadline"] = now + SEEDREAM_TIMEOUT_SECONDS
+        job["last_status"] = None
+        job["polls"] = 0
+        job["next_poll_at"] = now + next_poll_delay(0, webhooks=bool(webhook_url))
+        return True
+
+    except Exception as e:
+        import traceback
+        logger.error(f"[SeeDream] Error creating prediction for image {image_num} (attempt {job['attempt'] + 1}): {e}")
+        logger.error(f"[SeeDream] Traceback: {traceback.format_exc()}")
+        job["prediction"] = None
+        return False
+
+
+def _retry_seedream_job(job: Dict[str, Any]) -> bool:
+    """
+    Resubmit a job with a NEW prediction if it has retries left.
+
+    Returns:
+        True if the job is pending again, False if it is out of retries
+    """
+    image_num = job["index"] + 1
+    while job["attempt"] < SEEDREAM_MAX_RETRIES:
+        job["attempt"] += 1
+        logger.info(f"[SeeDream] Will retry image {image_num} with NEW prediction...")
+        if _submit_seedream_prediction(job):
+            return True
+
+    logger.error(f"[SeeDream] All {SEEDREAM_MAX_RETRIES + 1} attempts failed for image {image_num}")
+    return False
+
+
+def _run_seedream_jobs(jobs: List[Dict[str, Any]], results: List[Optional[str]], webhooks: bool) -> None:
+    """
+    Submit every job's prediction and track them until each succeeds, fails or times out.
+
+    Fills results[job["index"]] with the output URL of each succeeded job.
+    """
+    import time
+
+    logger.info(f"[SeeDream] Submitting {len(jobs)} predictions concurrently (webhooks: {'on' if webhooks else 'off'})")
+    pending = [job for job in jobs if _submit_seedream_prediction(job) or _retry_seedream_job(job)]
+
+    while pending:
+        now = time.monotonic()
+
+        for job in list(pending):
+            prediction = job["prediction"]
+            image_num = job["index"] + 1
+
+            completion = get_completion(prediction.id)
+            if completion:
+                # Webhook delivered the final state - no API call needed
+                prediction.status = completion["status"]
+                prediction.output = completion.get("output")
+                prediction.error = completion.get("error")
+                prediction.metrics = completion.get("metrics") or getattr(prediction, "metrics", None)
+                discard_completion(prediction.id)
+            elif now >= job["next_poll_at"]:
+                # Fallback poll (no webhook yet) with adaptive backoff
+                try:
+                    prediction.reload()
+                except Exception as e:
+                    logger.error(f"[SeeDream] Error polling prediction {prediction.id} for image {image_num}: {e}")
+                    if not _retry_seedream_job(job):
+                        pending.remove(job)
+                    continue
+                job["polls"] += 1
+                job["next_poll_at"] = now + next_poll_delay(job["polls"], webhooks)
+
+            # Log status changes for debugging
+            if prediction.status != job["last_status"]:
+                logger.info(f"[SeeDream] Prediction {prediction.id} status: {prediction.status}")
+                job["last_status"] = prediction.status
+
+            if prediction.status in ["succeeded", "failed", "canceled"]:
+                record_replicate_prediction(prediction)
+
+            if prediction.status == "succeeded":
+                output = prediction.output
+                if isinstance(output, str):
+                    output = [output]
+                if output and len(output) > 0:
+                    results[job["index"]] = output[0]
+                    logger.info(f"[SeeDream] Image {image_num} succeeded after {job['polls']} polls: {output[0][:60]}...")
+                else:
+                    logger.error(f"[SeeDream] No output for image {image_num}")
+                pending.remove(job)
+
+            elif prediction.status in ["failed", "canceled"]:
+                logger.error(f"[SeeDream] Image {image_num} {prediction.status}: {getattr(prediction, 'error', 'Unknown error')}")
+                pending.remove(job)
+
+            elif now > job["deadline"]:
+                # Timeout reached - prediction never completed
+                logger.error(f"[SeeDream] Image {image_num} TIMED OUT after {SEEDREAM_TIMEOUT_SECONDS // 60} minutes (Prediction ID: {prediction.id})")
+
+                # Cancel the stuck prediction
+                try:
+                    prediction.cancel()
+                    logger.info(f"[SeeDream] ✅ Canceled stuck prediction: {prediction.id}")
+                except Exception as cancel_error:
+                    logger.warning(f"[SeeDream] Could not cancel prediction: {cancel_error}")
+
+                if not _retry_seedream_job(job):
+                    pending.remove(job)
+
+        if pending:
+            # Block on the completion registry until a webhook lands or the
+            # next fallback poll / timeout is due
+            wake_at = min(min(job["next_poll_at"], job["deadline"]) for job in pending)
+            wait_for_any(
+                [job["prediction"].id for job in pending],
+                timeout=wake_at - time.monotonic()
+            )
+
+
 def generate_images_with_seedream(
     prompts: List[str],
     user_id: int,
-    aspect_ratio: str = "16:9"
+    aspect_ratio: str = "16:9",
+    aspect_ratios: Optional[List[str]] = None,
+    settings: Optional[JobSettings] = None
 ) -> List[Optional[str]]:
     """
     Generate images via Replicate SeeDream-4.
 
+    All predictions are submitted up front and tracked together, so the wall
+    time is close to the slowest single image rather than the sum of all of
+    them. Each image keeps its own 4-minute timeout, cancel and retry.
+
+    Completion is event-driven: when REPLICATE_WEBHOOK_URL is configured,
+    Replicate calls /webhook/replicate and we wake up from the completion
+    registry. prediction.reload() is only a fallback poller with adaptive
+    backoff (see replicate_completion.next_poll_delay).
+
     Args:
         prompts: List of photographic prompts
         user_id: User ID for environment
         aspect_ratio: "16:9" for hero, "21:9" for sections
+        aspect_ratios: Optional per-prompt aspect ratios (overrides aspect_ratio),
+            e.g. ["16:9", "21:9", "21:9"] to generate hero and sections together
+        settings: The job's settings (Replicate token); looked up from user_id if omitted
 
     Returns:
-        List of image URLs (Replicate URLs, need persistence)
+        List of image URLs in prompt order (Replicate URLs, need persistence).
+        Failed images are None.
     """
-    load_dotenv()  # Load REPLICATE_API_TOKEN from main .env
-
-    api_token = os.getenv("REPLICATE_API_TOKEN")
+    settings = settings or get_job_settings(user_id)
+    api_token = settings.replicate_api_token
     if not api_token:
         logger.error("REPLICATE_API_TOKEN not found")
         return [None] * len(prompts)
 
-    results = []
+    if aspect_ratios is None:
+        aspect_ratios = [aspect_ratio] * len(prompts)
+    elif len(aspect_ratios) != len(prompts):
+        raise ValueError("aspect_ratios must have one entry per prompt")
+
+    webhooks = webhooks_enabled()
+    client = _get_replicate_client(api_token)
+    results: List[Optional[str]] = [None] * len(prompts)
+    jobs = [
+        {"index": i, "prompt": prompt, "aspect_ratio": ratio, "attempt": 0, "client": client}
+        for i, (prompt, ratio) in enumerate(zip(prompts, aspect_ratios))
+    ]
 
-    for i, prompt in enumerate(prompts):
-        max_retries = 1  # Try once, retry once if timeout
-        retry_count = 0
-        image_generated = False
+    # One Replicate unit per prediction in flight, shared with concurrent articles
+    with provider_slot("replicate", units=len(jobs)):
+        _run_seedream_jobs(jobs, results, webhooks)
 
-        while retry_count <= max_retries and not image_generated:
-            try:
-                attempt_num = retry_count + 1
-                if retry_count > 0:
-                    logger.info(f"[SeeDream] RETRY {retry_count}/{max_retries} for image {i+1}")
-                else:
-                    logger.info(f"[SeeDream] Generating image {i+1}/{len(prompts)}: {prompt[:80]}...")
-
-                # Create prediction with manual polling to prevent infinite loops
-                prediction = replicate.predictions.create(
-                    model="bytedance/seedream-4",
-                    input={
-                        "prompt": prompt,
-                        "aspect_ratio": aspect_ratio,
-                        "output_format": "jpg",
-                        "output_quality": 90,
-                        "num_outputs": 1,
-                        "guidance_scale": 5.0,
-                        "num_inference_steps": 28,
-                        "disable_safety_checker": False
-                    }
-                )
+    succeeded = sum(1 for url in results if url)
+    logger.info(f"[SeeDream] {succeeded}/{len(prompts)} images generated")
+    return results
 
-                # Log prediction ID immediately for debugging
-                logger.info(f"[SeeDream] Created prediction ID: {prediction.id}")
 
-                # Poll with 4-minute timeout per image (sufficient for SeeDream-4)
-                from datetime import datetime, timedelta
-                import time
+def _media_filename(user_id: int, index: int, content_type: str = "image/jpeg") -> str:
+    """Unique media library filename for a generated image."""
+    import time
 
-                timeout = datetime.now() + timedelta(minutes=4)
-                poll_interval = 1  # Check every second
-                last_status = None
+    ts = int(time.time() * 1000)
+    return f"ai_img_{user_id}_{ts}_{index}.{file_extension(content_type)}"
 
-                while datetime.now() < timeout:
-                    prediction.reload()
 
-                    # Log status changes for debugging
-                    if prediction.status != last_status:
-                        logger.info(f"[SeeDream] Prediction {prediction.id} status: {prediction.status}")
-                        last_status = prediction.status
-
-                    if prediction.status == "succeeded":
-                        if prediction.output and len(prediction.output) > 0:
-                            image_url = prediction.output[0]
-                            results.append(image_url)
-                            logger.info(f"[SeeDream] Image {i+1} succeeded: {image_url[:60]}...")
-                            image_generated = True
-                        else:
-                            logger.error(f"[SeeDream] No output for image {i+1}")
-                            results.append(None)
-                            image_generated = True
-                        break
-
-                    elif prediction.status in ["failed", "canceled"]:
-                        logger.error(f"[SeeDream] Image {i+1} {prediction.status}: {getattr(prediction, 'error', 'Unknown error')}")
-                        results.append(None)
-                        image_generated = True
-                        break
-
-                    # Still processing, wait before next check
-                    time.sleep(poll_interval)
-                else:
-                    # Timeout reached - prediction never completed
-                    logger.error(f"[SeeDream] Image {i+1} TIMED OUT after 4 minutes (Prediction ID: {prediction.id})")
-
-                    # Cancel the stuck prediction
-                    try:
-                        prediction.cancel()
-                        logger.info(f"[SeeDream] ✅ Canceled stuck prediction: {prediction.id}")
-                        time.sleep(2)  # Wait 2 seconds before retry
-                    except Exception as cancel_error:
-                        logger.warning(f"[SeeDream] Could not cancel prediction: {cancel_error}")
-
-                    # If we have retries left, try again with NEW prediction
-                    if retry_count < max_retries:
-                        logger.info(f"[SeeDream] Will retry image {i+1} with NEW prediction...")
-                        retry_count += 1
-                        continue  # Try again
-                    else:
-                        logger.error(f"[SeeDream] All {max_retries + 1} attempts failed for image {i+1}")
-                        results.append(None)
-                        image_generated = True
+def persist_image_to_wordpress(
+    tmp_url: Optional[str],
+    user_id: int,
+    site: Optional[WordPressSite] = None
+) -> Optional[str]:
+    """
+    Persist an ephemeral Replicate URL (hero-sized) to the WordPress media library.
 
-            except Exception as e:
-                logger.error(f"[SeeDream] Error generating image {i+1} (attempt {attempt_num}): {e}")
-                import traceback
-                logger.error(f"[SeeDream] Traceback: {traceback.format_exc()}")
-
-                if retry_count < max_retries:
-                    logger.info(f"[SeeDream] Will retry after error...")
-                    retry_count += 1
-                    time.sleep(2)
-                    continue
-                else:
-                    results.append(None)
-                    image_generated = True
+    Returns permanent WordPress source_url.
+    """
+    if not tmp_url:
+        return None
 
-    return results
+    return persist_images_to_wordpress([tmp_url], user_id, max_width=HERO_MAX_WIDTH, site=site)[0]
 
 
-def persist_image_to_wordpress(tmp_url: Optional[str], user_id: int) -> Optional[str]:
+def _upload_cached_image(
+    tmp_url: str,
+    user_id: int,
+    index: int,
+    max_width: int,
+    site: WordPressSite
+) -> Optional[Dict[str, Any]]:
     """
-    Download ephemeral Replicate URL and upload to WordPress media library.
+    Read a Replicate image through the image cache, recompress it to
+    max_width and upload the variant.
 
-    Returns permanent WordPress source_url.
+    The uploaded bytes are cached under the returned WordPress source_url,
+    so later readers of that URL (e.g. the featured image in
+    create_wordpress_post) never download it again.
     """
-    import tempfile
-    import time
+    import requests
 
-    if not tmp_url:
+    try:
+        image_bytes, content_type = fetch_image(tmp_url)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"[WP Persist] Failed to download image {index}: {e}")
         return None
 
-    tmp_path = None
-    try:
-        ts = int(time.time() * 1000)
-        tmp_path = os.path.join(tempfile.gettempdir(), f"ai_img_{user_id}_{ts}.jpg")
+    image_bytes, content_type = optimize_image(image_bytes, max_width, content_type=content_type)
+    media = upload_image_bytes_to_wordpress(
+        image_bytes,
+        user_id,
+        filename=_media_filename(user_id, index, content_type),
+        content_type=content_type,
+        site=site
+    )
+    if media and media.get("source_url"):
+        try:
+            get_image_cache().put(image_bytes, content_type, urls=[media["source_url"]])
+        except OSError as e:
+            logger.warning(f"[WP Persist] Could not cache uploaded image {index}: {e}")
+    return media
 
-        download_image(tmp_url, tmp_path)
-        media = _upload_media_to_wordpress(tmp_path, user_id)
 
-        return (media or {}).get("source_url")
+def persist_images_to_wordpress(
+    tmp_urls: List[Optional[str]],
+    user_id: int,
+    first_index: int = 0,
+    max_width: int = SECTION_MAX_WIDTH,
+    site: Optional[WordPressSite] = None
+) -> List[Optional[str]]:
+    """
+    Upload images to the WordPress media library and return their URLs.
 
-    except Exception as e:
-        logger.error(f"[WP Persist] Error: {e}")
-        return None
+    See persist_media_to_wordpress, which also returns the media IDs.
+
+    Returns:
+        WordPress source_urls in the same order (None where upload failed)
+    """
+    media = persist_media_to_wordpress(tmp_urls, user_id, first_index=first_index, max_width=max_width, site=site)
+    return [(item or {}).get("source_url") for item in media]
+
+
+def persist_media_to_wordpress(
+    tmp_urls: List[Optional[str]],
+    user_id: int,
+    first_index: int = 0,
+    max_width: int = SECTION_MAX_WIDTH,
+    site: Optional[WordPressSite] = None
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Upload all generated images to the WordPress media library concurrently.
+
+    Each image is read through the image cache (one network fetch per
+    image), recompressed to max_width when IMAGE_OPTIMIZATION is on, and
+    uploaded. Concurrency per site is bounded by the "wordpress" provider
+    limit (WORDPRESS_SITE_CONCURRENCY).
+
+    Args:
+        tmp_urls: Replicate URLs in pipeline order (None entries are skipped)
+        user_id: User ID
+        first_index: Image number of tmp_urls[0] (keeps filenames unique when
+            hero and section images are persisted separately)
+        max_width: Display width the images are downscaled to
+        site: Resolved WordPress site (looked up from user_id if omitted)
 
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
+    Returns:
+        {"id": media ID, "source_url": permanent URL} per image in the same
+        order (None where upload failed). The hero's ID becomes the post's
+        featured_media, so it is never uploaded twice.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tmp_urls)
+    work = [(i, url) for i, url in enumerate(tmp_urls) if url]
+    if not work:
+        return results
+
+    # Resolve the site once here - worker threads have no app context
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
+        logger.error(f"[WP Persist] WordPress credentials not configured for user {user_id}")
+        return results
+
+    def _persist(index: int, url: str) -> Optional[Dict[str, Any]]:
+        media = _upload_cached_image(url, user_id, first_index + index, max_width, site)
+        if not media or not media.get("source_url"):
+            return None
+        return {"id": media.get("id"), "source_url": media["source_url"]}
+
+    with ThreadPoolExecutor(max_workers=min(len(work), PROVIDER_CONCURRENCY["wordpress"])) as pool:
+        # copy_context: uploads record their bytes into the caller's metrics run
+        futures = {
+            index: pool.submit(contextvars.copy_context().run, _persist, index, url)
+            for index, url in work
+        }
+        for index, future in futures.items():
             try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
+                results[index] = future.result()
+            except Exception as e:
+                logger.error(f"[WP Persist] Error persisting image {index + 1}: {e}")
+
+    return results
 
 
 def _save_article_to_database(
@@ -492,149 +772,139 @@ def _save_images_to_database(
         return False
 
 
-def create_blog_post_with_images_v4(
-    perplexity_research: str,
-    user_id: int,
-    user_system_prompt: str,
-    writing_style: Optional[str] = None,
-    local_mode: bool = False
-) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+def _article_summary(article_data: Dict[str, Any], perplexity_research: str) -> str:
+    """Executive summary intro, falling back to the start of the Perplexity research."""
+    summary = article_data.get("executive_summary", {}).get("intro", "")
+    if not summary:
+        summary = perplexity_research[:500] + "..." if len(perplexity_research) > 500 else perplexity_research
+    return summary
+
+
+def _swap_image_urls(html: str, replacements: Dict[str, Optional[str]]) -> str:
     """
-    V4 Modular Pipeline Orchestrator with Structured Article Generation
+    Replace temporary image URLs in formatted HTML with their permanent URLs.
 
-    Args:
-        perplexity_research: Enhanced research from Perplexity (2000 tokens)
-        user_id: User ID for environment
-        user_system_prompt: User's custom prompt
-        writing_style: Optional writing style for tone/visuals
-        local_mode: If True, skip WordPress upload and embed images as base64 in self-contained HTML
+    A temporary URL mapped to None (upload/download failed) is removed: <img>
+    tags using it are dropped and background-image declarations are stripped,
+    so the published article never references an expiring Replicate URL.
 
-    Returns:
-        (result_dict, error_message)
-        result_dict contains:
-        {
-            "title": "Article title",
-            "content": "Fully styled HTML with magazine components and images",
-            "hero_image_url": "...",  # Base64 data URI if local_mode=True
-            "section_images": [...],  # Base64 data URIs if local_mode=True
-            "all_images": [...],
-            "summary": "...",
-            "prompts": {...},
-            "components": [...]  # NEW: Component metadata for debugging
-        }
+    All URLs are matched by one compiled alternation and the document is
+    rebuilt in a single pass, so the cost is linear in the output size even
+    when the replacements are multi-megabyte base64 data URIs.
     """
+    import re
 
-    try:
-        logger.info("=" * 80)
-        logger.info("[V4 Pipeline] Starting modular article generation")
-        logger.info(f"[V4 Pipeline] Writing style: {writing_style or 'Default'}")
-        logger.info("=" * 80)
+    replacements = {tmp_url: final_url for tmp_url, final_url in replacements.items() if tmp_url}
+    if not replacements:
+        return html
+
+    def alternation(urls):
+        # Longest first and ending at a delimiter, so a URL that prefixes
+        # another (".../a.jpg" vs ".../a.jpg?v=2") never matches inside it
+        escaped = "|".join(re.escape(url) for url in sorted(urls, key=len, reverse=True))
+        return rf"(?:{escaped})(?=[\s'\")>]|$)"
+
+    patterns = []
+    removed = [url for url, final_url in replacements.items() if not final_url]
+    if removed:
+        removed_urls = alternation(removed)
+        patterns.append(rf"(?P<img><img\b[^>]*(?:{removed_urls})[^>]*>)")
+        patterns.append(rf"(?P<background>background-image:\s*url\(['\"]?(?:{removed_urls})['\"]?\);?)")
+    patterns.append(rf"(?P<url>{alternation(replacements)})")
+
+    def substitute(match) -> str:
+        if match.lastgroup != "url":
+            return ""
+        return replacements[match.group()] or ""
+
+    return re.compile("|".join(patterns)).sub(substitute, html)
 
+
+def _build_v4_stages(
+    perplexity_research: str,
+    user_id: int,
+    user_system_prompt: str,
+    writing_style: Optional[str],
+    local_mode: bool,
+    wordpress_site: Optional[WordPressSite] = None,
+    settings: Optional[JobSettings] = None
+) -> List[Stage]:
+    """
+    Build the V4 pipeline stage graph.
+
+    Critical path: story -> section prompts -> section images -> formatting.
+    Everything else overlaps with it:
+    - The story is streamed; the hero prompt/image start as soon as the title
+      and executive summary arrive (story_head), while GPT-5 is still
+      writing the article body
+    - Brand colors load while the story is being written
+    - Claude formats against the Replicate URLs while the images are
+      uploaded to WordPress (or downloaded for local mode); the permanent
+      URLs are swapped in afterwards
+    """
+
+    def story(emit) -> Dict[str, Any]:
         # STEP 1: Generate structured article with component metadata
-        logger.info("\n[STEP 1] Generating structured article content with GPT-5...")
+        logger.info("[STEP 1] Generating structured article content with GPT-5...")
+        head: Dict[str, Any] = {}
+
+        def emit_head(partial: Dict[str, Any]) -> None:
+            if "emitted" in head:
+                return
+            head["emitted"] = True
+            emit("story_head", {
+                "title": partial["title"],
+                "perplexity_summary": _article_summary(partial, perplexity_research)
+            })
+
+        def on_partial(name: str, value: Any) -> None:
+            if name in ("title", "executive_summary"):
+                head[name] = value
+                if "title" in head and "executive_summary" in head:
+                    logger.info(f"[STEP 1] Title streamed: {head['title'][:60]} - starting hero image early")
+                    emit_head(head)
+            elif name == "section":
+                logger.info(f"[STEP 1] Section {value['index'] + 1} streamed ({len(value['html'])} chars)")
+                if "title" in head:
+                    emit_head(head)  # No executive summary - fall back to the research
+
         article_data = generate_clean_article(
             perplexity_research=perplexity_research,
             user_id=user_id,
             user_system_prompt=user_system_prompt,
-            writing_style=writing_style
+            writing_style=writing_style,
+            on_partial=on_partial,
+            settings=settings
         )
-
         if not article_data:
-            return None, "Story generation failed"
+            raise PipelineError("Story generation failed")
+        emit_head(article_data)  # Non-streaming mode
 
-        title = article_data["title"]
         components = article_data.get("components", [])
-        logger.info(f"[STEP 1] ✅ Article generated - Title: {title[:60]}")
+        logger.info(f"[STEP 1] ✅ Article generated - Title: {article_data['title'][:60]}")
         logger.info(f"[STEP 1] Components: {len(components)} ({', '.join(set(c['type'] for c in components))})")
 
         # SAVE POINT #1: Save raw article immediately after generation
         _save_raw_article(article_data, user_id, "after_step1")
 
-        # STEP 2: Generate contextual image prompts
-        logger.info("\n[STEP 2] Generating contextual image prompts with GPT-5-mini...")
-
-        # Extract summary from article data or use Perplexity research
-        perplexity_summary = article_data.get("executive_summary", {}).get("intro", "")
-        if not perplexity_summary:
-            perplexity_summary = perplexity_research[:500] + "..." if len(perplexity_research) > 500 else perplexity_research
-
-        prompts_data = generate_contextual_image_prompts(
-            article_html=article_data["html"],
-            perplexity_summary=perplexity_summary,
-            user_id=user_id,
-            writing_style=writing_style
-        )
-
-        if not prompts_data:
-            return None, "Image prompt generation failed"
-
-        hero_prompt = prompts_data["hero_prompt"]
-        section_prompts = prompts_data["section_prompts"]
-
-        logger.info(f"[STEP 2] ✅ Generated {len(section_prompts)} section prompts")
-
-        # STEP 3: Generate images with SeeDream-4
-        logger.info("\n[STEP 3] Generating images with SeeDream-4...")
-
-        # Hero image (16:9)
-        hero_images = generate_images_with_seedream([hero_prompt], user_id, aspect_ratio="16:9")
-        hero_image_tmp = hero_images[0] if hero_images else None
-
-        # Section images (21:9)
-        section_image_prompts = [sp["prompt"] for sp in section_prompts]
-        section_images_tmp = generate_images_with_seedream(section_image_prompts, user_id, aspect_ratio="21:9")
-
-        logger.info(f"[STEP 3] ✅ Generated {1 + len(section_images_tmp)} images")
-
-        # STEP 3.5: Handle image persistence (WordPress OR local base64)
-        if local_mode:
-            logger.info("\n[STEP 3.5] LOCAL MODE: Using Replicate URLs directly for Claude formatting...")
-            logger.info("[STEP 3.5] Images will be downloaded and embedded as base64 after formatting")
-
-            # Keep Replicate URLs for now (valid for 60 minutes)
-            hero_image_url = hero_image_tmp
-            section_image_urls = section_images_tmp
-            all_images = [hero_image_url] + section_image_urls
-
-            logger.info(f"[STEP 3.5] ✅ {len(all_images)} Replicate URLs ready (60-minute window)")
-        else:
-            logger.info("\n[STEP 3.5] Uploading images to WordPress media library...")
-
-            hero_image_url = persist_image_to_wordpress(hero_image_tmp, user_id)
-            if not hero_image_url:
-                logger.error("[STEP 3.5] Hero image persistence failed")
-                return None, "Hero image upload failed"
-
-            section_image_urls = []
-            for i, tmp_url in enumerate(section_images_tmp):
-                wp_url = persist_image_to_wordpress(tmp_url, user_id)
-                if wp_url:
-                    section_image_urls.append(wp_url)
-                else:
-                    logger.warning(f"[STEP 3.5] Section image {i+1} persistence failed")
-
-            all_images = [hero_image_url] + section_image_urls
-
-            logger.info(f"[STEP 3.5] ✅ Uploaded {len(all_images)} images to WordPress")
-
-        # STEP 4: Assemble magazine layout with components
-        logger.info("\n[STEP 4] Assembling magazine layout...")
-
-        # Map section images to headings
-        section_image_mappings = [
-            {
-                "heading": section_prompts[i]["section_heading"],
-                "url": section_image_urls[i]
-            }
-            for i in range(min(len(section_prompts), len(section_image_urls)))
-        ]
+        return {
+            "article_data": article_data,
+            "perplexity_summary": _article_summary(article_data, perplexity_research)
+        }
 
-        # Get user's brand colors from database
+    def load_design_settings() -> Dict[str, Any]:
+        # Get user's brand colors and layout choice from database
         brand_colors = None
+        layout = {"style": DEFAULT_LAYOUT, "premium": False}
         try:
             from app_v3 import User, app
             with app.app_context():
                 user = User.query.get(user_id)
+                if user:
+                    layout = {
+                        "style": user.article_layout or DEFAULT_LAYOUT,
+                        "premium": bool(user.premium_formatting)
+                    }
                 if user and not user.use_default_branding:
                     brand_colors = {
                         "primary": user.brand_primary_color or "#08b2c6",
@@ -644,79 +914,312 @@ def create_blog_post_with_images_v4(
                 else:
                     logger.info("[STEP 4] Using default EZWAi brand colors")
         except Exception as e:
-            logger.warning(f"[STEP 4] Could not load brand colors, using defaults: {e}")
-
-        # Try Claude AI formatter first (intelligent layout decisions)
-        logger.info("[STEP 4] Attempting Claude AI-powered formatting...")
-        section_image_urls_only = [img['url'] for img in section_image_mappings if img.get('url')]
+            logger.warning(f"[STEP 4] Could not load design settings, using defaults: {e}")
+        logger.info(f"[STEP 4] Layout: {layout['style']} ({'Claude premium' if layout['premium'] else 'template'})")
+        return {"brand_colors": brand_colors, "layout": layout}
+
+    def hero_prompt_stage(story_head: Dict[str, str]) -> str:
+        # STEP 2a: Hero prompt only needs the title and summary
+        logger.info("[STEP 2] Generating hero image prompt with GPT-5-mini...")
+        hero_prompt = generate_hero_image_prompt(
+            title=story_head["title"],
+            perplexity_summary=story_head["perplexity_summary"],
+            user_id=user_id,
+            writing_style=writing_style,
+            settings=settings
+        )
+        if not hero_prompt:
+            raise PipelineError("Image prompt generation failed")
+        return hero_prompt
 
-        final_html = format_article_with_claude(
-            article_html=article_data['html'],
-            title=title,
-            hero_image_url=hero_image_url,
-            section_images=section_image_urls_only,
+    def section_prompts_stage(article_data: Dict[str, Any], perplexity_summary: str) -> List[Dict[str, str]]:
+        # STEP 2b: Section prompts need the full article HTML
+        logger.info("[STEP 2] Generating contextual section image prompts with GPT-5-mini...")
+        prompts_data = generate_contextual_image_prompts(
+            article_html=article_data["html"],
+            perplexity_summary=perplexity_summary,
             user_id=user_id,
-            brand_colors=brand_colors,
-            layout_style="premium_magazine"
+            writing_style=writing_style,
+            include_hero=False,
+            settings=settings
+        )
+        if not prompts_data:
+            raise PipelineError("Image prompt generation failed")
+
+        section_prompts = prompts_data["section_prompts"]
+        logger.info(f"[STEP 2] ✅ Generated {len(section_prompts)} section prompts")
+        return section_prompts
+
+    def hero_image(hero_prompt: str) -> str:
+        # STEP 3a: Hero image (16:9)
+        logger.info("[STEP 3] Generating hero image with SeeDream-4...")
+        hero_image_tmp = generate_images_with_seedream([hero_prompt], user_id, aspect_ratio="16:9",
+                                                       settings=settings)[0]
+        if not hero_image_tmp:
+            raise PipelineError("Hero image generation failed")
+        return hero_image_tmp
+
+    def section_images(section_prompts: List[Dict[str, str]]) -> List[Optional[str]]:
+        # STEP 3b: Section images (21:9) in one concurrent batch
+        logger.info("[STEP 3] Generating section images with SeeDream-4...")
+        section_images_tmp = generate_images_with_seedream(
+            [sp["prompt"] for sp in section_prompts],
+            user_id,
+            aspect_ratio="21:9",
+            settings=settings
+        )
+        logger.info(f"[STEP 3] ✅ Generated {sum(1 for url in section_images_tmp if url)} section images")
+        return section_images_tmp
+
+    def format_article(
+        article_data: Dict[str, Any],
+        hero_image_tmp: str,
+        section_images_tmp: List[Optional[str]],
+        section_prompts: List[Dict[str, str]],
+        brand_colors: Optional[Dict[str, str]],
+        layout: Dict[str, Any]
+    ) -> str:
+        # STEP 4: Assemble magazine layout against the (60-minute) Replicate URLs
+        logger.info("[STEP 4] Assembling magazine layout...")
+
+        # Map section images to headings
+        section_image_mappings = [
+            {"heading": sp["section_heading"], "url": url}
+            for sp, url in zip(section_prompts, section_images_tmp)
+            if url
+        ]
+
+        # Premium mode: Claude AI formatter (intelligent layout decisions, 30-90s)
+        formatted_html = None
+        if layout["premium"]:
+            logger.info("[STEP 4] Attempting Claude AI-powered formatting...")
+            formatted_html = format_article_with_claude(
+                article_html=article_data['html'],
+                title=article_data["title"],
+                hero_image_url=hero_image_tmp,
+                section_images=[img['url'] for img in section_image_mappings],
+                user_id=user_id,
+                brand_colors=brand_colors,
+                layout_style=layout["style"],
+                settings=settings
+            )
+            if formatted_html:
+                logger.info(f"[STEP 4] ✅ Claude AI layout assembled - {len(formatted_html)} characters")
+                return formatted_html
+            logger.warning("[STEP 4] Claude formatter failed, using template layout")
+
+        # Default: compiled template layout (milliseconds)
+        formatted_html = render_article_layout(
+            article_data=article_data,
+            hero_image_url=hero_image_tmp,
+            section_images=section_image_mappings,
+            layout_style=layout["style"],
+            brand_colors=brand_colors
         )
 
-        # Fallback to template formatter if Claude fails
-        if not final_html:
-            logger.warning("[STEP 4] Claude formatter failed, using template fallback")
-            final_html = apply_magazine_styling(
+        # Last resort: legacy inline-style formatter
+        if not formatted_html:
+            logger.warning("[STEP 4] Template layout failed, using legacy formatter")
+            formatted_html = apply_magazine_styling(
                 article_data=article_data,
-                hero_image_url=hero_image_url,
+                hero_image_url=hero_image_tmp,
                 section_images=section_image_mappings,
                 user_id=user_id,
                 brand_colors=brand_colors
             )
 
-            if not final_html:
-                return None, "Both Claude and template formatting failed"
-
-            logger.info(f"[STEP 4] ✅ Template layout assembled - {len(final_html)} characters")
-        else:
-            logger.info(f"[STEP 4] ✅ Claude AI layout assembled - {len(final_html)} characters")
+            if not formatted_html:
+                raise PipelineError("All formatters failed")
+
+        logger.info(f"[STEP 4] ✅ {layout['style']} layout assembled - {len(formatted_html)} characters")
+        return formatted_html
+
+    def finalize(
+        formatted_html: str,
+        hero_image_tmp: str,
+        section_images_tmp: List[Optional[str]],
+        section_prompts: List[Dict[str, str]],
+        hero_final: str,
+        section_final: List[Optional[str]]
+    ) -> Dict[str, Any]:
+        # Swap temporary Replicate URLs for permanent ones in the formatted HTML
+        replacements = {hero_image_tmp: hero_final}
+        section_image_urls = []
+        section_image_prompts = []
+        for i, (tmp_url, final_url, prompt_obj) in enumerate(zip(section_images_tmp, section_final, section_prompts)):
+            if not tmp_url:
+                continue
+            replacements[tmp_url] = final_url
+            if final_url:
+                section_image_urls.append(final_url)
+                section_image_prompts.append(prompt_obj)
+            else:
+                logger.warning(f"[STEP 4.5] Section image {i+1} could not be persisted - removed from layout")
+
+        final_html = _swap_image_urls(formatted_html, replacements)
+        logger.info(f"[STEP 4.5] ✅ Swapped {len(replacements)} image URLs ({len(final_html)} chars)")
+
+        return {
+            "final_html": final_html,
+            "hero_image_url": hero_final,
+            "section_image_urls": section_image_urls,
+            "section_image_prompts": section_image_prompts
+        }
 
-        # STEP 4.5: For LOCAL MODE, download images and replace URLs with base64
-        if local_mode:
-            logger.info("\n[STEP 4.5] LOCAL MODE: Downloading images and embedding as base64...")
-            logger.info("[STEP 4.5] ⚠️ Must complete within 60-minute Replicate expiry window")
+    stages = [
+        Stage("story", story, outputs=["article_data", "perplexity_summary"], early_outputs=["story_head"]),
+        Stage("design", load_design_settings, outputs=["brand_colors", "layout"], checkpoint=False),
+        Stage("hero_prompt", hero_prompt_stage, inputs=["story_head"], outputs=["hero_prompt"]),
+        Stage("section_prompts", section_prompts_stage,
+              inputs=["article_data", "perplexity_summary"], outputs=["section_prompts"]),
+        Stage("hero_image", hero_image, inputs=["hero_prompt"], outputs=["hero_image_tmp"],
+              checkpoint_ttl=REPLICATE_URL_TTL_SECONDS),
+        Stage("section_images", section_images, inputs=["section_prompts"], outputs=["section_images_tmp"],
+              checkpoint_ttl=REPLICATE_URL_TTL_SECONDS),
+        Stage("format", format_article,
+              inputs=["article_data", "hero_image_tmp", "section_images_tmp", "section_prompts", "brand_colors",
+                      "layout"],
+              outputs=["formatted_html"]),
+        Stage("finalize", finalize,
+              inputs=["formatted_html", "hero_image_tmp", "section_images_tmp", "section_prompts",
+                      "hero_final", "section_final"],
+              outputs=["final_html", "hero_image_url", "section_image_urls", "section_image_prompts"],
+              checkpoint=not local_mode),  # Base64 HTML is too large to persist
+    ]
 
-            # Download hero image
-            hero_base64 = _download_and_convert_to_base64(hero_image_url)
+    if local_mode:
+        # STEP 4.5 (local): Download images as base64 while Claude is formatting
+        def download_hero(hero_image_tmp: str) -> str:
+            logger.info("[STEP 4.5] LOCAL MODE: Downloading hero image as base64...")
+            hero_base64 = _download_and_convert_to_base64(hero_image_tmp, max_width=HERO_MAX_WIDTH)
             if not hero_base64:
-                logger.error("[STEP 4.5] Failed to download hero image")
-                return None, "Hero image download failed (URL may have expired)"
-
-            # Download section images
-            section_base64_list = []
-            for i, section_url in enumerate(section_image_urls):
-                section_base64 = _download_and_convert_to_base64(section_url)
-                if section_base64:
-                    section_base64_list.append(section_base64)
-                else:
-                    logger.warning(f"[STEP 4.5] Failed to download section image {i+1}")
+                raise PipelineError("Hero image download failed (URL may have expired)")
+            return hero_base64
+
+        def download_sections(section_images_tmp: List[Optional[str]]) -> List[Optional[str]]:
+            logger.info("[STEP 4.5] LOCAL MODE: Downloading section images as base64...")
+            section_base64 = download_images_as_base64(section_images_tmp)
+            logger.info(f"[STEP 4.5] ✅ Downloaded {sum(1 for uri in section_base64 if uri)} section images")
+            return section_base64
+
+        stages += [
+            Stage("download_hero", download_hero, inputs=["hero_image_tmp"], outputs=["hero_final"],
+                  checkpoint=False),
+            Stage("download_sections", download_sections, inputs=["section_images_tmp"], outputs=["section_final"],
+                  checkpoint=False),
+        ]
+    else:
+        # STEP 3.5: Upload images to WordPress while Claude is formatting
+        def persist_hero(hero_image_tmp: str) -> Dict[str, Any]:
+            logger.info("[STEP 3.5] Uploading hero image to WordPress media library...")
+            hero_media = persist_media_to_wordpress([hero_image_tmp], user_id, max_width=HERO_MAX_WIDTH,
+                                                    site=wordpress_site)[0]
+            if not hero_media:
+                raise PipelineError("Hero image upload failed")
+            # The media ID is reused as the post's featured image
+            return {"hero_final": hero_media["source_url"], "hero_media_id": hero_media["id"]}
+
+        def persist_sections(section_images_tmp: List[Optional[str]]) -> Dict[str, Any]:
+            logger.info("[STEP 3.5] Uploading section images to WordPress media library...")
+            section_media = persist_media_to_wordpress(section_images_tmp, user_id, first_index=1,
+                                                       site=wordpress_site)
+            logger.info(f"[STEP 3.5] ✅ Uploaded {sum(1 for item in section_media if item)} section images")
+            return {
+                "section_final": [(item or {}).get("source_url") for item in section_media],
+                "section_media_ids": [(item or {}).get("id") for item in section_media],
+            }
+
+        stages += [
+            Stage("persist_hero", persist_hero, inputs=["hero_image_tmp"],
+                  outputs=["hero_final", "hero_media_id"]),
+            Stage("persist_sections", persist_sections, inputs=["section_images_tmp"],
+                  outputs=["section_final", "section_media_ids"]),
+        ]
+
+    return stages
+
 
-            logger.info(f"[STEP 4.5] ✅ Downloaded {1 + len(section_base64_list)} images as base64")
+def create_blog_post_with_images_v4(
+    perplexity_research: str,
+    user_id: int,
+    user_system_prompt: str,
+    writing_style: Optional[str] = None,
+    local_mode: bool = False,
+    run_id: Optional[str] = None,
+    wordpress_site: Optional[WordPressSite] = None,
+    settings: Optional[JobSettings] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    V4 Modular Pipeline Orchestrator with Structured Article Generation
+
+    Args:
+        perplexity_research: Enhanced research from Perplexity (2000 tokens)
+        user_id: User ID for environment
+        user_system_prompt: User's custom prompt
+        writing_style: Optional writing style for tone/visuals
+        local_mode: If True, skip WordPress upload and embed images as base64 in self-contained HTML
+        run_id: Optional generation run ID (GenerationJob.id) - stage outputs are
+            checkpointed under it, and a re-run with the same ID resumes at the
+            first incomplete stage
+        wordpress_site: WordPress site resolved by the caller; images are
+            uploaded through it without another credentials lookup
+        settings: The job's API keys and models (see job_settings.py), passed
+            to every stage; looked up from user_id if omitted
+
+    Returns:
+        (result_dict, error_message)
+        result_dict contains:
+        {
+            "title": "Article title",
+            "content": "Fully styled HTML with magazine components and images",
+            "hero_image_url": "...",  # Base64 data URI if local_mode=True
+            "hero_media_id": 123,  # WordPress media ID of the hero (None in local mode)
+            "section_images": [...],  # Base64 data URIs if local_mode=True
+            "all_images": [...],
+            "summary": "...",
+            "prompts": {...},
+            "components": [...]  # NEW: Component metadata for debugging
+        }
+    """
 
-            # Replace Replicate URLs with base64 in formatted HTML
-            logger.info("[STEP 4.5] Replacing Replicate URLs with base64 data URIs...")
+    try:
+        logger.info("=" * 80)
+        logger.info("[V4 Pipeline] Starting modular article generation")
+        logger.info(f"[V4 Pipeline] Writing style: {writing_style or 'Default'}")
+        logger.info("=" * 80)
 
-            # Replace hero URL
-            final_html = final_html.replace(hero_image_url, hero_base64)
+        stages = _build_v4_stages(
+            perplexity_research=perplexity_research,
+            user_id=user_id,
+            user_system_prompt=user_system_prompt,
+            writing_style=writing_style,
+            local_mode=local_mode,
+            wordpress_site=wordpress_site,
+            settings=settings or get_job_settings(user_id)
+        )
 
-            # Replace section URLs
-            for i, section_url in enumerate(section_image_urls):
-                if i < len(section_base64_list):
-                    final_html = final_html.replace(section_url, section_base64_list[i])
+        checkpoints = CheckpointStore(run_id) if run_id else None
+        metrics = current_run()
+        if metrics:
+            metrics.mode = 'local' if local_mode else 'wordpress'
 
-            # Update URLs in result dict to base64
-            hero_image_url = hero_base64
-            section_image_urls = section_base64_list
-            all_images = [hero_image_url] + section_image_urls
+        try:
+            values = run_pipeline(stages, name="V4 Pipeline", checkpoints=checkpoints)
+        except PipelineError as e:
+            record_stage_timings(e.timings)
+            return None, str(e)
+        record_stage_timings(values["_timings"])
 
-            logger.info(f"[STEP 4.5] ✅ All URLs replaced with base64 ({len(final_html)} chars)")
+        article_data = values["article_data"]
+        title = article_data["title"]
+        components = article_data.get("components", [])
+        perplexity_summary = values["perplexity_summary"]
+        hero_prompt = values["hero_prompt"]
+        final_html = values["final_html"]
+        hero_image_url = values["hero_image_url"]
+        section_image_urls = values["section_image_urls"]
+        section_prompts = values["section_image_prompts"]
+        all_images = [hero_image_url] + section_image_urls
 
         # SAVE POINT #2: Save formatted article with styling
         _save_formatted_article(final_html, title, user_id, hero_image_url, section_image_urls)
@@ -724,19 +1227,19 @@ def create_blog_post_with_images_v4(
         # FINAL VALIDATION
         logger.info("\n[VALIDATION] Checking output quality...")
 
-        # Check for inline styles instead of <style> tags
-        if 'style="' not in final_html:
-            logger.error("[VALIDATION] Inline styles missing")
+        # Check for styling (inline styles, or the <style> block of a template layout)
+        if 'style="' not in final_html and '<style' not in final_html:
+            logger.error("[VALIDATION] Styling missing")
             return None, "CSS styling missing"
 
-        # Check for hero section (now a div with inline styles, not class)
-        # In local mode, hero_image_url is base64, so just check for background-image
+        # Check for hero image (an <img> or a background-image, depending on layout)
+        # In local mode, hero_image_url is base64, so just check for a data URI
         if local_mode:
-            if "background-image" not in final_html or "data:image/" not in final_html:
+            if "data:image/" not in final_html:
                 logger.error("[VALIDATION] Hero section missing")
                 return None, "Hero section missing"
         else:
-            if "background-image" not in final_html or hero_image_url not in final_html:
+            if hero_image_url not in final_html:
                 logger.error("[VALIDATION] Hero section missing")
                 return None, "Hero section missing"
 
@@ -760,12 +1263,14 @@ def create_blog_post_with_images_v4(
             "title": title,
             "content": final_html,
             "hero_image_url": hero_image_url,
+            "hero_media_id": values.get("hero_media_id"),
             "section_images": section_image_urls,
+            "section_media_ids": values.get("section_media_ids"),
             "all_images": all_images,
             "summary": perplexity_summary,
             "prompts": {
                 "hero": hero_prompt,
-                "sections": section_prompts
+                "sections": values["section_prompts"]
             },
             "components": components  # Include for debugging/logging
         }
@@ -801,32 +1306,47 @@ def create_blog_post_with_images_v4(
                 "cost_usd": 0.075
             })
 
-        # Save article to database
-        article_id = _save_article_to_database(
-            user_id=user_id,
-            title=title,
-            content_html=final_html,
-            hero_image_url=hero_image_url,
-            section_images=section_image_urls,
-            generation_mode='local' if local_mode else 'wordpress',
-            wordpress_post_id=None,  # Will be updated by app_v3 if WordPress post created
-            wordpress_url=None,
-            backup_file_path=None,  # Will be updated if backup saved
-            metadata={
-                "writing_style": writing_style,
-                "component_count": len(components),
-                "word_count": len(perplexity_summary.split()) if perplexity_summary else 0
-            }
-        )
+        # A resumed run already saved its article - don't create a duplicate row
+        saved = checkpoints.get("article_db") if checkpoints else None
+        if saved:
+            logger.info(f"[DB] Article already saved by an earlier attempt (ID: {saved['article_id']})")
+            result["article_id"] = saved["article_id"]
+            if metrics:
+                metrics.article_id = saved["article_id"]
+            return result, None
 
-        # Save images to database
-        if article_id:
-            _save_images_to_database(
+        # Save article to database
+        with track_stage("db_save"):
+            article_id = _save_article_to_database(
                 user_id=user_id,
-                article_id=article_id,
-                image_data=image_data
+                title=title,
+                content_html=final_html,
+                hero_image_url=hero_image_url,
+                section_images=section_image_urls,
+                generation_mode='local' if local_mode else 'wordpress',
+                wordpress_post_id=None,  # Will be updated by app_v3 if WordPress post created
+                wordpress_url=None,
+                backup_file_path=None,  # Will be updated if backup saved
+                metadata={
+                    "writing_style": writing_style,
+                    "component_count": len(components),
+                    "word_count": len(perplexity_summary.split()) if perplexity_summary else 0
+                }
             )
-            result["article_id"] = article_id  # Add article_id to result
+
+            # Save images to database
+            if article_id:
+                _save_images_to_database(
+                    user_id=user_id,
+                    article_id=article_id,
+                    image_data=image_data
+                )
+                result["article_id"] = article_id  # Add article_id to result
+                if checkpoints:
+                    checkpoints.save("article_db", {"article_id": article_id})
+
+        if metrics and article_id:
+            metrics.article_id = article_id
 
         return result, None
 
@@ -1,28 +1,25 @@
+import os
 import json
 import requests
-from dotenv import load_dotenv
-import os
+import time
 import logging
 from flask_sqlalchemy import SQLAlchemy
 from flask import current_app
+from pipeline_metrics import record_llm_call
+from job_settings import get_job_settings
+from perplexity_client import get_perplexity_client
+from research_cache import research_cache_key, get_cached_research, store_research, user_wants_fresh_research
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
+PERPLEXITY_MODEL = "sonar"
+PERPLEXITY_RECENCY_FILTER = os.getenv("PERPLEXITY_RECENCY_FILTER", "month")  # Part of the research cache key
 
 db = SQLAlchemy()
 
-def load_user_env(user_id):
-    """Load user-specific environment variables."""
-    env_file = f'.env.user_{user_id}'
-    if os.path.exists(env_file):
-        load_dotenv(env_file, override=True)  # CRITICAL: Override existing env vars
-        logger.debug(f"Loaded environment for user {user_id}")
-    else:
-        logger.error(f"Environment file for user {user_id} not found")
-
 def query_management(user_id):
     """Manage and rotate through user-specific queries. Returns tuple (query, writing_style)."""
     from app_v3 import User  # Import User model here to avoid circular imports
@@ -66,10 +63,30 @@ def query_management(user_id):
     logger.warning(f"No non-empty queries found for user {user_id}")
     return None, None
 
-def generate_blog_post_ideas(query, user_id, writing_style=None):
-    """Generate blog post ideas using the Perplexity AI API with enhanced prompts based on writing style."""
-    load_user_env(user_id)
-    api_key = os.getenv('PERPLEXITY_AI_API_TOKEN')
+def generate_blog_post_ideas(query, user_id, writing_style=None, settings=None, fresh=None):
+    """
+    Generate blog post ideas using the Perplexity AI API with enhanced prompts based on writing style.
+
+    Research is shared through the research cache (research_cache.py): the same
+    normalized query and writing style within RESEARCH_CACHE_TTL is answered
+    without calling Perplexity.
+
+    settings is the job's JobSettings (Perplexity token); looked up from user_id if omitted.
+    fresh skips the cache lookup; defaults to the user's fresh_research preference.
+    """
+    settings = settings or get_job_settings(user_id)
+    if fresh is None:
+        fresh = user_wants_fresh_research(user_id)
+
+    cache_key = research_cache_key(query, writing_style, PERPLEXITY_RECENCY_FILTER, PERPLEXITY_MODEL)
+    cached = get_cached_research(cache_key, bypass=fresh)
+    if cached:
+        logger.info(f"[Research Cache] Hit for query: {query}")
+        return [cached]
+    if fresh:
+        logger.info(f"[Research Cache] Fresh research requested for user {user_id}")
+
+    api_key = settings.perplexity_api_token
 
     if not api_key:
         logger.error(f"Perplexity API token not found for user {user_id}")
@@ -117,7 +134,7 @@ Include:
     logger.info(f"Writing style: {writing_style or 'Default'}")
 
     data = {
-        "model": "sonar",
+        "model": PERPLEXITY_MODEL,
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
@@ -129,7 +146,7 @@ Include:
         "search_domain_filter": ["perplexity.ai"],
         "return_images": False,
         "return_related_questions": False,
-        "search_recency_filter": "month",
+        "search_recency_filter": PERPLEXITY_RECENCY_FILTER,
         "top_k": 0,
         "stream": False,
         "presence_penalty": 0,
@@ -139,15 +156,20 @@ Include:
     logger.debug(f"Perplexity API request payload: {json.dumps(data, indent=2)}")
 
     try:
-        response = requests.post(PERPLEXITY_API_URL, json=data, headers=headers, timeout=30)
+        started = time.monotonic()
+        # Pooled session, shared rate limit, 429/5xx retried with backoff
+        response = get_perplexity_client().post(PERPLEXITY_API_URL, json=data, headers=headers)
         response.raise_for_status()
 
         response_json = response.json()
+        record_llm_call("perplexity", data["model"], response_json, time.monotonic() - started)
         logger.debug(f"Perplexity API response for query '{query}': {json.dumps(response_json, indent=2)}")
         
         blog_post_idea = response_json['choices'][0]['message']['content'].strip()
         logger.info(f"Generated blog post idea for query '{query}': {blog_post_idea[:100]}...")  # Log first 100 chars
 
+        if blog_post_idea:
+            store_research(cache_key, query, writing_style, PERPLEXITY_RECENCY_FILTER, blog_post_idea)
         return [blog_post_idea]
     except requests.exceptions.HTTPError as e:
         logger.error(f"HTTP error occurred: {e}")
@@ -156,7 +178,7 @@ Include:
         elif e.response.status_code == 401:
             logger.error("Unauthorized. Check your API key.")
         elif e.response.status_code == 429:
-            logger.error("Too Many Requests. You might have exceeded your rate limit.")
+            logger.error("Too Many Requests - still rate limited after retries. Check PERPLEXITY_RATE_PER_MINUTE.")
         else:
             logger.error(f"An HTTP {e.response.status_code} error occurred. Response: {e.response.text}")
         logger.exception(e)
@@ -0,0 +1,301 @@
+"""
+perplexity_client.py - Pooled, Rate-Limited Perplexity Client
+
+At the top of each hour the scheduler starts many users' articles at once,
+and every one of them asks Perplexity for research within a few seconds.
+A bare requests.post per call paid a TLS handshake each time, and the
+resulting 429s were treated as final failures - the article was lost.
+
+Requests now go through one keep-alive session per process and a token
+bucket shared by every process on the host (web workers, generation
+workers, scheduler). The bucket state lives in a small JSON file guarded
+by an exclusive file lock, so bursts are smoothed to
+PERPLEXITY_RATE_PER_MINUTE instead of being rejected.
+
+429, 5xx and connection failures are retried with exponential backoff and
+full jitter. A Retry-After from Perplexity is honored and also pauses the
+shared bucket, so other processes wait instead of adding to the overload.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+PERPLEXITY_RATE_PER_MINUTE = float(os.getenv('PERPLEXITY_RATE_PER_MINUTE', '50'))
+PERPLEXITY_BURST = float(os.getenv('PERPLEXITY_BURST', '5'))
+PERPLEXITY_MAX_WAIT = float(os.getenv('PERPLEXITY_MAX_WAIT', '300'))
+PERPLEXITY_MAX_RETRIES = int(os.getenv('PERPLEXITY_MAX_RETRIES', '4'))
+PERPLEXITY_BACKOFF_BASE = float(os.getenv('PERPLEXITY_BACKOFF_BASE', '1'))
+PERPLEXITY_BACKOFF_MAX = float(os.getenv('PERPLEXITY_BACKOFF_MAX', '60'))
+PERPLEXITY_CONNECT_TIMEOUT = float(os.getenv('PERPLEXITY_CONNECT_TIMEOUT', '5'))
+PERPLEXITY_READ_TIMEOUT = float(os.getenv('PERPLEXITY_READ_TIMEOUT', '60'))
+PERPLEXITY_POOL_SIZE = int(os.getenv('PERPLEXITY_POOL_SIZE', '8'))
+PERPLEXITY_RATE_FILE = os.getenv(
+    'PERPLEXITY_RATE_FILE', os.path.join(tempfile.gettempdir(), 'ezwai_perplexity_bucket.json')
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PerplexityRateLimited(requests.exceptions.RequestException):
+    """No request slot became free within PERPLEXITY_MAX_WAIT seconds."""
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header (delta-seconds or HTTP-date).
+
+    Returns:
+        Seconds to wait (>= 0), or None if absent or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (1-based).
+
+    Full jitter: uniform in [0, min(max, base * 2^(attempt-1))]. Retry-After
+    from the server takes precedence (capped at PERPLEXITY_BACKOFF_MAX).
+    """
+    server_delay = retry_after_seconds(retry_after)
+    if server_delay is not None:
+        return min(server_delay, PERPLEXITY_BACKOFF_MAX)
+    ceiling = min(PERPLEXITY_BACKOFF_MAX, PERPLEXITY_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[Any]:
+    """Open the bucket file with an exclusive lock held across processes."""
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket whose state is shared by every process using the same file.
+
+    Holds up to `burst` tokens, refilled at `rate_per_minute`. Each request
+    takes one token; callers without a token sleep until one is due.
+    """
+
+    def __init__(
+        self,
+        path: str = PERPLEXITY_RATE_FILE,
+        rate_per_minute: float = PERPLEXITY_RATE_PER_MINUTE,
+        burst: float = PERPLEXITY_BURST
+    ):
+        self.path = path
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(burst, 1.0)
+
+    def _update(self, change) -> Any:
+        """Apply change(state, now) to the shared state under the file lock."""
+        with _file_lock(self.path) as f:
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or '{}')
+            except ValueError:
+                state = {}  # Corrupt or partially written - start full
+            now = time.time()
+            tokens = state.get('tokens', self.burst)
+            updated = state.get('updated', now)
+            state['tokens'] = min(self.burst, tokens + max(now - updated, 0.0) * self.rate)
+            state['updated'] = now
+            state.setdefault('blocked_until', 0.0)
+
+            result = change(state, now)
+
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(state))
+            f.flush()
+            return result
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available.
+
+        Returns:
+            0.0 if a token was taken, otherwise seconds until one is due
+        """
+        def take(state: Dict[str, float], now: float) -> float:
+            if state['blocked_until'] > now:
+                return state['blocked_until'] - now
+            if state['tokens'] >= 1.0:
+                state['tokens'] -= 1.0
+                return 0.0
+            return (1.0 - state['tokens']) / self.rate
+
+        return self._update(take)
+
+    def acquire(self, max_wait: float = PERPLEXITY_MAX_WAIT) -> float:
+        """
+        Block until a token is available.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            PerplexityRateLimited if no token is free within max_wait seconds
+        """
+        started = time.monotonic()
+        while True:
+            delay = self.try_acquire()
+            waited = time.monotonic() - started
+            if delay <= 0:
+                return waited
+            if waited + delay > max_wait:
+                raise PerplexityRateLimited(f"No Perplexity request slot within {max_wait:.0f}s")
+            # Small jitter so waiting processes do not all retry the lock at once
+            time.sleep(delay + random.uniform(0, 0.05))
+
+    def pause(self, seconds: float) -> None:
+        """Hold every process's requests for `seconds` (e.g. after a 429 with Retry-After)."""
+        def block(state: Dict[str, float], now: float) -> None:
+            state['blocked_until'] = max(state['blocked_until'], now + seconds)
+            state['tokens'] = 0.0  # Resume gradually rather than with a full burst
+
+        self._update(block)
+
+
+class PerplexityClient:
+    """
+    Keep-alive, rate-limited HTTP client for the Perplexity API.
+
+    Thread-safe. Use get_perplexity_client() rather than constructing one,
+    so every call in the process shares the connection pool.
+    """
+
+    def __init__(self, bucket: Optional[SharedTokenBucket] = None, max_retries: int = PERPLEXITY_MAX_RETRIES):
+        self.bucket = bucket or SharedTokenBucket()
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PERPLEXITY_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, url: str, timeout: Optional[float] = None, **kwargs: Any) -> requests.Response:
+        """
+        POST through the shared rate limit, retrying transient failures.
+
+        Args:
+            url: API endpoint
+            timeout: Read timeout in seconds (defaults to PERPLEXITY_READ_TIMEOUT)
+            **kwargs: Passed to requests (json, headers, ...)
+
+        Returns:
+            The last response (which may still be a 4xx/5xx status)
+
+        Raises:
+            PerplexityRateLimited if no request slot became free in time
+            requests.exceptions.RequestException once retries are exhausted
+        """
+        kwargs['timeout'] = (PERPLEXITY_CONNECT_TIMEOUT, timeout or PERPLEXITY_READ_TIMEOUT)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = self.bucket.acquire()
+            if waited >= 1:
+                logger.info(f"[Perplexity] Waited {waited:.1f}s for a request slot")
+
+            response: Optional[requests.Response] = None
+            error: Optional[requests.exceptions.RequestException] = None
+            try:
+                response = self.session.post(url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = e
+
+            if error is not None:
+                retryable = isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+            else:
+                retryable = response.status_code in RETRY_STATUSES  # type: ignore[union-attr]
+            if not retryable or attempt > self.max_retries:
+                if error is not None:
+                    raise error
+                return response  # type: ignore[return-value]
+
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            delay = backoff_delay(attempt, retry_after)
+            reason = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+            logger.warning(f"[Perplexity] Request failed ({reason}), retry {attempt}/{self.max_retries} "
+                           f"in {delay:.2f}s")
+            if response is not None:
+                response.close()  # Return the connection to the pool
+            if response is not None and response.status_code == 429:
+                # Everyone backs off, not just this request - the next acquire() waits it out
+                self.bucket.pause(delay)
+            else:
+                time.sleep(delay)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[PerplexityClient] = None
+_client_lock = threading.Lock()
+
+
+def get_perplexity_client() -> PerplexityClient:
+    """Process-wide Perplexity client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = PerplexityClient()
+        return _client
+
+
+def _reset_client_after_fork() -> None:
+    """Forked workers must not share the parent's pooled sockets."""
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_client_after_fork)
@@ -0,0 +1,130 @@
+"""
+pipeline_checkpoints.py - Keyed Checkpoint Store for Generation Runs
+
+Every completed stage of a generation run (Perplexity research, story JSON,
+image prompts, image URLs, formatted HTML, ...) is stored in the
+pipeline_checkpoints table under (run_id, stage). When a failed job is
+resumed, the pipeline restores those artifacts instead of re-spending
+GPT-5 and SeeDream time, and restarts at the first incomplete stage.
+
+The run_id is the GenerationJob id, so resuming a job reuses its
+checkpoints automatically.
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Replicate output URLs expire 1 hour after the prediction is created
+REPLICATE_URL_TTL_SECONDS = 50 * 60
+CHECKPOINT_RETENTION_DAYS = int(os.getenv('CHECKPOINT_RETENTION_DAYS', '7'))
+
+
+class CheckpointStore:
+    """
+    Checkpoints of one generation run, backed by the PipelineCheckpoint model.
+
+    Must be used inside an application context. Artifacts must be
+    JSON-serializable dicts.
+    """
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+
+    def load_all(self) -> Dict[str, Tuple[Dict[str, Any], float]]:
+        """
+        Load every checkpoint of this run.
+
+        Returns:
+            {stage: (artifact, age_seconds)}
+        """
+        from app_v3 import PipelineCheckpoint
+
+        now = datetime.utcnow()
+        rows = PipelineCheckpoint.query.filter_by(run_id=self.run_id).all()  # type: ignore[attr-defined]
+        return {
+            row.stage: (row.artifact or {}, (now - row.created_at).total_seconds())
+            for row in rows
+        }
+
+    def get(self, stage: str, max_age_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get one stage's artifact.
+
+        Returns:
+            Artifact dict, or None if missing or older than max_age_seconds
+        """
+        from app_v3 import PipelineCheckpoint
+
+        row = PipelineCheckpoint.query.filter_by(run_id=self.run_id, stage=stage).first()  # type: ignore[attr-defined]
+        if not row:
+            return None
+        if max_age_seconds is not None and (datetime.utcnow() - row.created_at).total_seconds() > max_age_seconds:
+            return None
+        return row.artifact
+
+    def save(self, stage: str, artifact: Dict[str, Any]) -> bool:
+        """
+        Insert or replace one stage's artifact.
+
+        A failed save is logged, not raised - losing a checkpoint only
+        costs a re-run of that stage on resume.
+
+        Returns:
+            True if the checkpoint was written
+        """
+        from app_v3 import db, PipelineCheckpoint
+
+        try:
+            row = PipelineCheckpoint.query.filter_by(run_id=self.run_id, stage=stage).first()  # type: ignore[attr-defined]
+            if row:
+                row.artifact = artifact
+                row.created_at = datetime.utcnow()
+            else:
+                db.session.add(PipelineCheckpoint(run_id=self.run_id, stage=stage, artifact=artifact))
+            db.session.commit()
+            logger.debug(f"[Checkpoint] Saved {self.run_id}/{stage}")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"[Checkpoint] Failed to save {self.run_id}/{stage}: {e}")
+            return False
+
+    def clear(self) -> int:
+        """
+        Delete every checkpoint of this run.
+
+        Returns:
+            Number of checkpoints deleted
+        """
+        from app_v3 import db, PipelineCheckpoint
+
+        deleted = PipelineCheckpoint.query.filter_by(run_id=self.run_id).delete(  # type: ignore[attr-defined]
+            synchronize_session=False
+        )
+        db.session.commit()
+        return deleted
+
+
+def cleanup_checkpoints(retention_days: int = CHECKPOINT_RETENTION_DAYS) -> int:
+    """
+    Delete checkpoints of runs nobody resumed.
+
+    Must be called inside an application context.
+
+    Returns:
+        Number of checkpoints deleted
+    """
+    from app_v3 import db, PipelineCheckpoint
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = PipelineCheckpoint.query.filter(PipelineCheckpoint.created_at < cutoff).delete(  # type: ignore[attr-defined]
+        synchronize_session=False
+    )
+    db.session.commit()
+    if deleted:
+        logger.info(f"[Checkpoint] Cleaned up {deleted} expired checkpoints")
+    return deleted
@@ -0,0 +1,335 @@
+"""
+pipeline_executor.py - Stage Graph Executor for Article Pipelines
+
+Runs a set of pipeline stages as a dependency graph instead of a fixed
+sequence. Each stage declares the named values it consumes (inputs) and the
+named values it produces (outputs). A stage starts as soon as all of its
+inputs exist, so independent stages overlap and end-to-end latency is the
+critical path through the graph rather than the sum of all stages.
+
+Stage functions run in a thread pool. The Flask application context and any
+contextvars of the calling thread are propagated into every stage, so stages
+can use Model.query and other context-bound helpers.
+
+With a checkpoint store (see pipeline_checkpoints.py) every completed
+stage's outputs are persisted, and a re-run of the same pipeline restores
+them instead of executing the stage again. A stage is only restored if all
+stages it depends on were restored too, so re-running an expired stage
+(e.g. Replicate URLs older than their TTL) also re-runs everything after it.
+
+A streaming stage can publish some outputs before it returns (early_outputs,
+via the emit callback), so dependents of those values start while the stage
+is still running - e.g. the hero image prompt starts as soon as the streamed
+story has its title, long before the article body is finished.
+
+Usage:
+    stages = [
+        Stage("story", write_story, inputs=["research"], outputs=["article"]),
+        Stage("hero_prompt", make_hero_prompt, inputs=["article"], outputs=["hero_prompt"]),
+        Stage("brand", load_brand, outputs=["brand_colors"]),
+    ]
+    values = run_pipeline(stages, {"research": research})
+"""
+
+import time
+import queue
+import logging
+import contextvars
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 6
+
+
+class PipelineError(Exception):
+    """
+    Raised by a stage to abort the pipeline with a user-facing error message.
+
+    Attributes:
+        stage: Name of the stage that failed (filled in by the executor)
+        timings: Wall times of the stages that finished, including the failed
+            one (filled in by the executor)
+    """
+
+    def __init__(self, message: str, stage: Optional[str] = None):
+        super().__init__(message)
+        self.stage = stage
+        self.timings: Dict[str, float] = {}
+
+
+class Stage:
+    """
+    One node of the pipeline graph.
+
+    The stage function is called with its inputs as keyword arguments. A
+    stage with a single output returns that value; a stage with several
+    outputs returns a dict keyed by output name.
+
+    Outputs must be JSON-serializable when the pipeline runs with a
+    checkpoint store. Set checkpoint=False for stages whose outputs are
+    cheap to recompute or too large to persist, and checkpoint_ttl (seconds)
+    for outputs that go stale.
+
+    Stages with early_outputs are also called with an `emit` keyword
+    argument; emit(name, value) publishes one of those outputs immediately.
+    Every early output must be emitted before the function returns, and the
+    return value only carries the regular outputs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        inputs: Iterable[str] = (),
+        outputs: Iterable[str] = (),
+        checkpoint: bool = True,
+        checkpoint_ttl: Optional[float] = None,
+        early_outputs: Iterable[str] = ()
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.early_outputs = list(early_outputs)
+        self.checkpoint = checkpoint
+        self.checkpoint_ttl = checkpoint_ttl
+
+    @property
+    def all_outputs(self) -> List[str]:
+        """Early and regular outputs."""
+        return self.early_outputs + self.outputs
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+
+def _validate_graph(stages: List[Stage], initial: Dict[str, Any]) -> None:
+    """
+    Check that every input has exactly one producer and the graph is acyclic.
+
+    Raises:
+        ValueError: On duplicate producers, missing inputs or cycles
+    """
+    producers: Dict[str, str] = {name: "<initial>" for name in initial}
+    for stage in stages:
+        for output in stage.all_outputs:
+            if output in producers:
+                raise ValueError(f"'{output}' produced by both {producers[output]} and {stage.name}")
+            producers[output] = stage.name
+
+    for stage in stages:
+        missing = [name for name in stage.inputs if name not in producers]
+        if missing:
+            raise ValueError(f"Stage {stage.name} has no producer for inputs: {missing}")
+
+    # Kahn's algorithm over value availability
+    available = set(initial)
+    remaining = list(stages)
+    while remaining:
+        ready = [s for s in remaining if all(name in available for name in s.inputs)]
+        if not ready:
+            raise ValueError(f"Cycle between stages: {[s.name for s in remaining]}")
+        for stage in ready:
+            available.update(stage.all_outputs)
+            remaining.remove(stage)
+
+
+def _bind_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap func so it runs with the caller's contextvars and Flask app context."""
+    ctx = contextvars.copy_context()
+
+    app = None
+    try:
+        from flask import current_app, has_app_context
+        if has_app_context():
+            app = current_app._get_current_object()
+    except ImportError:
+        pass
+
+    def _run(**kwargs: Any) -> Any:
+        if app is None:
+            return ctx.copy().run(func, **kwargs)
+        with app.app_context():
+            return ctx.copy().run(func, **kwargs)
+
+    return _run
+
+
+def _collect_outputs(stage: Stage, result: Any) -> Dict[str, Any]:
+    """Normalize a stage return value into {output_name: value}."""
+    if not stage.outputs:
+        return {}
+    if len(stage.outputs) == 1:
+        return {stage.outputs[0]: result}
+
+    if not isinstance(result, dict):
+        raise TypeError(f"Stage {stage.name} must return a dict of {stage.outputs}")
+
+    missing = [name for name in stage.outputs if name not in result]
+    if missing:
+        raise TypeError(f"Stage {stage.name} did not produce: {missing}")
+    return {name: result[name] for name in stage.outputs}
+
+
+def _restore_checkpoints(
+    stages: List[Stage],
+    values: Dict[str, Any],
+    checkpoints: Any,
+    name: str
+) -> List[Stage]:
+    """
+    Restore completed stages from the checkpoint store into values.
+
+    Walks the graph in dependency order; a stage is restored only if its
+    checkpoint is fresh and every input is already available from the
+    initial values or another restored stage.
+
+    Returns:
+        Stages that were restored
+    """
+    try:
+        saved = checkpoints.load_all()
+    except Exception as e:
+        logger.error(f"[{name}] Could not load checkpoints - running all stages: {e}")
+        return []
+
+    restored: List[Stage] = []
+    remaining = [s for s in stages if s.checkpoint and s.name in saved]
+    progress = True
+    while progress:
+        progress = False
+        for stage in list(remaining):
+            if not all(n in values for n in stage.inputs):
+                continue
+            remaining.remove(stage)
+            outputs, age = saved[stage.name]
+            if stage.checkpoint_ttl is not None and age > stage.checkpoint_ttl:
+                logger.info(f"[{name}] Checkpoint for {stage.name} expired ({age:.0f}s old) - re-running")
+                continue
+            if not all(n in outputs for n in stage.all_outputs):
+                continue
+            values.update({n: outputs[n] for n in stage.all_outputs})
+            restored.append(stage)
+            progress = True
+            logger.info(f"[{name}] ↺ {stage.name} restored from checkpoint")
+    return restored
+
+
+def run_pipeline(
+    stages: List[Stage],
+    initial: Optional[Dict[str, Any]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    name: str = "Pipeline",
+    checkpoints: Any = None
+) -> Dict[str, Any]:
+    """
+    Execute a stage graph, running every stage as soon as its inputs exist.
+
+    Args:
+        stages: Stages to run (order does not matter)
+        initial: Values available before any stage runs
+        max_workers: Maximum number of stages running at once
+        name: Label used in log lines
+        checkpoints: Optional store with load_all() -> {stage: (outputs, age_seconds)}
+            and save(stage, outputs) that never raises - see
+            pipeline_checkpoints.CheckpointStore
+
+    Returns:
+        Dict of all initial and produced values. Per-stage wall times
+        (seconds) are included under "_timings".
+
+    Raises:
+        PipelineError: If a stage raises PipelineError (stage name attached)
+        Exception: Any other stage exception is re-raised unchanged
+
+    On failure, stages that have not started yet are cancelled; stages
+    already running are allowed to finish before the error propagates.
+    """
+    values: Dict[str, Any] = dict(initial or {})
+    _validate_graph(stages, values)
+
+    timings: Dict[str, float] = {}
+    pending = list(stages)
+    if checkpoints is not None:
+        for stage in _restore_checkpoints(stages, values, checkpoints, name):
+            pending.remove(stage)
+            timings[stage.name] = 0.0
+    running: Dict[Any, Stage] = {}
+    started_at: Dict[str, float] = {}
+    pipeline_start = time.monotonic()
+
+    # Early outputs arrive on a queue; emit() resolves `wakeup` so the wait
+    # below returns. The future is replaced before the queue is drained, so
+    # an emit racing with the drain is never lost.
+    emitted: "queue.Queue[tuple]" = queue.Queue()
+    wakeup = {"future": Future()}
+
+    def _emitter(stage: Stage) -> Callable[[str, Any], None]:
+        def emit(output: str, value: Any) -> None:
+            if output not in stage.early_outputs:
+                raise ValueError(f"Stage {stage.name} cannot emit '{output}'")
+            emitted.put((stage, output, value))
+            try:
+                wakeup["future"].set_result(None)
+            except InvalidStateError:
+                pass  # Already woken
+        return emit
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline") as pool:
+        try:
+            while pending or running:
+                for stage in [s for s in pending if all(n in values for n in s.inputs)]:
+                    pending.remove(stage)
+                    kwargs = {n: values[n] for n in stage.inputs}
+                    if stage.early_outputs:
+                        kwargs["emit"] = _emitter(stage)
+                    logger.info(f"[{name}] ▶ {stage.name}")
+                    started_at[stage.name] = time.monotonic()
+                    running[pool.submit(_bind_context(stage.func), **kwargs)] = stage
+
+                done, _ = wait(list(running) + [wakeup["future"]], return_when=FIRST_COMPLETED)
+                if wakeup["future"].done():
+                    wakeup["future"] = Future()
+                while not emitted.empty():
+                    stage, output, value = emitted.get()
+                    values[output] = value
+                    logger.info(f"[{name}] ⇢ {stage.name} emitted {output} "
+                                f"({time.monotonic() - started_at[stage.name]:.1f}s)")
+
+                for future in done:
+                    if future not in running:
+                        continue
+                    stage = running.pop(future)
+                    timings[stage.name] = time.monotonic() - started_at[stage.name]
+                    try:
+                        result = future.result()
+                        missing = [n for n in stage.early_outputs if n not in values]
+                        if missing:
+                            raise PipelineError(f"{stage.name} finished without emitting {missing}")
+                    except PipelineError as e:
+                        e.stage = e.stage or stage.name
+                        e.timings = dict(timings)
+                        logger.error(f"[{name}] ✗ {stage.name} failed: {e}")
+                        raise
+                    except Exception as e:
+                        logger.error(f"[{name}] ✗ {stage.name} raised {type(e).__name__}: {e}")
+                        raise
+                    outputs = _collect_outputs(stage, result)
+                    values.update(outputs)
+                    if checkpoints is not None and stage.checkpoint:
+                        checkpoints.save(stage.name, {**{n: values[n] for n in stage.early_outputs}, **outputs})
+                    logger.info(f"[{name}] ✓ {stage.name} ({timings[stage.name]:.1f}s)")
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+
+    total = time.monotonic() - pipeline_start
+    logger.info(
+        f"[{name}] Completed {len(stages)} stages in {total:.1f}s "
+        f"(sum of stages {sum(timings.values()):.1f}s)"
+    )
+    values["_timings"] = timings
+    return values
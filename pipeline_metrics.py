@@ -0,0 +1,492 @@
+"""
+pipeline_metrics.py - Per-Run Latency, Token and Cost Instrumentation
+
+Collects, for every article generation run:
+- Wall time of each V4 stage (story, prompts, images, formatting, uploads)
+  plus persistence and email delivery
+- Input/output tokens, latency and estimated cost of every LLM call
+  (GPT-5 story, GPT-5-mini prompts, Claude formatter, Perplexity research),
+  plus prompt-cache reads/writes and time-to-first-token where available
+- Replicate prediction durations (predict_time reported by Replicate)
+- Bytes downloaded from Replicate and uploaded to WordPress
+
+The active run lives in a contextvar, so instrumented code anywhere in the
+call tree records into it without threading a collector through every
+signature. pipeline_executor copies contextvars into stage threads; other
+thread pools must submit through contextvars.copy_context().run.
+
+Each run is stored as one ArticleMetrics row. aggregate_metrics() turns the
+recent rows into percentiles for /api/admin/metrics, and
+render_prometheus() exposes the same numbers on /metrics.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M tokens (input, output) - override with MODEL_PRICE_<MODEL>="in,out"
+MODEL_PRICING_PER_MILLION = {
+    "gpt-5": (1.25, 10.00),
+    "gpt-5-mini": (0.25, 2.00),
+    "claude-sonnet-4-20250514": (3.00, 15.00),
+    "sonar": (1.00, 1.00),
+}
+SEEDREAM_IMAGE_COST_USD = 0.075  # Matches Image.cost_usd
+# Anthropic prompt caching: reads bill at 10% of input, writes at 125%
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+METRICS_WINDOW_DAYS = int(os.getenv('METRICS_WINDOW_DAYS', '7'))
+METRICS_MAX_RUNS = 5000  # Rows loaded per aggregation
+LLM_CALL_SERIES = ("seconds", "ttft_seconds", "input_tokens", "output_tokens", "cache_read_tokens", "cost_usd")
+
+_current_run: contextvars.ContextVar[Optional["RunMetrics"]] = contextvars.ContextVar(
+    "pipeline_metrics_run", default=None
+)
+
+
+def _model_price(model: str) -> Optional[tuple]:
+    """(input, output) USD per 1M tokens for model, or None if unknown."""
+    override = os.getenv(f"MODEL_PRICE_{model.upper().replace('-', '_').replace('.', '_')}")
+    if override:
+        try:
+            input_price, output_price = (float(p) for p in override.split(","))
+            return input_price, output_price
+        except ValueError:
+            logger.warning(f"[Metrics] Ignoring malformed price override for {model}: {override}")
+    return MODEL_PRICING_PER_MILLION.get(model)
+
+
+def _usage_tokens(response: Any) -> tuple:
+    """
+    Extract (input_tokens, output_tokens) from an LLM response.
+
+    Handles OpenAI Responses and Anthropic Messages objects (usage.input_tokens /
+    usage.output_tokens) and chat-completions JSON dicts such as Perplexity's
+    (usage.prompt_tokens / usage.completion_tokens).
+    """
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0
+
+    def _field(*names: str) -> int:
+        for name in names:
+            value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+            if isinstance(value, (int, float)):
+                return int(value)
+        return 0
+
+    return _field("input_tokens", "prompt_tokens"), _field("output_tokens", "completion_tokens")
+
+
+def _cache_tokens(response: Any) -> tuple:
+    """(cache_read_tokens, cache_write_tokens) from an Anthropic response, (0, 0) otherwise."""
+    usage = getattr(response, "usage", None)
+    read = getattr(usage, "cache_read_input_tokens", None)
+    write = getattr(usage, "cache_creation_input_tokens", None)
+    return (read if isinstance(read, int) else 0), (write if isinstance(write, int) else 0)
+
+
+class RunMetrics:
+    """
+    Measurements of one generation run.
+
+    Stage threads record concurrently, so every mutation takes the lock.
+    """
+
+    def __init__(self, user_id: Optional[int] = None, run_id: Optional[str] = None):
+        self.user_id = user_id
+        self.run_id = run_id
+        self.article_id: Optional[int] = None
+        self.mode: Optional[str] = None
+        self.status = "failed"  # Set to "succeeded" by the caller on success
+        self.stages: Dict[str, float] = {}
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.replicate_predictions: List[Dict[str, Any]] = []
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        self.image_bytes_original = 0
+        self.image_bytes_optimized = 0
+        self._started = time.monotonic()
+        self.total_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = round(self.stages.get(name, 0.0) + seconds, 3)
+
+    def add_llm_call(
+        self,
+        label: str,
+        model: str,
+        input_tokens: int,
+        output_tokens: int,
+        seconds: float,
+        cache_read_tokens: int = 0,
+        cache_write_tokens: int = 0,
+        ttft_seconds: Optional[float] = None
+    ) -> None:
+        price = _model_price(model)
+        cost = 0.0
+        if price:
+            billed_input = (input_tokens
+                            + cache_read_tokens * CACHE_READ_PRICE_FACTOR
+                            + cache_write_tokens * CACHE_WRITE_PRICE_FACTOR)
+            cost = (billed_input * price[0] + output_tokens * price[1]) / 1_000_000
+        with self._lock:
+            self.llm_calls.append({
+                "label": label,
+                "model": model,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cache_read_tokens": cache_read_tokens,
+                "cache_write_tokens": cache_write_tokens,
+                "seconds": round(seconds, 3),
+                "ttft_seconds": round(ttft_seconds, 3) if ttft_seconds is not None else None,
+                "cost_usd": round(cost, 6)
+            })
+
+    def add_replicate_prediction(self, prediction_id: str, status: str, predict_seconds: Optional[float]) -> None:
+        with self._lock:
+            self.replicate_predictions.append({
+                "id": prediction_id,
+                "status": status,
+                "predict_seconds": round(predict_seconds, 3) if predict_seconds is not None else None
+            })
+
+    def add_bytes(self, downloaded: int = 0, uploaded: int = 0) -> None:
+        with self._lock:
+            self.bytes_downloaded += downloaded
+            self.bytes_uploaded += uploaded
+
+    def add_image_optimization(self, original: int, optimized: int) -> None:
+        with self._lock:
+            self.image_bytes_original += original
+            self.image_bytes_optimized += optimized
+
+    def finish(self) -> None:
+        if self.total_seconds is None:
+            self.total_seconds = round(time.monotonic() - self._started, 3)
+
+    def totals(self) -> Dict[str, Any]:
+        """Run-level sums stored in the ArticleMetrics columns."""
+        with self._lock:
+            images = sum(1 for p in self.replicate_predictions if p["status"] == "succeeded")
+            return {
+                "input_tokens": sum(c["input_tokens"] for c in self.llm_calls),
+                "output_tokens": sum(c["output_tokens"] for c in self.llm_calls),
+                "llm_cost_usd": round(sum(c["cost_usd"] for c in self.llm_calls), 6),
+                "image_cost_usd": round(images * SEEDREAM_IMAGE_COST_USD, 4),
+                "replicate_seconds": round(sum(p["predict_seconds"] or 0.0 for p in self.replicate_predictions), 3),
+            }
+
+
+def current_run() -> Optional[RunMetrics]:
+    """The run being measured in this context, or None."""
+    return _current_run.get()
+
+
+@contextmanager
+def collect_run_metrics(user_id: Optional[int] = None, run_id: Optional[str] = None) -> Iterator[RunMetrics]:
+    """
+    Measure a generation run and store it when the block exits.
+
+    Nested calls join the outer run (e.g. run_test_post_generation wraps
+    create_blog_post_v3), and only the outermost block saves. Must be used
+    inside an application context.
+
+    Usage:
+        with collect_run_metrics(user_id, run_id=job_id) as run:
+            ...
+            run.status = "succeeded"
+    """
+    run = _current_run.get()
+    if run is not None:
+        yield run
+        return
+
+    run = RunMetrics(user_id=user_id, run_id=run_id)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        run.finish()
+        save_run_metrics(run)
+
+
+@contextmanager
+def track_stage(name: str) -> Iterator[None]:
+    """Record the wall time of a block as a stage of the current run."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        run = _current_run.get()
+        if run is not None:
+            run.add_stage(name, time.monotonic() - started)
+
+
+def record_stage_timings(timings: Dict[str, float]) -> None:
+    """Record run_pipeline()'s "_timings" (0.0 = restored from checkpoint, skipped)."""
+    run = _current_run.get()
+    if run is None:
+        return
+    for name, seconds in timings.items():
+        if seconds > 0:
+            run.add_stage(name, seconds)
+
+
+def record_llm_call(
+    label: str,
+    model: str,
+    response: Any,
+    seconds: float,
+    ttft_seconds: Optional[float] = None
+) -> None:
+    """
+    Record tokens, latency and estimated cost of one LLM call.
+
+    Args:
+        label: Call site (e.g. "story", "hero_prompt", "claude_formatter")
+        model: Model name used for pricing
+        response: SDK response object or JSON dict carrying usage
+            (Anthropic cache read/write tokens are picked up as well)
+        seconds: Request wall time
+        ttft_seconds: Time to first streamed token, for streaming calls
+    """
+    run = _current_run.get()
+    if run is None:
+        return
+    input_tokens, output_tokens = _usage_tokens(response)
+    cache_read, cache_write = _cache_tokens(response)
+    run.add_llm_call(label, model, input_tokens, output_tokens, seconds,
+                     cache_read_tokens=cache_read, cache_write_tokens=cache_write,
+                     ttft_seconds=ttft_seconds)
+
+
+def record_replicate_prediction(prediction: Any) -> None:
+    """Record the Replicate-reported predict_time of a finished prediction."""
+    run = _current_run.get()
+    if run is None:
+        return
+    metrics = getattr(prediction, "metrics", None) or {}
+    predict_time = metrics.get("predict_time") if isinstance(metrics, dict) else None
+    run.add_replicate_prediction(prediction.id, prediction.status, predict_time)
+
+
+def record_bytes(downloaded: int = 0, uploaded: int = 0) -> None:
+    """Record image bytes transferred by the current run."""
+    run = _current_run.get()
+    if run is not None:
+        run.add_bytes(downloaded=downloaded, uploaded=uploaded)
+
+
+def record_image_optimization(original: int, optimized: int) -> None:
+    """Record the size of an image before and after recompression."""
+    run = _current_run.get()
+    if run is not None:
+        run.add_image_optimization(original=original, optimized=optimized)
+
+
+def save_run_metrics(run: RunMetrics) -> bool:
+    """
+    Store a finished run as an ArticleMetrics row.
+
+    A failed save is logged, not raised - metrics must never fail a run.
+
+    Returns:
+        True if the row was written
+    """
+    from app_v3 import db, ArticleMetrics
+
+    try:
+        totals = run.totals()
+        db.session.add(ArticleMetrics(
+            article_id=run.article_id,
+            user_id=run.user_id,
+            run_id=run.run_id,
+            status=run.status,
+            mode=run.mode,
+            total_seconds=run.total_seconds,
+            stage_seconds=dict(run.stages),
+            llm_calls=list(run.llm_calls),
+            replicate_predictions=list(run.replicate_predictions),
+            bytes_downloaded=run.bytes_downloaded,
+            bytes_uploaded=run.bytes_uploaded,
+            image_bytes_original=run.image_bytes_original,
+            image_bytes_optimized=run.image_bytes_optimized,
+            **totals
+        ))
+        db.session.commit()
+        saved_kb = (run.image_bytes_original - run.image_bytes_optimized) / 1024
+        logger.info(
+            f"[Metrics] Run {run.run_id or '-'} ({run.status}): {run.total_seconds:.1f}s, "
+            f"{totals['input_tokens']}+{totals['output_tokens']} tokens, "
+            f"${totals['llm_cost_usd'] + totals['image_cost_usd']:.3f}, "
+            f"{saved_kb:.0f} KB saved by image optimization"
+        )
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Metrics] Failed to save run metrics: {e}")
+        return False
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile of values (q in 0..1), None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return round(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower), 4)
+
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {f"p{int(q * 100)}": percentile(values, q) for q in PERCENTILES}
+    summary["count"] = len(values)
+    summary["sum"] = round(sum(values), 4)
+    return summary
+
+
+def aggregate_metrics(days: int = METRICS_WINDOW_DAYS) -> Dict[str, Any]:
+    """
+    Percentiles over the runs of the last `days` days.
+
+    Must be called inside an application context.
+
+    Returns:
+        {
+            "window_days", "runs", "succeeded", "failed",
+            "total_seconds": {p50, p90, p95, p99, count, sum},
+            "stages": {stage: summary},
+            "llm_calls": {label: {"seconds", "ttft_seconds", "input_tokens", "output_tokens",
+                                  "cache_read_tokens", "cost_usd", "cache_hit_ratio"}},
+            "replicate_predict_seconds": summary,
+            "per_run": {"input_tokens", "output_tokens", "cost_usd", "bytes_downloaded", "bytes_uploaded",
+                        "image_bytes_saved"}
+        }
+    """
+    from app_v3 import ArticleMetrics
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    rows = (
+        ArticleMetrics.query  # type: ignore[attr-defined]
+        .filter(ArticleMetrics.created_at >= cutoff)
+        .order_by(ArticleMetrics.created_at.desc())
+        .limit(METRICS_MAX_RUNS)
+        .all()
+    )
+
+    stages: Dict[str, List[float]] = {}
+    llm: Dict[str, Dict[str, List[float]]] = {}
+    predict_seconds: List[float] = []
+    for row in rows:
+        for name, seconds in (row.stage_seconds or {}).items():
+            stages.setdefault(name, []).append(seconds)
+        for call in row.llm_calls or []:
+            series = llm.setdefault(call["label"], {key: [] for key in LLM_CALL_SERIES})
+            for key in LLM_CALL_SERIES:
+                if key == "ttft_seconds" and call.get(key) is None:
+                    continue  # Non-streaming call
+                series[key].append(call.get(key) or 0)
+        predict_seconds.extend(
+            p["predict_seconds"] for p in row.replicate_predictions or [] if p.get("predict_seconds") is not None
+        )
+
+    succeeded = [row for row in rows if row.status == "succeeded"]
+    return {
+        "window_days": days,
+        "runs": len(rows),
+        "succeeded": len(succeeded),
+        "failed": len(rows) - len(succeeded),
+        "total_seconds": _summary([row.total_seconds for row in succeeded if row.total_seconds is not None]),
+        "stages": {name: _summary(values) for name, values in sorted(stages.items())},
+        "llm_calls": {
+            label: {
+                **{key: _summary(values) for key, values in series.items()},
+                "cache_hit_ratio": round(
+                    sum(1 for t in series["cache_read_tokens"] if t) / len(series["cache_read_tokens"]), 4
+                )
+            }
+            for label, series in sorted(llm.items())
+        },
+        "replicate_predict_seconds": _summary(predict_seconds),
+        "per_run": {
+            "input_tokens": _summary([row.input_tokens or 0 for row in rows]),
+            "output_tokens": _summary([row.output_tokens or 0 for row in rows]),
+            "cost_usd": _summary([(row.llm_cost_usd or 0.0) + (row.image_cost_usd or 0.0) for row in rows]),
+            "bytes_downloaded": _summary([row.bytes_downloaded or 0 for row in rows]),
+            "bytes_uploaded": _summary([row.bytes_uploaded or 0 for row in rows]),
+            "image_bytes_saved": _summary([
+                (row.image_bytes_original or 0) - (row.image_bytes_optimized or 0) for row in rows
+            ]),
+        }
+    }
+
+
+def _prometheus_summary(lines: List[str], metric: str, help_text: str,
+                        series: List[tuple]) -> None:
+    """Append one summary metric; series is [(labels_dict, summary_dict)]."""
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} summary")
+    for labels, summary in series:
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        for q in PERCENTILES:
+            value = summary[f"p{int(q * 100)}"]
+            if value is not None:
+                quantile_labels = f'{label_text},quantile="{q}"' if label_text else f'quantile="{q}"'
+                lines.append(f"{metric}{{{quantile_labels}}} {value}")
+        suffix = f"{{{label_text}}}" if label_text else ""
+        lines.append(f"{metric}_sum{suffix} {summary['sum']}")
+        lines.append(f"{metric}_count{suffix} {summary['count']}")
+
+
+def render_prometheus(aggregate: Dict[str, Any]) -> str:
+    """Render aggregate_metrics() output in the Prometheus text exposition format."""
+    lines = [
+        "# HELP ezwai_pipeline_runs Generation runs in the metrics window",
+        "# TYPE ezwai_pipeline_runs gauge",
+        f'ezwai_pipeline_runs{{status="succeeded"}} {aggregate["succeeded"]}',
+        f'ezwai_pipeline_runs{{status="failed"}} {aggregate["failed"]}',
+    ]
+
+    _prometheus_summary(lines, "ezwai_pipeline_duration_seconds", "End-to-end wall time of successful runs",
+                        [({}, aggregate["total_seconds"])])
+    _prometheus_summary(lines, "ezwai_stage_duration_seconds", "Wall time per pipeline stage",
+                        [({"stage": name}, summary) for name, summary in aggregate["stages"].items()])
+    _prometheus_summary(lines, "ezwai_llm_call_duration_seconds", "LLM request latency per call site",
+                        [({"call": label}, series["seconds"]) for label, series in aggregate["llm_calls"].items()])
+    _prometheus_summary(lines, "ezwai_llm_input_tokens", "LLM input tokens per call",
+                        [({"call": label}, series["input_tokens"]) for label, series in aggregate["llm_calls"].items()])
+    _prometheus_summary(lines, "ezwai_llm_output_tokens", "LLM output tokens per call",
+                        [({"call": label}, series["output_tokens"]) for label, series in aggregate["llm_calls"].items()])
+    _prometheus_summary(lines, "ezwai_llm_ttft_seconds", "Time to first streamed token per call site",
+                        [({"call": label}, series["ttft_seconds"]) for label, series in aggregate["llm_calls"].items()
+                         if series["ttft_seconds"]["count"]])
+    _prometheus_summary(lines, "ezwai_llm_cache_read_tokens", "Prompt-cache input tokens read per call",
+                        [({"call": label}, series["cache_read_tokens"]) for label, series in aggregate["llm_calls"].items()])
+    lines.append("# HELP ezwai_llm_cache_hit_ratio Share of calls that read the prompt cache")
+    lines.append("# TYPE ezwai_llm_cache_hit_ratio gauge")
+    lines.extend(f'ezwai_llm_cache_hit_ratio{{call="{label}"}} {series["cache_hit_ratio"]}'
+                 for label, series in aggregate["llm_calls"].items())
+    _prometheus_summary(lines, "ezwai_replicate_predict_seconds", "Replicate-reported SeeDream prediction time",
+                        [({}, aggregate["replicate_predict_seconds"])])
+    _prometheus_summary(lines, "ezwai_run_cost_usd", "Estimated LLM + image cost per run",
+                        [({}, aggregate["per_run"]["cost_usd"])])
+    _prometheus_summary(lines, "ezwai_run_bytes", "Image bytes transferred per run",
+                        [({"direction": "downloaded"}, aggregate["per_run"]["bytes_downloaded"]),
+                         ({"direction": "uploaded"}, aggregate["per_run"]["bytes_uploaded"])])
+    _prometheus_summary(lines, "ezwai_run_image_bytes_saved", "Image bytes saved per run by recompression",
+                        [({}, aggregate["per_run"]["image_bytes_saved"])])
+    return "\n".join(lines) + "\n"
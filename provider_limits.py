@@ -0,0 +1,145 @@
+"""
+provider_limits.py - Per-Provider Concurrency Limits
+
+When many articles run at once (the scheduler dispatching everyone due at
+9:00, or several generation workers), each provider sees the sum of their
+calls. Every call to a provider takes a slot from that provider's limiter,
+so throughput stays high without tripping rate limits:
+
+    with provider_slot("openai"):
+        client.responses.create(...)
+
+Replicate is limited by predictions in flight (a batch of images takes one
+unit per image); WordPress is limited per site. Limits are per process -
+set them to each provider's account limit divided by the number of
+processes that generate articles.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_CONCURRENCY = {
+    "openai": int(os.getenv('OPENAI_CONCURRENCY', '8')),
+    "anthropic": int(os.getenv('ANTHROPIC_CONCURRENCY', '4')),
+    "replicate": int(os.getenv('REPLICATE_CONCURRENCY', '12')),  # Predictions in flight
+    "wordpress": int(os.getenv('WORDPRESS_SITE_CONCURRENCY', '4')),  # Requests per site
+}
+
+
+class ConcurrencyLimiter:
+    """
+    Counting limiter where one acquisition may take several units.
+
+    Waiters are served in arrival order, so a large request (e.g. six
+    images) is not starved by a stream of small ones.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(limit, 1)
+        self.in_use = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._condition = threading.Condition()
+        self._queue: list = []
+
+    def acquire(self, units: int = 1) -> Tuple[int, float]:
+        """
+        Block until `units` are free (capped at the limit).
+
+        Returns:
+            (units taken, seconds waited)
+        """
+        units = min(max(units, 1), self.limit)
+        ticket = object()
+        started = time.monotonic()
+        with self._condition:
+            self._queue.append(ticket)
+            while self._queue[0] is not ticket or self.in_use + units > self.limit:
+                self._condition.wait()
+            self._queue.pop(0)
+            self.in_use += units
+            waited = time.monotonic() - started
+            if waited > 0.001:
+                self.waits += 1
+                self.wait_seconds += waited
+            self._condition.notify_all()  # The next waiter may fit as well
+        return units, waited
+
+    def release(self, units: int) -> None:
+        with self._condition:
+            self.in_use -= units
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "in_use": self.in_use,
+                "waiting": len(self._queue),
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+_limiters: Dict[str, ConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str, key: Optional[str] = None) -> ConcurrencyLimiter:
+    """
+    Limiter of a provider (or of one of its sites, e.g. a WordPress base URL).
+
+    Raises:
+        KeyError if the provider has no configured limit
+    """
+    name = f"{provider}:{key}" if key else provider
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = ConcurrencyLimiter(PROVIDER_CONCURRENCY[provider])
+            _limiters[name] = limiter
+        return limiter
+
+
+@contextmanager
+def provider_slot(provider: str, key: Optional[str] = None, units: int = 1) -> Iterator[None]:
+    """
+    Hold `units` of a provider's concurrency for the duration of the block.
+
+    Args:
+        provider: "openai", "anthropic", "replicate" or "wordpress"
+        key: Sub-limit, e.g. the WordPress site base URL
+        units: Concurrent operations the block starts (e.g. predictions)
+    """
+    limiter = get_limiter(provider, key)
+    taken, waited = limiter.acquire(units)
+    if waited >= 1:
+        logger.info(f"[Limits] Waited {waited:.1f}s for {taken} {provider} slot(s)")
+    try:
+        yield
+    finally:
+        limiter.release(taken)
+
+
+def provider_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """Limit, current use and accumulated waiting of every limiter in this process."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in sorted(limiters.items())}
+
+
+def _reset_limiters_after_fork() -> None:
+    """A forked child must not inherit the parent's held slots or locks."""
+    global _limiters_lock
+    _limiters.clear()
+    _limiters_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_limiters_after_fork)
@@ -0,0 +1,277 @@
+"""
+replicate_completion.py - Replicate Prediction Completion Registry
+
+Replicate calls our /webhook/replicate route when a prediction finishes.
+The webhook handler records the final prediction payload here, and image
+generation waits on this registry instead of calling prediction.reload()
+every second.
+
+The registry is two-level:
+1. In-process condition variable - wakes waiters immediately when the
+   webhook lands in the same worker process. Only predictions someone in
+   this process is waiting on are kept in memory.
+2. Completion files on local disk - shared by every gunicorn worker and the
+   scheduler on the host, so a webhook received by worker A releases a
+   pipeline waiting in worker B. Files nobody consumed are removed by
+   cleanup_completions(), which generation_worker.py runs periodically.
+
+When webhooks are not configured (or a webhook is lost) callers fall back
+to polling the Replicate API with adaptive backoff - see next_poll_delay().
+"""
+
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_DIR = os.getenv(
+    "REPLICATE_COMPLETION_DIR",
+    os.path.join(tempfile.gettempdir(), "ezwai_replicate_completions")
+)
+COMPLETION_MAX_AGE_SECONDS = 2 * 60 * 60  # Replicate output URLs expire after 1 hour anyway
+FILE_CHECK_INTERVAL = 0.5  # Local stat() of completion files - no network involved
+WEBHOOK_TOLERANCE_SECONDS = 5 * 60  # Reject replayed webhooks older than this
+
+# Adaptive backoff for the API poller: (first delay, growth factor, max delay)
+POLL_BACKOFF_NO_WEBHOOK = (1.0, 1.5, 10.0)
+POLL_BACKOFF_WITH_WEBHOOK = (15.0, 1.5, 30.0)  # Safety net only - webhook should win
+
+_condition = threading.Condition()
+_local_completions: Dict[str, Dict[str, Any]] = {}
+_local_waiters: Dict[str, int] = {}  # Prediction ID -> threads of this process waiting on it
+
+
+def get_webhook_url() -> Optional[str]:
+    """
+    Get the public URL Replicate should call when a prediction completes.
+
+    Returns None unless both REPLICATE_WEBHOOK_URL and REPLICATE_WEBHOOK_SECRET
+    are set - an unsigned webhook would be rejected by our route anyway.
+    """
+    url = os.getenv("REPLICATE_WEBHOOK_URL", "").strip()
+    secret = os.getenv("REPLICATE_WEBHOOK_SECRET", "").strip()
+    if url and secret:
+        return url
+    return None
+
+
+def webhooks_enabled() -> bool:
+    """True if predictions should be created with a completion webhook."""
+    return get_webhook_url() is not None
+
+
+def next_poll_delay(polls_done: int, webhooks: bool) -> float:
+    """
+    Seconds to wait before the next prediction.reload() for a prediction.
+
+    Grows geometrically with the number of polls already made, so a 60s
+    image costs ~10 API calls instead of 60 - and ~3 when webhooks are on.
+    """
+    first, factor, cap = POLL_BACKOFF_WITH_WEBHOOK if webhooks else POLL_BACKOFF_NO_WEBHOOK
+    return min(first * (factor ** polls_done), cap)
+
+
+def _completion_path(prediction_id: str) -> str:
+    """Path of the completion file for a prediction ID."""
+    safe_id = "".join(ch for ch in prediction_id if ch.isalnum() or ch in "-_")
+    return os.path.join(COMPLETION_DIR, f"{safe_id}.json")
+
+
+def verify_webhook_signature(headers: Mapping[str, str], body: bytes) -> bool:
+    """
+    Verify a Replicate webhook signature.
+
+    Replicate signs "{webhook-id}.{webhook-timestamp}.{body}" with HMAC-SHA256
+    using the base64 key after the "whsec_" prefix of the signing secret.
+    The webhook-signature header holds one or more "v1,<base64 signature>".
+
+    Args:
+        headers: Request headers
+        body: Raw request body
+
+    Returns:
+        True if the signature matches and the timestamp is fresh
+    """
+    secret = os.getenv("REPLICATE_WEBHOOK_SECRET", "").strip()
+    if not secret:
+        logger.error("[Replicate Webhook] REPLICATE_WEBHOOK_SECRET not configured")
+        return False
+
+    webhook_id = headers.get("webhook-id")
+    timestamp = headers.get("webhook-timestamp")
+    signatures = headers.get("webhook-signature")
+    if not webhook_id or not timestamp or not signatures:
+        logger.warning("[Replicate Webhook] Missing signature headers")
+        return False
+
+    try:
+        if abs(time.time() - int(timestamp)) > WEBHOOK_TOLERANCE_SECONDS:
+            logger.warning(f"[Replicate Webhook] Stale timestamp: {timestamp}")
+            return False
+
+        key = base64.b64decode(secret.split("_", 1)[1] if secret.startswith("whsec_") else secret)
+    except (ValueError, TypeError) as e:
+        logger.error(f"[Replicate Webhook] Invalid timestamp or secret: {e}")
+        return False
+
+    signed_content = f"{webhook_id}.{timestamp}.".encode("utf-8") + body
+    expected = base64.b64encode(hmac.new(key, signed_content, hashlib.sha256).digest()).decode("utf-8")
+
+    for entry in signatures.split():
+        _, _, signature = entry.partition(",")
+        if hmac.compare_digest(signature, expected):
+            return True
+
+    logger.warning(f"[Replicate Webhook] Signature mismatch for webhook {webhook_id}")
+    return False
+
+
+def record_completion(payload: Dict[str, Any]) -> bool:
+    """
+    Record a completed prediction payload from a webhook.
+
+    Non-terminal statuses are ignored (we subscribe to "completed" events only,
+    but be defensive about filters changing).
+
+    Returns:
+        True if the completion was recorded
+    """
+    prediction_id = payload.get("id")
+    status = payload.get("status")
+    if not prediction_id or status not in ("succeeded", "failed", "canceled"):
+        logger.debug(f"[Replicate Webhook] Ignoring non-terminal event: {prediction_id} {status}")
+        return False
+
+    completion = {
+        "id": prediction_id,
+        "status": status,
+        "output": payload.get("output"),
+        "error": payload.get("error"),
+        "metrics": payload.get("metrics"),
+        "received_at": time.time()
+    }
+
+    try:
+        os.makedirs(COMPLETION_DIR, exist_ok=True)
+        path = _completion_path(prediction_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(completion, f)
+        os.replace(tmp_path, path)  # Atomic - readers never see a partial file
+    except OSError as e:
+        logger.error(f"[Replicate Webhook] Failed to write completion for {prediction_id}: {e}")
+
+    with _condition:
+        # Web workers receive every webhook - keep a copy only for local waiters
+        if prediction_id in _local_waiters:
+            _local_completions[prediction_id] = completion
+            _condition.notify_all()
+
+    logger.info(f"[Replicate Webhook] Prediction {prediction_id} {status}")
+    return True
+
+
+def get_completion(prediction_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the recorded completion for a prediction, if the webhook has arrived.
+
+    Returns:
+        Completion dict with id/status/output/error, or None if not completed yet
+    """
+    with _condition:
+        completion = _local_completions.get(prediction_id)
+    if completion:
+        return completion
+
+    try:
+        with open(_completion_path(prediction_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"[Replicate Webhook] Unreadable completion for {prediction_id}: {e}")
+        return None
+
+
+def wait_for_any(prediction_ids: Iterable[str], timeout: float) -> None:
+    """
+    Block until any of the predictions has a recorded completion, or timeout.
+
+    Same-process webhooks wake the waiter immediately; webhooks received by
+    another worker are picked up from disk within FILE_CHECK_INTERVAL.
+    """
+    ids = list(prediction_ids)
+    deadline = time.monotonic() + max(timeout, 0)
+
+    with _condition:
+        for pid in ids:
+            _local_waiters[pid] = _local_waiters.get(pid, 0) + 1
+    try:
+        while True:
+            if any(get_completion(pid) for pid in ids):
+                return
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            with _condition:
+                if any(pid in _local_completions for pid in ids):
+                    return
+                _condition.wait(min(remaining, FILE_CHECK_INTERVAL))
+    finally:
+        with _condition:
+            for pid in ids:
+                if _local_waiters[pid] > 1:
+                    _local_waiters[pid] -= 1
+                else:
+                    del _local_waiters[pid]
+
+
+def discard_completion(prediction_id: str) -> None:
+    """Forget a completion once its result has been consumed."""
+    with _condition:
+        _local_completions.pop(prediction_id, None)
+    try:
+        os.remove(_completion_path(prediction_id))
+    except OSError:
+        pass
+
+
+def cleanup_completions(max_age_seconds: int = COMPLETION_MAX_AGE_SECONDS) -> int:
+    """
+    Delete completion files nobody consumed (e.g. pipeline crashed mid-wait).
+
+    Returns:
+        Number of files removed
+    """
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    try:
+        for name in os.listdir(COMPLETION_DIR):
+            path = os.path.join(COMPLETION_DIR, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    except FileNotFoundError:
+        return 0
+
+    with _condition:
+        expired = [pid for pid, c in _local_completions.items() if c.get("received_at", 0) < cutoff]
+        for pid in expired:
+            del _local_completions[pid]
+
+    if removed:
+        logger.info(f"[Replicate Webhook] Cleaned up {removed} stale completion files")
+    return removed
@@ -0,0 +1,228 @@
+"""
+research_cache.py - Shared Cache of Perplexity Research
+
+Many users in the same vertical (e.g. auto dealers) rotate through the
+same topics on the same day, and a job retried after a downstream failure
+asks Perplexity the same question again. Research is stored in the
+research_cache table under a hash of the normalized (query, writing style,
+recency window, model), so every web worker, generation worker and the
+scheduler share it.
+
+Entries expire after RESEARCH_CACHE_TTL seconds. Beyond
+RESEARCH_CACHE_MAX_ENTRIES the least recently used entries are evicted.
+Users who always want fresh research set User.fresh_research: their jobs
+skip the lookup, and the fresh result replaces the shared entry.
+
+Every function must be called inside an application context. Failures
+are logged, not raised - the caller falls back to calling Perplexity.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+RESEARCH_CACHE_TTL = int(os.getenv('RESEARCH_CACHE_TTL', '43200'))  # 0 disables the cache
+RESEARCH_CACHE_MAX_ENTRIES = int(os.getenv('RESEARCH_CACHE_MAX_ENTRIES', '2000'))
+
+# Process-local counters; the per-entry hit_count column is shared by all processes
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "stored": 0, "evicted": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def normalize_research_text(text: Optional[str]) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation ("EV Sales?" == "ev  sales")."""
+    return " ".join((text or "").lower().split()).rstrip(".?!")
+
+
+def research_cache_key(query: str, writing_style: Optional[str], recency: str, model: str) -> str:
+    """
+    Cache key of one research request.
+
+    Returns:
+        SHA-256 hex digest of the normalized request
+    """
+    parts = [normalize_research_text(query), normalize_research_text(writing_style), recency, model]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def user_wants_fresh_research(user_id: int) -> bool:
+    """Whether the user opted out of shared research (User.fresh_research)."""
+    from app_v3 import User
+
+    try:
+        user = User.query.get(user_id)  # type: ignore[attr-defined]
+        return bool(user and user.fresh_research)
+    except Exception as e:
+        logger.warning(f"[Research Cache] Could not read preference of user {user_id}: {e}")
+        return False
+
+
+def get_cached_research(key: str, bypass: bool = False) -> Optional[str]:
+    """
+    Look up research by cache key, counting a hit or miss.
+
+    Args:
+        key: research_cache_key() of the request
+        bypass: Skip the lookup (user opted out) - counted separately from misses
+
+    Returns:
+        Cached research text, or None if missing, expired, bypassed or the cache is disabled
+    """
+    if RESEARCH_CACHE_TTL <= 0:
+        return None
+    if bypass:
+        _count("bypassed")
+        return None
+
+    from app_v3 import db, ResearchCache
+
+    try:
+        now = datetime.utcnow()
+        row = ResearchCache.query.filter(  # type: ignore[attr-defined]
+            ResearchCache.cache_key == key, ResearchCache.expires_at > now
+        ).first()
+        if not row:
+            _count("misses")
+            return None
+
+        # Atomic increment - concurrent workers may hit the same entry
+        ResearchCache.query.filter_by(id=row.id).update(  # type: ignore[attr-defined]
+            {"hit_count": ResearchCache.hit_count + 1, "last_used_at": now}, synchronize_session=False
+        )
+        db.session.commit()
+        _count("hits")
+        return row.content
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Research Cache] Lookup failed: {e}")
+        _count("misses")
+        return None
+
+
+def store_research(key: str, query: str, writing_style: Optional[str], recency: str, content: str) -> bool:
+    """
+    Insert or replace research under a cache key, then enforce the size bound.
+
+    Returns:
+        True if the entry was written
+    """
+    if RESEARCH_CACHE_TTL <= 0:
+        return False
+
+    from app_v3 import db, ResearchCache
+
+    now = datetime.utcnow()
+    values = {
+        "query_text": query,
+        "writing_style": writing_style,
+        "recency": recency,
+        "content": content,
+        "created_at": now,
+        "last_used_at": now,
+        "expires_at": now + timedelta(seconds=RESEARCH_CACHE_TTL),
+    }
+    try:
+        updated = ResearchCache.query.filter_by(cache_key=key).update(  # type: ignore[attr-defined]
+            values, synchronize_session=False
+        )
+        if not updated:
+            db.session.add(ResearchCache(cache_key=key, **values))
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same research first - keep the newer text
+        db.session.rollback()
+        try:
+            ResearchCache.query.filter_by(cache_key=key).update(  # type: ignore[attr-defined]
+                values, synchronize_session=False
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"[Research Cache] Failed to store research: {e}")
+            return False
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Research Cache] Failed to store research: {e}")
+        return False
+
+    _count("stored")
+    evict_research()
+    return True
+
+
+def evict_research(max_entries: Optional[int] = None) -> int:
+    """
+    Delete expired entries, then the least recently used beyond max_entries.
+
+    Returns:
+        Number of entries deleted
+    """
+    from app_v3 import db, ResearchCache
+
+    max_entries = RESEARCH_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    try:
+        deleted = ResearchCache.query.filter(  # type: ignore[attr-defined]
+            ResearchCache.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+
+        excess = ResearchCache.query.count() - max_entries  # type: ignore[attr-defined]
+        if excess > 0:
+            oldest = [
+                row.id for row in ResearchCache.query.with_entities(ResearchCache.id)  # type: ignore[attr-defined]
+                .order_by(ResearchCache.last_used_at.asc()).limit(excess)
+            ]
+            deleted += ResearchCache.query.filter(ResearchCache.id.in_(oldest)).delete(  # type: ignore[attr-defined]
+                synchronize_session=False
+            )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Research Cache] Eviction failed: {e}")
+        return 0
+
+    if deleted:
+        _count("evicted", deleted)
+        logger.info(f"[Research Cache] Evicted {deleted} entries")
+    return deleted
+
+
+def research_cache_stats() -> Dict[str, Any]:
+    """
+    Hit/miss counters of this process plus the shared table's size and hits.
+
+    Returns:
+        {"hits", "misses", "bypassed", "stored", "evicted", "hit_ratio",
+         "entries", "shared_hits", "ttl_seconds", "max_entries"}
+    """
+    from app_v3 import db, ResearchCache
+
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+
+    try:
+        entries, shared_hits = db.session.query(  # type: ignore[attr-defined]
+            db.func.count(ResearchCache.id), db.func.coalesce(db.func.sum(ResearchCache.hit_count), 0)
+        ).one()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Research Cache] Failed to read stats: {e}")
+        entries, shared_hits = None, None
+
+    stats.update(entries=entries, shared_hits=int(shared_hits) if shared_hits is not None else None,
+                 ttl_seconds=RESEARCH_CACHE_TTL, max_entries=RESEARCH_CACHE_MAX_ENTRIES)
+    return stats
@@ -1,6 +1,8 @@
 #!/bin/bash
 # EZWAI SMM V3.0 - Scheduler Runner
 # Designed to be run by cron every 5 minutes
+# Prefer the long-running daemon (python scheduler_v3.py --daemon, started by
+# start_v3_production.sh) - do not run both
 
 # Log file
 LOG_FILE="/var/log/ezwai_scheduler_v3.log"
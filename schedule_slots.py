@@ -0,0 +1,262 @@
+"""
+schedule_slots.py - Precomputed Next-Run Times of User Schedules
+
+A user's schedule is a 7-entry list (Monday first) of
+{"enabled", "time1", "time2"} in US/Eastern wall-clock time. Scanning
+every user's JSON schedule on each scheduler tick does not scale, so each
+enabled time slot is stored as a ScheduleSlot row with its next run time
+in UTC. The next_run_at column is indexed: finding due slots is a single
+range query.
+
+Slots are rebuilt whenever a schedule is saved (sync_schedule_slots) and
+advanced to their next weekly occurrence when claimed (claim_slot). The
+claim is a conditional UPDATE, so two scheduler instances never run the
+same slot.
+
+A slot is claimed generation_lead_seconds() before its run time - long
+enough, judging by recently recorded pipeline durations, for the article
+to be ready when the slot arrives.
+
+Every function must be called inside an application context.
+"""
+
+import os
+import re
+import json
+import logging
+from datetime import datetime, timedelta, time as dt_time
+from typing import Any, List, Optional, Tuple
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_TIMEZONE = pytz.timezone(os.getenv('SCHEDULE_TIMEZONE', 'US/Eastern'))
+SCHEDULE_SLOT_NAMES = ('time1', 'time2')
+# Slots missed by more than this (scheduler down) are skipped, not run late
+SCHEDULER_MISFIRE_GRACE = int(os.getenv('SCHEDULER_MISFIRE_GRACE', '600'))
+
+# Generation starts this long before a slot; unset = learned from recorded run durations
+SCHEDULER_LEAD_TIME = os.getenv('SCHEDULER_LEAD_TIME')
+SCHEDULER_LEAD_PERCENTILE = float(os.getenv('SCHEDULER_LEAD_PERCENTILE', '0.95'))
+SCHEDULER_LEAD_MARGIN = int(os.getenv('SCHEDULER_LEAD_MARGIN', '120'))
+SCHEDULER_LEAD_DEFAULT = int(os.getenv('SCHEDULER_LEAD_DEFAULT', '900'))  # Until enough runs are recorded
+SCHEDULER_LEAD_MAX = int(os.getenv('SCHEDULER_LEAD_MAX', '2700'))
+SCHEDULER_LEAD_MIN_RUNS = 5
+SCHEDULER_LEAD_SAMPLE = 200  # Most recent successful runs considered
+
+_TIME_PATTERN = re.compile(r'^([01]?\d|2[0-3]):([0-5]\d)$')
+
+
+def parse_schedule(schedule: Any) -> List[Tuple[int, str, str]]:
+    """
+    Enabled time slots of a schedule.
+
+    Args:
+        schedule: User.schedule - a 7-entry list (or its JSON string)
+
+    Returns:
+        [(weekday, slot_name, "HH:MM")] - empty if the schedule is malformed
+    """
+    if isinstance(schedule, str):
+        try:
+            schedule = json.loads(schedule)
+        except ValueError:
+            return []
+    if not isinstance(schedule, list) or len(schedule) != 7:
+        return []
+
+    slots = []
+    for weekday, day in enumerate(schedule):
+        if not isinstance(day, dict) or not day.get('enabled'):
+            continue
+        for name in SCHEDULE_SLOT_NAMES:
+            value = day.get(name)
+            if value and _TIME_PATTERN.match(value):
+                hour, minute = value.split(':')
+                slots.append((weekday, name, f"{int(hour):02d}:{minute}"))
+    return slots
+
+
+def is_valid_schedule(schedule: Any) -> bool:
+    """True for a 7-entry list of day dicts whose non-empty times are HH:MM."""
+    if not isinstance(schedule, list) or len(schedule) != 7:
+        return False
+    for day in schedule:
+        if not isinstance(day, dict):
+            return False
+        for name in SCHEDULE_SLOT_NAMES:
+            value = day.get(name)
+            if value and not _TIME_PATTERN.match(str(value)):
+                return False
+    return True
+
+
+def next_occurrence(weekday: int, local_time: str, after: datetime) -> datetime:
+    """
+    Next time the slot falls strictly after `after`.
+
+    Args:
+        weekday: 0 = Monday
+        local_time: "HH:MM" in SCHEDULE_TIMEZONE
+        after: Naive UTC datetime
+
+    Returns:
+        Naive UTC datetime (DST transitions are resolved per date)
+    """
+    hour, minute = (int(part) for part in local_time.split(':'))
+    after_local = pytz.utc.localize(after).astimezone(SCHEDULE_TIMEZONE)
+    day = after_local.date() + timedelta(days=(weekday - after_local.weekday()) % 7)
+    while True:
+        candidate = SCHEDULE_TIMEZONE.localize(datetime.combine(day, dt_time(hour, minute)))
+        candidate_utc = candidate.astimezone(pytz.utc).replace(tzinfo=None)
+        if candidate_utc > after:
+            return candidate_utc
+        day += timedelta(days=7)
+
+
+def sync_schedule_slots(user_id: int, schedule: Any, now: Optional[datetime] = None) -> int:
+    """
+    Replace a user's slots with those of `schedule` (call after saving it).
+
+    Unchanged slots keep their next_run_at, so re-saving a schedule never
+    re-runs or skips a slot. The caller commits.
+
+    Returns:
+        Number of enabled slots
+    """
+    from app_v3 import db, ScheduleSlot
+
+    now = now or datetime.utcnow()
+    wanted = {(weekday, name): local_time for weekday, name, local_time in parse_schedule(schedule)}
+    existing = {(row.weekday, row.slot): row for row in ScheduleSlot.query.filter_by(user_id=user_id)}  # type: ignore[attr-defined]
+
+    for key, row in existing.items():
+        if key not in wanted:
+            db.session.delete(row)
+        elif row.local_time != wanted[key]:
+            row.local_time = wanted[key]
+            row.next_run_at = next_occurrence(row.weekday, row.local_time, now)
+
+    for (weekday, name), local_time in wanted.items():
+        if (weekday, name) not in existing:
+            db.session.add(ScheduleSlot(
+                user_id=user_id, weekday=weekday, slot=name, local_time=local_time,
+                next_run_at=next_occurrence(weekday, local_time, now)
+            ))
+
+    logger.debug(f"[Schedule] User {user_id}: {len(wanted)} slot(s) scheduled")
+    return len(wanted)
+
+
+def rebuild_all_schedule_slots(now: Optional[datetime] = None) -> int:
+    """
+    Sync every user's slots from User.schedule (migration and daemon startup).
+
+    Returns:
+        Total number of enabled slots
+    """
+    from app_v3 import db, User
+
+    total = 0
+    for user in User.query.all():  # type: ignore[attr-defined]
+        total += sync_schedule_slots(user.id, user.schedule, now=now)  # Empty schedules drop their slots
+    db.session.commit()
+    logger.info(f"[Schedule] Rebuilt {total} slot(s) from saved schedules")
+    return total
+
+
+def generation_lead_seconds() -> int:
+    """
+    How long before its slot a scheduled article starts generating.
+
+    SCHEDULER_LEAD_PERCENTILE of the durations of recent successful runs
+    (ArticleMetrics.total_seconds) plus SCHEDULER_LEAD_MARGIN, capped at
+    SCHEDULER_LEAD_MAX. Until SCHEDULER_LEAD_MIN_RUNS runs are recorded,
+    SCHEDULER_LEAD_DEFAULT. A fixed SCHEDULER_LEAD_TIME overrides the
+    estimate (0 = start at the slot time).
+
+    Returns:
+        Lead time in seconds
+    """
+    if SCHEDULER_LEAD_TIME not in (None, ''):
+        return max(int(SCHEDULER_LEAD_TIME), 0)
+
+    from app_v3 import db, ArticleMetrics
+    from pipeline_metrics import percentile, METRICS_WINDOW_DAYS
+
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=METRICS_WINDOW_DAYS)
+        durations = [
+            row.total_seconds for row in ArticleMetrics.query  # type: ignore[attr-defined]
+            .with_entities(ArticleMetrics.total_seconds)
+            .filter(ArticleMetrics.status == 'succeeded', ArticleMetrics.created_at >= cutoff,
+                    ArticleMetrics.total_seconds.isnot(None))
+            .order_by(ArticleMetrics.created_at.desc())
+            .limit(SCHEDULER_LEAD_SAMPLE)
+        ]
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Schedule] Could not read run durations: {e}")
+        return SCHEDULER_LEAD_DEFAULT
+
+    if len(durations) < SCHEDULER_LEAD_MIN_RUNS:
+        return SCHEDULER_LEAD_DEFAULT
+    return int(min(percentile(durations, SCHEDULER_LEAD_PERCENTILE) + SCHEDULER_LEAD_MARGIN, SCHEDULER_LEAD_MAX))
+
+
+def due_slots(now: Optional[datetime] = None, lead_seconds: int = 0) -> List[Any]:
+    """
+    Slots whose next run time is at most lead_seconds away - one range query on the index.
+
+    The rows are detached from the session: claiming one commits, and a
+    refreshed row would show the next_run_at another scheduler instance
+    already advanced it to - claim_slot() must compare against the run
+    time this tick saw.
+
+    Returns:
+        ScheduleSlot rows ordered by next_run_at
+    """
+    from app_v3 import db, ScheduleSlot
+
+    now = now or datetime.utcnow()
+    slots = (
+        ScheduleSlot.query  # type: ignore[attr-defined]
+        .filter(ScheduleSlot.next_run_at <= now + timedelta(seconds=lead_seconds))
+        .order_by(ScheduleSlot.next_run_at)
+        .all()
+    )
+    for slot in slots:
+        db.session.expunge(slot)
+    return slots
+
+
+def claim_slot(slot: Any, now: Optional[datetime] = None, commit: bool = True) -> bool:
+    """
+    Advance a due slot to its next occurrence, unless someone else already did.
+
+    Args:
+        slot: ScheduleSlot row from due_slots()
+        now: Naive UTC time of the tick
+        commit: False to leave the claim in the caller's transaction
+            (scheduled_jobs.lease_slot records the run alongside it)
+
+    Returns:
+        True if this caller claimed the run
+    """
+    from app_v3 import db, ScheduleSlot
+
+    now = now or datetime.utcnow()
+    due_at = slot.next_run_at
+    claimed = ScheduleSlot.query.filter_by(id=slot.id, next_run_at=due_at).update(  # type: ignore[attr-defined]
+        {"next_run_at": next_occurrence(slot.weekday, slot.local_time, max(now, due_at)), "last_run_at": due_at},
+        synchronize_session=False
+    )
+    if commit:
+        db.session.commit()
+    return claimed == 1
+
+
+def slot_local_datetime(utc_naive: datetime) -> datetime:
+    """A naive UTC run time as an aware SCHEDULE_TIMEZONE datetime (CompletedJob.scheduled_time)."""
+    return pytz.utc.localize(utc_naive).astimezone(SCHEDULE_TIMEZONE)
@@ -0,0 +1,307 @@
+"""
+scheduled_jobs.py - Leased Runs of Schedule Slots
+
+Several scheduler instances (on one or more nodes) may share the database.
+Claiming a slot (schedule_slots.claim_slot) and recording its run as a
+CompletedJob row happen in one transaction. The row carries a lease: the
+owner (host:pid:nonce of the claiming scheduler), a heartbeat and a lease
+expiry. Once the owner starts generating, it renews the lease every
+SCHEDULER_HEARTBEAT_SECONDS. If the owner dies, its lease runs out and the
+next tick of any instance takes the run over. Runs still waiting in a busy
+owner's queue are not renewed either, so instances with idle workers take
+them over - that spreads a burst of slots across every node.
+
+Job lifecycle:
+    running -> held <-> publishing -> completed
+            -> failed               -> failed
+
+A publish error returns the run to 'held' for the next tick to retry.
+
+Every transition is a conditional UPDATE (compare-and-set) on the current
+status, and transitions out of 'running' also require the caller to still
+own the lease. A scheduler that lost its lease - e.g. it stalled while
+another instance took over - finds out when it tries to hold its article
+and discards it, so each slot is published exactly once.
+
+Publishing is bounded by SCHEDULER_PUBLISH_TIMEOUT_SECONDS as well: a
+scheduler that died mid-publish leaves the run 'publishing' with an
+expired lease, and the next tick of any instance returns it to 'held'.
+The held article stays checkpointed until its run completes.
+
+Every function must be called inside an application context.
+"""
+
+import os
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from generation_jobs import default_worker_id
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', '120'))
+SCHEDULER_HEARTBEAT_SECONDS = int(os.getenv('SCHEDULER_HEARTBEAT_SECONDS', '30'))
+SCHEDULER_MAX_ATTEMPTS = int(os.getenv('SCHEDULER_MAX_ATTEMPTS', '3'))  # Runs started per slot, takeovers included
+SCHEDULER_PUBLISH_TIMEOUT_SECONDS = int(os.getenv('SCHEDULER_PUBLISH_TIMEOUT_SECONDS', '600'))
+TAKEOVER_BATCH_SIZE = 20
+
+RUN_RUNNING = 'running'
+RUN_HELD = 'held'
+RUN_PUBLISHING = 'publishing'
+RUN_COMPLETED = 'completed'
+RUN_FAILED = 'failed'
+
+_owner_id: Optional[str] = None
+
+
+def scheduler_owner_id() -> str:
+    """
+    Lease owner identity of this process (host:pid:nonce).
+
+    The nonce keeps a restarted scheduler that reuses a PID from renewing
+    the leases of its dead predecessor.
+    """
+    global _owner_id
+    if _owner_id is None:
+        _owner_id = f"{default_worker_id()}:{uuid.uuid4().hex[:8]}"
+    return _owner_id
+
+
+def lease_slot(slot: Any, owner: str, now: Optional[datetime] = None) -> Optional[int]:
+    """
+    Claim a due slot and record its leased run in one transaction.
+
+    Args:
+        slot: ScheduleSlot row from due_slots()
+        owner: scheduler_owner_id() of the caller
+        now: Naive UTC time of the tick
+
+    Returns:
+        CompletedJob ID, or None if another instance claimed the slot first
+    """
+    from app_v3 import db, CompletedJob
+    from schedule_slots import claim_slot, slot_local_datetime
+
+    due_at, user_id = slot.next_run_at, slot.user_id
+    if not claim_slot(slot, now, commit=False):
+        db.session.rollback()
+        return None
+
+    job = CompletedJob(
+        user_id=user_id,
+        scheduled_time=slot_local_datetime(due_at),
+        due_at=due_at,
+        completed_time=None,
+        post_title="",
+        status=RUN_RUNNING,
+        owner=owner,
+        heartbeat_at=None,  # Set by start_run()
+        lease_expires_at=datetime.utcnow() + timedelta(seconds=SCHEDULER_LEASE_SECONDS),
+        attempts=0
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A run of this slot is already recorded (e.g. by a leftover cron scheduler) - just advance the slot
+        db.session.rollback()
+        claim_slot(slot, now)
+        logger.info(f"[Jobs] Run of user {user_id} slot {due_at} already recorded - skipped")
+        return None
+    return job.id
+
+
+def start_run(job_id: int, owner: str, now: Optional[datetime] = None) -> bool:
+    """
+    Mark a leased run started (counted as an attempt) if owner still holds it.
+
+    Returns:
+        False if another instance took the run over while it was queued here
+    """
+    from app_v3 import db, CompletedJob
+
+    now = now or datetime.utcnow()
+    started = CompletedJob.query.filter_by(id=job_id, owner=owner, status=RUN_RUNNING).update(  # type: ignore[attr-defined]
+        {"heartbeat_at": now, "lease_expires_at": now + timedelta(seconds=SCHEDULER_LEASE_SECONDS),
+         "attempts": CompletedJob.attempts + 1},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return started == 1
+
+
+def renew_leases(owner: str, now: Optional[datetime] = None) -> int:
+    """
+    Heartbeat: extend the lease of every run owner has started, in one UPDATE.
+
+    Runs still queued are not renewed - once their lease runs out, an
+    instance with idle workers may take them over.
+
+    Returns:
+        Number of leases renewed
+    """
+    from app_v3 import db, CompletedJob
+
+    now = now or datetime.utcnow()
+    renewed = CompletedJob.query.filter(  # type: ignore[attr-defined]
+        CompletedJob.owner == owner, CompletedJob.status == RUN_RUNNING, CompletedJob.heartbeat_at.isnot(None)
+    ).update(
+        {"heartbeat_at": now, "lease_expires_at": now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return renewed
+
+
+def take_over_expired_runs(owner: str, limit: int = TAKEOVER_BATCH_SIZE,
+                           now: Optional[datetime] = None) -> List[Tuple[int, int, datetime]]:
+    """
+    Take over runs whose lease expired: the owner died, or left them queued too long.
+
+    Runs that already used SCHEDULER_MAX_ATTEMPTS starts are failed
+    instead. The caller's own runs are left alone - they are still queued
+    in its pool.
+
+    Args:
+        owner: scheduler_owner_id() of the caller
+        limit: Most runs to take (the caller's idle workers)
+        now: Naive UTC time (defaults to now)
+
+    Returns:
+        [(job_id, user_id, due_at)] of the runs this caller now owns
+    """
+    from app_v3 import db, CompletedJob
+
+    if limit <= 0:
+        return []
+    now = now or datetime.utcnow()
+    expired = (
+        CompletedJob.query  # type: ignore[attr-defined]
+        .with_entities(CompletedJob.id, CompletedJob.user_id, CompletedJob.due_at,
+                       CompletedJob.owner, CompletedJob.attempts)
+        .filter(CompletedJob.status == RUN_RUNNING, CompletedJob.lease_expires_at < now,
+                CompletedJob.owner != owner)
+        .order_by(CompletedJob.due_at)
+        .limit(min(limit, TAKEOVER_BATCH_SIZE))
+        .all()
+    )
+
+    taken = []
+    for job_id, user_id, due_at, previous_owner, attempts in expired:
+        # Compare-and-set on the lease we saw: only one instance wins each expired run
+        unchanged = CompletedJob.query.filter(  # type: ignore[attr-defined]
+            CompletedJob.id == job_id, CompletedJob.status == RUN_RUNNING,
+            CompletedJob.owner == previous_owner, CompletedJob.lease_expires_at < now
+        )
+        if attempts >= SCHEDULER_MAX_ATTEMPTS:
+            if unchanged.update({"status": RUN_FAILED, "lease_expires_at": None}, synchronize_session=False):
+                logger.warning(f"[Jobs] Run {job_id} of user {user_id} abandoned by {previous_owner} "
+                               f"after {attempts} attempt(s) - marked failed")
+            db.session.commit()
+            continue
+
+        updated = unchanged.update({
+            "owner": owner,
+            "heartbeat_at": None,  # Queued here; start_run() counts the attempt
+            "lease_expires_at": now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)
+        }, synchronize_session=False)
+        db.session.commit()
+        if updated == 1:
+            logger.warning(f"[Jobs] Took over run {job_id} of user {user_id} from {previous_owner} "
+                           f"(lease expired after {attempts} attempt(s))")
+            taken.append((job_id, user_id, due_at))
+    return taken
+
+
+def _transition(job_id: int, from_status: str, to_status: str, owner: Optional[str] = None, **fields: Any) -> bool:
+    """
+    Move a run between states only if it is still in from_status (and owned by owner, if given).
+
+    Returns:
+        True if this caller performed the transition
+    """
+    from app_v3 import db, CompletedJob
+
+    match = {"id": job_id, "status": from_status}
+    if owner is not None:
+        match["owner"] = owner
+    updated = CompletedJob.query.filter_by(**match).update(  # type: ignore[attr-defined]
+        dict(status=to_status, **fields), synchronize_session=False
+    )
+    db.session.commit()
+    return updated == 1
+
+
+def hold_run(job_id: int, owner: str) -> bool:
+    """Fence: mark a generated run held, unless owner lost its lease meanwhile."""
+    return _transition(job_id, RUN_RUNNING, RUN_HELD, owner=owner, lease_expires_at=None)
+
+
+def fail_run(job_id: int, owner: Optional[str] = None, from_status: str = RUN_RUNNING) -> bool:
+    """Mark a run failed (a running one only by its lease owner)."""
+    return _transition(job_id, from_status, RUN_FAILED, owner=owner, lease_expires_at=None)
+
+
+def start_publishing(job_id: int) -> bool:
+    """Claim a held run for publishing - its timer and catch-up ticks race for it."""
+    return _transition(job_id, RUN_HELD, RUN_PUBLISHING,
+                       lease_expires_at=datetime.utcnow() + timedelta(seconds=SCHEDULER_PUBLISH_TIMEOUT_SECONDS))
+
+
+def release_publishing(job_id: int) -> bool:
+    """Return a run whose publish failed to held, so a later tick retries it."""
+    return _transition(job_id, RUN_PUBLISHING, RUN_HELD, lease_expires_at=None)
+
+
+def release_expired_publishing(now: Optional[datetime] = None) -> int:
+    """
+    Return runs stuck publishing (their publisher died) to held.
+
+    Returns:
+        Number of runs released
+    """
+    from app_v3 import db, CompletedJob
+
+    now = now or datetime.utcnow()
+    released = CompletedJob.query.filter(  # type: ignore[attr-defined]
+        CompletedJob.status == RUN_PUBLISHING, CompletedJob.lease_expires_at < now
+    ).update({"status": RUN_HELD, "lease_expires_at": None}, synchronize_session=False)
+    db.session.commit()
+    if released:
+        logger.warning(f"[Jobs] Released {released} run(s) whose publisher stopped responding")
+    return released
+
+
+def complete_run(job_id: int, post_title: str) -> bool:
+    """Mark a published run completed."""
+    from schedule_slots import SCHEDULE_TIMEZONE
+
+    return _transition(job_id, RUN_PUBLISHING, RUN_COMPLETED, lease_expires_at=None,
+                       completed_time=datetime.now(SCHEDULE_TIMEZONE), post_title=post_title[:255])
+
+
+def due_held_runs(now: Optional[datetime] = None) -> List[int]:
+    """IDs of held runs whose slot has arrived."""
+    from app_v3 import CompletedJob
+
+    now = now or datetime.utcnow()
+    return [
+        job_id for (job_id,) in CompletedJob.query  # type: ignore[attr-defined]
+        .with_entities(CompletedJob.id)
+        .filter(CompletedJob.status == RUN_HELD, CompletedJob.due_at <= now)
+        .order_by(CompletedJob.due_at)
+    ]
+
+
+def _reset_owner_after_fork() -> None:
+    """A forked scheduler is a different lease owner."""
+    global _owner_id
+    _owner_id = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_owner_after_fork)
@@ -1,9 +1,16 @@
 """
 EZWAI SMM V3.0 Scheduler
 Updated to use V4 modular integrations with GPT-5-mini + SeeDream-4
+
+Run with: python scheduler_v3.py --daemon   (long-running, ticks every SCHEDULER_TICK_SECONDS)
+      or: python scheduler_v3.py            (single tick, for cron)
 """
 import os
-import json
+import signal
+import hashlib
+import argparse
+import threading
+from concurrent.futures import wait as wait_for_futures
 from datetime import datetime, timedelta
 import pytz
 import logging
@@ -12,8 +19,21 @@ from sqlalchemy.exc import SQLAlchemyError
 from app_v3 import app, db, User, CompletedJob  # V3 imports
 from perplexity_ai_integration import query_management, generate_blog_post_ideas
 from openai_integration_v4 import create_blog_post_with_images_v4  # V4 modular refactor (feature parity with V3)
-from wordpress_integration import create_wordpress_post
+from wordpress_integration import create_wordpress_post, resolve_wordpress_site
+from job_settings import get_job_settings
 from email_notification import send_email_notification
+from pipeline_metrics import collect_run_metrics, track_stage
+from pipeline_checkpoints import CheckpointStore
+from deadline_executor import EarliestDeadlineExecutor
+from schedule_slots import (
+    due_slots, claim_slot, rebuild_all_schedule_slots, slot_local_datetime, generation_lead_seconds,
+    SCHEDULE_TIMEZONE, SCHEDULER_MISFIRE_GRACE
+)
+from scheduled_jobs import (
+    scheduler_owner_id, lease_slot, start_run, renew_leases, take_over_expired_runs, hold_run, fail_run,
+    start_publishing, release_publishing, release_expired_publishing, complete_run, due_held_runs,
+    RUN_PUBLISHING, RUN_FAILED, SCHEDULER_HEARTBEAT_SECONDS
+)
 
 # Load environment variables
 load_dotenv()
@@ -22,12 +42,34 @@ load_dotenv()
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def create_blog_post(user_id):
+SCHEDULER_TICK_SECONDS = int(os.getenv('SCHEDULER_TICK_SECONDS', '60'))
+# Articles generated at the same time; provider calls are further bounded by provider_limits
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '4'))
+
+HELD_ARTICLE_STAGE = "scheduled_article"  # Checkpoint stage of an article waiting for its slot
+POSTED_ARTICLE_STAGE = "wordpress_post"  # Checkpoint stage of its created draft - a retry never posts twice
+# Publishes of a held article (one per tick) before its run is failed
+SCHEDULER_PUBLISH_ATTEMPTS = int(os.getenv('SCHEDULER_PUBLISH_ATTEMPTS', '3'))
+
+_dispatch_pool = None
+_dispatch_pool_lock = threading.Lock()
+_heartbeat_stop = None  # Set to stop the lease heartbeat of the current pool
+_held_timers = {}  # CompletedJob ID -> Timer publishing the held article at its slot time
+_held_lock = threading.Lock()
+
+def generate_scheduled_article(user_id):
     """
-    V4 blog post creation for scheduled jobs
+    V4 article generation for scheduled jobs, without publishing
     Uses GPT-5-mini reasoning + SeeDream-4 2K images
+
+    Images are already uploaded to the WordPress media library; the post
+    itself is created by publish_scheduled_article() at the slot time.
+
+    Returns:
+        (article, error) - article is a JSON-serializable dict of
+        title, content, hero_image_url and hero_media_id
     """
-    with app.app_context():
+    with app.app_context(), collect_run_metrics(user_id) as metrics:
         try:
             user = User.query.get(user_id)
             if not user:
@@ -42,7 +84,8 @@ def create_blog_post(user_id):
             logger.info(f"[V3 Scheduler] Using query for user {user_id}: {query}")
             logger.info(f"[V3 Scheduler] Writing style: {writing_style or 'Default'}")
 
-            blog_post_ideas = generate_blog_post_ideas(query, user_id, writing_style)
+            settings = get_job_settings(user_id)  # Built once, passed to every stage
+            blog_post_ideas = generate_blog_post_ideas(query, user_id, writing_style, settings=settings)
             if not blog_post_ideas:
                 logger.error(f"No blog post ideas generated for user {user_id}")
                 return None, "No blog post ideas generated"
@@ -53,21 +96,62 @@ def create_blog_post(user_id):
             logger.info(f"[V3 Scheduler] Creating magazine-style blog post with GPT-5-mini reasoning...")
             logger.info(f"Research: {perplexity_research[:100]}...")
 
+            # Resolve WordPress credentials for the image uploads (the post is created at the slot time)
+            wordpress_site = resolve_wordpress_site(user_id)
+
             # Use V4 function with GPT-5-mini + SeeDream-4
             # V4 signature: (perplexity_research, user_id, user_system_prompt, writing_style)
             processed_post, error = create_blog_post_with_images_v4(
-                perplexity_research, user_id, system_prompt, writing_style
+                perplexity_research, user_id, system_prompt, writing_style,
+                wordpress_site=wordpress_site,
+                settings=settings
             )
             if error:
                 logger.error(f"Error in create_blog_post_with_images_v4 for user {user_id}: {error}")
                 return None, error
 
-            title = processed_post['title']
-            blog_post_content = processed_post['content']
-            image_url = processed_post['hero_image_url']
-
             logger.info(f"[V3 Scheduler] Article created. Images: {len([img for img in processed_post['all_images'] if img])}")
 
+            metrics.status = "succeeded"
+            return {
+                'title': processed_post['title'],
+                'content': processed_post['content'],
+                'hero_image_url': processed_post['hero_image_url'],
+                'hero_media_id': processed_post.get('hero_media_id')
+            }, None
+        except Exception as e:
+            logger.error(f"Unexpected error in generate_scheduled_article for user {user_id}: {str(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return None, str(e)
+
+def publish_scheduled_article(user_id, article, checkpoints=None, notify_failure=True):
+    """
+    Create the WordPress draft of a generated article and email the user.
+
+    Args:
+        user_id: Article owner
+        article: Dict returned by generate_scheduled_article()
+        checkpoints: CheckpointStore of the held article - the created post
+            is saved there before anything else can fail
+        notify_failure: Email the article to the user if WordPress fails
+            (False while the publish will be retried)
+
+    Returns:
+        (post, error)
+    """
+    with app.app_context():
+        try:
+            user = User.query.get(user_id)
+            if not user:
+                logger.error(f"User {user_id} not found")
+                return None, "User not found"
+
+            title = article['title']
+            blog_post_content = article['content']
+            image_url = article['hero_image_url']
+            wordpress_site = resolve_wordpress_site(user_id)
+
             # Scheduled posts ALWAYS use WordPress mode (never local mode)
             # Handle WordPress upload with failure protection
             wordpress_url = user.wordpress_rest_api_url.rstrip('/') if user.wordpress_rest_api_url else None
@@ -78,11 +162,20 @@ def create_blog_post(user_id):
                     wordpress_url = wordpress_url[:-len('/wp-json')]
 
             try:
-                post = create_wordpress_post(title, blog_post_content, user_id, image_url)
+                with track_stage("wordpress_post"):
+                    # The hero is already in the media library - feature it by ID
+                    post = create_wordpress_post(title, blog_post_content, user_id, image_url,
+                                                 site=wordpress_site,
+                                                 featured_media_id=article.get('hero_media_id'))
+
+                if post and checkpoints:
+                    checkpoints.save(POSTED_ARTICLE_STAGE, {'post': post})
 
                 if not post:
                     # WordPress upload failed - send failure email with article
                     logger.error(f"[Scheduler] WordPress post creation failed for user {user_id}")
+                    if not notify_failure:
+                        return None, "Failed to create WordPress post (scheduled) - will retry"
 
                     from email_notification import send_wordpress_failure_notification
                     error_details = {
@@ -113,6 +206,8 @@ def create_blog_post(user_id):
             except Exception as e:
                 # WordPress upload exception - send failure email
                 logger.error(f"[Scheduler] WordPress upload exception for user {user_id}: {str(e)}")
+                if not notify_failure:
+                    return None, f"WordPress upload failed (scheduled): {str(e)} - will retry"
 
                 from email_notification import send_wordpress_failure_notification
                 error_details = {
@@ -140,15 +235,16 @@ def create_blog_post(user_id):
 
             # Send email notification with HTML attachment
             from email_notification import send_article_notification_with_attachment
-            email_sent = send_article_notification_with_attachment(
-                title=post['title']['rendered'],
-                article_html=blog_post_content,  # Full HTML with styling
-                hero_image_url=image_url,
-                user_email=user.email,
-                mode="wordpress",
-                wordpress_url=wordpress_url,
-                post_id=post['id']
-            )
+            with track_stage("email"):
+                email_sent = send_article_notification_with_attachment(
+                    title=post['title']['rendered'],
+                    article_html=blog_post_content,  # Full HTML with styling
+                    hero_image_url=image_url,
+                    user_email=user.email,
+                    mode="wordpress",
+                    wordpress_url=wordpress_url,
+                    post_id=post['id']
+                )
 
             if not email_sent:
                 logger.warning(f"Failed to send email notification for user {user_id}")
@@ -158,99 +254,287 @@ def create_blog_post(user_id):
 
             return post, None
         except Exception as e:
-            logger.error(f"Unexpected error in create_blog_post for user {user_id}: {str(e)}")
+            logger.error(f"Unexpected error in publish_scheduled_article for user {user_id}: {str(e)}")
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
             return None, str(e)
 
-def check_and_trigger_jobs():
+def scheduled_run_id(job_id, owner):
     """
-    Check schedules and trigger blog post creation
-    Compatible with V3 article generation
+    Checkpoint run ID of a held article - per lease owner, so a scheduler
+    that lost the run never overwrites or clears the new owner's article.
     """
-    with app.app_context():
-        try:
-            eastern_tz = pytz.timezone('US/Eastern')
-            now = datetime.now(eastern_tz)
-            logger.info(f"[V3 Scheduler] Checking schedules at {now.strftime('%Y-%m-%d %H:%M:%S')} EST")
+    return f"slot-{job_id}-{hashlib.sha1(owner.encode()).hexdigest()[:12]}"
 
-            # Time window: 2 minutes before to 5 minutes after
-            start_time = now - timedelta(minutes=2)
-            end_time = now + timedelta(minutes=5)
+def publish_held_article(job_id):
+    """
+    Publish a held article - exactly once, as its timer and catch-up ticks
+    of every scheduler instance may race.
 
-            users = User.query.all()
-            for user in users:
-                if not user.schedule:
-                    continue
+    The article stays checkpointed until its run is completed. A failed
+    publish returns the run to held, so the next tick retries it - up to
+    SCHEDULER_PUBLISH_ATTEMPTS times, after which the article is emailed
+    to the user and the run fails.
 
-                schedule = json.loads(user.schedule) if isinstance(user.schedule, str) else user.schedule
-                if not isinstance(schedule, list) or len(schedule) != 7:
-                    logger.warning(f"Invalid schedule format for user {user.id}")
-                    continue
+    Returns:
+        True if this caller published it
+    """
+    if not start_publishing(job_id):
+        return False  # Already published by someone else
+
+    job = CompletedJob.query.get(job_id)
+    store = CheckpointStore(scheduled_run_id(job_id, job.owner))
+    held = store.get(HELD_ARTICLE_STAGE)
+    if not held:
+        logger.error(f"[V3 Scheduler] Held article of run {job_id} (user {job.user_id}) is missing")
+        fail_run(job_id, from_status=RUN_PUBLISHING)
+        return False
+
+    scheduled_datetime = slot_local_datetime(job.due_at)
+    posted = store.get(POSTED_ARTICLE_STAGE)
+    if posted:
+        # An earlier attempt created the draft but died before completing the run
+        logger.info(f"[V3 Scheduler] Run {job_id} already posted (ID: {posted['post'].get('id')}) - completing it")
+        post = posted['post']
+    else:
+        # Counted before publishing, so a publisher crashing every time cannot retry forever
+        attempt = held.get('publish_attempts', 0) + 1
+        last_attempt = attempt >= SCHEDULER_PUBLISH_ATTEMPTS
+        store.save(HELD_ARTICLE_STAGE, dict(held, publish_attempts=attempt))
+
+        post, error = publish_scheduled_article(job.user_id, held['article'], checkpoints=store,
+                                                notify_failure=last_attempt)
+        if error:
+            if last_attempt:
+                logger.error(f"Failed to publish V3 blog post for user {job.user_id} after {attempt} "
+                             f"attempt(s): {error}")
+                fail_run(job_id, from_status=RUN_PUBLISHING)
+            else:
+                logger.warning(f"[V3 Scheduler] Publishing run {job_id} (user {job.user_id}) failed "
+                               f"(attempt {attempt}/{SCHEDULER_PUBLISH_ATTEMPTS}) - retrying next tick: {error}")
+                release_publishing(job_id)
+            return False
+
+    if not complete_run(job_id, post['title']['rendered']):
+        logger.warning(f"[V3 Scheduler] Run {job_id} of user {job.user_id} is no longer publishing - "
+                       f"left for the scheduler that now holds it")
+        return False
+    store.clear()
+    late = (datetime.utcnow() - job.due_at).total_seconds()
+    logger.info(f"[V3 Scheduler] Completed job for user {job.user_id} scheduled at {scheduled_datetime} "
+                f"(published {late:.0f}s after the slot)")
+    return True
+
+def _publish_held_in_worker(job_id):
+    """Timer entry point - runs at the slot time in its own thread."""
+    try:
+        with app.app_context():
+            publish_held_article(job_id)
+    except Exception as e:
+        logger.error(f"[V3 Scheduler] Publishing held run {job_id} failed: {e}", exc_info=True)
+    finally:
+        # Registered until done, so shutdown_dispatch_pool() waits for this publish
+        with _held_lock:
+            _held_timers.pop(job_id, None)
+
+def _hold_until(job_id, due_at):
+    """Publish a held article when its slot arrives."""
+    delay = max((due_at - datetime.utcnow()).total_seconds(), 0.0)
+    timer = threading.Timer(delay, _publish_held_in_worker, args=(job_id,))
+    timer.daemon = True
+    with _held_lock:
+        _held_timers[job_id] = timer
+    timer.start()
+
+def publish_due_held_articles(now=None):
+    """
+    Publish held articles whose slot has passed but whose timer is gone.
 
-                current_day = now.weekday()
-                day_schedule = schedule[current_day]
+    Covers a restarted or failed-over scheduler, single-tick (cron) mode,
+    where the process exits before the slot arrives, publishes that failed
+    and publishes whose scheduler died midway.
 
-                if not day_schedule['enabled']:
-                    continue
+    Returns:
+        Number of articles published
+    """
+    release_expired_publishing(now)
+    with _held_lock:
+        pending = set(_held_timers)
+    published = 0
+    for job_id in due_held_runs(now):
+        if job_id not in pending and publish_held_article(job_id):
+            published += 1
+    return published
+
+def run_scheduled_slot(job_id, user_id, due_at):
+    """
+    Generate the article of one leased slot run and publish it at the slot time.
 
-                for time_slot in ['time1', 'time2']:
-                    if not day_schedule[time_slot]:
-                        continue
+    The finished article is held (checkpointed) and its WordPress draft is
+    created when the slot arrives - straight away if generation finished
+    late. Holding is fenced by the lease: if another scheduler took the
+    run over meanwhile, this article is discarded.
 
-                    scheduled_time = datetime.strptime(day_schedule[time_slot], "%H:%M").time()
-                    scheduled_datetime = eastern_tz.localize(
-                        datetime.combine(now.date(), scheduled_time)
-                    )
+    Args:
+        job_id: CompletedJob ID of the leased run
+        user_id: Slot owner
+        due_at: The slot's run time (naive UTC)
+    """
+    owner = scheduler_owner_id()
+    if not start_run(job_id, owner):
+        logger.info(f"[V3 Scheduler] Run {job_id} of user {user_id} was taken over while queued - skipped")
+        return
+
+    scheduled_datetime = slot_local_datetime(due_at)
+    logger.info(f"[V3 Scheduler] Initiating V3 blog post creation for user {user_id} "
+                f"scheduled at {scheduled_datetime}")
+    article, error = generate_scheduled_article(user_id)
+    if error:
+        logger.error(f"Failed to create V3 blog post for user {user_id}: {error}")
+        fail_run(job_id, owner)
+        return
+
+    # Checkpoint first: once the run is held, any scheduler's tick may publish it
+    store = CheckpointStore(scheduled_run_id(job_id, owner))
+    if not store.save(HELD_ARTICLE_STAGE, {'article': article}):
+        fail_run(job_id, owner)
+        return
+    if not hold_run(job_id, owner):
+        logger.warning(f"[V3 Scheduler] Lost the lease of run {job_id} (user {user_id}) during generation "
+                       f"- discarding this article")
+        store.clear()
+        return
+
+    early = (due_at - datetime.utcnow()).total_seconds()
+    if early > 0:
+        logger.info(f"[V3 Scheduler] Article for user {user_id} ready {early:.0f}s early - "
+                    f"holding it until {scheduled_datetime}")
+        _hold_until(job_id, due_at)
+        return
+    logger.warning(f"[V3 Scheduler] Article for user {user_id} finished {-early:.0f}s after its slot "
+                   f"- lead time too short")
+    publish_held_article(job_id)
+
+def _heartbeat_loop(stop_event):
+    """Renew this process's leases until stopped."""
+    owner = scheduler_owner_id()
+    while not stop_event.wait(SCHEDULER_HEARTBEAT_SECONDS):
+        try:
+            with app.app_context():
+                renew_leases(owner)
+        except Exception as e:
+            logger.error(f"[V3 Scheduler] Lease heartbeat failed: {e}")
 
-                    if start_time <= scheduled_datetime <= end_time:
-                        job = CompletedJob.query.filter_by(user_id=user.id, scheduled_time=scheduled_datetime).first()
-
-                        if not job:
-                            logger.info(f"[V3 Scheduler] Creating new V3 job for user {user.id} scheduled at {scheduled_datetime}")
-                            new_job = CompletedJob(
-                                user_id=user.id,
-                                scheduled_time=scheduled_datetime,
-                                completed_time=None,
-                                post_title=""
-                            )
-                            db.session.add(new_job)
-                            db.session.commit()
-
-                            logger.info(f"[V3 Scheduler] Initiating V3 blog post creation for user {user.id}")
-                            post, error = create_blog_post(user.id)
-                            if error:
-                                logger.error(f"Failed to create V3 blog post for user {user.id}: {error}")
-                            else:
-                                new_job.completed_time = eastern_tz.localize(datetime.now())
-                                new_job.post_title = post['title']['rendered']
-                                db.session.commit()
-                                logger.info(f"[V3 Scheduler] Completed job for user {user.id} scheduled at {scheduled_datetime}")
-                        elif job.completed_time is None:
-                            time_pending = now - scheduled_datetime
-                            if time_pending > timedelta(minutes=5):
-                                logger.info(f"[V3 Scheduler] Retrying job for user {user.id} scheduled at {scheduled_datetime}")
-
-                                post, error = create_blog_post(user.id)
-                                if error:
-                                    logger.error(f"Failed to create V3 blog post for user {user.id} on retry: {error}")
-                                else:
-                                    job.completed_time = eastern_tz.localize(datetime.now())
-                                    job.post_title = post['title']['rendered']
-                                    db.session.commit()
-                                    logger.info(f"[V3 Scheduler] Completed job for user {user.id} scheduled at {scheduled_datetime} on retry")
-                            else:
-                                logger.info(f"Job for user {user.id} scheduled at {scheduled_datetime} is still pending")
-                        else:
-                            logger.info(f"Job for user {user.id} scheduled at {scheduled_datetime} already completed")
-
-            # Clean up old completed jobs
-            week_ago = now - timedelta(days=7)
-            old_jobs = CompletedJob.query.filter(CompletedJob.completed_time < week_ago).all()
-            for job in old_jobs:
-                db.session.delete(job)
-            db.session.commit()
-            logger.info(f"[V3 Scheduler] Cleaned up {len(old_jobs)} old jobs")
+def _get_dispatch_pool():
+    """
+    Bounded earliest-deadline-first pool the scheduler runs articles in,
+    created on first use together with the lease heartbeat.
+    """
+    global _dispatch_pool, _heartbeat_stop
+    with _dispatch_pool_lock:
+        if _dispatch_pool is None:
+            _dispatch_pool = EarliestDeadlineExecutor(max_workers=SCHEDULER_WORKERS,
+                                                      thread_name_prefix="scheduled-article")
+            _heartbeat_stop = threading.Event()
+            threading.Thread(target=_heartbeat_loop, args=(_heartbeat_stop,), daemon=True,
+                             name="scheduler-heartbeat").start()
+        return _dispatch_pool
+
+def shutdown_dispatch_pool():
+    """
+    Wait for dispatched articles (running and queued) to finish.
+
+    Articles held for a later slot stay checkpointed; the next tick of a
+    scheduler publishes them once their slot has passed.
+    """
+    global _dispatch_pool, _heartbeat_stop
+    with _dispatch_pool_lock:
+        pool, _dispatch_pool = _dispatch_pool, None
+        heartbeat_stop, _heartbeat_stop = _heartbeat_stop, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+    if heartbeat_stop is not None:
+        heartbeat_stop.set()
+    with _held_lock:
+        timers = list(_held_timers.values())
+        _held_timers.clear()
+    for timer in timers:
+        timer.cancel()
+        timer.join()  # One already publishing finishes first
+
+def _reset_scheduler_after_fork():
+    """A forked scheduler starts without the parent's pool, heartbeat and timers."""
+    global _dispatch_pool, _dispatch_pool_lock, _heartbeat_stop, _held_timers, _held_lock
+    _dispatch_pool, _heartbeat_stop, _held_timers = None, None, {}
+    _dispatch_pool_lock, _held_lock = threading.Lock(), threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_scheduler_after_fork)
+
+def _run_slot_in_worker(job_id, user_id, due_at):
+    """Pool entry point - each worker thread needs its own app context."""
+    try:
+        with app.app_context():
+            run_scheduled_slot(job_id, user_id, due_at)
+    except Exception as e:
+        logger.error(f"[V3 Scheduler] Scheduled article for user {user_id} failed: {e}", exc_info=True)
+
+def check_and_trigger_jobs(now=None, wait=False):
+    """
+    Dispatch every schedule slot whose article should start generating.
+
+    Slots within the generation lead time (learned from recorded pipeline
+    durations) are found with one range query on the indexed
+    schedule_slots.next_run_at. Each is claimed - advanced to its next
+    weekly occurrence - and its run recorded under a lease owned by this
+    instance, in one transaction. Runs whose owner stopped heartbeating
+    are taken over. The runs go to a pool of SCHEDULER_WORKERS threads
+    that starts the earliest slot first; finished articles are held and
+    published at their slot time.
+
+    Any number of scheduler instances may tick against the same database:
+    each slot is claimed, and each article published, exactly once.
+
+    Args:
+        now: Naive UTC time of the tick (defaults to now)
+        wait: Block until the dispatched articles are generated (single-tick mode)
+
+    Returns:
+        Futures of the dispatched articles
+    """
+    futures = []
+    with app.app_context():
+        try:
+            now = now or datetime.utcnow()
+            owner = scheduler_owner_id()
+            published = publish_due_held_articles(now)
+            if published:
+                logger.info(f"[V3 Scheduler] Published {published} held article(s) whose slot passed")
+
+            pool = _get_dispatch_pool()
+            runs = take_over_expired_runs(owner, limit=pool.idle_workers())
+
+            lead_seconds = generation_lead_seconds()
+            claimed = 0
+            for slot in due_slots(now, lead_seconds):
+                due_at, user_id = slot.next_run_at, slot.user_id
+                if (now - due_at).total_seconds() > SCHEDULER_MISFIRE_GRACE:
+                    if claim_slot(slot, now):
+                        logger.warning(f"[V3 Scheduler] Skipping slot of user {user_id} missed at "
+                                       f"{slot_local_datetime(due_at)} (scheduler was down)")
+                    continue
+                job_id = lease_slot(slot, owner, now)
+                if job_id is None:
+                    continue  # Another scheduler instance took it
+                runs.append((job_id, user_id, due_at))
+                claimed += 1
+
+            if runs:
+                logger.info(f"[V3 Scheduler] Dispatching {len(runs)} run(s) ({claimed} new) due by "
+                            f"{slot_local_datetime(max(run[2] for run in runs)).strftime('%Y-%m-%d %H:%M:%S %Z')} "
+                            f"to {SCHEDULER_WORKERS} workers (lead time {lead_seconds}s)")
+            futures = [pool.submit(due_at, _run_slot_in_worker, job_id, user_id, due_at)
+                       for job_id, user_id, due_at in runs]
 
         except SQLAlchemyError as e:
             logger.error(f"Database error: {str(e)}")
@@ -260,13 +544,78 @@ def check_and_trigger_jobs():
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
 
+    if wait and futures:
+        wait_for_futures(futures)
+    return futures
+
+def cleanup_completed_jobs():
+    """Delete CompletedJob records (completed or failed runs) older than a week."""
+    with app.app_context():
+        try:
+            week_ago = datetime.now(SCHEDULE_TIMEZONE) - timedelta(days=7)
+            deleted = CompletedJob.query.filter(CompletedJob.completed_time < week_ago).delete(
+                synchronize_session=False
+            )
+            deleted += CompletedJob.query.filter(
+                CompletedJob.status == RUN_FAILED, CompletedJob.due_at < datetime.utcnow() - timedelta(days=7)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            logger.info(f"[V3 Scheduler] Cleaned up {deleted} old jobs")
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}")
+            db.session.rollback()
+
+def run_daemon():
+    """
+    Long-running scheduler: ticks every SCHEDULER_TICK_SECONDS in one process.
+
+    The app, provider SDKs and connection pools are loaded once instead of
+    on every cron run. Slots are rebuilt from User.schedule at startup;
+    after that /api/save_schedule keeps them current. Articles generated
+    ahead of their slot are published at the slot time to the second
+    (a cron run leaves them to the first run after the slot).
+    """
+    from apscheduler.schedulers.blocking import BlockingScheduler
+
+    with app.app_context():
+        slot_count = rebuild_all_schedule_slots()
+    logger.info(f"[V3 Scheduler] {slot_count} schedule slot(s) loaded, ticking every {SCHEDULER_TICK_SECONDS}s")
+
+    scheduler = BlockingScheduler(timezone=pytz.utc)
+    # Ticks only claim and dispatch - articles run in the worker pool
+    scheduler.add_job(check_and_trigger_jobs, 'interval', seconds=SCHEDULER_TICK_SECONDS, id='tick',
+                      next_run_time=datetime.now(pytz.utc), max_instances=1, coalesce=True,
+                      misfire_grace_time=None)
+    scheduler.add_job(cleanup_completed_jobs, 'interval', hours=1, id='cleanup',
+                      next_run_time=datetime.now(pytz.utc), max_instances=1, coalesce=True)
+
+    def _shutdown(signum, frame):
+        logger.info(f"[V3 Scheduler] Signal {signum} received - finishing dispatched articles")
+        scheduler.shutdown(wait=False)
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    scheduler.start()
+    shutdown_dispatch_pool()  # Claimed slots are not re-run - let them finish
+    logger.info("[V3 Scheduler] Scheduler daemon stopped")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EZWAI SMM scheduler")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Run continuously (default: a single tick, for cron)")
+    args = parser.parse_args()
+
     try:
         logger.info("[V3 Scheduler] Starting EZWAI SMM V3.0 Scheduler")
         logger.info("[V3 Scheduler] Using V4 pipeline: GPT-5-mini + SeeDream-4")
-        check_and_trigger_jobs()
-        logger.info("[V3 Scheduler] Scheduler run completed")
+        if args.daemon:
+            run_daemon()
+        else:
+            check_and_trigger_jobs(wait=True)
+            shutdown_dispatch_pool()  # Articles held for a later slot are published by a later run
+            cleanup_completed_jobs()
+            logger.info("[V3 Scheduler] Scheduler run completed")
     except Exception as e:
         logger.error(f"An unexpected error occurred in the main scheduler execution: {str(e)}")
         import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
\ No newline at end of file
+        logger.error(f"Traceback: {traceback.format_exc()}")
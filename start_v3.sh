@@ -144,8 +144,14 @@ echo ""
 echo "Press Ctrl+C to stop the application"
 echo ""
 
+# Article generation runs in a separate worker pool
+python generation_worker.py &
+WORKER_PID=$!
+
 python app_v3.py
 
+kill $WORKER_PID 2>/dev/null
+
 # Cleanup on exit
 deactivate
 echo ""
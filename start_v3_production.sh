@@ -14,6 +14,11 @@ LOG_FILE="logs/gunicorn.log"
 ACCESS_LOG="logs/access.log"
 ERROR_LOG="logs/error.log"
 PID_FILE="gunicorn.pid"
+GENERATION_WORKERS="${GENERATION_WORKERS:-2}"  # Article generation worker processes
+WORKER_LOG="logs/generation_worker.log"
+WORKER_PID_FILE="generation_worker.pid"
+SCHEDULER_LOG="logs/scheduler.log"
+SCHEDULER_PID_FILE="scheduler.pid"
 
 # Create logs directory
 mkdir -p logs
@@ -69,7 +74,29 @@ gunicorn "$APP_MODULE" \
     --max-requests 1000 \
     --max-requests-jitter 50
 
-if [ $? -eq 0 ]; then
+GUNICORN_EXIT=$?
+
+# Start the article generation worker pool (processes /api/create_test_post jobs)
+if [ -f "$WORKER_PID_FILE" ] && ps -p $(cat "$WORKER_PID_FILE") > /dev/null 2>&1; then
+    echo "Stopping existing generation workers (PID: $(cat $WORKER_PID_FILE))..."
+    kill $(cat "$WORKER_PID_FILE")
+    sleep 2
+fi
+echo "Starting $GENERATION_WORKERS generation workers..."
+nohup python generation_worker.py --workers $GENERATION_WORKERS >> "$WORKER_LOG" 2>&1 &
+echo $! > "$WORKER_PID_FILE"
+
+# Start the scheduler daemon (replaces the */5 cron entry for run_scheduler_v3.sh)
+if [ -f "$SCHEDULER_PID_FILE" ] && ps -p $(cat "$SCHEDULER_PID_FILE") > /dev/null 2>&1; then
+    echo "Stopping existing scheduler (PID: $(cat $SCHEDULER_PID_FILE))..."
+    kill $(cat "$SCHEDULER_PID_FILE")
+    sleep 2
+fi
+echo "Starting scheduler daemon..."
+nohup python scheduler_v3.py --daemon >> "$SCHEDULER_LOG" 2>&1 &
+echo $! > "$SCHEDULER_PID_FILE"
+
+if [ $GUNICORN_EXIT -eq 0 ]; then
     echo "Application started successfully!"
     echo "PID: $(cat $PID_FILE)"
     echo ""
@@ -78,6 +105,8 @@ if [ $? -eq 0 ]; then
     echo ""
     echo "To view logs:"
     echo "  tail -f $LOG_FILE"
+    echo "  tail -f $WORKER_LOG"
+    echo "  tail -f $SCHEDULER_LOG"
     echo ""
     echo "To stop:"
     echo "  ./stop_v3.sh"
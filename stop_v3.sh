@@ -31,6 +31,27 @@ if [ -f "gunicorn.pid" ]; then
     fi
 fi
 
+# Stop generation worker pool (lets running pipelines finish)
+if [ -f "generation_worker.pid" ]; then
+    PID=$(cat generation_worker.pid)
+    if ps -p $PID > /dev/null 2>&1; then
+        echo "Stopping generation workers (PID: $PID)..."
+        kill $PID
+        echo "Generation workers finishing current jobs"
+    fi
+    rm -f generation_worker.pid
+fi
+
+# Stop scheduler daemon (dispatched articles finish first)
+if [ -f "scheduler.pid" ]; then
+    PID=$(cat scheduler.pid)
+    if ps -p $PID > /dev/null 2>&1; then
+        echo "Stopping scheduler (PID: $PID)..."
+        kill $PID
+    fi
+    rm -f scheduler.pid
+fi
+
 # Stop any remaining Python processes running app_v3.py
 PIDS=$(pgrep -f "python.*app_v3.py")
 if [ ! -z "$PIDS" ]; then
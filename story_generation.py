@@ -3,34 +3,35 @@ story_generation.py - STEP 1: Structured Article Generation
 
 Uses GPT-5 to generate article with component metadata for magazine layout.
 Returns JSON with content + component placement instructions.
+
+With an on_partial callback the response is streamed and parsed
+incrementally: title and executive_summary are reported as soon as they are
+written (they come first in the JSON), and the html field is reported one
+<h2> section at a time, so downstream steps can start before the full
+16k-token response has arrived.
 """
 
 import os
 import re
 import json
+import time
 import logging
-from typing import Optional, Dict, List
-from dotenv import load_dotenv
+from typing import Any, Callable, Optional, Dict, List, Tuple
 from openai import OpenAI
+from job_settings import JobSettings, get_job_settings
+from pipeline_metrics import record_llm_call
+from provider_limits import provider_slot
+from incremental_json import IncrementalJSONParser
 
 logger = logging.getLogger(__name__)
 
-def load_user_env(user_id: int) -> None:
-    """Load user-specific environment variables."""
-    env_file = f".env.user_{user_id}"
-    if os.path.exists(env_file):
-        load_dotenv(env_file, override=True)  # CRITICAL: Override existing env vars
-        logger.debug(f"Loaded environment for user {user_id}")
-    else:
-        logger.error(f"Environment file for user {user_id} not found")
-
+STORY_STREAMING = os.getenv("STORY_STREAMING", "true").lower() == "true"
 
-def _get_openai_client() -> OpenAI:
-    """Get OpenAI client with API key."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+def _get_openai_client(settings: JobSettings) -> OpenAI:
+    """Get OpenAI client with the job's API key."""
+    if not settings.openai_api_key:
         raise RuntimeError("OPENAI_API_KEY not set.")
-    return OpenAI(api_key=api_key)
+    return OpenAI(api_key=settings.openai_api_key)
 
 
 def create_story_prompt(
@@ -63,10 +64,9 @@ def create_story_prompt(
 RESEARCH CONTEXT (from Perplexity AI):
 {perplexity_research}
 
-OUTPUT FORMAT - Return valid JSON only:
+OUTPUT FORMAT - Return valid JSON only, with the keys in exactly this order:
 {{
   "title": "Article main title",
-  "html": "Article content in semantic HTML (h1, h2, h3, p, ul, ol, li only - NO classes or styling)",
   "executive_summary": {{
     "intro": "2-3 sentence overview that motivates reading",
     "key_stats": [
@@ -74,6 +74,7 @@ OUTPUT FORMAT - Return valid JSON only:
       {{"number": "220%", "description": "Sales increase achieved"}}
     ]
   }},
+  "html": "Article content in semantic HTML (h1, h2, h3, p, ul, ol, li only - NO classes or styling)",
   "components": [
     {{
       "type": "pull_quote",
@@ -136,27 +137,80 @@ Return ONLY valid JSON. No markdown, no code blocks, just the JSON object.
 """
 
 
+def _stream_response_text(
+    client: OpenAI,
+    request: Dict[str, Any],
+    on_partial: Callable[[str, Any], None]
+) -> Tuple[str, Any]:
+    """
+    Run a Responses API request as an event stream.
+
+    Text deltas are fed to an IncrementalJSONParser that reports each
+    top-level field, and each <h2> section of "html", through on_partial.
+    Callback errors are logged and never abort the stream.
+
+    Returns:
+        (full output text, final response object or None)
+    """
+    def _notify(name: str, value: Any) -> None:
+        try:
+            on_partial(name, value)
+        except Exception as e:
+            logger.warning(f"[Story Gen] Partial callback failed for '{name}': {e}")
+
+    parser = IncrementalJSONParser(
+        on_field=_notify,
+        on_section=lambda field, index, html: _notify("section", {"index": index, "html": html}),
+        sections={"html": "<h2"}
+    )
+
+    chunks: List[str] = []
+    final_response = None
+    for event in client.responses.create(stream=True, **request):
+        event_type = getattr(event, "type", "")
+        if event_type == "response.output_text.delta":
+            chunks.append(event.delta)
+            parser.feed(event.delta)
+        elif event_type == "response.completed":
+            final_response = event.response
+        elif event_type in ("response.failed", "response.incomplete", "error"):
+            logger.error(f"[Story Gen] Stream ended with {event_type}: {getattr(event, 'response', event)}")
+            final_response = getattr(event, "response", None)
+
+    return "".join(chunks), final_response
+
+
 def generate_clean_article(
     perplexity_research: str,
     user_id: int,
     user_system_prompt: str,
-    writing_style: Optional[str] = None
+    writing_style: Optional[str] = None,
+    on_partial: Optional[Callable[[str, Any], None]] = None,
+    settings: Optional[JobSettings] = None
 ) -> Optional[Dict]:
     """
     Generate structured article with component metadata using GPT-5.
 
+    Args:
+        settings: The job's settings (API key, MODEL_FOR_PASS1); looked up
+            from user_id if omitted
+        on_partial: Optional callback for streamed partial results, called as
+            on_partial(name, value) with name "title", "executive_summary",
+            "section" ({"index", "html"} per finished <h2> section), "html"
+            and "components". Streaming can be disabled with STORY_STREAMING=false.
+
     Returns:
     {
         "title": str,
-        "html": str,
         "executive_summary": {...},
+        "html": str,
         "components": [...]
     }
     """
-    load_user_env(user_id)
-    client = _get_openai_client()
+    settings = settings or get_job_settings(user_id)
+    client = _get_openai_client(settings)
 
-    model = os.getenv("MODEL_FOR_PASS1", "gpt-5")
+    model = settings.story_model
     output_text = ""  # Initialize to prevent unbound variable error
 
     try:
@@ -165,7 +219,7 @@ def generate_clean_article(
         logger.info(f"[Story Gen] Generating structured article with {model}")
         logger.info(f"[Story Gen] Writing style: {writing_style or 'Default'}")
 
-        response = client.responses.create(
+        request = dict(
             model=model,
             input=[
                 {
@@ -180,7 +234,14 @@ def generate_clean_article(
             max_output_tokens=16000
         )
 
-        output_text = getattr(response, "output_text", "")
+        with provider_slot("openai"):
+            started = time.monotonic()
+            if on_partial and STORY_STREAMING:
+                output_text, response = _stream_response_text(client, request, on_partial)
+            else:
+                response = client.responses.create(**request)
+                output_text = getattr(response, "output_text", "")
+        record_llm_call("story", model, response, time.monotonic() - started)
 
         if not output_text or len(output_text.strip()) < 100:
             logger.error("[Story Gen] Empty or too-short response")
@@ -0,0 +1,186 @@
+"""
+Test script for Claude formatter prompt caching.
+
+Runs entirely locally - anthropic.Anthropic is replaced with a fake client
+that streams a canned layout and reports prompt-cache usage:
+1. The system prompt is one cacheable block, byte-identical across articles
+2. The per-article message is compact and carries placeholders, not URLs
+3. Placeholders in the output are replaced with the real image URLs
+4. Cache reads, cache writes and TTFT land in the run metrics
+
+Run with: python test_claude_formatter_cache.py
+"""
+
+import sys
+
+from app_v3 import app, ArticleMetrics
+import claude_formatter
+import pipeline_metrics
+from pipeline_metrics import collect_run_metrics
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("formatter_cache_")
+
+
+def setup_module():
+    """Temporary database and Anthropic key of this script"""
+    ENV.start(environ={"ANTHROPIC_API_KEY": "test-key"})
+
+
+def teardown_module():
+    ENV.stop()
+
+ARTICLE_HTML = """
+<h1>AI Receptionists</h1>
+<!-- generated intro -->
+<p>Dealers   book more appointments.</p>
+    <h2>The Problem</h2>
+    <p>Missed calls.</p>
+"""
+
+FORMATTED = (
+    '<div class="magazine-article-wrapper"><div class="cover" style="background-image: url(HERO_IMAGE_URL)"></div>'
+    '<div class="section-header"><img src="SECTION_IMAGE_1_URL" alt="one"></div>'
+    '<div class="section-header"><img src="SECTION_IMAGE_2_URL" alt="two"></div>'
+    '<div class="section-header"><img src="SECTION_IMAGE_3_URL" alt="three"></div></div>'
+)
+
+
+class _Usage:
+    def __init__(self, cache_read, cache_write):
+        self.input_tokens = 600
+        self.output_tokens = 2500
+        self.cache_read_input_tokens = cache_read
+        self.cache_creation_input_tokens = cache_write
+
+
+class _Message:
+    def __init__(self, usage):
+        self.usage = usage
+
+
+class _Stream:
+    def __init__(self, usage):
+        self.usage = usage
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        for i in range(0, len(FORMATTED), 40):
+            yield FORMATTED[i:i + 40]
+
+    def get_final_message(self):
+        return _Message(self.usage)
+
+
+class _Messages:
+    def __init__(self):
+        self.requests = []
+
+    def stream(self, **request):
+        self.requests.append(request)
+        # First request writes the cache, later ones read it
+        if len(self.requests) == 1:
+            return _Stream(_Usage(cache_read=0, cache_write=9000))
+        return _Stream(_Usage(cache_read=9000, cache_write=0))
+
+
+class _FakeAnthropic:
+    messages = _Messages()
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+
+
+def _format(title, section_images):
+    return claude_formatter.format_article_with_claude(
+        article_html=ARTICLE_HTML,
+        title=title,
+        hero_image_url="https://cdn.example.com/hero.jpg",
+        section_images=section_images,
+        user_id=0,
+        brand_colors={"primary": "#112233", "accent": "#445566"}
+    )
+
+
+def test_cached_prefix_and_compact_message():
+    """System prefix is cacheable and identical; article message has no URLs"""
+    original = claude_formatter.anthropic.Anthropic
+    claude_formatter.anthropic.Anthropic = _FakeAnthropic
+    _FakeAnthropic.messages = _Messages()
+    try:
+        with app.app_context():
+            with collect_run_metrics(run_id="formatter-1") as run:
+                first = _format("First Article", ["https://cdn.example.com/s1.jpg", "https://cdn.example.com/s2.jpg"])
+                second = _format("Second Article", ["https://cdn.example.com/s1.jpg"])
+                run.status = "succeeded"
+            row = ArticleMetrics.query.filter_by(run_id="formatter-1").one()
+            calls = row.llm_calls
+    finally:
+        claude_formatter.anthropic.Anthropic = original
+
+    requests = _FakeAnthropic.messages.requests
+    assert len(requests) == 2
+    assert requests[0]["system"] == requests[1]["system"]
+    assert requests[0]["system"][0]["cache_control"] == {"type": "ephemeral"}
+
+    message = requests[0]["messages"][0]["content"]
+    print(f"Article message: {len(message)} chars, system prefix: {len(requests[0]['system'][0]['text'])} chars")
+    assert "https://" not in message
+    assert "<!--" not in message and "\n    <h2>" not in message
+    assert "SECTION_IMAGE_2_URL" in message and "SECTION_IMAGE_3_URL" not in message
+    assert "First Article" not in requests[0]["system"][0]["text"]
+
+    # Placeholders swapped for URLs; unmatched section images dropped
+    assert "url(https://cdn.example.com/hero.jpg)" in first
+    assert 'src="https://cdn.example.com/s2.jpg"' in first
+    assert "SECTION_IMAGE" not in first and 'alt="three"' not in first
+    assert 'alt="two"' not in second
+
+    print(f"Recorded calls: {calls}")
+    assert [call["cache_write_tokens"] for call in calls] == [9000, 0]
+    assert [call["cache_read_tokens"] for call in calls] == [0, 9000]
+    assert all(call["ttft_seconds"] is not None and call["ttft_seconds"] <= call["seconds"] for call in calls)
+    assert calls[1]["cost_usd"] < calls[0]["cost_usd"], "Cache reads should be cheaper than cache writes"
+    return True
+
+
+def test_aggregate_reports_cache_hit_ratio():
+    """Aggregated metrics expose TTFT and the cache hit ratio per call site"""
+    with app.app_context():
+        aggregate = pipeline_metrics.aggregate_metrics(days=1)
+        text = pipeline_metrics.render_prometheus(aggregate)
+
+    formatter = aggregate["llm_calls"]["claude_formatter"]
+    print(f"Formatter aggregate: hit ratio {formatter['cache_hit_ratio']}, ttft {formatter['ttft_seconds']}")
+    assert formatter["cache_hit_ratio"] == 0.5
+    assert formatter["ttft_seconds"]["count"] == 2
+    assert 'ezwai_llm_cache_hit_ratio{call="claude_formatter"} 0.5' in text
+    assert 'ezwai_llm_ttft_seconds_count{call="claude_formatter"} 2' in text
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("CLAUDE FORMATTER CACHE TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_cached_prefix_and_compact_message(),
+            test_aggregate_reports_cache_hit_ratio(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All Claude formatter cache tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Claude formatter cache tests failed")
+    sys.exit(1)
@@ -0,0 +1,199 @@
+"""
+Test script for the atomic credit ledger.
+
+Runs entirely locally: threads with their own sessions hammer one user's
+balance in a temporary SQLite database, and the ledger is audited after:
+1. Parallel charges never overdraw - exactly the affordable number succeed
+2. Mixed charges, refunds and purchases lose no update: the final balance
+   is the sum of the ledger, and every row's balance_after continues the
+   previous row's
+3. A payment delivered many times at once (webhook retries) is credited
+   once; the welcome bonus is given once
+4. Generation jobs record their charges and refunds under per-job keys
+
+Run with: python test_credit_ledger.py
+"""
+
+import sys
+import threading
+from datetime import datetime
+
+from app_v3 import app, db, User, CreditTransaction, GenerationJob
+from credit_system import deduct_credits, refund_credits, add_credits_manual, add_welcome_credit
+import generation_jobs
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("credit_ledger_")
+
+
+def setup_module():
+    """Temporary database of this script"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+def _setup_user(credits):
+    """A user with `credits` and an opening ledger row; returns the user ID."""
+    with app.app_context():
+        user = User(email=f"ledger{datetime.utcnow().timestamp()}@example.com", credit_balance=credits,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False)
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(CreditTransaction(user_id=user.id, amount=credits, transaction_type='welcome',
+                                         balance_after=credits, description='Opening balance'))
+        db.session.commit()
+        return user.id
+
+
+def _hammer(workers):
+    """Run (name, count, fn(i)) workers in parallel threads, each in its own app context."""
+    results = {name: [] for name, _, _ in workers}
+    barrier = threading.Barrier(len(workers))
+
+    def run(name, count, fn):
+        with app.app_context():
+            barrier.wait()
+            for i in range(count):
+                results[name].append(fn(i))
+
+    threads = [threading.Thread(target=run, args=worker) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _charge(user_id):
+    return deduct_credits(User.query.get(user_id), db)
+
+
+def _audit(user_id):
+    """Check the ledger chain of a user; returns (balance, ledger rows)."""
+    with app.app_context():
+        rows = CreditTransaction.query.filter_by(user_id=user_id).order_by(CreditTransaction.id).all()
+        balance = User.query.get(user_id).credit_balance
+        running = 0
+        for row in rows:
+            running += row.amount
+            assert row.balance_after == running, f"row {row.id}: balance_after {row.balance_after} != {running}"
+        assert balance == running, f"balance {balance} != ledger sum {running}"
+        return balance, [(row.transaction_type, row.amount, row.balance_after) for row in rows]
+
+
+def test_parallel_charges_never_overdraw():
+    """8 threads x 10 charges against 20 credits: exactly 20 succeed"""
+    user_id = _setup_user(20)
+    results = _hammer([(f"t{n}", 10, lambda i: _charge(user_id)) for n in range(8)])
+    charged = sum(ok for outcomes in results.values() for ok in outcomes)
+
+    balance, rows = _audit(user_id)
+    print(f"80 parallel charges against 20 credits: {charged} succeeded, balance {balance}")
+    assert charged == 20 and balance == 0
+    charges = [after for kind, _, after in rows if kind == 'article_generation']
+    assert sorted(charges) == list(range(20))  # Every intermediate balance exactly once
+    with app.app_context():
+        assert User.query.get(user_id).total_articles_generated == 20
+    return True
+
+
+def test_mixed_load_loses_no_updates():
+    """Concurrent charges, refunds and purchases: the balance is the ledger sum"""
+    user_id = _setup_user(10)  # Charges outpace credits at times - some are refused
+    results = _hammer(
+        [(f"charge{n}", 15, lambda i: _charge(user_id)) for n in range(6)]
+        + [(f"refund{n}", 10, lambda i: refund_credits(User.query.get(user_id), db, reason="stress"))
+           for n in range(3)]
+        + [(f"buy{n}", 5, lambda i, n=n: add_credits_manual(user_id, 10.00, f"pi_mixed_{user_id}_{n}_{i}", db))
+           for n in range(2)]
+    )
+    count = {kind: sum(ok for name, outcomes in results.items() if name.startswith(kind) for ok in outcomes)
+             for kind in ("charge", "refund", "buy")}
+
+    balance, rows = _audit(user_id)
+    print(f"Succeeded: {count}; final balance {balance} over {len(rows)} ledger rows")
+    assert count["refund"] == 30 and count["buy"] == 10
+    assert balance == 10 - count["charge"] + count["refund"] + 5 * count["buy"]
+    assert min(after for _, _, after in rows) >= 0
+    with app.app_context():
+        user = User.query.get(user_id)
+        assert user.total_spent == 100.0
+        assert user.total_articles_generated == count["charge"] - count["refund"]
+    return True
+
+
+def test_duplicate_payments_credited_once():
+    """The same payment intent delivered by 8 concurrent webhooks adds credits once"""
+    user_id = _setup_user(0)
+    results = _hammer([(f"hook{n}", 1, lambda i: add_credits_manual(user_id, 10.00, "pi_retried", db))
+                       for n in range(8)])
+    credited = sum(ok for outcomes in results.values() for ok in outcomes)
+    with app.app_context():
+        assert not add_credits_manual(user_id, 10.00, "pi_retried", db)  # A retry after it was credited
+
+    balance, rows = _audit(user_id)
+    print(f"8 deliveries of one payment: credited {credited} time(s), balance {balance}")
+    assert credited == 1 and balance == 5
+    assert [kind for kind, _, _ in rows].count('purchase') == 1
+
+    with app.app_context():
+        assert refund_credits(User.query.get(user_id), db, idempotency_key="refund-once")
+        assert refund_credits(User.query.get(user_id), db, idempotency_key="refund-once")  # Retry - no change
+        assert User.query.get(user_id).credit_balance == 6
+
+        fresh = User(email=f"welcome{datetime.utcnow().timestamp()}@example.com", credit_balance=0,
+                     total_articles_generated=0, total_spent=0.0, is_admin=False)
+        db.session.add(fresh)
+        db.session.commit()
+        fresh_id = fresh.id
+    results = _hammer([(f"welcome{n}", 1, lambda i: add_welcome_credit(fresh_id, db)) for n in range(4)])
+    assert sum(ok for outcomes in results.values() for ok in outcomes) == 1
+    assert _audit(fresh_id)[0] == 3
+    return True
+
+
+def test_job_credit_changes_are_keyed():
+    """A job's charge and refund are ledger rows keyed by the job and its attempt"""
+    user_id = _setup_user(2)
+    with app.app_context():
+        job, error = generation_jobs.enqueue_generation_job(User.query.get(user_id), {"blog_post_idea": "Ledgers"})
+        assert error is None
+        job_id = job.id
+        assert generation_jobs.fail_job(job_id, "boom", from_status=generation_jobs.JOB_QUEUED)
+        assert generation_jobs.requeue_failed_job(GenerationJob.query.get(job_id), User.query.get(user_id)) is None
+        assert GenerationJob.query.get(job_id).attempt == 2
+        # A retried charge of the same attempt (e.g. after a lost commit) is not applied twice
+        assert deduct_credits(User.query.get(user_id), db,
+                              idempotency_key=generation_jobs._credit_key(job_id, "charge", 2))
+        keys = [key for (key,) in CreditTransaction.query.with_entities(CreditTransaction.idempotency_key)
+                .filter_by(user_id=user_id).order_by(CreditTransaction.id)]
+    print(f"Ledger keys of job {job_id}: {keys[1:]}")
+    assert keys[1:] == [f"job:{job_id}:charge:1", f"job:{job_id}:refund:1", f"job:{job_id}:charge:2"]
+    assert _audit(user_id)[0] == 1
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("CREDIT LEDGER TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_parallel_charges_never_overdraw(),
+            test_mixed_load_loses_no_updates(),
+            test_duplicate_payments_credited_once(),
+            test_job_credit_changes_are_keyed(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All credit ledger tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Credit ledger tests failed")
+    sys.exit(1)
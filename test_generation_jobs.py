@@ -0,0 +1,210 @@
+"""
+Test script for the asynchronous article generation job queue.
+
+Runs entirely locally against a temporary SQLite database - the article
+pipeline itself is replaced with a fast fake:
+1. /api/create_test_post returns 202 + job id immediately and deducts a credit
+2. A job can only be claimed by one worker
+3. Successful jobs expose their result and keep the credit
+4. Failed jobs and jobs whose worker stopped heartbeating are refunded
+   exactly once; a slow job that keeps heartbeating is left running
+5. A refund that fails leaves the job charged (never "refunded" without
+   the credit), and the next recovery pass refunds it
+
+Run with: python test_generation_jobs.py
+"""
+
+import sys
+from datetime import datetime, timedelta
+
+import app_v3
+from app_v3 import app, db, User, GenerationJob, CreditTransaction
+import generation_jobs
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("generation_jobs_")
+
+
+def setup_module():
+    """Temporary database of this script"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+def _setup_user(credits=3):
+    with app.app_context():
+        GenerationJob.query.delete()  # Each test starts with an empty queue
+        user = User(email=f"jobs{datetime.utcnow().timestamp()}@example.com", credit_balance=credits,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+
+
+def _balance(user_id):
+    with app.app_context():
+        return User.query.get(user_id).credit_balance
+
+
+def _queue_job(client, user_id):
+    response = client.post("/api/create_test_post", json={"blog_post_idea": "AI in dentistry", "local_mode": True})
+    assert response.status_code == 202, response.get_json()
+    return response.get_json()["job_id"]
+
+
+def test_create_returns_job_immediately():
+    """Endpoint queues a job, deducts a credit and reports status"""
+    user_id = _setup_user(credits=3)
+    client = app.test_client()
+    _login(client, user_id)
+
+    job_id = _queue_job(client, user_id)
+    print(f"Queued job {job_id}")
+    assert _balance(user_id) == 2
+
+    status = client.get(f"/api/jobs/{job_id}").get_json()
+    assert status["status"] == "queued" and status["credit_status"] == "charged"
+    assert client.get(f"/api/jobs/{job_id}/result").status_code == 202
+    return True
+
+
+def test_success_keeps_credit():
+    """Claimed job runs once, result is served and credit is consumed"""
+    user_id = _setup_user(credits=3)
+    client = app.test_client()
+    _login(client, user_id)
+    job_id = _queue_job(client, user_id)
+
+    original = app_v3.run_test_post_generation
+    app_v3.run_test_post_generation = lambda uid, params, run_id=None: ({"title": "Done", "mode": "local"}, None)
+    try:
+        with app.app_context():
+            claimed = generation_jobs.claim_next_job("worker-a")
+            assert claimed == job_id
+            assert generation_jobs.claim_next_job("worker-b") is None, "Job claimed twice"
+            assert generation_jobs.run_generation_job(job_id)
+    finally:
+        app_v3.run_test_post_generation = original
+
+    response = client.get(f"/api/jobs/{job_id}/result")
+    print(f"Result: {response.status_code} {response.get_json()}")
+    assert response.status_code == 200 and response.get_json()["title"] == "Done"
+    assert client.get(f"/api/jobs/{job_id}").get_json()["credit_status"] == "consumed"
+    assert _balance(user_id) == 2
+    return True
+
+
+def test_failure_refunds_once():
+    """Failed jobs refund their credit exactly once"""
+    user_id = _setup_user(credits=3)
+    client = app.test_client()
+    _login(client, user_id)
+    job_id = _queue_job(client, user_id)
+
+    original = app_v3.run_test_post_generation
+    app_v3.run_test_post_generation = lambda uid, params, run_id=None: (None, "Story generation failed")
+    try:
+        with app.app_context():
+            generation_jobs.claim_next_job("worker-a")
+            assert not generation_jobs.run_generation_job(job_id)
+            # A late duplicate failure (e.g. stale recovery) must not refund again
+            assert not generation_jobs.fail_job(job_id, "duplicate")
+    finally:
+        app_v3.run_test_post_generation = original
+
+    response = client.get(f"/api/jobs/{job_id}/result")
+    print(f"Failed result: {response.status_code} {response.get_json()}")
+    assert response.status_code == 500 and response.get_json()["error"] == "Story generation failed"
+    assert _balance(user_id) == 3
+    with app.app_context():
+        refunds = CreditTransaction.query.filter_by(user_id=user_id, transaction_type="refund").count()
+    assert refunds == 1
+    return True
+
+
+def test_stale_jobs_recovered():
+    """Jobs abandoned by a dead worker are failed and refunded, slow live ones are not"""
+    user_id = _setup_user(credits=4)
+    client = app.test_client()
+    _login(client, user_id)
+    dead_job = _queue_job(client, user_id)
+    slow_job = _queue_job(client, user_id)
+
+    with app.app_context():
+        assert generation_jobs.claim_next_job("dead-worker") == dead_job
+        assert generation_jobs.claim_next_job("slow-worker") == slow_job
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        for job in GenerationJob.query.filter(GenerationJob.id.in_([dead_job, slow_job])):
+            job.started_at = job.heartbeat_at = long_ago
+        db.session.commit()
+
+        # The slow worker is still alive - its heartbeat keeps the job
+        assert generation_jobs.renew_heartbeats("slow-worker") == 1
+        assert generation_jobs.recover_stale_jobs() == 1
+        assert GenerationJob.query.get(dead_job).status == "failed"
+        assert GenerationJob.query.get(slow_job).status == "running"
+
+    assert _balance(user_id) == 3
+    return True
+
+
+def test_failed_refund_rolls_back():
+    """A job is only marked refunded together with its ledger refund"""
+    import credit_system
+
+    user_id = _setup_user(credits=3)
+    client = app.test_client()
+    _login(client, user_id)
+    job_id = _queue_job(client, user_id)
+
+    original = credit_system.refund_credits
+    credit_system.refund_credits = lambda user, db, reason="", idempotency_key=None: False
+    try:
+        with app.app_context():
+            generation_jobs.claim_next_job("worker-a")
+            assert generation_jobs.fail_job(job_id, "WordPress unreachable")
+            assert GenerationJob.query.get(job_id).credit_status == "charged"
+    finally:
+        credit_system.refund_credits = original
+    assert _balance(user_id) == 2
+
+    with app.app_context():
+        generation_jobs.recover_stale_jobs()
+        job = GenerationJob.query.get(job_id)
+        print(f"After recovery: {job.status}/{job.credit_status}")
+        assert job.status == "failed" and job.credit_status == "refunded"
+    assert _balance(user_id) == 3
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("GENERATION JOB QUEUE TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_create_returns_job_immediately(),
+            test_success_keeps_credit(),
+            test_failure_refunds_once(),
+            test_stale_jobs_recovered(),
+            test_failed_refund_rolls_back(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All generation job tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Generation job tests failed")
+    sys.exit(1)
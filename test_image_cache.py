@@ -0,0 +1,220 @@
+"""
+Test script for the content-addressed image cache.
+
+Runs entirely locally - requests.get and the WordPress session are
+replaced with fakes that count network fetches, and the cache lives in a temp directory:
+1. Concurrent fetches of one URL download it once
+2. Identical bytes behind different URLs share one blob
+3. The store stays under its size bound, evicting least recently used first
+4. A WordPress article fetches each Replicate image exactly once - the
+   featured image in create_wordpress_post is served from the cache and no
+   temp files are written
+
+Run with: python test_image_cache.py
+"""
+
+import io
+import os
+import sys
+import time
+import threading
+
+import requests
+from PIL import Image
+
+import image_cache
+import wordpress_integration
+import openai_integration_v4 as v4
+from image_cache import ImageCache
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("image_cache_")
+
+
+def setup_module():
+    """Temporary database and an empty process-wide image cache of this script"""
+    ENV.start()
+    ENV.patch(image_cache, "_cache", ImageCache(root=ENV.path("cache")))
+
+
+def teardown_module():
+    ENV.stop()
+
+
+def _jpeg(width=1800, height=1200):
+    """A random-noise JPEG (every call yields different bytes of about the same size)."""
+    image = Image.effect_noise((width, height), 30).convert("RGB")
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+class _FakeResponse:
+    def __init__(self, content=b"", status_code=200, payload=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {"Content-Type": "image/jpeg"}
+        self._payload = payload
+        self.text = ""
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+class _FakeNetwork:
+    """Serves images by URL and records every GET and POST."""
+
+    def __init__(self, images):
+        self.images = images
+        self.gets = []
+        self.posts = []
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None, **kwargs):
+        with self._lock:
+            self.gets.append(url)
+        time.sleep(0.05)
+        return _FakeResponse(self.images[url])
+
+    def request(self, session, method, endpoint, headers=None, data=None, json=None, timeout=None, **kwargs):
+        with self._lock:
+            self.posts.append((endpoint, headers, data, json))
+            number = len(self.posts)
+        if endpoint.endswith("/media"):
+            return _FakeResponse(status_code=201, payload={"id": 100 + number,
+                                                           "source_url": f"https://wp.test/uploads/{number}.jpg"})
+        return _FakeResponse(status_code=201, payload={"id": 9, "featured_media": json.get("featured_media")})
+
+    def __enter__(self):
+        network = self
+        self._original = requests.get, requests.Session.request
+        requests.get = self.get
+        requests.Session.request = lambda session, *args, **kwargs: network.request(session, *args, **kwargs)
+        return self
+
+    def __exit__(self, *exc):
+        requests.get, requests.Session.request = self._original
+        return False
+
+
+def test_concurrent_fetches_download_once():
+    """Eight threads asking for the same URL cause one network fetch"""
+    cache = ImageCache(root=ENV.path("concurrent"), max_bytes=50 * 1024 * 1024)
+    url = "https://replicate.delivery/one.jpg"
+    network = _FakeNetwork({url: _jpeg()})
+    results = []
+
+    with network:
+        threads = [threading.Thread(target=lambda: results.append(cache.fetch(url))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    print(f"8 concurrent fetches -> {len(network.gets)} download(s), {cache.hits} hits")
+    assert len(network.gets) == 1 and cache.misses == 1 and cache.hits == 7
+    assert all(data == network.images[url] and content_type == "image/jpeg" for data, content_type in results)
+    assert cache.path(url).endswith(".jpg")
+
+    # Another process (new instance on the same directory) sees the blob
+    assert ImageCache(root=cache.root).get(url)[0] == network.images[url]
+    return True
+
+
+def test_identical_bytes_share_one_blob():
+    """Two URLs with the same bytes map to one content-addressed file"""
+    cache = ImageCache(root=ENV.path("dedup"), max_bytes=50 * 1024 * 1024)
+    data = _jpeg()
+    first = cache.put(data, "image/jpeg", urls=["https://replicate.delivery/x.jpg"])
+    second = cache.put(data, "image/jpeg", urls=["https://wp.test/uploads/x.jpg"])
+
+    blobs = list(cache._scan_blobs())
+    assert first == second and len(blobs) == 1
+    assert cache.get("https://wp.test/uploads/x.jpg")[0] == data
+    assert cache.get("https://never.cached/x.jpg") is None
+    return True
+
+
+def test_lru_eviction_bounds_size():
+    """Least recently used blobs are evicted first; their URL mappings go too"""
+    images = [_jpeg(600, 400) for _ in range(5)]
+    bound = sum(len(image) for image in images[:3]) + len(images[0]) // 2
+    cache = ImageCache(root=ENV.path("lru"), max_bytes=bound)
+    urls = [f"https://replicate.delivery/lru{i}.jpg" for i in range(5)]
+
+    for i in range(3):
+        cache.put(images[i], "image/jpeg", urls=[urls[i]])
+        time.sleep(0.02)  # Distinct mtimes
+    cache.get(urls[0])  # Touch 0 - now 1 is least recently used
+    time.sleep(0.02)
+    cache.put(images[3], "image/jpeg", urls=[urls[3]])
+    time.sleep(0.02)
+    cache.put(images[4], "image/jpeg", urls=[urls[4]])
+
+    cached = [cache.get(url) is not None for url in urls]
+    total = sum(size for _, size, _ in cache._scan_blobs())
+    print(f"Cached after eviction: {cached}, {total} / {bound} bytes")
+    assert total <= bound
+    assert cached == [True, False, False, True, True]
+    assert len(os.listdir(os.path.join(cache.root, "urls"))) == 3
+    return True
+
+
+def test_article_fetches_each_image_once():
+    """Persistence and the featured image share the cached bytes"""
+    replicate_urls = [f"https://replicate.delivery/article{i}.jpg" for i in range(3)]
+    network = _FakeNetwork({url: _jpeg() for url in replicate_urls})
+    credentials = ("https://wp.test", "editor", "app pass")
+
+    original_load = wordpress_integration._load_wordpress_credentials
+    wordpress_integration._load_wordpress_credentials = lambda user_id: credentials
+    wordpress_integration._credentials_cache.clear()
+    cwd_before = set(os.listdir("."))
+    try:
+        with network:
+            hero_wp_url = v4.persist_images_to_wordpress(replicate_urls[:1], user_id=3,
+                                                         max_width=v4.HERO_MAX_WIDTH)[0]
+            section_wp_urls = v4.persist_images_to_wordpress(replicate_urls[1:], user_id=3, first_index=1)
+            # Local mode for the same outputs (e.g. a resumed run) is served from the cache too
+            v4.download_images_as_base64(replicate_urls[1:])
+            post = wordpress_integration.create_wordpress_post("Title", "<p>Body</p>", 3, hero_wp_url)
+    finally:
+        wordpress_integration._load_wordpress_credentials = original_load
+
+    print(f"Network GETs: {network.gets}")
+    assert sorted(network.gets) == sorted(replicate_urls), "Each image must be fetched exactly once"
+    assert hero_wp_url and all(section_wp_urls)
+    assert post["featured_media"] == 104
+
+    # The featured image upload is the optimized hero, straight from the cache
+    media_posts = [p for p in network.posts if p[0].endswith("/media")]
+    assert media_posts[-1][2] == media_posts[0][2]
+    assert 'filename="post_image_3_' in media_posts[-1][1]["Content-Disposition"]
+    assert set(os.listdir(".")) == cwd_before, "No temp files in the working directory"
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("IMAGE CACHE TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_concurrent_fetches_download_once(),
+            test_identical_bytes_share_one_blob(),
+            test_lru_eviction_bounds_size(),
+            test_article_fetches_each_image_once(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All image cache tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Image cache tests failed")
+    sys.exit(1)
@@ -0,0 +1,198 @@
+"""
+Test script for image recompression and resizing.
+
+Runs entirely locally - images are generated in memory with Pillow, and
+requests.get and the WordPress session are replaced with fakes serving them:
+1. Images are downscaled to the display width and re-encoded smaller
+   (JPEG and WebP; alpha is flattened for JPEG; small images kept as-is)
+2. Encoding runs in the process pool and savings land in the run metrics
+3. Local mode embeds the optimized variant as the data URI
+4. WordPress mode uploads the optimized variant with a matching filename
+
+Run with: python test_image_optimizer.py
+"""
+
+import io
+import sys
+import base64
+
+import requests
+from PIL import Image
+
+from app_v3 import app, ArticleMetrics
+import image_cache
+import image_optimizer
+import pipeline_metrics
+import openai_integration_v4 as v4
+from wordpress_integration import WordPressSite
+from pipeline_metrics import collect_run_metrics
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("image_optimizer_")
+
+
+def setup_module():
+    """Temporary database and an empty image cache of this script"""
+    ENV.start()
+    ENV.patch(image_cache, "_cache", image_cache.ImageCache(root=ENV.path("cache")))
+
+
+def teardown_module():
+    ENV.stop()
+
+
+def _seedream_jpeg(width=2048, height=1536, mode="RGB", image_format="JPEG"):
+    """A photo-like image (gradient + noise) encoded like SeeDream output."""
+    noise = Image.effect_noise((width, height), 40).convert("L")
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    if mode == "RGBA":
+        image.putalpha(gradient)
+    out = io.BytesIO()
+    if image_format == "JPEG":
+        image.save(out, format="JPEG", quality=90)
+    else:
+        image.save(out, format=image_format)
+    return out.getvalue()
+
+
+SOURCE = _seedream_jpeg()
+
+
+class _FakeResponse:
+    def __init__(self, content=b"", status_code=200, payload=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {"Content-Type": "image/jpeg"}
+        self._payload = payload
+        self.text = ""
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+def test_resize_and_encode():
+    """Variants are display-sized, smaller, and in the configured format"""
+    data, content_type = image_optimizer.resize_and_encode(SOURCE, 1600, "jpeg", 82)
+    with Image.open(io.BytesIO(data)) as image:
+        size = image.size
+    print(f"JPEG: {len(SOURCE) / 1024:.0f} KB -> {len(data) / 1024:.0f} KB, {size}")
+    assert content_type == "image/jpeg" and size == (1600, 1200)
+    assert len(data) < len(SOURCE) * 0.7
+
+    webp, content_type = image_optimizer.resize_and_encode(SOURCE, 1400, "webp", 80)
+    with Image.open(io.BytesIO(webp)) as image:
+        assert image.format == "WEBP" and image.width == 1400
+    assert content_type == "image/webp" and len(webp) < len(data)
+
+    # PNG with alpha becomes an RGB JPEG
+    png = _seedream_jpeg(800, 600, mode="RGBA", image_format="PNG")
+    data, content_type = image_optimizer.resize_and_encode(png, 1400, "jpeg", 82)
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.mode == "RGB" and image.width == 800
+    assert content_type == "image/jpeg"
+
+    # Already small - re-encoding would grow it, so the original is kept
+    tiny = _seedream_jpeg(64, 48)
+    tiny_q30 = io.BytesIO()
+    Image.open(io.BytesIO(tiny)).save(tiny_q30, format="JPEG", quality=30)
+    data, content_type = image_optimizer.resize_and_encode(tiny_q30.getvalue(), 1400, "jpeg", 95)
+    assert data == tiny_q30.getvalue() and content_type == "image/jpeg"
+    return True
+
+
+def test_pool_records_savings():
+    """optimize_image runs in the process pool and records the savings per run"""
+    with app.app_context():
+        with collect_run_metrics(run_id="imageopt-1") as run:
+            data, content_type = image_optimizer.optimize_image(SOURCE, 1600)
+            kept, kept_type = image_optimizer.optimize_image(b"not an image", 1600, content_type="image/png")
+            run.status = "succeeded"
+        row = ArticleMetrics.query.filter_by(run_id="imageopt-1").one()
+        aggregate = pipeline_metrics.aggregate_metrics(days=1)
+        text = pipeline_metrics.render_prometheus(aggregate)
+
+    assert image_optimizer._pool is not None, "Encoding should use the process pool"
+    assert kept == b"not an image" and kept_type == "image/png"
+    print(f"Recorded: {row.image_bytes_original} -> {row.image_bytes_optimized} bytes")
+    assert row.image_bytes_original == len(SOURCE) and row.image_bytes_optimized == len(data)
+    assert aggregate["per_run"]["image_bytes_saved"]["sum"] == len(SOURCE) - len(data)
+    assert "ezwai_run_image_bytes_saved_count 1" in text
+    return True
+
+
+def test_local_mode_embeds_optimized_variant():
+    """The data URI carries the section-sized variant, not the 2K original"""
+    original = requests.get
+    requests.get = lambda url, timeout=None: _FakeResponse(SOURCE)
+    try:
+        uris = v4.download_images_as_base64(["https://replicate.delivery/a.jpg", None])
+        hero = v4._download_and_convert_to_base64("https://replicate.delivery/h.jpg", max_width=v4.HERO_MAX_WIDTH)
+    finally:
+        requests.get = original
+
+    section = base64.b64decode(uris[0].split(",", 1)[1])
+    with Image.open(io.BytesIO(section)) as image:
+        assert image.width == image_optimizer.SECTION_MAX_WIDTH
+    with Image.open(io.BytesIO(base64.b64decode(hero.split(",", 1)[1]))) as image:
+        assert image.width == image_optimizer.HERO_MAX_WIDTH
+    print(f"Embedded section image: {len(uris[0]) / 1024:.0f} KB data URI "
+          f"(original would be {len(SOURCE) * 4 / 3 / 1024:.0f} KB)")
+    assert uris[1] is None and len(uris[0]) < len(SOURCE)
+    return True
+
+
+def test_wordpress_uploads_optimized_variant():
+    """WordPress receives the recompressed bytes under a matching filename"""
+    uploads = []
+
+    def fake_request(session, method, endpoint, headers=None, data=None, timeout=None, **kwargs):
+        uploads.append((headers, data))
+        return _FakeResponse(status_code=201, payload={"id": len(uploads), "source_url": f"https://wp.test/{len(uploads)}.jpg"})
+
+    original_get, original_request = requests.get, requests.Session.request
+    requests.get = lambda url, timeout=None: _FakeResponse(SOURCE)
+    requests.Session.request = fake_request
+    try:
+        urls = v4.persist_images_to_wordpress(["https://replicate.delivery/a.jpg", None,
+                                               "https://replicate.delivery/b.jpg"], user_id=7, first_index=1,
+                                              site=WordPressSite(7, "https://wp.test", "editor", "app pass"))
+    finally:
+        requests.get, requests.Session.request = original_get, original_request
+
+    assert urls[0] and urls[1] is None and urls[2]
+    assert len(uploads) == 2
+    for headers, body in uploads:
+        assert headers["Content-Type"] == "image/jpeg"
+        assert headers["Content-Disposition"].endswith('.jpg"')
+        assert len(body) < len(SOURCE)
+        with Image.open(io.BytesIO(body)) as image:
+            assert image.width == image_optimizer.SECTION_MAX_WIDTH
+    print(f"Uploaded {len(uploads)} images of {[len(body) // 1024 for _, body in uploads]} KB")
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("IMAGE OPTIMIZER TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_resize_and_encode(),
+            test_pool_records_savings(),
+            test_local_mode_embeds_optimized_variant(),
+            test_wordpress_uploads_optimized_variant(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All image optimizer tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Image optimizer tests failed")
+    sys.exit(1)
@@ -0,0 +1,159 @@
+"""
+Test script for immutable per-job settings.
+
+Runs entirely locally against a temporary SQLite database - OpenAI is
+replaced with a fake client that records the key it was built with:
+1. JobSettings is read-only, copies with replace() and never prints secrets
+2. Settings are cached per user and invalidated by /api/update_integrations
+3. Two users' jobs running in parallel threads each use their own settings,
+   and nothing touches os.environ or reads .env.user_{id} files
+
+Run with: python test_job_settings.py
+"""
+
+import os
+import sys
+import time
+import threading
+from datetime import datetime
+
+from app_v3 import app, db, User
+import job_settings
+import image_prompt_generator
+from job_settings import JobSettings, get_job_settings, invalidate_job_settings
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("job_settings_")
+
+
+def setup_module():
+    """Temporary database and central OpenAI key of this script"""
+    ENV.start(environ={"OPENAI_API_KEY": "sk-central"})
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class _FakeOpenAI:
+    """Stands in for openai.OpenAI; responses echo the key the client was built with."""
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self.responses = self
+
+    def create(self, **kwargs):
+        time.sleep(0.01)  # Let the other job's thread interleave
+        return type("Response", (), {"output_text": f"photo for {self.api_key}", "usage": None})()
+
+
+def test_settings_are_immutable():
+    """Attributes cannot be changed; replace() returns a modified copy"""
+    settings = JobSettings(1, openai_api_key="sk-secret", story_model="gpt-5")
+    for attempt in (lambda: setattr(settings, "story_model", "other"),
+                    lambda: setattr(settings, "extra", 1),
+                    lambda: delattr(settings, "openai_api_key")):
+        try:
+            attempt()
+            raise AssertionError("JobSettings was modified")
+        except AttributeError:
+            pass
+
+    cheaper = settings.replace(story_model="gpt-5-mini")
+    assert cheaper.story_model == "gpt-5-mini" and cheaper.openai_api_key == "sk-secret"
+    assert settings.story_model == "gpt-5"
+    print(f"repr: {settings!r}")
+    assert "sk-secret" not in repr(settings) and "openai_api_key" in repr(settings)
+    return True
+
+
+def test_cached_and_invalidated():
+    """One build per user until the user's integrations change"""
+    with app.app_context():
+        user = User(email=f"settings{datetime.utcnow().timestamp()}@example.com", credit_balance=1,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    invalidate_job_settings()
+    first = get_job_settings(user_id)
+    assert get_job_settings(user_id) is first
+    assert first.openai_api_key == "sk-central"
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+    response = client.post("/api/update_integrations",
+                           json={"wordpress_rest_api_url": "https://blog.example.com/wp-json/wp/v2"})
+    assert response.status_code == 200, response.get_json()
+    assert user_id not in job_settings._settings_cache
+    assert get_job_settings(user_id) is not first
+    return True
+
+
+def test_parallel_jobs_are_isolated():
+    """Concurrent jobs never see each other's keys or mutate os.environ"""
+    cwd = os.getcwd()
+    os.chdir(ENV.dir)
+    for user_id in (1, 2):
+        with open(f".env.user_{user_id}", "w") as f:
+            f.write("OPENAI_API_KEY=sk-from-user-file\n")
+
+    environ_before = dict(os.environ)
+    original_openai = image_prompt_generator.OpenAI
+    image_prompt_generator.OpenAI = _FakeOpenAI
+    results = {}
+    errors = []
+
+    def job(user_id, key):
+        settings = JobSettings(user_id, openai_api_key=key)
+        try:
+            for i in range(10):
+                prompt = image_prompt_generator.generate_hero_image_prompt(
+                    "Title", "<p>Body</p>", user_id, settings=settings
+                )
+                results.setdefault(user_id, []).append(prompt)
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        threads = [threading.Thread(target=job, args=(1, "sk-user-one")),
+                   threading.Thread(target=job, args=(2, "sk-user-two"))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        image_prompt_generator.OpenAI = original_openai
+        os.chdir(cwd)
+
+    assert not errors, errors
+    print(f"User 1: {set(results[1])}, user 2: {set(results[2])}")
+    assert all("sk-user-one" in prompt for prompt in results[1])
+    assert all("sk-user-two" in prompt for prompt in results[2])
+    assert dict(os.environ) == environ_before
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("JOB SETTINGS TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_settings_are_immutable(),
+            test_cached_and_invalidated(),
+            test_parallel_jobs_are_isolated(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All job settings tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Job settings tests failed")
+    sys.exit(1)
@@ -0,0 +1,172 @@
+"""
+Test script for the compiled template layout engine.
+
+Runs entirely locally against the layouts/ samples and a temporary
+SQLite database:
+1. Every layout compiles, and renders a full article in milliseconds
+2. Rendered articles contain the title, every section, image, component
+   and key stat - and none of the sample article's text
+3. Brand colors replace the layout palette; unknown layouts fall back
+4. Users pick a layout and premium (Claude) mode via /api/update_brand_colors
+
+Run with: python test_layout_engine.py
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+from app_v3 import app, db, User
+import layout_engine
+from layout_engine import render_article_layout, available_layouts, LAYOUT_SLOTS
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("layout_engine_")
+
+
+def setup_module():
+    """Temporary database of this script"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+ARTICLE = {
+    "title": "AI Receptionists & the 24/7 Dealership",
+    "executive_summary": {
+        "intro": "Dealers that answer every call book more appointments.",
+        "key_stats": [
+            {"number": "43%", "description": "More appointments booked"},
+            {"number": "24/7", "description": "Phone coverage"},
+        ],
+    },
+    "html": (
+        "<h1>AI Receptionists</h1><p>Opening paragraph.</p>"
+        "<h2>The Missed Call Problem</h2><p>Calls go unanswered.</p><p>Customers leave.</p>"
+        "<h2>How the AI Answers</h2><p>It books the visit.</p><ul><li>Scheduling</li></ul>"
+        "<h2>Dealer Results</h2><p>Bookings climbed.</p><p>Staff focus on sales.</p>"
+    ),
+    "components": [
+        {"type": "pull_quote", "content": "Every call is a customer", "insert_after_paragraph": 2},
+        {"type": "stat_highlight", "number": "3x", "description": "Faster response", "insert_after_paragraph": 4},
+        {"type": "case_study", "title": "Valley Motors", "challenge": "Missed calls", "solution": "AI receptionist",
+         "results": ["18% more sales"], "insert_after_heading": "Dealer Results"},
+        {"type": "sidebar", "title": "Setup Checklist", "content": "<ul><li>Forward calls</li></ul>",
+         "insert_after_heading": "How the AI Answers"},
+    ],
+}
+HERO = "https://replicate.delivery/hero.jpg"
+SECTION_IMAGES = [
+    {"heading": "The Missed Call Problem", "url": "https://replicate.delivery/s1.jpg"},
+    {"heading": "How the AI Answers", "url": "https://replicate.delivery/s2.jpg"},
+    {"heading": "Dealer Results", "url": "https://replicate.delivery/s3.jpg"},
+]
+EXPECTED = [
+    HERO, "s1.jpg", "s2.jpg", "s3.jpg", "AI Receptionists &amp; the 24/7 Dealership",
+    "The Missed Call Problem", "How the AI Answers", "Dealer Results", "Staff focus on sales.",
+    "Every call is a customer", "43%", "Phone coverage", "3x", "Valley Motors", "Forward calls",
+    "magazine-article-wrapper",
+]
+SAMPLE_TEXT = ["Sarah Chen", "Silent Revolution", "Green Revolution", "rooftop farming", "placeholder-"]
+
+
+def test_all_layouts_render():
+    """Every layout renders the whole article and none of its sample text"""
+    layouts = available_layouts()
+    print(f"Layouts: {layouts}")
+    assert layouts == sorted(LAYOUT_SLOTS)
+    assert len(layouts) == len(os.listdir(layout_engine.LAYOUT_DIR))
+
+    for name in layouts:
+        html = render_article_layout(ARTICLE, HERO, SECTION_IMAGES, layout_style=name)
+        assert html, f"{name} did not render"
+        missing = [text for text in EXPECTED if text not in html]
+        leftover = [text for text in SAMPLE_TEXT if text in html]
+        assert not missing, f"{name} is missing {missing}"
+        assert not leftover, f"{name} still contains sample text {leftover}"
+        assert "<h1>AI Receptionists</h1>" not in html, f"{name} kept the article <h1>"
+        assert html.index("Opening paragraph.") < html.index("The Missed Call Problem") < html.index("Dealer Results")
+    return True
+
+
+def test_render_is_fast():
+    """Rendering takes milliseconds, not an LLM round trip"""
+    layout_engine.preload_layouts()
+    runs = 50
+    started = time.monotonic()
+    for i in range(runs):
+        render_article_layout(ARTICLE, HERO, SECTION_IMAGES, layout_style=available_layouts()[i % 7])
+    average_ms = (time.monotonic() - started) * 1000 / runs
+    print(f"Average render: {average_ms:.2f}ms")
+    assert average_ms < 50
+    return True
+
+
+def test_brand_colors_and_fallbacks():
+    """Brand colors replace the palette; missing images and unknown layouts degrade gracefully"""
+    html = render_article_layout(ARTICLE, HERO, SECTION_IMAGES, layout_style="tech_digital",
+                                 brand_colors={"primary": "#123456", "accent": "#abcdef"})
+    assert "--brand-color: #123456" in html and "--accent-color: #abcdef" in html
+
+    default = render_article_layout(ARTICLE, HERO, SECTION_IMAGES, layout_style="tech_digital")
+    assert "--brand-color: #1f6feb" in default, "Layout palette should be the default"
+
+    fallback = render_article_layout(ARTICLE, HERO, SECTION_IMAGES, layout_style="no_such_layout")
+    assert fallback == render_article_layout(ARTICLE, HERO, SECTION_IMAGES, layout_style=layout_engine.DEFAULT_LAYOUT)
+
+    # One section image failed - its section still renders, without an empty <img>
+    html = render_article_layout(ARTICLE, HERO, SECTION_IMAGES[:1], layout_style="lifestyle_luxury")
+    assert "Dealer Results" in html and 'src=""' not in html and "url('')" not in html
+    return True
+
+
+def test_layout_preferences_endpoint():
+    """Users choose a layout and premium Claude formatting"""
+    with app.app_context():
+        user = User(email=f"layout{datetime.utcnow().timestamp()}@example.com", credit_balance=0,
+                    total_articles_generated=0, total_spent=0.0)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+
+    assert client.post("/api/update_brand_colors", json={"article_layout": "nope"}).status_code == 400
+    response = client.post("/api/update_brand_colors", json={"article_layout": "bold_editorial",
+                                                             "premium_formatting": True})
+    assert response.status_code == 200
+
+    profile = client.get("/api/profile").get_json()
+    print(f"Profile layout: {profile['article_layout']}, premium={profile['premium_formatting']}")
+    assert profile["article_layout"] == "bold_editorial" and profile["premium_formatting"] is True
+    assert "tech_digital" in profile["available_layouts"]
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("LAYOUT ENGINE TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_all_layouts_render(),
+            test_render_is_fast(),
+            test_brand_colors_and_fallbacks(),
+            test_layout_preferences_endpoint(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All layout engine tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Layout engine tests failed")
+    sys.exit(1)
@@ -0,0 +1,166 @@
+"""
+Test script for local-mode image embedding.
+
+Runs entirely locally - requests.get is replaced with a fake that serves
+canned image bytes after a delay:
+1. Section images download concurrently, in order, failures as None
+2. _swap_image_urls rebuilds the HTML in one pass with the same result as
+   replacing URLs one at a time
+3. Failed images are removed (img tags and background-image declarations)
+
+Run with: python test_local_mode_embedding.py
+"""
+
+import re
+import sys
+import time
+import random
+import threading
+
+import requests
+import image_cache
+import openai_integration_v4 as v4
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("local_embedding_")
+
+
+def setup_module():
+    """Temporary database (metrics helpers use the app) and an empty image cache"""
+    ENV.start()
+    ENV.patch(image_cache, "_cache", image_cache.ImageCache(root=ENV.path("cache")))
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class _FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.headers = {"Content-Type": "image/jpeg"}
+
+    def raise_for_status(self):
+        pass
+
+
+def _sequential_swap(html, replacements):
+    """Reference implementation: one full-document pass per URL."""
+    for tmp_url, final_url in replacements.items():
+        if final_url:
+            html = html.replace(tmp_url, final_url)
+            continue
+        escaped = re.escape(tmp_url)
+        html = re.sub(rf"<img\b[^>]*{escaped}[^>]*>", "", html)
+        html = re.sub(rf"background-image:\s*url\(['\"]?{escaped}['\"]?\);?", "", html)
+        html = html.replace(tmp_url, "")
+    return html
+
+
+def test_downloads_run_concurrently():
+    """Four 0.3s downloads finish in about one download time"""
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fake_get(url, timeout=None):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.3)
+        with lock:
+            active[0] -= 1
+        if "broken" in url:
+            raise requests.exceptions.ConnectionError("expired")
+        return _FakeResponse(url.encode())
+
+    original = requests.get
+    requests.get = fake_get
+    try:
+        started = time.monotonic()
+        results = v4.download_images_as_base64([
+            "https://replicate.delivery/a.jpg", None, "https://replicate.delivery/broken.jpg",
+            "https://replicate.delivery/c.jpg", "https://replicate.delivery/d.jpg"
+        ])
+        elapsed = time.monotonic() - started
+    finally:
+        requests.get = original
+
+    print(f"Downloaded 4 images in {elapsed:.2f}s (peak concurrency {peak[0]})")
+    assert elapsed < 0.6, "Downloads ran serially"
+    assert results[1] is None and results[2] is None
+    assert results[0].startswith("data:image/jpeg;base64,")
+    assert results[3] != results[4]
+    return True
+
+
+def test_single_pass_matches_sequential():
+    """One-pass substitution equals per-URL replacement on random documents"""
+    rng = random.Random(3)
+    urls = [f"https://replicate.delivery/out{i}.jpg" for i in range(5)]
+    urls.append(urls[0] + "?v=2")  # Shares a prefix with another URL
+    snippets = [
+        '<p>text</p>',
+        '<img src="{u}" alt="x">',
+        '<div style="background-image: url(\'{u}\'); color: red">',
+        '.cover {{ background: url(\'{u}\') center/cover; }}',
+        '<a href="{u}">link</a>',
+    ]
+    for _ in range(200):
+        html = "".join(rng.choice(snippets).format(u=rng.choice(urls)) for _ in range(30))
+        replacements = {
+            url: (None if rng.random() < 0.3 else f"data:image/jpeg;base64,{'A' * rng.randint(1, 50)}{i}")
+            for i, url in enumerate(urls)
+        }
+        # The reference replaces one URL at a time, so only compare when no
+        # replaced URL is a prefix of another one
+        safe = {u: r for u, r in replacements.items() if u != urls[0]}
+        assert v4._swap_image_urls(html, safe) == _sequential_swap(html, safe)
+
+        swapped = v4._swap_image_urls(html, replacements)
+        assert "replicate.delivery" not in swapped
+        if replacements[urls[-1]]:
+            assert urls[-1] not in swapped and (replacements[urls[-1]] in swapped or urls[-1] not in html)
+    return True
+
+
+def test_failed_images_removed_and_large_documents():
+    """Failed URLs drop their img/background; big data URIs are swapped in one pass"""
+    hero = "https://replicate.delivery/hero.jpg"
+    dead = "https://replicate.delivery/dead.jpg"
+    html = (f'<div class="cover" style="background-image: url(\'{hero}\');"><h1>T</h1></div>'
+            f'<img class="side-image" src="{dead}" alt="x"><div style="background-image: url({dead});">H</div>'
+            + "<p>filler paragraph</p>" * 20000)
+    big = "data:image/jpeg;base64," + "B" * 3_000_000
+
+    started = time.monotonic()
+    swapped = v4._swap_image_urls(html, {hero: big, dead: None})
+    elapsed = time.monotonic() - started
+
+    print(f"Swapped into {len(swapped) / 1e6:.1f}MB document in {elapsed * 1000:.0f}ms")
+    assert swapped.count(big) == 1
+    assert dead not in swapped and "<img" not in swapped
+    assert '<div style="">H</div>' in swapped
+    assert v4._swap_image_urls(html, {}) == html
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("LOCAL MODE EMBEDDING TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_downloads_run_concurrently(),
+            test_single_pass_matches_sequential(),
+            test_failed_images_removed_and_large_documents(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All local mode embedding tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Local mode embedding tests failed")
+    sys.exit(1)
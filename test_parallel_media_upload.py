@@ -0,0 +1,178 @@
+"""
+Test script for the parallel WordPress media upload path.
+
+Runs entirely locally - image downloads are replaced with an in-memory
+fake and each test site gets a WordPressClient whose session answers
+/media uploads after a short sleep:
+1. Results come back in input order however the uploads finish
+2. A failed download or upload leaves None in its slot without
+   affecting the other images
+3. Uploads to one site never exceed the per-site "wordpress" limit, even
+   across concurrent articles, while another site is not held back
+
+Run with: python test_parallel_media_upload.py
+"""
+
+import sys
+import time
+import random
+import threading
+
+import requests
+
+import provider_limits
+import wordpress_client
+import openai_integration_v4 as v4
+from wordpress_integration import WordPressSite
+
+SITE_LIMIT = 2
+
+
+class _FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = {}
+        self.text = "" if payload else "Internal Server Error"
+
+    def json(self):
+        return self._payload
+
+
+class _FakeSession:
+    """Answers /media uploads after a random delay and tracks uploads in flight."""
+
+    def __init__(self, base_url, fail_bodies=()):
+        self.base_url = base_url
+        self.fail_bodies = set(fail_bodies)
+        self.current = 0
+        self.peak = 0
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers=None, data=None, **kwargs):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+            self.uploads += 1
+            number = self.uploads
+        try:
+            time.sleep(random.uniform(0.02, 0.08))
+        finally:
+            with self._lock:
+                self.current -= 1
+
+        if data in self.fail_bodies:
+            return _FakeResponse(500)
+        return _FakeResponse(201, {"id": 100 + number, "source_url": f"{self.base_url}/uploads/{data.decode()}.jpg"})
+
+    def close(self):
+        pass
+
+
+def _install_site(base_url, fail_bodies=()):
+    """A WordPressSite whose pooled client talks to a fake session."""
+    session = _FakeSession(base_url, fail_bodies)
+    client = wordpress_client.WordPressClient(base_url, max_retries=0)
+    client.session = session
+    with wordpress_client._clients_lock:
+        wordpress_client._clients[base_url] = client
+    return WordPressSite(999, base_url, "editor", "app-password"), session
+
+
+class _PatchedImages:
+    """Serve image bytes (the URL's name) from memory and skip recompression and caching."""
+
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+
+    def fetch(self, url):
+        if url in self.missing:
+            raise requests.exceptions.ConnectionError(f"404 {url}")
+        return url.rsplit("/", 1)[1].encode(), "image/jpeg"
+
+    def __enter__(self):
+        self._original = v4.fetch_image, v4.optimize_image, v4.get_image_cache, provider_limits.PROVIDER_CONCURRENCY["wordpress"]
+        v4.fetch_image = self.fetch
+        v4.optimize_image = lambda data, max_width, content_type="image/jpeg": (data, content_type)
+        v4.get_image_cache = lambda: type("NoCache", (), {"put": lambda self, *args, **kwargs: None})()
+        provider_limits.PROVIDER_CONCURRENCY["wordpress"] = SITE_LIMIT
+        return self
+
+    def __exit__(self, *exc):
+        v4.fetch_image, v4.optimize_image, v4.get_image_cache, limit = self._original
+        provider_limits.PROVIDER_CONCURRENCY["wordpress"] = limit
+        return False
+
+
+def test_results_keep_input_order():
+    """Media come back in tmp_urls order, None entries stay None"""
+    site, _ = _install_site("https://order.test")
+    urls = [f"https://replicate.delivery/img{i}" for i in range(6)] + [None]
+
+    with _PatchedImages():
+        media = v4.persist_media_to_wordpress(urls, user_id=999, site=site)
+
+    print(f"Uploaded: {[(item or {}).get('source_url') for item in media]}")
+    assert [item["source_url"] for item in media[:6]] == [f"https://order.test/uploads/img{i}.jpg" for i in range(6)]
+    assert media[6] is None
+    assert len({item["id"] for item in media[:6]}) == 6
+    return True
+
+
+def test_partial_failure():
+    """A failed download and a rejected upload only lose their own images"""
+    site, _ = _install_site("https://partial.test", fail_bodies={b"ok3"})
+    urls = [f"https://replicate.delivery/ok{i}" for i in range(5)]
+    urls[1] = "https://replicate.delivery/expired"
+
+    with _PatchedImages(missing={urls[1]}):
+        media = v4.persist_media_to_wordpress(urls, user_id=999, site=site)
+
+    print(f"Partial failure: {[(item or {}).get('source_url') for item in media]}")
+    assert media[1] is None and media[3] is None
+    assert [media[i]["source_url"] for i in (0, 2, 4)] == [f"https://partial.test/uploads/ok{i}.jpg" for i in (0, 2, 4)]
+    return True
+
+
+def test_per_site_limit():
+    """Two articles uploading to one site share its limit; another site runs alongside"""
+    busy_site, busy = _install_site("https://busy.test")
+    other_site, other = _install_site("https://other.test")
+    results = {}
+
+    def _article(name, site, count):
+        urls = [f"https://replicate.delivery/{name}{i}" for i in range(count)]
+        results[name] = v4.persist_media_to_wordpress(urls, user_id=999, site=site)
+
+    with _PatchedImages():
+        threads = [
+            threading.Thread(target=_article, args=("a", busy_site, 6)),
+            threading.Thread(target=_article, args=("b", busy_site, 6)),
+            threading.Thread(target=_article, args=("c", other_site, 6)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    print(f"Peak uploads in flight: busy.test={busy.peak}, other.test={other.peak} (limit {SITE_LIMIT})")
+    assert busy.uploads == 12 and other.uploads == 6
+    assert busy.peak <= SITE_LIMIT and other.peak <= SITE_LIMIT
+    assert busy.peak == SITE_LIMIT, "Uploads to one site did not run in parallel"
+    assert all(item and item["source_url"] for media in results.values() for item in media)
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("PARALLEL MEDIA UPLOAD TEST")
+    print("=" * 80)
+
+    results = [test_results_keep_input_order(), test_partial_failure(), test_per_site_limit()]
+
+    if all(results):
+        print("\n[OK] All parallel media upload tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Parallel media upload tests failed")
+    sys.exit(1)
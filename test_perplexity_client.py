@@ -0,0 +1,206 @@
+"""
+Test script for the pooled, rate-limited Perplexity client.
+
+Runs entirely locally against a fake Perplexity API served over HTTP/1.1
+on 127.0.0.1 and a temporary SQLite database:
+1. The token bucket is shared by separate processes - a burst from three
+   processes is smoothed to the configured rate
+2. A 429 with Retry-After is waited out (pausing the shared bucket) and
+   retried instead of failing the article
+3. 5xx responses are retried with backoff; 4xx errors are not
+4. Requests reuse one pooled keep-alive connection
+5. generate_blog_post_ideas survives a rate-limited burst
+
+Run with: python test_perplexity_client.py
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app_v3 import app
+import perplexity_client
+import perplexity_ai_integration
+from job_settings import JobSettings
+from perplexity_client import PerplexityClient, SharedTokenBucket, backoff_delay
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("perplexity_client_")
+
+
+def setup_module():
+    """Temporary database and fast backoff of this script"""
+    ENV.start(settings={perplexity_client: {"PERPLEXITY_BACKOFF_BASE": 0.01}})
+
+
+def teardown_module():
+    ENV.stop()
+
+
+def _bucket():
+    """A generous limiter on this script's own bucket file"""
+    return SharedTokenBucket(ENV.path("bucket.json"), rate_per_minute=6000)
+
+
+class _FakePerplexity(BaseHTTPRequestHandler):
+    """Chat completions endpoint answering with a scripted list of statuses."""
+
+    protocol_version = "HTTP/1.1"
+    script = []  # [(status, headers)] - 200 once exhausted
+    seen = []  # (time, client port)
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with _FakePerplexity.lock:
+            _FakePerplexity.seen.append((time.monotonic(), self.client_address[1]))
+            status, headers = _FakePerplexity.script.pop(0) if _FakePerplexity.script else (200, {})
+
+        payload = {"choices": [{"message": {"content": "Fresh research"}}]} if status == 200 else {"error": "x"}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+SERVER = ThreadingHTTPServer(("127.0.0.1", 0), _FakePerplexity)
+SERVER.daemon_threads = True
+threading.Thread(target=SERVER.serve_forever, daemon=True).start()
+URL = f"http://127.0.0.1:{SERVER.server_address[1]}/chat/completions"
+
+
+def _reset(script=()):
+    _FakePerplexity.script = list(script)
+    _FakePerplexity.seen = []
+    if os.path.exists(ENV.path("bucket.json")):
+        os.remove(ENV.path("bucket.json"))
+
+
+def _take_tokens(path, count, queue):
+    bucket = SharedTokenBucket(path, rate_per_minute=1200, burst=2)  # 20 per second
+    for _ in range(count):
+        bucket.acquire()
+        queue.put(time.time())
+
+
+def test_bucket_shared_across_processes():
+    """15 requests from 3 processes: 2 burst immediately, the rest at 20/s"""
+    path = ENV.path("shared_bucket.json")
+    ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=_take_tokens, args=(path, 5, queue)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    stamps = sorted(queue.get(timeout=30) for _ in range(15))
+    for process in processes:
+        process.join(timeout=30)
+
+    span = stamps[-1] - stamps[0]
+    print(f"15 tokens across 3 processes in {span:.2f}s (expected >= {13 / 20:.2f}s)")
+    assert all(process.exitcode == 0 for process in processes)
+    assert span >= 13 / 20 - 0.05
+    # No window of the sequence ever ran faster than burst + rate
+    for i, stamp in enumerate(stamps):
+        assert stamp - stamps[0] >= (i - 2) / 20 - 0.05, (i, stamp - stamps[0])
+    return True
+
+
+def test_retry_after_honored():
+    """A 429 pauses every client on the bucket for Retry-After, then succeeds"""
+    _reset(script=[(429, {"Retry-After": "1"})])
+    client = PerplexityClient(bucket=_bucket())
+    started = time.monotonic()
+    response = client.post(URL, json={"model": "sonar"})
+    elapsed = time.monotonic() - started
+
+    print(f"429 + Retry-After: 1 -> {response.status_code} after {elapsed:.2f}s")
+    assert response.status_code == 200 and len(_FakePerplexity.seen) == 2
+    assert elapsed >= 1.0
+    assert _FakePerplexity.seen[1][0] - _FakePerplexity.seen[0][0] >= 1.0
+
+    # The pause is shared: another process's bucket sees it too
+    _bucket().pause(0.5)
+    assert _bucket().try_acquire() > 0.3
+    return True
+
+
+def test_server_errors_retried_client_errors_not():
+    """502/503 are retried with backoff; a 400 is returned at once"""
+    _reset(script=[(502, {}), (503, {})])
+    client = PerplexityClient(bucket=_bucket(), max_retries=3)
+    assert client.post(URL, json={}).status_code == 200
+    assert len(_FakePerplexity.seen) == 3
+
+    _reset(script=[(400, {})])
+    assert client.post(URL, json={}).status_code == 400
+    assert len(_FakePerplexity.seen) == 1
+
+    _reset(script=[(503, {})] * 5)
+    assert client.post(URL, json={}).status_code == 503
+    assert len(_FakePerplexity.seen) == 4  # First attempt + 3 retries
+
+    assert backoff_delay(1, retry_after="7") == 7.0
+    assert backoff_delay(1, retry_after="3600") == perplexity_client.PERPLEXITY_BACKOFF_MAX
+    assert backoff_delay(3) <= perplexity_client.PERPLEXITY_BACKOFF_BASE * 4
+    return True
+
+
+def test_connections_pooled():
+    """Sequential requests reuse one keep-alive connection"""
+    _reset()
+    client = PerplexityClient(bucket=_bucket())
+    for _ in range(5):
+        client.post(URL, json={})
+    ports = {port for _, port in _FakePerplexity.seen}
+    print(f"5 requests over {len(ports)} connection(s)")
+    assert len(ports) == 1
+    return True
+
+
+def test_research_survives_burst():
+    """A rate-limited research call waits and retries instead of returning []"""
+    _reset(script=[(429, {"Retry-After": "0.2"}), (429, {})])
+    ENV.patch(perplexity_ai_integration, "PERPLEXITY_API_URL", URL)
+    ENV.patch(perplexity_client, "_client", PerplexityClient(bucket=_bucket()))
+    with app.app_context():
+        ideas = perplexity_ai_integration.generate_blog_post_ideas(
+            "Spring tire promotions", 1, settings=JobSettings(1, perplexity_api_token="pplx-test"), fresh=True
+        )
+
+    assert ideas == ["Fresh research"] and len(_FakePerplexity.seen) == 3
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("PERPLEXITY CLIENT TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_bucket_shared_across_processes(),
+            test_retry_after_honored(),
+            test_server_errors_retried_client_errors_not(),
+            test_connections_pooled(),
+            test_research_survives_burst(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All Perplexity client tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Perplexity client tests failed")
+    sys.exit(1)
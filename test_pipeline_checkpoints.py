@@ -0,0 +1,204 @@
+"""
+Test script for checkpointed pipeline stages and job resume.
+
+Runs entirely locally against a temporary SQLite database:
+1. CheckpointStore round-trips artifacts and replaces them on re-save
+2. A re-run pipeline restores completed stages and only runs the rest
+3. Expired image checkpoints are re-run, and so is everything after them
+4. /api/jobs/<id>/resume re-queues a failed job and charges it again
+5. A resumed run reuses the WordPress post an earlier attempt created
+
+Run with: python test_pipeline_checkpoints.py
+"""
+
+import sys
+from datetime import datetime, timedelta
+
+from app_v3 import app, db, User, GenerationJob, PipelineCheckpoint
+from pipeline_executor import Stage, PipelineError, run_pipeline
+from pipeline_checkpoints import CheckpointStore
+import generation_jobs
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("pipeline_checkpoints_")
+
+
+def setup_module():
+    """Temporary database of this script"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+def _graph(ran, fail_at=None):
+    """story -> prompts -> images -> format, recording which stages ran"""
+    def _stage(name, value):
+        def _run(**kwargs):
+            ran.append(name)
+            if name == fail_at:
+                raise PipelineError(f"{name} failed")
+            return value
+        return _run
+
+    return [
+        Stage("story", _stage("story", "article"), outputs=["article"]),
+        Stage("prompts", _stage("prompts", ["p1", "p2"]), inputs=["article"], outputs=["prompts"]),
+        Stage("images", _stage("images", ["u1", "u2"]), inputs=["prompts"], outputs=["images"],
+              checkpoint_ttl=60),
+        Stage("format", _stage("format", "<html>"), inputs=["article", "images"], outputs=["html"]),
+    ]
+
+
+def test_store_round_trip():
+    """Artifacts are saved per stage, replaced on re-save and cleared"""
+    with app.app_context():
+        store = CheckpointStore("run-store")
+        assert store.save("story", {"article": {"title": "A"}})
+        assert store.save("story", {"article": {"title": "B"}})
+        assert store.get("story") == {"article": {"title": "B"}}
+        assert store.get("missing") is None
+        assert PipelineCheckpoint.query.filter_by(run_id="run-store").count() == 1
+        assert store.clear() == 1
+        assert store.get("story") is None
+    return True
+
+
+def test_resume_skips_completed_stages():
+    """A failed run resumes at the first incomplete stage"""
+    with app.app_context():
+        store = CheckpointStore("run-resume")
+
+        ran = []
+        try:
+            run_pipeline(_graph(ran, fail_at="format"), name="Test", checkpoints=store)
+            assert False, "format should have failed"
+        except PipelineError as e:
+            assert e.stage == "format"
+
+        ran = []
+        values = run_pipeline(_graph(ran), name="Test", checkpoints=store)
+        print(f"Resumed run executed: {ran}")
+        assert ran == ["format"]
+        assert values["html"] == "<html>" and values["images"] == ["u1", "u2"]
+        assert values["_timings"]["story"] == 0.0
+    return True
+
+
+def test_expired_checkpoint_cascades():
+    """Stale image URLs are regenerated and their dependents re-run"""
+    with app.app_context():
+        store = CheckpointStore("run-expired")
+        run_pipeline(_graph([]), name="Test", checkpoints=store)
+
+        row = PipelineCheckpoint.query.filter_by(run_id="run-expired", stage="images").first()
+        row.created_at = datetime.utcnow() - timedelta(hours=2)
+        db.session.commit()
+
+        ran = []
+        run_pipeline(_graph(ran), name="Test", checkpoints=store)
+        print(f"Run with expired images executed: {ran}")
+        assert sorted(ran) == ["format", "images"]
+    return True
+
+
+def test_resume_endpoint_requeues_failed_job():
+    """Failed jobs are re-queued with the same id and charged again"""
+    with app.app_context():
+        GenerationJob.query.delete()
+        user = User(email=f"resume{datetime.utcnow().timestamp()}@example.com", credit_balance=3,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+
+    job_id = client.post("/api/create_test_post", json={"blog_post_idea": "AI in dentistry", "local_mode": True}).get_json()["job_id"]
+    assert client.post(f"/api/jobs/{job_id}/resume").status_code == 409, "Queued job must not be resumable"
+
+    with app.app_context():
+        generation_jobs.claim_next_job("worker-a")
+        generation_jobs.fail_job(job_id, "Formatting failed")
+        assert User.query.get(user_id).credit_balance == 3
+
+    response = client.post(f"/api/jobs/{job_id}/resume")
+    print(f"Resume: {response.status_code} {response.get_json()}")
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["job_id"] == job_id and body["status"] == "queued" and body["error"] is None
+
+    with app.app_context():
+        assert User.query.get(user_id).credit_balance == 2
+        assert GenerationJob.query.get(job_id).credit_status == "charged"
+    assert client.post("/api/jobs/unknown/resume").status_code == 404
+    return True
+
+
+def test_resume_reuses_wordpress_post():
+    """The created WordPress post is checkpointed, so a resumed run never publishes twice"""
+    import app_v3
+    import email_notification
+
+    with app.app_context():
+        user = User(email=f"wp{datetime.utcnow().timestamp()}@example.com", credit_balance=3,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    hero = "https://wp.test/uploads/hero.jpg"
+    processed = {"title": "Resumable", "content": f'<div style="x"><img src="{hero}">' + "x" * 5000 + "</div>",
+                 "hero_image_url": hero, "hero_media_id": 7, "all_images": [hero]}
+    created = []
+
+    def _create_post(title, content, uid, image_url=None, site=None, featured_media_id=None):
+        created.append(title)
+        return {"id": 100 + len(created), "title": {"rendered": title}, "content": {"rendered": content}}
+
+    originals = (app_v3.create_blog_post_with_images_v4, app_v3.create_wordpress_post,
+                 app_v3.resolve_wordpress_site, email_notification.send_article_notification_with_attachment)
+    app_v3.create_blog_post_with_images_v4 = lambda *args, **kwargs: (processed, None)
+    app_v3.create_wordpress_post = _create_post
+    app_v3.resolve_wordpress_site = lambda uid: None
+    email_notification.send_article_notification_with_attachment = lambda **kwargs: True
+    try:
+        with app.app_context():
+            first, _ = app_v3.create_blog_post_v3(user_id, manual_topic="research", run_id="run-wp-post")
+            # The attempt dies before its job completes; the resumed job runs again
+            second, _ = app_v3.create_blog_post_v3(user_id, manual_topic="research", run_id="run-wp-post")
+    finally:
+        (app_v3.create_blog_post_with_images_v4, app_v3.create_wordpress_post,
+         app_v3.resolve_wordpress_site, email_notification.send_article_notification_with_attachment) = originals
+
+    print(f"Posts created: {len(created)}, first ID {first['id']}, resumed ID {second['id']}")
+    assert len(created) == 1 and first["id"] == second["id"] == 101
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("PIPELINE CHECKPOINT TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_store_round_trip(),
+            test_resume_skips_completed_stages(),
+            test_expired_checkpoint_cascades(),
+            test_resume_endpoint_requeues_failed_job(),
+            test_resume_reuses_wordpress_post(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All pipeline checkpoint tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Pipeline checkpoint tests failed")
+    sys.exit(1)
@@ -0,0 +1,243 @@
+"""
+Test script for the stage graph pipeline executor.
+
+Runs entirely locally with sleep-based fake stages:
+1. Independent stages overlap (wall time = critical path, not sum)
+2. A failing stage aborts the pipeline and un-started stages never run
+3. Invalid graphs (missing producer, cycle) are rejected up front
+4. The V4 orchestrator graph overlaps uploads with formatting and swaps
+   the permanent image URLs into the formatted HTML
+5. Early outputs emitted by a running stage start its dependents at once
+
+Run with: python test_pipeline_executor.py
+"""
+
+import sys
+import time
+import threading
+
+from pipeline_executor import Stage, PipelineError, run_pipeline
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("pipeline_executor_")
+
+
+def setup_module():
+    """Temporary database (the brand color lookup hits the DB)"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+def _sleeper(seconds, value):
+    def _stage(**kwargs):
+        time.sleep(seconds)
+        return value
+    return _stage
+
+
+def test_independent_stages_overlap():
+    """Diamond graph runs in critical-path time"""
+    stages = [
+        Stage("root", _sleeper(0.2, "r"), outputs=["a"]),
+        Stage("left", _sleeper(0.5, "l"), inputs=["a"], outputs=["b"]),
+        Stage("right", _sleeper(0.5, "r"), inputs=["a"], outputs=["c"]),
+        Stage("join", lambda b, c: b + c, inputs=["b", "c"], outputs=["d"]),
+    ]
+
+    started = time.monotonic()
+    values = run_pipeline(stages, name="Test")
+    elapsed = time.monotonic() - started
+
+    print(f"Diamond graph: {elapsed:.2f}s (sum of stages 1.2s)")
+    assert values["d"] == "lr"
+    assert elapsed < 1.0, "left and right did not overlap"
+    assert set(values["_timings"]) == {"root", "left", "right", "join"}
+    return True
+
+
+def test_failure_cancels_downstream():
+    """PipelineError carries the stage name and dependents never start"""
+    ran = []
+
+    def failing():
+        raise PipelineError("Story generation failed")
+
+    def downstream(story):
+        ran.append("downstream")
+
+    stages = [
+        Stage("story", failing, outputs=["story"]),
+        Stage("downstream", downstream, inputs=["story"], outputs=["done"]),
+    ]
+
+    try:
+        run_pipeline(stages, name="Test")
+    except PipelineError as e:
+        print(f"Pipeline failed at {e.stage}: {e}")
+        assert e.stage == "story"
+        assert str(e) == "Story generation failed"
+        assert not ran
+        return True
+
+    raise AssertionError("PipelineError not raised")
+
+
+def test_invalid_graphs_rejected():
+    """Missing producers and cycles fail before anything runs"""
+    for stages in (
+        [Stage("a", _sleeper(0, 1), inputs=["missing"], outputs=["x"])],
+        [Stage("a", _sleeper(0, 1), inputs=["y"], outputs=["x"]),
+         Stage("b", _sleeper(0, 1), inputs=["x"], outputs=["y"])],
+    ):
+        try:
+            run_pipeline(stages, name="Test")
+        except ValueError as e:
+            print(f"Rejected: {e}")
+        else:
+            raise AssertionError("Invalid graph accepted")
+    return True
+
+
+def test_early_outputs_start_dependents():
+    """A streaming stage's emitted value starts dependents before it returns"""
+    events = []
+
+    def streaming(emit):
+        time.sleep(0.1)
+        emit("head", "title")
+        time.sleep(0.5)
+        events.append(("story_done", time.monotonic()))
+        return "body"
+
+    def hero(head):
+        events.append(("hero_started", time.monotonic()))
+        return head.upper()
+
+    values = run_pipeline([
+        Stage("story", streaming, outputs=["body"], early_outputs=["head"]),
+        Stage("hero", hero, inputs=["head"], outputs=["hero"]),
+    ], name="Test")
+    times = dict(events)
+    print(f"Hero started {times['story_done'] - times['hero_started']:.2f}s before story finished")
+    assert values["hero"] == "TITLE" and values["body"] == "body"
+    assert times["hero_started"] < times["story_done"] - 0.3
+
+    # A stage that never emits its early output fails instead of hanging
+    try:
+        run_pipeline([
+            Stage("story", lambda emit: "body", outputs=["body"], early_outputs=["head"]),
+            Stage("hero", hero, inputs=["head"], outputs=["hero"]),
+        ], name="Test")
+        assert False, "Missing early output not detected"
+    except PipelineError as e:
+        assert e.stage == "story"
+    return True
+
+
+def test_v4_graph_overlaps_persistence_with_formatting():
+    """V4 orchestrator formats against Replicate URLs while uploading"""
+    import openai_integration_v4 as v4
+
+    active = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def track(name, seconds):
+        with lock:
+            active.add(name)
+            if "format" in active and any(n.startswith("persist") for n in active):
+                overlaps.append(set(active))
+        time.sleep(seconds)
+        with lock:
+            active.discard(name)
+
+    def fake_story(**kwargs):
+        time.sleep(0.3)
+        return {
+            "title": "Test Title",
+            "html": "<h2>One</h2><p>a</p><h2>Two</h2><p>b</p>",
+            "executive_summary": {"intro": "Summary"},
+            "components": []
+        }
+
+    def fake_images(prompts, user_id, aspect_ratio="16:9", aspect_ratios=None, settings=None):
+        time.sleep(0.3)
+        return [f"https://replicate.delivery/{p.replace(' ', '_')}.jpg" for p in prompts]
+
+    def fake_persist(tmp_urls, user_id, first_index=0, max_width=None, site=None):
+        track(f"persist{first_index}", 0.4)
+        return [{"id": first_index + i + 100, "source_url": url.replace("replicate.delivery", "wp.example.com")}
+                if url else None for i, url in enumerate(tmp_urls)]
+
+    def fake_layout(article_data, hero_image_url, section_images, **kwargs):
+        track("format", 0.4)
+        imgs = "".join(f'<img src="{img["url"]}">' for img in section_images)
+        return f'<div style="background-image: url(\'{hero_image_url}\');">{article_data["title"]}</div>{imgs}'
+
+    patches = {
+        "generate_clean_article": fake_story,
+        "generate_hero_image_prompt": lambda **kw: "hero shot",
+        "generate_contextual_image_prompts": lambda **kw: {"section_prompts": [
+            {"section_heading": "One", "prompt": "section one"},
+            {"section_heading": "Two", "prompt": "section two"}
+        ]},
+        "generate_images_with_seedream": fake_images,
+        "persist_media_to_wordpress": fake_persist,
+        "render_article_layout": fake_layout,
+        "format_article_with_claude": lambda **kw: None,
+        "_save_raw_article": lambda *a, **kw: None,
+        "_save_formatted_article": lambda *a, **kw: None,
+        "_save_article_to_database": lambda **kw: None,
+    }
+    originals = {name: getattr(v4, name) for name in patches}
+    for name, fake in patches.items():
+        setattr(v4, name, fake)
+
+    try:
+        started = time.monotonic()
+        result, error = v4.create_blog_post_with_images_v4("research", 1, "prompt")
+        elapsed = time.monotonic() - started
+    finally:
+        for name, original in originals.items():
+            setattr(v4, name, original)
+
+    print(f"V4 graph: {elapsed:.2f}s, error={error}")
+    assert error is None, error
+    assert overlaps, "WordPress uploads did not overlap with formatting"
+    assert "replicate.delivery" not in result["content"]
+    assert result["hero_image_url"] == "https://wp.example.com/hero_shot.jpg"
+    assert result["hero_media_id"] == 100 and result["section_media_ids"] == [101, 102]
+    assert result["section_images"] == [
+        "https://wp.example.com/section_one.jpg",
+        "https://wp.example.com/section_two.jpg"
+    ]
+    # story 0.3 + images 0.3 + format 0.4 (uploads hidden behind formatting)
+    assert elapsed < 1.4, f"Pipeline took {elapsed:.2f}s - stages ran serially"
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("PIPELINE EXECUTOR TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_independent_stages_overlap(),
+            test_failure_cancels_downstream(),
+            test_invalid_graphs_rejected(),
+            test_early_outputs_start_dependents(),
+            test_v4_graph_overlaps_persistence_with_formatting(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All pipeline executor tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Pipeline executor tests failed")
+    sys.exit(1)
@@ -0,0 +1,199 @@
+"""
+Test script for per-run pipeline metrics.
+
+Runs entirely locally against a temporary SQLite database with fake
+LLM responses and Replicate predictions:
+1. Stage threads record into the run started by collect_run_metrics
+2. Nested collectors join the outer run and only it is stored
+3. Stored runs aggregate into percentiles and Prometheus text
+4. /api/admin/metrics is admin-only, /metrics accepts METRICS_TOKEN
+
+Run with: python test_pipeline_metrics.py
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from app_v3 import app, db, User, ArticleMetrics
+from pipeline_executor import Stage, run_pipeline
+import pipeline_metrics
+from pipeline_metrics import (
+    collect_run_metrics,
+    record_llm_call,
+    record_replicate_prediction,
+    record_bytes,
+    record_stage_timings,
+    track_stage
+)
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("pipeline_metrics_")
+
+
+def setup_module():
+    """Temporary database and scrape token of this script"""
+    ENV.start(environ={"METRICS_TOKEN": "scrape-secret"})
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class _Usage:
+    def __init__(self, input_tokens, output_tokens):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class _Response:
+    def __init__(self, input_tokens, output_tokens):
+        self.usage = _Usage(input_tokens, output_tokens)
+
+
+class _Prediction:
+    def __init__(self, prediction_id, predict_time):
+        self.id = prediction_id
+        self.status = "succeeded"
+        self.metrics = {"predict_time": predict_time}
+
+
+def _fake_run(story_seconds):
+    """Run a two-stage graph whose stages record LLM, Replicate and byte metrics."""
+    def story():
+        time.sleep(story_seconds)
+        record_llm_call("story", "gpt-5", _Response(1000, 4000), story_seconds)
+        return "article"
+
+    def images(article):
+        record_replicate_prediction(_Prediction(f"p-{story_seconds}", 12.5))
+        record_bytes(downloaded=2048, uploaded=2048)
+        return ["u1"]
+
+    values = run_pipeline([
+        Stage("story", story, outputs=["article"]),
+        Stage("images", images, inputs=["article"], outputs=["images"]),
+    ], name="Test")
+    record_stage_timings(values["_timings"])
+
+
+def test_run_collects_from_stage_threads():
+    """Stage threads record tokens, cost, predictions and bytes into one row"""
+    with app.app_context():
+        ArticleMetrics.query.delete()
+        db.session.commit()
+
+        with collect_run_metrics(user_id=None, run_id="run-1") as run:
+            _fake_run(0.1)
+            with track_stage("email"):
+                pass
+            run.status = "succeeded"
+
+        row = ArticleMetrics.query.filter_by(run_id="run-1").one()
+        print(f"Stored run: stages={row.stage_seconds} tokens={row.input_tokens}+{row.output_tokens} "
+              f"llm=${row.llm_cost_usd} images=${row.image_cost_usd}")
+        assert row.status == "succeeded"
+        assert set(row.stage_seconds) == {"story", "images", "email"}
+        assert row.stage_seconds["story"] >= 0.1
+        assert (row.input_tokens, row.output_tokens) == (1000, 4000)
+        assert abs(row.llm_cost_usd - (1000 * 1.25 + 4000 * 10.0) / 1_000_000) < 1e-9
+        assert row.image_cost_usd == pipeline_metrics.SEEDREAM_IMAGE_COST_USD
+        assert row.replicate_seconds == 12.5
+        assert (row.bytes_downloaded, row.bytes_uploaded) == (2048, 2048)
+    return True
+
+
+def test_nested_collectors_store_once():
+    """Inner collect_run_metrics joins the outer run"""
+    with app.app_context():
+        before = ArticleMetrics.query.count()
+        with collect_run_metrics(run_id="outer") as outer:
+            with collect_run_metrics(run_id="inner") as inner:
+                assert inner is outer
+        assert ArticleMetrics.query.count() == before + 1
+        assert ArticleMetrics.query.filter_by(run_id="outer").one().status == "failed"
+
+        # Outside a run, recording is a no-op
+        record_llm_call("story", "gpt-5", _Response(1, 1), 0.1)
+        record_bytes(downloaded=10)
+    return True
+
+
+def test_percentiles_and_prometheus():
+    """Stored runs aggregate into percentiles and Prometheus summaries"""
+    assert pipeline_metrics.percentile([1, 2, 3, 4, 5], 0.5) == 3
+    assert pipeline_metrics.percentile([10, 20], 0.9) == 19
+    assert pipeline_metrics.percentile([], 0.5) is None
+
+    with app.app_context():
+        ArticleMetrics.query.delete()
+        db.session.commit()
+        for seconds in (0.05, 0.1, 0.15):
+            with collect_run_metrics(run_id=f"agg-{seconds}") as run:
+                _fake_run(seconds)
+                run.status = "succeeded"
+
+        aggregate = pipeline_metrics.aggregate_metrics(days=1)
+        story = aggregate["stages"]["story"]
+        print(f"Story stage percentiles: {story}")
+        assert aggregate["runs"] == 3 and aggregate["succeeded"] == 3
+        assert story["count"] == 3 and story["p50"] <= story["p90"] <= story["p99"]
+        assert aggregate["llm_calls"]["story"]["output_tokens"]["p50"] == 4000
+        assert aggregate["replicate_predict_seconds"]["p95"] == 12.5
+
+        text = pipeline_metrics.render_prometheus(aggregate)
+    assert '# TYPE ezwai_stage_duration_seconds summary' in text
+    assert 'ezwai_stage_duration_seconds_count{stage="story"} 3' in text
+    assert 'ezwai_llm_output_tokens{call="story",quantile="0.5"} 4000' in text
+    assert 'ezwai_pipeline_runs{status="succeeded"} 3' in text
+    return True
+
+
+def test_endpoints_require_admin_or_token():
+    """Admin endpoint is admin-only; /metrics accepts the bearer token"""
+    with app.app_context():
+        users = []
+        for is_admin in (False, True):
+            user = User(email=f"metrics{is_admin}{datetime.utcnow().timestamp()}@example.com", credit_balance=0,
+                        total_articles_generated=0, total_spent=0.0, is_admin=is_admin)
+            db.session.add(user)
+            db.session.commit()
+            users.append(user.id)
+
+    client = app.test_client()
+    assert client.get("/metrics").status_code == 403
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200 and response.content_type.startswith("text/plain")
+    assert b"ezwai_stage_duration_seconds" in response.data
+
+    for user_id, expected in zip(users, (403, 200)):
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(user_id)
+            sess["_fresh"] = True
+        assert client.get("/api/admin/metrics?days=1").status_code == expected
+
+    print(f"Admin metrics: {client.get('/api/admin/metrics').get_json()['runs']} runs")
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("PIPELINE METRICS TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_run_collects_from_stage_threads(),
+            test_nested_collectors_store_once(),
+            test_percentiles_and_prometheus(),
+            test_endpoints_require_admin_or_token(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All pipeline metrics tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Pipeline metrics tests failed")
+    sys.exit(1)
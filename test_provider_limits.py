@@ -0,0 +1,213 @@
+"""
+Test script for the scheduler's worker pool and per-provider concurrency limits.
+
+Runs entirely locally against a temporary SQLite database - article
+generation and provider calls are replaced with fakes that sleep:
+1. A limiter never lets more than its limit run, multi-unit requests
+   are capped at the limit and waiters are served in arrival order
+2. Articles of users due at the same time run side by side, never more
+   than SCHEDULER_WORKERS at once
+3. Provider calls from many articles are capped per provider, and
+   WordPress is limited per site
+
+Run with: python test_provider_limits.py
+"""
+
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+
+from app_v3 import app, db, User, ScheduleSlot, CompletedJob
+import scheduler_v3
+import provider_limits
+from provider_limits import ConcurrencyLimiter, provider_slot, provider_limit_stats
+from schedule_slots import slot_local_datetime
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("provider_limits_")
+
+
+def setup_module():
+    """Temporary database of this script"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class InFlight:
+    """Counts concurrent entries and remembers the peak."""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.current -= 1
+
+
+def _run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_limiter_bounds_concurrency():
+    """At most `limit` units in use; large requests are capped and not starved"""
+    limiter = ConcurrencyLimiter(3)
+    in_flight = InFlight()
+
+    def work(_):
+        units, _ = limiter.acquire()
+        try:
+            with in_flight:
+                time.sleep(0.02)
+        finally:
+            limiter.release(units)
+
+    _run_threads(work, 12)
+    print(f"Peak with limit 3: {in_flight.peak}")
+    assert in_flight.peak == 3
+    assert limiter.stats()["in_use"] == 0 and limiter.stats()["waits"] > 0
+
+    assert limiter.acquire(10)[0] == 3  # Capped at the limit
+    limiter.release(3)
+
+    # A two-unit request queued before a stream of one-unit requests goes first
+    order = []
+    held, _ = limiter.acquire(2)
+    big = threading.Thread(target=lambda: order.append(("big", limiter.acquire(2)[0])))
+    big.start()
+    while limiter.stats()["waiting"] < 1:
+        time.sleep(0.001)
+    small = threading.Thread(target=lambda: order.append(("small", limiter.acquire(1)[0])))
+    small.start()
+    while limiter.stats()["waiting"] < 2:
+        time.sleep(0.001)
+    assert order == []  # One unit is free, but the small request waits its turn
+    limiter.release(held)
+    big.join()
+    limiter.release(2)
+    small.join()
+    limiter.release(1)
+    assert [name for name, _ in order] == ["big", "small"], order
+    return True
+
+
+def test_scheduler_runs_due_slots_in_bounded_pool():
+    """Ten users due at 9:00 run concurrently, SCHEDULER_WORKERS at a time"""
+    now = datetime.utcnow().replace(microsecond=0)
+    user_ids = []
+    with app.app_context():
+        for i in range(10):
+            user = User(email=f"pool{i}@example.com", credit_balance=1, total_articles_generated=0,
+                        total_spent=0.0, is_admin=False)
+            db.session.add(user)
+            db.session.flush()
+            user_ids.append(user.id)
+            due_at = now - timedelta(seconds=10)
+            local = slot_local_datetime(due_at)
+            db.session.add(ScheduleSlot(user_id=user.id, weekday=local.weekday(), slot="time1",
+                                        local_time=local.strftime("%H:%M"), next_run_at=due_at))
+        db.session.commit()
+
+    in_flight = InFlight()
+    ran = []
+
+    def fake_generate(user_id):
+        with in_flight:
+            time.sleep(0.2)
+        ran.append(user_id)
+        return {"title": f"Post {user_id}"}, None
+
+    originals = scheduler_v3.generate_scheduled_article, scheduler_v3.publish_scheduled_article
+    original_workers = scheduler_v3.SCHEDULER_WORKERS
+    scheduler_v3.generate_scheduled_article = fake_generate
+    scheduler_v3.publish_scheduled_article = lambda user_id, article, **kwargs: ({"title": {"rendered": article["title"]}}, None)
+    scheduler_v3.SCHEDULER_WORKERS = 4
+    scheduler_v3.shutdown_dispatch_pool()
+    try:
+        started = time.monotonic()
+        futures = scheduler_v3.check_and_trigger_jobs(now)
+        dispatched = time.monotonic() - started
+        scheduler_v3.shutdown_dispatch_pool()
+        elapsed = time.monotonic() - started
+    finally:
+        scheduler_v3.generate_scheduled_article, scheduler_v3.publish_scheduled_article = originals
+        scheduler_v3.SCHEDULER_WORKERS = original_workers
+
+    print(f"Dispatched {len(futures)} articles in {dispatched:.2f}s, all done in {elapsed:.2f}s, "
+          f"peak {in_flight.peak} concurrent")
+    assert len(futures) == 10 and sorted(ran) == sorted(user_ids)
+    assert dispatched < 0.2  # The tick does not wait for the articles
+    assert in_flight.peak == 4
+    assert elapsed < 10 * 0.2  # Faster than one after another
+    with app.app_context():
+        jobs = CompletedJob.query.filter(CompletedJob.user_id.in_(user_ids)).all()
+        assert len(jobs) == 10 and all(job.completed_time for job in jobs)
+    return True
+
+
+def test_provider_calls_are_capped():
+    """Concurrent articles share provider limits; WordPress is limited per site"""
+    original = dict(provider_limits.PROVIDER_CONCURRENCY)
+    provider_limits.PROVIDER_CONCURRENCY.update(openai=2, wordpress=1)
+    provider_limits._limiters.clear()
+    openai_calls, site_a, site_b = InFlight(), InFlight(), InFlight()
+
+    def article(i):
+        with provider_slot("openai"):
+            with openai_calls:
+                time.sleep(0.03)
+        site, counter = ("https://a.example.com", site_a) if i % 2 else ("https://b.example.com", site_b)
+        with provider_slot("wordpress", site):
+            with counter:
+                time.sleep(0.01)
+
+    try:
+        _run_threads(article, 8)
+        stats = provider_limit_stats()
+    finally:
+        provider_limits.PROVIDER_CONCURRENCY.update(original)
+        provider_limits._limiters.clear()
+
+    print(f"Peaks: openai {openai_calls.peak}, site a {site_a.peak}, site b {site_b.peak}")
+    print(f"Stats: {stats}")
+    assert openai_calls.peak == 2
+    assert site_a.peak == 1 and site_b.peak == 1
+    assert set(stats) == {"openai", "wordpress:https://a.example.com", "wordpress:https://b.example.com"}
+    assert stats["openai"]["waits"] > 0 and stats["openai"]["in_use"] == 0
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("PROVIDER LIMITS TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_limiter_bounds_concurrency(),
+            test_scheduler_runs_due_slots_in_bounded_pool(),
+            test_provider_calls_are_capped(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All provider limit tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Provider limit tests failed")
+    sys.exit(1)
@@ -0,0 +1,233 @@
+"""
+Test script for event-driven Replicate completion (webhooks + fallback poller).
+
+Runs entirely locally - no Replicate account needed:
+1. A fake Replicate API server accepts prediction requests
+2. After a short "inference" delay it fires a signed webhook at our Flask app
+3. generate_images_with_seedream() should wake up from the completion
+   registry and make (almost) no prediction.reload() calls
+
+Run with: python test_replicate_webhooks.py
+"""
+
+import os
+import sys
+import json
+import time
+import hmac
+import base64
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import replicate_completion
+from testing_env import LocalTestEnv
+
+WEBHOOK_SECRET = "whsec_" + base64.b64encode(b"local-test-signing-key").decode("utf-8")
+INFERENCE_SECONDS = 2.0
+
+ENV = LocalTestEnv("replicate_webhooks_")
+
+
+def setup_module():
+    """Fake Replicate credentials and a completion directory of this script"""
+    ENV.start(environ={"REPLICATE_API_TOKEN": "r8_local_test_token", "REPLICATE_WEBHOOK_SECRET": WEBHOOK_SECRET})
+    ENV.patch(replicate_completion, "COMPLETION_DIR", ENV.path("completions"))
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class FakeReplicate:
+    """In-memory prediction store shared by the fake API handler."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.predictions = {}
+        self.get_calls = 0
+        self.counter = 0
+
+    def create(self, body, base_url):
+        with self.lock:
+            self.counter += 1
+            prediction_id = f"fake{self.counter:04d}"
+            prediction = {
+                "id": prediction_id,
+                "model": "bytedance/seedream-4",
+                "version": "fake-version",
+                "status": "starting",
+                "input": body.get("input", {}),
+                "output": None,
+                "logs": "",
+                "error": None,
+                "metrics": {},
+                "created_at": "2025-01-01T00:00:00Z",
+                "urls": {
+                    "get": f"{base_url}/v1/predictions/{prediction_id}",
+                    "cancel": f"{base_url}/v1/predictions/{prediction_id}/cancel"
+                }
+            }
+            self.predictions[prediction_id] = prediction
+
+        webhook = body.get("webhook")
+        threading.Thread(target=self._finish, args=(prediction_id, webhook), daemon=True).start()
+        return prediction
+
+    def _finish(self, prediction_id, webhook):
+        time.sleep(INFERENCE_SECONDS)
+        with self.lock:
+            prediction = self.predictions[prediction_id]
+            prediction["status"] = "succeeded"
+            prediction["output"] = [f"https://replicate.delivery/fake/{prediction_id}.jpg"]
+            payload = json.dumps(prediction).encode("utf-8")
+
+        if webhook:
+            webhook_id = f"msg_{prediction_id}"
+            timestamp = str(int(time.time()))
+            key = base64.b64decode(WEBHOOK_SECRET.split("_", 1)[1])
+            signed = f"{webhook_id}.{timestamp}.".encode("utf-8") + payload
+            signature = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode("utf-8")
+            requests.post(webhook, data=payload, timeout=10, headers={
+                "Content-Type": "application/json",
+                "webhook-id": webhook_id,
+                "webhook-timestamp": timestamp,
+                "webhook-signature": f"v1,{signature}"
+            })
+
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.endswith("/predictions") and "/models/" in self.path:
+                base_url = f"http://{self.headers['Host']}"
+                self._send(201, fake.create(body, base_url))
+            elif self.path.endswith("/cancel"):
+                prediction_id = self.path.split("/")[-2]
+                with fake.lock:
+                    fake.predictions[prediction_id]["status"] = "canceled"
+                    self._send(200, fake.predictions[prediction_id])
+            else:
+                self._send(404, {"detail": "Not found"})
+
+        def do_GET(self):
+            prediction_id = self.path.rstrip("/").split("/")[-1]
+            with fake.lock:
+                fake.get_calls += 1
+                prediction = fake.predictions.get(prediction_id)
+                if prediction:
+                    self._send(200, prediction)
+                else:
+                    self._send(404, {"detail": "Not found"})
+
+    return Handler
+
+
+def _start_server(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_webhook_completion():
+    """Predictions complete via webhooks with no per-second polling"""
+    from werkzeug.serving import make_server
+    from app_v3 import app
+    import openai_integration_v4
+
+    fake = FakeReplicate()
+    replicate_server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(fake))
+    ENV.setenv("REPLICATE_BASE_URL", _start_server(replicate_server))
+
+    app_server = make_server("127.0.0.1", 0, app, threaded=True)
+    ENV.setenv("REPLICATE_WEBHOOK_URL", f"{_start_server(app_server)}/webhook/replicate")
+
+    try:
+        started = time.monotonic()
+        urls = openai_integration_v4.generate_images_with_seedream(
+            ["hero prompt", "section one", "section two", "section three"],
+            user_id=999,
+            aspect_ratios=["16:9", "21:9", "21:9", "21:9"]
+        )
+        elapsed = time.monotonic() - started
+
+        print(f"Results: {urls}")
+        print(f"Elapsed: {elapsed:.1f}s, fallback polls: {fake.get_calls}")
+
+        assert urls == [f"https://replicate.delivery/fake/fake{i:04d}.jpg" for i in range(1, 5)], urls
+        assert elapsed < INFERENCE_SECONDS * 3, "Images were not generated concurrently"
+        assert fake.get_calls == 0, f"Expected webhook completion, got {fake.get_calls} polls"
+        return True
+    finally:
+        replicate_server.shutdown()
+        app_server.shutdown()
+
+
+def test_rejects_bad_signature():
+    """Unsigned or tampered webhooks are rejected"""
+    from app_v3 import app
+
+    client = app.test_client()
+    response = client.post(
+        "/webhook/replicate",
+        data=json.dumps({"id": "forged", "status": "succeeded", "output": ["https://evil/x.jpg"]}),
+        headers={
+            "Content-Type": "application/json",
+            "webhook-id": "msg_forged",
+            "webhook-timestamp": str(int(time.time())),
+            "webhook-signature": "v1,Zm9yZ2Vk"
+        }
+    )
+    print(f"Forged webhook status: {response.status_code}")
+    assert response.status_code == 400
+
+    assert replicate_completion.get_completion("forged") is None
+    return True
+
+
+def test_unawaited_completions_not_kept():
+    """Webhooks nobody in this process waits on go to disk only, and expire"""
+    replicate_completion.record_completion({"id": "unawaited", "status": "succeeded", "output": ["https://x/1.jpg"]})
+    assert "unawaited" not in replicate_completion._local_completions
+    assert replicate_completion.get_completion("unawaited")["output"] == ["https://x/1.jpg"]
+
+    path = replicate_completion._completion_path("unawaited")
+    os.utime(path, (time.time() - 3 * 60 * 60,) * 2)
+    removed = replicate_completion.cleanup_completions()
+    print(f"Expired completion files removed: {removed}")
+    assert removed == 1
+    assert replicate_completion.get_completion("unawaited") is None
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("REPLICATE WEBHOOK COMPLETION TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [test_rejects_bad_signature(), test_unawaited_completions_not_kept(), test_webhook_completion()]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All webhook completion tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Webhook completion tests failed")
+    sys.exit(1)
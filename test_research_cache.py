@@ -0,0 +1,235 @@
+"""
+Test script for the shared Perplexity research cache.
+
+Runs entirely locally against a temporary SQLite database - the Perplexity
+API is replaced with a fake that counts calls:
+1. The same normalized query and writing style is researched once for all
+   users; a different style or recency window is a separate entry
+2. Entries expire after RESEARCH_CACHE_TTL and failed calls are not cached
+3. Beyond RESEARCH_CACHE_MAX_ENTRIES the least recently used entries go
+4. Users with fresh_research (set through /api/profile) skip the lookup and
+   refresh the shared entry
+5. Hit/miss counters are reported in /api/admin/metrics
+
+Run with: python test_research_cache.py
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from app_v3 import app, db, User, ResearchCache
+import research_cache
+import perplexity_ai_integration
+from job_settings import JobSettings
+from perplexity_ai_integration import generate_blog_post_ideas
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("research_cache_")
+
+
+def setup_module():
+    """Temporary database of this script"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class _FakePerplexity:
+    """Replaces the Perplexity client; answers with a numbered research text."""
+
+    def __init__(self, status_code=200):
+        self.calls = []
+        self.status_code = status_code
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.calls.append(json)
+        fake = self
+
+        class _Response:
+            status_code = fake.status_code
+            text = "error"
+
+            def raise_for_status(self):
+                if fake.status_code >= 400:
+                    import requests
+                    raise requests.exceptions.HTTPError(response=self)
+
+            def json(self):
+                return {"choices": [{"message": {"content": f"Research #{len(fake.calls)}"}}],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": 20}}
+
+        return _Response()
+
+    def __enter__(self):
+        self._original = perplexity_ai_integration.get_perplexity_client
+        perplexity_ai_integration.get_perplexity_client = lambda: self
+        return self
+
+    def __exit__(self, *exc):
+        perplexity_ai_integration.get_perplexity_client = self._original
+        return False
+
+
+def _reset():
+    with app.app_context():
+        ResearchCache.query.delete()
+        db.session.commit()
+    for name in research_cache._stats:
+        research_cache._stats[name] = 0
+
+
+def _setup_user(fresh=False):
+    with app.app_context():
+        user = User(email=f"research{datetime.utcnow().timestamp()}@example.com", credit_balance=1,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False, fresh_research=fresh)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _research(query, user_id, writing_style=None):
+    settings = JobSettings(user_id, perplexity_api_token="pplx-test")
+    with app.app_context():
+        return generate_blog_post_ideas(query, user_id, writing_style, settings=settings)
+
+
+def test_shared_across_users():
+    """Normalized queries share one entry; style changes the key"""
+    _reset()
+    first, second = _setup_user(), _setup_user()
+    with _FakePerplexity() as api:
+        a = _research("EV sales trends at car dealerships", first, "Investigative")
+        b = _research("  ev SALES trends at car   dealerships? ", second, "investigative")
+        c = _research("EV sales trends at car dealerships", second, "Opinion")
+        d = _research("EV sales trends at car dealerships", first, "Investigative")
+
+    print(f"4 requests -> {len(api.calls)} Perplexity call(s)")
+    assert len(api.calls) == 2
+    assert a == b == d == ["Research #1"] and c == ["Research #2"]
+    with app.app_context():
+        stats = research_cache.research_cache_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2 and stats["hit_ratio"] == 0.5
+    assert stats["entries"] == 2 and stats["shared_hits"] == 2
+
+    other_recency = research_cache.research_cache_key("EV sales trends at car dealerships", "Investigative",
+                                                      "week", perplexity_ai_integration.PERPLEXITY_MODEL)
+    with app.app_context():
+        assert research_cache.get_cached_research(other_recency) is None
+    return True
+
+
+def test_ttl_and_failures():
+    """Expired entries are re-fetched; errors are never cached"""
+    _reset()
+    user_id = _setup_user()
+    original_ttl = research_cache.RESEARCH_CACHE_TTL
+    research_cache.RESEARCH_CACHE_TTL = 1
+    try:
+        with _FakePerplexity() as api:
+            _research("Used truck financing", user_id)
+            _research("Used truck financing", user_id)
+            time.sleep(1.1)
+            assert _research("Used truck financing", user_id) == ["Research #2"]
+        assert len(api.calls) == 2
+    finally:
+        research_cache.RESEARCH_CACHE_TTL = original_ttl
+
+    with _FakePerplexity(status_code=500) as failing:
+        assert _research("Service department upsells", user_id) == []
+    with _FakePerplexity() as api:
+        assert _research("Service department upsells", user_id) == ["Research #1"]
+    assert len(failing.calls) == 1 and len(api.calls) == 1
+    return True
+
+
+def test_size_bound_evicts_least_recently_used():
+    """Only RESEARCH_CACHE_MAX_ENTRIES entries are kept; recently read ones survive"""
+    _reset()
+    user_id = _setup_user()
+    original_max = research_cache.RESEARCH_CACHE_MAX_ENTRIES
+    research_cache.RESEARCH_CACHE_MAX_ENTRIES = 3
+    try:
+        with _FakePerplexity() as api:
+            for topic in ("topic a", "topic b", "topic c"):
+                _research(topic, user_id)
+                time.sleep(0.01)
+            _research("topic a", user_id)  # Refresh a - b is now least recently used
+            time.sleep(0.01)
+            _research("topic d", user_id)
+        with app.app_context():
+            remaining = sorted(row.query_text for row in ResearchCache.query.all())
+    finally:
+        research_cache.RESEARCH_CACHE_MAX_ENTRIES = original_max
+
+    print(f"Kept: {remaining}, evicted: {research_cache._stats['evicted']}")
+    assert remaining == ["topic a", "topic c", "topic d"]
+    assert len(api.calls) == 4 and research_cache._stats["evicted"] == 1
+    return True
+
+
+def test_fresh_research_opt_out():
+    """An opted-out user always calls Perplexity and refreshes the shared entry"""
+    _reset()
+    shared, fresh = _setup_user(), _setup_user()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(fresh)
+        sess["_fresh"] = True
+    assert client.post("/api/profile", json={"fresh_research": True}).status_code == 200
+    assert client.get("/api/profile").get_json()["fresh_research"] is True
+
+    with _FakePerplexity() as api:
+        _research("Holiday sales event ideas", shared)
+        assert _research("Holiday sales event ideas", fresh) == ["Research #2"]
+        assert _research("Holiday sales event ideas", shared) == ["Research #2"]
+
+    assert len(api.calls) == 2
+    assert research_cache._stats["bypassed"] == 1 and research_cache._stats["hits"] == 1
+    return True
+
+
+def test_admin_metrics_report_counters():
+    """Admins see the cache counters next to the pipeline metrics"""
+    with app.app_context():
+        admin = User(email=f"admin{datetime.utcnow().timestamp()}@example.com", credit_balance=1,
+                     total_articles_generated=0, total_spent=0.0, is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(admin_id)
+        sess["_fresh"] = True
+    body = client.get("/api/admin/metrics").get_json()
+    print(f"Admin research_cache: {body['research_cache']}")
+    assert body["research_cache"]["hits"] == research_cache._stats["hits"]
+    assert body["research_cache"]["entries"] == 1
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("RESEARCH CACHE TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_shared_across_users(),
+            test_ttl_and_failures(),
+            test_size_bound_evicts_least_recently_used(),
+            test_fresh_research_opt_out(),
+            test_admin_metrics_report_counters(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All research cache tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Research cache tests failed")
+    sys.exit(1)
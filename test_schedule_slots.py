@@ -0,0 +1,226 @@
+"""
+Test script for precomputed schedule slots and the scheduler tick.
+
+Runs entirely locally against a temporary SQLite database - article
+generation is replaced with a fake:
+1. Next run times are computed in US/Eastern, across DST changes
+2. /api/save_schedule validates the schedule and recomputes its slots;
+   unchanged slots keep their next run time
+3. A tick finds due slots with one indexed query (no user table scan),
+   runs each once and advances it a week; missed slots are skipped
+4. A slot can only be claimed once
+5. Slots of schedules saved before the upgrade are rebuilt at startup
+
+Run with: python test_schedule_slots.py
+"""
+
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app_v3 import app, db, User, ScheduleSlot, CompletedJob
+import scheduler_v3
+from schedule_slots import next_occurrence, due_slots, claim_slot, rebuild_all_schedule_slots, slot_local_datetime
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("schedule_slots_")
+
+
+def setup_module():
+    """Temporary database of this script"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+def _schedule(times=None):
+    """Weekly schedule with the given {weekday: ("HH:MM", "HH:MM")} enabled."""
+    times = times or {}
+    return [{"enabled": day in times, "time1": times.get(day, ("", ""))[0], "time2": times.get(day, ("", ""))[1]}
+            for day in range(7)]
+
+
+def _setup_user(schedule=None):
+    with app.app_context():
+        user = User(email=f"schedule{datetime.utcnow().timestamp()}@example.com", credit_balance=1,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False, schedule=schedule)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+    return client
+
+
+def _slots(user_id):
+    with app.app_context():
+        return {(row.weekday, row.slot): (row.local_time, row.next_run_at)
+                for row in ScheduleSlot.query.filter_by(user_id=user_id)}
+
+
+def test_next_occurrence_in_eastern_time():
+    """Monday 09:00 Eastern is 14:00 UTC in winter and 13:00 UTC in summer"""
+    winter = next_occurrence(0, "09:00", datetime(2026, 1, 7, 12, 0))  # A Wednesday
+    summer = next_occurrence(0, "09:00", datetime(2026, 7, 8, 12, 0))
+    assert winter == datetime(2026, 1, 12, 14, 0), winter
+    assert summer == datetime(2026, 7, 13, 13, 0), summer
+    # Strictly after: a slot at exactly `after` moves to next week
+    assert next_occurrence(0, "09:00", winter) == winter + timedelta(days=7)
+    # Across the March DST change the UTC time shifts by an hour
+    assert next_occurrence(0, "09:00", datetime(2026, 3, 3, 0, 0)) == datetime(2026, 3, 9, 13, 0)
+    return True
+
+
+def test_save_schedule_recomputes_slots():
+    """Saving a schedule creates, keeps, moves and removes slots"""
+    user_id = _setup_user()
+    client = _client(user_id)
+
+    assert client.post("/api/save_schedule", json={"schedule": [{}] * 3}).status_code == 400
+    bad_time = _schedule({0: ("25:00", "")})
+    assert client.post("/api/save_schedule", json={"schedule": bad_time}).status_code == 400
+    assert not _slots(user_id)
+
+    response = client.post("/api/save_schedule", json={"schedule": _schedule({0: ("09:00", "15:30"), 4: ("8:05", "")})})
+    assert response.status_code == 200
+    first = _slots(user_id)
+    print(f"Slots: {sorted((key, value[0]) for key, value in first.items())}")
+    assert set(first) == {(0, "time1"), (0, "time2"), (4, "time1")}
+    assert first[(4, "time1")][0] == "08:05"
+    assert all(next_run > datetime.utcnow() for _, next_run in first.values())
+
+    client.post("/api/save_schedule", json={"schedule": _schedule({0: ("09:00", "16:00")})})
+    second = _slots(user_id)
+    assert set(second) == {(0, "time1"), (0, "time2")}
+    assert second[(0, "time1")] == first[(0, "time1")]  # Unchanged - keeps its run time
+    assert second[(0, "time2")][0] == "16:00"
+    assert second[(0, "time2")][1] - first[(0, "time2")][1] == timedelta(minutes=30)
+
+    client.post("/api/save_schedule", json={"schedule": _schedule()})
+    assert not _slots(user_id)
+    return True
+
+
+def test_tick_runs_due_slots_once():
+    """One indexed query per tick; each due slot runs once and moves a week ahead"""
+    with app.app_context():
+        ScheduleSlot.query.delete()
+        db.session.commit()
+    runs = []
+    originals = scheduler_v3.generate_scheduled_article, scheduler_v3.publish_scheduled_article
+    scheduler_v3.generate_scheduled_article = lambda user_id: ({"title": "Post"}, None)
+    scheduler_v3.publish_scheduled_article = (
+        lambda user_id, article, **kwargs: runs.append(user_id) or ({"title": {"rendered": article["title"]}}, None)
+    )
+
+    # 40 users scheduled in the future, one due now, one missed hours ago
+    now = datetime.utcnow().replace(microsecond=0)
+    for _ in range(40):
+        _setup_user()
+    due_user, missed_user = _setup_user(), _setup_user()
+    with app.app_context():
+        for user_id in range(1, due_user):
+            db.session.add(ScheduleSlot(user_id=user_id, weekday=0, slot="time1", local_time="09:00",
+                                        next_run_at=now + timedelta(days=1)))
+        for user_id, due_at in ((due_user, now - timedelta(seconds=30)), (missed_user, now - timedelta(hours=3))):
+            local = slot_local_datetime(due_at)
+            db.session.add(ScheduleSlot(user_id=user_id, weekday=local.weekday(), slot="time1",
+                                        local_time=local.strftime("%H:%M"), next_run_at=due_at))
+        db.session.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    try:
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", record)
+            due_slots(now)
+            event.remove(db.engine, "before_cursor_execute", record)
+        print(f"Due-slot lookup: {len(statements)} query - {statements[0].split('WHERE')[1].strip()[:60]}")
+        assert len(statements) == 1 and " user" not in statements[0].split("FROM")[1]
+
+        scheduler_v3.check_and_trigger_jobs(now, wait=True)
+        scheduler_v3.check_and_trigger_jobs(now + timedelta(seconds=60), wait=True)
+    finally:
+        scheduler_v3.generate_scheduled_article, scheduler_v3.publish_scheduled_article = originals
+
+    print(f"Ran articles for users {runs}")
+    assert runs == [due_user]
+    with app.app_context():
+        job = CompletedJob.query.filter_by(user_id=due_user).one()
+        assert job.completed_time is not None and job.post_title == "Post"
+        assert not CompletedJob.query.filter_by(user_id=missed_user).first()
+        for user_id in (due_user, missed_user):
+            slot = ScheduleSlot.query.filter_by(user_id=user_id).one()
+            assert slot.next_run_at > now + timedelta(days=5)  # Next week's occurrence
+        assert not due_slots(now + timedelta(seconds=60))
+    return True
+
+
+def test_claim_is_exclusive():
+    """Two schedulers racing for the same slot - only one wins"""
+    user_id = _setup_user()
+    with app.app_context():
+        slot = ScheduleSlot(user_id=user_id, weekday=2, slot="time2", local_time="10:00",
+                            next_run_at=datetime.utcnow() - timedelta(seconds=5))
+        db.session.add(slot)
+        db.session.commit()
+        slot_id = slot.id
+
+    with app.app_context():
+        first = ScheduleSlot.query.get(slot_id)
+        due_at = first.next_run_at
+        assert claim_slot(first)
+        db.session.expunge_all()
+        # The other scheduler still holds the row as it was before the claim
+        second = ScheduleSlot(id=slot_id, user_id=user_id, weekday=2, slot="time2", local_time="10:00",
+                              next_run_at=due_at)
+        assert not claim_slot(second)
+        row = ScheduleSlot.query.get(slot_id)
+        assert row.last_run_at == due_at and row.next_run_at > datetime.utcnow()
+    return True
+
+
+def test_rebuild_from_saved_schedules():
+    """Schedules saved before the upgrade get slots at daemon startup"""
+    legacy = _setup_user(schedule=_schedule({3: ("07:45", "")}))
+    with app.app_context():
+        assert not ScheduleSlot.query.filter_by(user_id=legacy).first()
+        rebuild_all_schedule_slots()
+    assert set(_slots(legacy)) == {(3, "time1")}
+    assert _slots(legacy)[(3, "time1")][1].weekday() in (3, 4)  # 07:45 Eastern is 11:45/12:45 UTC Thursday
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SCHEDULE SLOTS TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_next_occurrence_in_eastern_time(),
+            test_save_schedule_recomputes_slots(),
+            test_tick_runs_due_slots_once(),
+            test_claim_is_exclusive(),
+            test_rebuild_from_saved_schedules(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All schedule slot tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Schedule slot tests failed")
+    sys.exit(1)
@@ -0,0 +1,297 @@
+"""
+Test script for lead-time pre-generation of scheduled articles.
+
+Runs entirely locally against a temporary SQLite database - article
+generation and WordPress publishing are replaced with fakes:
+1. The lead time is learned from recorded run durations (default until
+   enough runs exist, capped, overridable)
+2. A slot within the lead time is generated early, held, and its
+   WordPress draft is created at the slot time - not before
+3. A held article whose timer is gone (restart, cron mode) is published
+   by the next tick after its slot, exactly once
+4. When workers are busy, the queued article with the earliest slot
+   starts first
+5. A failed publish keeps the article and is retried by the next tick; a
+   run left publishing by a dead scheduler is released and completed
+   without posting twice
+
+Run with: python test_scheduled_pregeneration.py
+"""
+
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+
+from app_v3 import app, db, User, ScheduleSlot, CompletedJob, ArticleMetrics, PipelineCheckpoint
+import scheduler_v3
+import scheduled_jobs
+import schedule_slots
+from schedule_slots import generation_lead_seconds, slot_local_datetime
+from deadline_executor import EarliestDeadlineExecutor
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("scheduled_pregeneration_")
+
+
+def setup_module():
+    """Temporary database of this script"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class FakePipeline:
+    """Stands in for generation and publishing; records when each happened."""
+
+    def __init__(self, generate_seconds=0.0):
+        self.generate_seconds = generate_seconds
+        self.generated = []
+        self.published = []
+        self.lock = threading.Lock()
+
+    def generate(self, user_id):
+        time.sleep(self.generate_seconds)
+        with self.lock:
+            self.generated.append((user_id, datetime.utcnow()))
+        return {"title": f"Post {user_id}", "content": "<p>Body</p>", "hero_image_url": None,
+                "hero_media_id": None}, None
+
+    def publish(self, user_id, article, **kwargs):
+        with self.lock:
+            self.published.append((user_id, datetime.utcnow()))
+        return {"id": 1, "title": {"rendered": article["title"]}}, None
+
+    def __enter__(self):
+        self.originals = scheduler_v3.generate_scheduled_article, scheduler_v3.publish_scheduled_article
+        scheduler_v3.generate_scheduled_article = self.generate
+        scheduler_v3.publish_scheduled_article = self.publish
+        return self
+
+    def __exit__(self, *exc):
+        scheduler_v3.shutdown_dispatch_pool()
+        scheduler_v3.generate_scheduled_article, scheduler_v3.publish_scheduled_article = self.originals
+
+
+def _setup_slot(due_at):
+    """A user with one slot whose next run is due_at; returns the user ID."""
+    with app.app_context():
+        user = User(email=f"pregen{time.time()}@example.com", credit_balance=1, total_articles_generated=0,
+                    total_spent=0.0, is_admin=False)
+        db.session.add(user)
+        db.session.flush()
+        local = slot_local_datetime(due_at)
+        db.session.add(ScheduleSlot(user_id=user.id, weekday=local.weekday(), slot="time1",
+                                    local_time=local.strftime("%H:%M"), next_run_at=due_at))
+        db.session.commit()
+        return user.id
+
+
+def _fixed_lead(seconds):
+    ENV.patch(schedule_slots, "SCHEDULER_LEAD_TIME", None if seconds is None else str(seconds))
+
+
+def test_lead_time_learned_from_runs():
+    """p95 of recent successful runs plus the margin, default until enough runs, capped"""
+    _fixed_lead(None)
+    with app.app_context():
+        assert generation_lead_seconds() == schedule_slots.SCHEDULER_LEAD_DEFAULT
+
+        for seconds in range(100, 1100, 100):  # 100 .. 1000
+            db.session.add(ArticleMetrics(status="succeeded", total_seconds=float(seconds)))
+        db.session.add(ArticleMetrics(status="failed", total_seconds=5000.0))  # Ignored
+        db.session.add(ArticleMetrics(status="succeeded", total_seconds=4000.0,
+                                      created_at=datetime.utcnow() - timedelta(days=30)))  # Too old
+        db.session.commit()
+
+        learned = generation_lead_seconds()
+        print(f"Learned lead time: {learned}s")
+        assert learned == 955 + schedule_slots.SCHEDULER_LEAD_MARGIN  # p95 of 100..1000 is 955
+
+        original_max = schedule_slots.SCHEDULER_LEAD_MAX
+        schedule_slots.SCHEDULER_LEAD_MAX = 600
+        try:
+            assert generation_lead_seconds() == 600
+        finally:
+            schedule_slots.SCHEDULER_LEAD_MAX = original_max
+
+        _fixed_lead(0)
+        assert generation_lead_seconds() == 0
+    return True
+
+
+def test_article_held_until_slot():
+    """Generated within the lead time, published at the slot time to the second"""
+    _fixed_lead(60)
+    now = datetime.utcnow().replace(microsecond=0)
+    due_at = now + timedelta(seconds=3)
+    user_id = _setup_slot(due_at)
+    later_user = _setup_slot(now + timedelta(minutes=5))  # Outside the lead time
+
+    with FakePipeline() as pipeline:
+        futures = scheduler_v3.check_and_trigger_jobs(now, wait=True)
+        assert len(futures) == 1
+        assert [uid for uid, _ in pipeline.generated] == [user_id]
+        assert pipeline.published == []  # Held, not published early
+        with app.app_context():
+            assert PipelineCheckpoint.query.filter_by(stage=scheduler_v3.HELD_ARTICLE_STAGE).count() == 1
+            assert CompletedJob.query.filter_by(user_id=user_id).one().completed_time is None
+
+        # The next tick before the slot neither re-generates nor publishes
+        scheduler_v3.check_and_trigger_jobs(now + timedelta(seconds=1), wait=True)
+        assert len(pipeline.generated) == 1 and pipeline.published == []
+
+        deadline = time.time() + 10
+        while not pipeline.published and time.time() < deadline:
+            time.sleep(0.05)
+
+    assert [uid for uid, _ in pipeline.published] == [user_id]
+    published_at = pipeline.published[0][1]
+    print(f"Generated at {pipeline.generated[0][1]}, slot {due_at}, published at {published_at}")
+    assert due_at <= published_at < due_at + timedelta(seconds=1)
+    assert later_user not in [uid for uid, _ in pipeline.generated]
+    with app.app_context():
+        job = CompletedJob.query.filter_by(user_id=user_id).one()
+        assert job.completed_time is not None and job.post_title == f"Post {user_id}"
+        assert not PipelineCheckpoint.query.filter_by(stage=scheduler_v3.HELD_ARTICLE_STAGE).count()
+        assert ScheduleSlot.query.filter_by(user_id=user_id).one().next_run_at > due_at + timedelta(days=6)
+    return True
+
+
+def test_held_article_published_after_restart():
+    """A held article outlives its process and is published once by a later tick"""
+    _fixed_lead(60)
+    now = datetime.utcnow().replace(microsecond=0)
+    due_at = now + timedelta(seconds=1)
+    user_id = _setup_slot(due_at)
+
+    with FakePipeline() as pipeline:
+        scheduler_v3.check_and_trigger_jobs(now, wait=True)
+        scheduler_v3.shutdown_dispatch_pool()  # Scheduler stops; the held timer is cancelled
+        time.sleep(max((due_at - datetime.utcnow()).total_seconds(), 0) + 0.5)
+        assert pipeline.published == []
+
+        # Restarted scheduler: ticks from two instances race for the article
+        tick_at = datetime.utcnow()
+        threads = [threading.Thread(target=scheduler_v3.check_and_trigger_jobs, args=(tick_at,))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        scheduler_v3.check_and_trigger_jobs(tick_at + timedelta(seconds=60))
+
+    print(f"Published after restart: {pipeline.published}")
+    assert [uid for uid, _ in pipeline.published] == [user_id]
+    assert len(pipeline.generated) == 1
+    with app.app_context():
+        assert CompletedJob.query.filter_by(user_id=user_id).one().completed_time is not None
+    return True
+
+
+def test_failed_publish_retried():
+    """Publish errors and dead publishers never lose the held article or post it twice"""
+    _fixed_lead(60)
+    now = datetime.utcnow().replace(microsecond=0)
+    user_id = _setup_slot(now)
+    failures = []
+
+    with FakePipeline() as pipeline:
+        healthy_publish = scheduler_v3.publish_scheduled_article
+
+        def flaky_publish(uid, article, **kwargs):
+            if not failures:
+                failures.append(kwargs.get("notify_failure"))
+                return None, "WordPress returned 503"
+            return healthy_publish(uid, article, **kwargs)
+
+        scheduler_v3.publish_scheduled_article = flaky_publish
+        scheduler_v3.check_and_trigger_jobs(now, wait=True)
+        with app.app_context():
+            job = CompletedJob.query.filter_by(user_id=user_id).one()
+            assert job.status == "held" and job.completed_time is None
+            assert PipelineCheckpoint.query.filter_by(stage=scheduler_v3.HELD_ARTICLE_STAGE).count() == 1
+        assert failures == [False], "A publish that will be retried must not email the failure"
+
+        scheduler_v3.check_and_trigger_jobs(now + timedelta(seconds=60))
+        assert [uid for uid, _ in pipeline.published] == [user_id]
+
+        # A scheduler that created the draft and died before completing its run
+        crashed_user = _setup_slot(now)
+
+        def crashing_publish(uid, article, checkpoints=None, **kwargs):
+            checkpoints.save(scheduler_v3.POSTED_ARTICLE_STAGE, {"post": {"id": 7, "title": {"rendered": "Posted"}}})
+            raise RuntimeError("Scheduler killed mid-publish")
+
+        scheduler_v3.publish_scheduled_article = crashing_publish
+        scheduler_v3.check_and_trigger_jobs(now, wait=True)
+        with app.app_context():
+            assert CompletedJob.query.filter_by(user_id=crashed_user).one().status == "publishing"
+
+        # Once the publish lease expires, the next tick completes the run without posting again
+        scheduler_v3.publish_scheduled_article = healthy_publish
+        posts_before = len(pipeline.published)
+        expired = datetime.utcnow() + timedelta(seconds=scheduled_jobs.SCHEDULER_PUBLISH_TIMEOUT_SECONDS + 1)
+        scheduler_v3.check_and_trigger_jobs(expired)
+
+    print(f"Publish failures: {failures}, published: {pipeline.published}")
+    assert len(pipeline.published) == posts_before, "Draft of the crashed publish was posted again"
+    with app.app_context():
+        for uid in (user_id, crashed_user):
+            job = CompletedJob.query.filter_by(user_id=uid).one()
+            assert job.status == "completed" and job.completed_time is not None
+            run_id = scheduler_v3.scheduled_run_id(job.id, job.owner)
+            assert not PipelineCheckpoint.query.filter_by(run_id=run_id).count()
+    return True
+
+
+def test_earliest_deadline_first():
+    """With workers busy, queued articles start in slot order, not claim order"""
+    pool = EarliestDeadlineExecutor(max_workers=1)
+    started, release = [], threading.Event()
+    pool.submit(datetime(2026, 1, 1, 8, 0), release.wait)
+    base = datetime(2026, 1, 1, 9, 0)
+    futures = [pool.submit(base + timedelta(minutes=minutes), started.append, minutes)
+               for minutes in (30, 5, 20, 5)]
+    release.set()
+    pool.shutdown(wait=True)
+    print(f"Start order (minutes past 9:00): {started}")
+    assert started == [5, 5, 20, 30]
+    assert all(future.done() for future in futures)
+
+    failing = EarliestDeadlineExecutor(max_workers=2)
+    future = failing.submit(base, lambda: 1 / 0)
+    failing.shutdown(wait=True)
+    assert isinstance(future.exception(), ZeroDivisionError)
+    try:
+        failing.submit(base, print)
+        assert False, "submit after shutdown must fail"
+    except RuntimeError:
+        pass
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SCHEDULED PRE-GENERATION TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_lead_time_learned_from_runs(),
+            test_article_held_until_slot(),
+            test_held_article_published_after_restart(),
+            test_failed_publish_retried(),
+            test_earliest_deadline_first(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All scheduled pre-generation tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Scheduled pre-generation tests failed")
+    sys.exit(1)
@@ -0,0 +1,243 @@
+"""
+Test script for lease-based claiming of scheduled runs across scheduler instances.
+
+Runs entirely locally: several forked scheduler processes tick against one
+temporary SQLite database, with article generation and publishing replaced
+by fakes that report back to the test:
+1. Leases are compare-and-set: a stalled owner whose run was taken over
+   cannot hold its article, and runs out of attempts are failed
+2. The heartbeat renews started runs only - queued ones can be taken over
+3. Three scheduler processes share a burst of slots: every slot is
+   generated and published exactly once, by more than one process
+4. A scheduler that dies mid-generation is failed over: another process
+   takes the run over when the lease expires and publishes it
+
+Run with: python test_scheduler_leases.py
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+from datetime import datetime, timedelta
+
+from app_v3 import app, db, User, ScheduleSlot, CompletedJob
+import scheduler_v3
+import scheduled_jobs
+from scheduled_jobs import (
+    lease_slot, start_run, renew_leases, take_over_expired_runs, hold_run,
+    RUN_RUNNING, RUN_HELD, RUN_COMPLETED, RUN_FAILED
+)
+import schedule_slots
+from schedule_slots import slot_local_datetime
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("scheduler_leases_")
+
+
+def setup_module():
+    """Temporary database of this script; slots start generating when due"""
+    ENV.start(settings={schedule_slots: {"SCHEDULER_LEAD_TIME": "0"}})
+
+
+def teardown_module():
+    ENV.stop()
+
+
+CTX = multiprocessing.get_context("fork")
+LEASE_SECONDS = 1
+GENERATE_SECONDS = 1.2  # Longer than the lease - only the heartbeat keeps it
+
+
+def _setup_slots(count, due_at):
+    """Users with one slot each, due at due_at; returns their IDs."""
+    user_ids = []
+    with app.app_context():
+        for _ in range(count):
+            user = User(email=f"lease{time.time()}@example.com", credit_balance=1, total_articles_generated=0,
+                        total_spent=0.0, is_admin=False)
+            db.session.add(user)
+            db.session.flush()
+            local = slot_local_datetime(due_at)
+            db.session.add(ScheduleSlot(user_id=user.id, weekday=local.weekday(), slot="time1",
+                                        local_time=local.strftime("%H:%M"), next_run_at=due_at))
+            user_ids.append(user.id)
+        db.session.commit()
+    return user_ids
+
+
+def _node(name, seconds, events, crash_user=None):
+    """One scheduler process: tick until `seconds` have passed."""
+    with app.app_context():
+        db.engine.dispose()  # Do not share the parent's connections
+
+    def generate(user_id):
+        if user_id == crash_user:
+            os._exit(3)  # Scheduler dies mid-generation
+        time.sleep(GENERATE_SECONDS)
+        events.put(("generated", user_id, name))
+        return {"title": f"Post {user_id}"}, None
+
+    def publish(user_id, article, **kwargs):
+        events.put(("published", user_id, name))
+        return {"id": user_id, "title": {"rendered": article["title"]}}, None
+
+    scheduler_v3.generate_scheduled_article = generate
+    scheduler_v3.publish_scheduled_article = publish
+    scheduler_v3.SCHEDULER_WORKERS = 2
+    scheduler_v3.SCHEDULER_HEARTBEAT_SECONDS = 0.25
+    scheduled_jobs.SCHEDULER_LEASE_SECONDS = LEASE_SECONDS
+
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        scheduler_v3.check_and_trigger_jobs()
+        time.sleep(0.1)
+    scheduler_v3.shutdown_dispatch_pool()
+
+
+def _run_nodes(specs, events):
+    """Start one process per (name, seconds, crash_user) and wait for all of them."""
+    with app.app_context():
+        db.engine.dispose()
+    processes = [CTX.Process(target=_node, args=(name, seconds, events, crash_user))
+                 for name, seconds, crash_user in specs]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+    return [process.exitcode for process in processes]
+
+
+def _drain(events):
+    drained = []
+    while True:
+        try:
+            drained.append(events.get(timeout=0.5))
+        except Exception:
+            return drained
+
+
+def test_lease_is_compare_and_set():
+    """A stalled owner loses its run to a takeover and cannot hold the article"""
+    (user_id,) = _setup_slots(1, datetime.utcnow().replace(microsecond=0) - timedelta(seconds=5))
+    with app.app_context():
+        slot = ScheduleSlot.query.filter_by(user_id=user_id).one()
+        stale = ScheduleSlot(id=slot.id, user_id=user_id, weekday=slot.weekday, slot=slot.slot,
+                             local_time=slot.local_time, next_run_at=slot.next_run_at)
+        job_id = lease_slot(slot, "node-a")
+        db.session.expunge_all()
+        assert job_id and lease_slot(stale, "node-b") is None  # The slot was claimed once
+        assert CompletedJob.query.filter_by(user_id=user_id).count() == 1
+        assert start_run(job_id, "node-a")
+
+        # node-a stalls past its lease; node-b takes over and starts the run
+        CompletedJob.query.filter_by(id=job_id).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        assert take_over_expired_runs("node-a") == []  # Never from yourself
+        assert [run[0] for run in take_over_expired_runs("node-b")] == [job_id]
+        assert take_over_expired_runs("node-c") == []  # Lease renewed by the takeover
+        assert start_run(job_id, "node-b")
+
+        # node-a wakes up: it can neither renew nor hold its (now stale) article
+        assert renew_leases("node-a") == 0
+        assert not hold_run(job_id, "node-a")
+        assert hold_run(job_id, "node-b")
+        job = CompletedJob.query.get(job_id)
+        print(f"Run {job_id}: status {job.status}, owner {job.owner}, attempts {job.attempts}")
+        assert job.status == RUN_HELD and job.owner == "node-b" and job.attempts == 2
+
+        # A run that keeps killing its scheduler is failed after SCHEDULER_MAX_ATTEMPTS starts
+        CompletedJob.query.filter_by(id=job_id).update({
+            "status": RUN_RUNNING, "attempts": scheduled_jobs.SCHEDULER_MAX_ATTEMPTS,
+            "lease_expires_at": datetime.utcnow() - timedelta(seconds=1)
+        })
+        db.session.commit()
+        assert take_over_expired_runs("node-c") == []
+        assert CompletedJob.query.get(job_id).status == RUN_FAILED
+    return True
+
+
+def test_heartbeat_renews_started_runs_only():
+    """Started runs stay leased; queued ones expire and can move to an idle scheduler"""
+    due_at = datetime.utcnow().replace(microsecond=0) - timedelta(seconds=5)
+    started_user, queued_user = _setup_slots(2, due_at)
+    with app.app_context():
+        started = lease_slot(ScheduleSlot.query.filter_by(user_id=started_user).one(), "node-a")
+        queued = lease_slot(ScheduleSlot.query.filter_by(user_id=queued_user).one(), "node-a")
+        assert start_run(started, "node-a")
+
+        later = datetime.utcnow() + timedelta(seconds=scheduled_jobs.SCHEDULER_LEASE_SECONDS + 10)
+        assert renew_leases("node-a", now=later - timedelta(seconds=5)) == 1
+        taken = take_over_expired_runs("node-b", now=later)
+        assert [run[0] for run in taken] == [queued]
+        assert not start_run(queued, "node-a")  # node-a's queued copy is skipped
+        assert take_over_expired_runs("node-b", limit=0, now=later + timedelta(days=1)) == []  # No idle workers
+    return True
+
+
+def test_schedulers_share_slots_exactly_once():
+    """Three scheduler processes, twelve slots: each generated and published once"""
+    user_ids = set(_setup_slots(12, datetime.utcnow().replace(microsecond=0) - timedelta(seconds=5)))
+    events = CTX.Queue()
+    started = time.monotonic()
+    exit_codes = _run_nodes([("node-1", 8, None), ("node-2", 8, None), ("node-3", 8, None)], events)
+    elapsed = time.monotonic() - started
+    drained = _drain(events)
+
+    generated = [(user_id, node) for kind, user_id, node in drained if kind == "generated" and user_id in user_ids]
+    published = [(user_id, node) for kind, user_id, node in drained if kind == "published" and user_id in user_ids]
+    per_node = {node: sum(1 for _, n in generated if n == node) for node in ("node-1", "node-2", "node-3")}
+    print(f"Exit codes {exit_codes}; generated per node {per_node}; {len(published)} published in {elapsed:.1f}s")
+    assert exit_codes == [0, 0, 0]
+    assert sorted(user_id for user_id, _ in generated) == sorted(user_ids)
+    assert sorted(user_id for user_id, _ in published) == sorted(user_ids)
+    assert sum(1 for count in per_node.values() if count) >= 2  # The burst was shared
+    with app.app_context():
+        jobs = CompletedJob.query.filter(CompletedJob.user_id.in_(user_ids)).all()
+        assert len(jobs) == 12 and all(job.status == RUN_COMPLETED and job.attempts == 1 for job in jobs)
+    return True
+
+
+def test_failover_after_scheduler_dies():
+    """The run of a crashed scheduler is taken over once its lease expires"""
+    (user_id,) = _setup_slots(1, datetime.utcnow().replace(microsecond=0) - timedelta(seconds=5))
+    events = CTX.Queue()
+    exit_codes = _run_nodes([("node-crash", 5, user_id)], events)
+    assert exit_codes == [3]
+    with app.app_context():
+        job = CompletedJob.query.filter_by(user_id=user_id).one()
+        assert job.status == RUN_RUNNING and job.attempts == 1
+
+    started = time.monotonic()
+    exit_codes = _run_nodes([("node-b", LEASE_SECONDS + GENERATE_SECONDS + 2, None)], events)
+    drained = [event for event in _drain(events) if event[1] == user_id]
+    print(f"After failover ({time.monotonic() - started:.1f}s): {drained}")
+    assert exit_codes == [0]
+    assert drained == [("generated", user_id, "node-b"), ("published", user_id, "node-b")]
+    with app.app_context():
+        job = CompletedJob.query.filter_by(user_id=user_id).one()
+        assert job.status == RUN_COMPLETED and job.attempts == 2 and job.post_title == f"Post {user_id}"
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SCHEDULER LEASES TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_lease_is_compare_and_set(),
+            test_heartbeat_renews_started_runs_only(),
+            test_schedulers_share_slots_exactly_once(),
+            test_failover_after_scheduler_dies(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All scheduler lease tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Scheduler lease tests failed")
+    sys.exit(1)
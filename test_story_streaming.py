@@ -0,0 +1,171 @@
+"""
+Test script for streaming story generation.
+
+Runs entirely locally - the OpenAI client is replaced with a fake that
+streams a canned article JSON in small deltas:
+1. The incremental parser reports every field and <h2> section for any chunking
+2. generate_clean_article reports title/executive_summary long before the
+   stream ends and still returns the complete article
+3. Without a callback (or with STORY_STREAMING off) the blocking call is used
+
+Run with: python test_story_streaming.py
+"""
+
+import sys
+import json
+import random
+
+import story_generation
+from incremental_json import IncrementalJSONParser
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("story_streaming_")
+
+
+def setup_module():
+    """Temporary database (the metrics helpers use the app)"""
+    ENV.start()
+
+
+def teardown_module():
+    ENV.stop()
+
+ARTICLE = {
+    "title": "AI Receptionists \"Cut\" Wait Times",
+    "executive_summary": {"intro": "Dealers book more {appointments}.", "key_stats": [{"number": "43%", "description": "More appointments"}]},
+    "html": "<h1>AI Receptionists</h1><p>Intro \\ text</p><h2>The Problem</h2><p>Missed calls.</p>"
+            "<h2>The Fix</h2><p>Answer every call.\n</p><h2>Results</h2><p>43% more bookings.</p>",
+    "components": [{"type": "pull_quote", "content": "Every call counts", "insert_after_paragraph": 2}],
+}
+
+
+class _Event:
+    def __init__(self, type, **fields):
+        self.type = type
+        self.__dict__.update(fields)
+
+
+class _FakeResponses:
+    def __init__(self, text, delta_size=5):
+        self.text = text
+        self.delta_size = delta_size
+        self.calls = []
+        self.deltas_sent = 0
+
+    def create(self, stream=False, **request):
+        self.calls.append({"stream": stream, **request})
+        final = _Event("response", output_text=self.text,
+                       usage=_Event("usage", input_tokens=900, output_tokens=3000))
+        if not stream:
+            return final
+        return self._events(final)
+
+    def _events(self, final):
+        yield _Event("response.created")
+        for i in range(0, len(self.text), self.delta_size):
+            self.deltas_sent += 1
+            yield _Event("response.output_text.delta", delta=self.text[i:i + self.delta_size])
+        yield _Event("response.completed", response=final)
+
+
+class _FakeClient:
+    def __init__(self, text):
+        self.responses = _FakeResponses(text)
+
+
+def _with_client(client, func):
+    original = story_generation._get_openai_client
+    story_generation._get_openai_client = lambda settings: client
+    try:
+        return func()
+    finally:
+        story_generation._get_openai_client = original
+
+
+def test_parser_any_chunking():
+    """Fields and sections are identical however the stream is split"""
+    text = "```json\n" + json.dumps(ARTICLE, indent=2) + "\n```"
+    rng = random.Random(7)
+    for _ in range(200):
+        fields, sections = [], []
+        parser = IncrementalJSONParser(
+            on_field=lambda name, value: fields.append((name, value)),
+            on_section=lambda name, index, html: sections.append(html),
+            sections={"html": "<h2"}
+        )
+        pos = 0
+        while pos < len(text):
+            size = rng.randint(1, 9)
+            parser.feed(text[pos:pos + size])
+            pos += size
+
+        assert [name for name, _ in fields] == list(ARTICLE)
+        assert dict(fields) == ARTICLE
+        assert len(sections) == 4 and "".join(sections) == ARTICLE["html"]
+    print(f"Sections: {[s[:20] for s in sections]}")
+    return True
+
+
+def test_streaming_reports_head_early():
+    """Title and summary arrive while most of the article is still streaming"""
+    client = _FakeClient(json.dumps(ARTICLE))
+    seen = []
+
+    def on_partial(name, value):
+        seen.append((name, client.responses.deltas_sent))
+
+    article = _with_client(client, lambda: story_generation.generate_clean_article(
+        "research", 1, "Write well.", on_partial=on_partial
+    ))
+
+    total = client.responses.deltas_sent
+    order = [name for name, _ in seen]
+    head_at = dict(seen)["executive_summary"]
+    print(f"Partial events: {order}; summary after {head_at}/{total} deltas")
+    assert article == ARTICLE
+    assert client.responses.calls[0]["stream"] is True
+    assert order[:2] == ["title", "executive_summary"]
+    assert order.count("section") == 4 and order[-2:] == ["html", "components"]
+    assert head_at < total / 2, "Executive summary was not reported early"
+    return True
+
+
+def test_blocking_without_callback():
+    """No callback, or STORY_STREAMING off, uses the single blocking call"""
+    client = _FakeClient(json.dumps(ARTICLE))
+    assert _with_client(client, lambda: story_generation.generate_clean_article("research", 1, "Write well.")) == ARTICLE
+    assert client.responses.calls[-1]["stream"] is False
+
+    story_generation.STORY_STREAMING = False
+    try:
+        seen = []
+        article = _with_client(client, lambda: story_generation.generate_clean_article(
+            "research", 1, "Write well.", on_partial=lambda name, value: seen.append(name)
+        ))
+    finally:
+        story_generation.STORY_STREAMING = True
+    assert article == ARTICLE and not seen
+    assert client.responses.calls[-1]["stream"] is False
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("STREAMING STORY GENERATION TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_parser_any_chunking(),
+            test_streaming_reports_head_early(),
+            test_blocking_without_callback(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All streaming story tests passed")
+        sys.exit(0)
+    print("\n[FAIL] Streaming story tests failed")
+    sys.exit(1)
@@ -0,0 +1,222 @@
+"""
+Test script for bulk publishing through the WordPress batch API.
+
+Runs entirely locally against a fake WordPress REST API served over
+HTTP/1.1 on 127.0.0.1 and a temporary SQLite database:
+1. Posts are published through /batch/v1 in chunks of WORDPRESS_BATCH_SIZE,
+   with per-post results in input order (a missing post fails on its own)
+2. Sites without the batch API fall back to concurrent single-post calls,
+   and the batch route is not probed again
+3. /api/publish_posts validates its input and returns per-post results
+
+Run with: python test_wordpress_bulk_publish.py
+"""
+
+import re
+import sys
+import json
+import time
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app_v3 import app, db, User
+import wordpress_client
+import wordpress_integration
+from wordpress_integration import WordPressSite, bulk_publish_wordpress_posts, bulk_update_wordpress_posts
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("wordpress_bulk_")
+
+
+def setup_module():
+    """Temporary database and default batch settings of this script"""
+    ENV.start(settings={wordpress_integration: {"WORDPRESS_BATCH_SIZE": 25, "WORDPRESS_BULK_CONCURRENCY": 4}})
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class _FakeWordPress(BaseHTTPRequestHandler):
+    """WordPress posts API with an optional /batch/v1 route."""
+
+    protocol_version = "HTTP/1.1"
+    batch_enabled = True
+    missing = set()  # Post IDs that do not exist
+    single_delay = 0.0
+    requests_seen = []
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    @staticmethod
+    def _update(post_id, changes):
+        if post_id in _FakeWordPress.missing:
+            return 404, {"code": "rest_post_invalid_id", "message": "Invalid post ID."}
+        return 200, {"id": post_id, "status": changes.get("status", "draft"),
+                     "link": f"https://blog.example.com/?p={post_id}"}
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with _FakeWordPress.lock:
+            _FakeWordPress.requests_seen.append((self.path, body))
+
+        if self.path == "/wp-json/batch/v1":
+            if not _FakeWordPress.batch_enabled:
+                return self._send(404, {"code": "rest_no_route", "message": "No route was found"})
+            responses = []
+            for sub in body["requests"]:
+                status, payload = self._update(int(sub["path"].rsplit("/", 1)[1]), sub["body"])
+                responses.append({"body": payload, "status": status, "headers": {}})
+            return self._send(207, {"responses": responses})
+
+        match = re.fullmatch(r"/wp-json/wp/v2/posts/(\d+)", self.path)
+        if not match:
+            return self._send(404, {"code": "rest_no_route"})
+        with _FakeWordPress.lock:
+            _FakeWordPress.in_flight += 1
+            _FakeWordPress.max_in_flight = max(_FakeWordPress.max_in_flight, _FakeWordPress.in_flight)
+        time.sleep(_FakeWordPress.single_delay)
+        with _FakeWordPress.lock:
+            _FakeWordPress.in_flight -= 1
+        self._send(*self._update(int(match.group(1)), body))
+
+
+SERVER = ThreadingHTTPServer(("127.0.0.1", 0), _FakeWordPress)
+SERVER.daemon_threads = True
+threading.Thread(target=SERVER.serve_forever, daemon=True).start()
+BASE_URL = f"http://127.0.0.1:{SERVER.server_address[1]}"
+
+
+def _reset(batch_enabled=True, missing=(), single_delay=0.0):
+    _FakeWordPress.batch_enabled = batch_enabled
+    _FakeWordPress.missing = set(missing)
+    _FakeWordPress.single_delay = single_delay
+    _FakeWordPress.requests_seen = []
+    _FakeWordPress.max_in_flight = 0
+    wordpress_integration._batch_unsupported_sites.clear()
+    wordpress_client._clients.clear()
+
+
+def _site():
+    return WordPressSite(1, BASE_URL, "editor", "app pass")
+
+
+def test_batches_in_chunks():
+    """30 drafts -> two batch calls; results line up with the input"""
+    _reset(missing={1007})
+    post_ids = list(range(1000, 1030))
+    results = bulk_publish_wordpress_posts(post_ids, 1, site=_site())
+
+    paths = [path for path, _ in _FakeWordPress.requests_seen]
+    print(f"30 posts -> {len(paths)} request(s): {sorted(set(paths))}")
+    assert paths == ["/wp-json/batch/v1", "/wp-json/batch/v1"]
+    assert [len(body["requests"]) for _, body in _FakeWordPress.requests_seen] == [25, 5]
+    assert _FakeWordPress.requests_seen[0][1]["requests"][0] == {
+        "method": "POST", "path": "/wp/v2/posts/1000", "body": {"status": "publish"}
+    }
+
+    assert [result["post_id"] for result in results] == post_ids
+    failed = [result for result in results if not result["success"]]
+    assert len(failed) == 1 and failed[0]["post_id"] == 1007
+    assert failed[0]["status_code"] == 404 and failed[0]["error"] == "Invalid post ID."
+    assert all(r["post_status"] == "publish" and r["link"] for r in results if r["success"])
+    return True
+
+
+def test_fallback_to_single_calls():
+    """Without /batch/v1 posts are updated concurrently, one call each"""
+    _reset(batch_enabled=False, missing={2002}, single_delay=0.1)
+    post_ids = list(range(2000, 2008))
+    started = time.monotonic()
+    results = bulk_update_wordpress_posts(post_ids, 1, {"status": "draft"}, site=_site())
+    elapsed = time.monotonic() - started
+
+    paths = [path for path, _ in _FakeWordPress.requests_seen]
+    print(f"8 posts without batch API: {elapsed:.2f}s, up to {_FakeWordPress.max_in_flight} in flight")
+    assert paths.count("/wp-json/batch/v1") == 1
+    assert sorted(paths[1:]) == [f"/wp-json/wp/v2/posts/{post_id}" for post_id in post_ids]
+    assert 1 < _FakeWordPress.max_in_flight <= 4
+    assert elapsed < 8 * 0.1
+    assert [result["post_id"] for result in results] == post_ids
+    assert [result["success"] for result in results] == [post_id != 2002 for post_id in post_ids]
+    assert results[0]["post_status"] == "draft"
+
+    # The site is remembered - the next bulk call goes straight to single-post calls
+    _FakeWordPress.requests_seen = []
+    bulk_publish_wordpress_posts([2000, 2001], 1, site=_site())
+    assert "/wp-json/batch/v1" not in [path for path, _ in _FakeWordPress.requests_seen]
+    return True
+
+
+def test_publish_posts_endpoint():
+    """The endpoint validates input and reports per-post results"""
+    _reset(missing={3001})
+    with app.app_context():
+        user = User(email=f"bulk{datetime.utcnow().timestamp()}@example.com", credit_balance=1,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False,
+                    wordpress_rest_api_url=f"{BASE_URL}/wp-json/wp/v2", wordpress_app_password="abcd efgh")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+
+    assert client.post("/api/publish_posts", json={"post_ids": []}).status_code == 400
+    assert client.post("/api/publish_posts", json={"post_ids": ["1"]}).status_code == 400
+    assert client.post("/api/publish_posts", json={"post_ids": [1], "updates": {"content": "x"}}).status_code == 400
+    assert client.post("/api/publish_posts", json={"post_ids": [1], "updates": {"status": "trash"}}).status_code == 400
+    assert not _FakeWordPress.requests_seen
+
+    response = client.post("/api/publish_posts", json={"post_ids": [3000, 3001, 3002, 3000]})
+    body = response.get_json()
+    print(f"Endpoint: {response.status_code} {body['message']}")
+    assert response.status_code == 200
+    assert body["succeeded"] == 2 and body["failed"] == 1
+    assert [result["post_id"] for result in body["results"]] == [3000, 3001, 3002]
+    assert len(_FakeWordPress.requests_seen) == 1
+
+    _reset(missing={3000})
+    response = client.post("/api/publish_posts", json={"post_ids": [3000], "updates": {"status": "future",
+                                                                                       "date": "2030-01-01T09:00:00"}})
+    assert response.status_code == 502 and response.get_json()["failed"] == 1
+    assert _FakeWordPress.requests_seen[0][1]["requests"][0]["body"] == {"status": "future",
+                                                                         "date": "2030-01-01T09:00:00"}
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("WORDPRESS BULK PUBLISH TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_batches_in_chunks(),
+            test_fallback_to_single_calls(),
+            test_publish_posts_endpoint(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All WordPress bulk publish tests passed")
+        sys.exit(0)
+    print("\n[FAIL] WordPress bulk publish tests failed")
+    sys.exit(1)
@@ -0,0 +1,273 @@
+"""
+Test script for the pooled, retrying WordPress client.
+
+Runs entirely locally against a fake WordPress REST API served over
+HTTP/1.1 on 127.0.0.1:
+1. All calls of one article reuse a single keep-alive connection
+2. 429/503 responses are retried (honoring Retry-After), with timing hooks
+3. Non-idempotent POSTs are not replayed after the server may have acted
+4. Read timeouts are retried for idempotent requests only
+5. Backoff delays stay within the jittered exponential bound
+6. A hero already in the media library is featured by ID - no second
+   download or upload
+
+Run with: python test_wordpress_client.py
+"""
+
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import image_cache
+import wordpress_client
+import wordpress_integration
+from wordpress_client import get_wordpress_client, add_request_hook, remove_request_hook, backoff_delay
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("wordpress_client_")
+
+
+def setup_module():
+    """Temporary database, image cache and fast backoff/timeouts of this script"""
+    ENV.start(settings={wordpress_client: {"WORDPRESS_BACKOFF_BASE": 0.01, "WORDPRESS_READ_TIMEOUT": 0.5}})
+    ENV.patch(image_cache, "_cache", image_cache.ImageCache(root=ENV.path("cache")))
+    ENV.patch(wordpress_integration, "_load_wordpress_credentials", lambda user_id: CREDENTIALS)
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class _FakeWordPress(BaseHTTPRequestHandler):
+    """Scripted WordPress REST API: `script` maps "METHOD path" to a list of responses."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    script = {}
+    connections = 0
+    requests_seen = []
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _FakeWordPress.lock:
+            _FakeWordPress.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        key = f"{self.command} {self.path.split('?')[0]}"
+        with _FakeWordPress.lock:
+            _FakeWordPress.requests_seen.append((key, body))
+            queue = _FakeWordPress.script.get(key) or [(200, {}, {})]
+            status, payload, headers = queue.pop(0) if len(queue) > 1 else queue[0]
+
+        if headers.get("delay"):
+            time.sleep(headers["delay"])
+        data = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                if name != "delay":
+                    self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+        except BrokenPipeError:
+            self.close_connection = True  # Client already gave up (read timeout)
+
+    do_GET = _respond
+    do_POST = _respond
+
+
+SERVER = ThreadingHTTPServer(("127.0.0.1", 0), _FakeWordPress)
+SERVER.daemon_threads = True
+threading.Thread(target=SERVER.serve_forever, daemon=True).start()
+BASE_URL = f"http://127.0.0.1:{SERVER.server_address[1]}"
+CREDENTIALS = (BASE_URL, "editor", "app pass")
+
+
+def _reset(script):
+    _FakeWordPress.script = script
+    _FakeWordPress.connections = 0
+    _FakeWordPress.requests_seen = []
+    wordpress_client._clients.clear()
+
+
+def test_article_reuses_one_connection():
+    """Featured image upload, post creation, publish and listing share one socket"""
+    _reset({
+        "POST /wp-json/wp/v2/media": [(201, {"id": 55, "source_url": f"{BASE_URL}/uploads/hero.jpg"}, {})],
+        "POST /wp-json/wp/v2/posts": [(201, {"id": 9}, {})],
+        "POST /wp-json/wp/v2/posts/9": [(200, {"id": 9, "status": "publish"}, {})],
+        "GET /wp-json/wp/v2/posts": [(200, [{"id": 9}], {})],
+        "GET /wp-json/wp/v2": [(200, {"name": "Test"}, {})],
+    })
+    wordpress_integration._credentials_cache.clear()
+    site = wordpress_integration.resolve_wordpress_site(1)
+    hero = f"{BASE_URL}/uploads/hero-original.jpg"
+    ENV.patch(wordpress_integration, "fetch_image", lambda url: (b"\xff\xd8jpeg-bytes", "image/jpeg"))
+
+    assert wordpress_integration.test_wordpress_connection(1)[0]
+    for _ in range(2):
+        wordpress_integration.upload_image_bytes_to_wordpress(b"\xff\xd8section", 1, "s.jpg", site=site)
+    post = wordpress_integration.create_wordpress_post("Title", "<p>Body</p>", 1, hero)
+    assert post["id"] == 9
+    assert wordpress_integration.publish_wordpress_post(9, 1)["status"] == "publish"
+    assert wordpress_integration.get_wordpress_posts(1) == [{"id": 9}]
+
+    calls = len(_FakeWordPress.requests_seen)
+    print(f"{calls} REST calls over {_FakeWordPress.connections} connection(s)")
+    assert calls == 7 and _FakeWordPress.connections == 1
+    assert get_wordpress_client(BASE_URL) is get_wordpress_client(BASE_URL)
+
+    # Bare requests.get opens a new connection per call
+    _reset({})
+    for _ in range(3):
+        requests.get(f"{BASE_URL}/wp-json/wp/v2", timeout=5)
+    assert _FakeWordPress.connections == 3
+    return True
+
+
+def test_featured_image_reuses_hero_media():
+    """Post creation with the persisted hero's media ID is a single REST call"""
+    _reset({
+        "POST /wp-json/wp/v2/media": [(201, {"id": 77, "source_url": f"{BASE_URL}/uploads/hero.jpg"}, {})],
+        "POST /wp-json/wp/v2/posts": [(201, {"id": 10}, {})],
+    })
+    fetched = []
+    ENV.patch(wordpress_integration, "fetch_image", lambda url: fetched.append(url) or (b"\xff\xd8jpeg-bytes", "image/jpeg"))
+    site = wordpress_integration.WordPressSite(1, BASE_URL, "editor", "app pass")
+
+    media = wordpress_integration.upload_image_bytes_to_wordpress(b"\xff\xd8hero", 1, "hero.jpg", site=site)
+    post = wordpress_integration.create_wordpress_post("Title", "<p>Body</p>", 1, media["source_url"],
+                                                       site=site, featured_media_id=media["id"])
+
+    keys = [key for key, _ in _FakeWordPress.requests_seen]
+    assert post["id"] == 10 and not fetched
+    assert keys == ["POST /wp-json/wp/v2/media", "POST /wp-json/wp/v2/posts"]
+    assert json.loads(_FakeWordPress.requests_seen[-1][1])["featured_media"] == 77
+    return True
+
+
+def test_throttled_requests_are_retried():
+    """429 and 503 are retried for any method; hooks see every attempt"""
+    _reset({
+        "POST /wp-json/wp/v2/posts": [
+            (429, {"code": "rate_limited"}, {"Retry-After": "0"}),
+            (503, {"code": "maintenance"}, {}),
+            (201, {"id": 12}, {}),
+        ],
+    })
+    events = []
+    add_request_hook(events.append)
+    try:
+        response = get_wordpress_client(BASE_URL).post(f"{BASE_URL}/wp-json/wp/v2/posts", json={"title": "x"})
+    finally:
+        remove_request_hook(events.append)
+
+    print(f"Attempts: {[(e['status'], e['will_retry'], round(e['seconds'], 3)) for e in events]}")
+    assert response.status_code == 201 and response.json()["id"] == 12
+    assert [e["status"] for e in events] == [429, 503, 201]
+    assert [e["will_retry"] for e in events] == [True, True, False]
+    assert all(e["path"] == "/wp-json/wp/v2/posts" and e["seconds"] >= 0 for e in events)
+    return True
+
+
+def test_non_idempotent_post_not_replayed():
+    """A 500 on POST /posts may have created the post - it is returned, not retried"""
+    _reset({
+        "POST /wp-json/wp/v2/posts": [(500, {}, {}), (201, {"id": 13}, {})],
+        "GET /wp-json/wp/v2/posts": [(502, {}, {}), (500, {}, {}), (200, [], {})],
+        "POST /wp-json/wp/v2/posts/13": [(504, {}, {}), (200, {"id": 13}, {})],
+    })
+    client = get_wordpress_client(BASE_URL)
+    assert client.post(f"{BASE_URL}/wp-json/wp/v2/posts", json={}).status_code == 500
+    assert client.get(f"{BASE_URL}/wp-json/wp/v2/posts").status_code == 200
+    assert client.post(f"{BASE_URL}/wp-json/wp/v2/posts/13", json={}, idempotent=True).status_code == 200
+    keys = [key for key, _ in _FakeWordPress.requests_seen]
+    assert keys.count("POST /wp-json/wp/v2/posts") == 1
+    assert keys.count("GET /wp-json/wp/v2/posts") == 3
+
+    # Retries stop after WORDPRESS_MAX_RETRIES; the last response is returned
+    _reset({"GET /wp-json/wp/v2/posts": [(503, {}, {})]})
+    assert client.get(f"{BASE_URL}/wp-json/wp/v2/posts").status_code == 503
+    assert len(_FakeWordPress.requests_seen) == wordpress_client.WORDPRESS_MAX_RETRIES + 1
+    return True
+
+
+def test_read_timeouts():
+    """Slow responses time out; GET retries, media upload POST does not"""
+    _reset({
+        "GET /wp-json/wp/v2/posts": [(200, [], {"delay": 1.0}), (200, [{"id": 1}], {})],
+        "POST /wp-json/wp/v2/media": [(201, {"id": 1}, {"delay": 1.0})],
+    })
+    client = get_wordpress_client(BASE_URL)
+    started = time.monotonic()
+    assert client.get(f"{BASE_URL}/wp-json/wp/v2/posts").json() == [{"id": 1}]
+    print(f"GET recovered from a read timeout in {time.monotonic() - started:.2f}s")
+
+    try:
+        client.post(f"{BASE_URL}/wp-json/wp/v2/media", data=b"image")
+        raise AssertionError("Expected a read timeout")
+    except requests.exceptions.ReadTimeout:
+        pass
+    assert [key for key, _ in _FakeWordPress.requests_seen].count("POST /wp-json/wp/v2/media") == 1
+
+    # Nothing listening - the request never reached a server, so even POST is retried
+    attempts = []
+    add_request_hook(attempts.append)
+    try:
+        closed = wordpress_client.WordPressClient("http://127.0.0.1:9")
+        closed.post("http://127.0.0.1:9/wp-json/wp/v2/posts", json={})
+        raise AssertionError("Expected a connection error")
+    except requests.exceptions.ConnectionError:
+        pass
+    finally:
+        remove_request_hook(attempts.append)
+    assert len(attempts) == wordpress_client.WORDPRESS_MAX_RETRIES + 1
+    return True
+
+
+def test_backoff_bounds():
+    """Full jitter stays below base * 2^n (capped); Retry-After wins"""
+    for attempt in range(1, 10):
+        ceiling = min(wordpress_client.WORDPRESS_BACKOFF_MAX, wordpress_client.WORDPRESS_BACKOFF_BASE * 2 ** (attempt - 1))
+        delays = [backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= d <= ceiling for d in delays)
+    assert backoff_delay(1, retry_after="3") == 3.0
+    assert backoff_delay(1, retry_after="3600") == wordpress_client.WORDPRESS_BACKOFF_MAX
+    assert backoff_delay(1, retry_after="Wed, 21 Oct 2015 07:28:00 GMT") <= wordpress_client.WORDPRESS_BACKOFF_BASE
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("WORDPRESS CLIENT TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_article_reuses_one_connection(),
+            test_featured_image_reuses_hero_media(),
+            test_throttled_requests_are_retried(),
+            test_non_idempotent_post_not_replayed(),
+            test_read_timeouts(),
+            test_backoff_bounds(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All WordPress client tests passed")
+        sys.exit(0)
+    print("\n[FAIL] WordPress client tests failed")
+    sys.exit(1)
@@ -0,0 +1,223 @@
+"""
+Test script for cached WordPress credential resolution.
+
+Runs entirely locally against a temporary SQLite database - the WordPress
+REST API is replaced with a fake session:
+1. Repeated lookups for a user hit the database once
+2. Cached credentials expire after WORDPRESS_CREDENTIALS_TTL
+3. /api/update_integrations invalidates the cache immediately
+4. A 401 from WordPress drops the cached credentials
+5. A site resolved once is passed down the pipeline - image uploads and
+   post creation do no further lookups
+
+Run with: python test_wordpress_credentials.py
+"""
+
+import sys
+import time
+from datetime import datetime
+
+import requests
+
+from app_v3 import app, db, User
+import image_cache
+import image_optimizer
+import wordpress_integration
+import openai_integration_v4 as v4
+from testing_env import LocalTestEnv
+
+ENV = LocalTestEnv("wordpress_credentials_")
+
+
+def setup_module():
+    """Temporary database and image cache; images are uploaded unoptimized"""
+    ENV.start(settings={image_optimizer: {"IMAGE_OPTIMIZATION_ENABLED": False}})
+    ENV.patch(image_cache, "_cache", image_cache.ImageCache(root=ENV.path("cache")))
+
+
+def teardown_module():
+    ENV.stop()
+
+
+class _FakeResponse:
+    def __init__(self, status_code=200, payload=None):
+        self.status_code = status_code
+        self.headers = {"Content-Type": "application/json"}
+        self._payload = payload or {}
+        self.text = ""
+
+    def json(self):
+        return self._payload
+
+
+class _CountingLoader:
+    """Wraps _load_wordpress_credentials and counts database lookups."""
+
+    def __init__(self):
+        self.calls = 0
+        self._original = wordpress_integration._load_wordpress_credentials
+
+    def __call__(self, user_id):
+        self.calls += 1
+        return self._original(user_id)
+
+    def __enter__(self):
+        wordpress_integration._credentials_cache.clear()
+        wordpress_integration._load_wordpress_credentials = self
+        return self
+
+    def __exit__(self, *exc):
+        wordpress_integration._load_wordpress_credentials = self._original
+        return False
+
+
+def _setup_user(url="https://blog.example.com/wp-json/wp/v2"):
+    with app.app_context():
+        user = User(email=f"creds{datetime.utcnow().timestamp()}@example.com", credit_balance=1,
+                    total_articles_generated=0, total_spent=0.0, is_admin=False,
+                    wordpress_rest_api_url=url, wordpress_app_password="abcd efgh ijkl")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+
+
+def test_repeated_lookups_hit_database_once():
+    """Every call after the first is served from the cache"""
+    user_id = _setup_user()
+    with app.app_context(), _CountingLoader() as loader:
+        results = [wordpress_integration.get_wordpress_credentials(user_id) for _ in range(10)]
+        site = wordpress_integration.resolve_wordpress_site(user_id)
+
+    print(f"11 lookups -> {loader.calls} database read(s)")
+    assert loader.calls == 1
+    assert results[0] == ("https://blog.example.com", results[0][1], "abcdefghijkl")
+    assert all(result == results[0] for result in results)
+    assert site.base_url == "https://blog.example.com"
+    assert site.endpoint("media") == "https://blog.example.com/wp-json/wp/v2/media"
+    return True
+
+
+def test_entries_expire_after_ttl():
+    """An expired entry is re-read; incomplete credentials are never cached"""
+    user_id = _setup_user()
+    unconfigured = _setup_user(url=None)
+    original_ttl = wordpress_integration.WORDPRESS_CREDENTIALS_TTL
+    wordpress_integration.WORDPRESS_CREDENTIALS_TTL = 0.1
+    try:
+        with app.app_context(), _CountingLoader() as loader:
+            wordpress_integration.get_wordpress_credentials(user_id)
+            wordpress_integration.get_wordpress_credentials(user_id)
+            time.sleep(0.15)
+            wordpress_integration.get_wordpress_credentials(user_id)
+            assert loader.calls == 2
+
+            assert wordpress_integration.resolve_wordpress_site(unconfigured) is None
+            assert wordpress_integration.resolve_wordpress_site(unconfigured) is None
+            assert loader.calls == 4
+    finally:
+        wordpress_integration.WORDPRESS_CREDENTIALS_TTL = original_ttl
+    return True
+
+
+def test_update_integrations_invalidates():
+    """New credentials saved through the API are used by the very next lookup"""
+    user_id = _setup_user()
+    client = app.test_client()
+    _login(client, user_id)
+
+    with _CountingLoader() as loader:
+        with app.app_context():
+            before = wordpress_integration.get_wordpress_credentials(user_id)
+        response = client.post("/api/update_integrations",
+                               json={"wordpress_rest_api_url": "https://new.example.com/wp-json/wp/v2"})
+        assert response.status_code == 200, response.get_json()
+        with app.app_context():
+            after = wordpress_integration.get_wordpress_credentials(user_id)
+
+    print(f"Before: {before[0]}, after update: {after[0]}")
+    assert before[0] == "https://blog.example.com" and after[0] == "https://new.example.com"
+    assert loader.calls == 2
+    return True
+
+
+def test_unauthorized_response_invalidates():
+    """WordPress rejecting the password forgets the cached credentials"""
+    user_id = _setup_user()
+    original = requests.Session.request
+    requests.Session.request = lambda session, method, url, **kwargs: _FakeResponse(401)
+    try:
+        with app.app_context(), _CountingLoader() as loader:
+            ok, message = wordpress_integration.test_wordpress_connection(user_id)
+            assert user_id not in wordpress_integration._credentials_cache
+            wordpress_integration.get_wordpress_credentials(user_id)
+    finally:
+        requests.Session.request = original
+
+    assert not ok and loader.calls == 2
+    return True
+
+
+def test_pipeline_reuses_resolved_site():
+    """Uploads (in worker threads) and post creation do no lookups of their own"""
+    user_id = _setup_user()
+    calls = []
+
+    def fake_request(session, method, url, json=None, **kwargs):
+        calls.append(url)
+        if url.endswith("/media"):
+            return _FakeResponse(201, {"id": len(calls), "source_url": f"https://blog.example.com/{len(calls)}.jpg"})
+        return _FakeResponse(201, {"id": 9, "featured_media": (json or {}).get("featured_media")})
+
+    original_request = requests.Session.request
+    original_fetch = v4.fetch_image, wordpress_integration.fetch_image
+    requests.Session.request = fake_request
+    v4.fetch_image = wordpress_integration.fetch_image = lambda url: (b"\xff\xd8jpeg", "image/jpeg")
+    try:
+        with _CountingLoader() as loader:
+            with app.app_context():
+                site = wordpress_integration.resolve_wordpress_site(user_id)
+            # No app context from here on - a lookup would fail
+            wordpress_integration._credentials_cache.clear()
+            urls = v4.persist_images_to_wordpress(
+                [f"https://replicate.delivery/{i}.jpg" for i in range(3)], user_id, site=site
+            )
+            post = wordpress_integration.create_wordpress_post("Title", "<p>Body</p>", user_id, urls[0], site=site)
+    finally:
+        requests.Session.request = original_request
+        v4.fetch_image, wordpress_integration.fetch_image = original_fetch
+
+    print(f"{len(calls)} REST calls, {loader.calls} credential lookup(s)")
+    assert loader.calls == 1
+    assert all(urls) and post["id"] == 9
+    assert all(url.startswith("https://blog.example.com/wp-json/wp/v2/") for url in calls)
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("WORDPRESS CREDENTIALS TEST")
+    print("=" * 80)
+
+    setup_module()
+    try:
+        results = [
+            test_repeated_lookups_hit_database_once(),
+            test_entries_expire_after_ttl(),
+            test_update_integrations_invalidates(),
+            test_unauthorized_response_invalidates(),
+            test_pipeline_reuses_resolved_site(),
+        ]
+    finally:
+        teardown_module()
+
+    if all(results):
+        print("\n[OK] All WordPress credentials tests passed")
+        sys.exit(0)
+    print("\n[FAIL] WordPress credentials tests failed")
+    sys.exit(1)
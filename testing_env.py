@@ -0,0 +1,111 @@
+"""
+Per-script setup of the local test scripts (test_*.py).
+
+Each script gets its own temporary SQLite database, environment variables
+and module settings in setup_module() and gives them back in
+teardown_module(). Nothing is configured at import time, so the scripts run
+on their own (python test_x.py) and together in one process
+(python -m pytest test_*.py) without one script's settings leaking into the
+next.
+
+    ENV = LocalTestEnv("image_cache_")
+
+    def setup_module():
+        ENV.start(environ={...}, settings={image_cache: {"IMAGE_CACHE_DIR": ...}})
+
+    def teardown_module():
+        ENV.stop()
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Optional
+
+
+class LocalTestEnv:
+    """Temporary database, environment variables and module settings of one test script."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.dir: Optional[str] = None
+        self._environ: Dict[str, Optional[str]] = {}
+        self._patches: list = []
+        self._database_uri: Optional[str] = None
+
+    def path(self, name: str) -> str:
+        """Path of a file in this script's temporary directory."""
+        return os.path.join(self.dir, name)
+
+    def start(self, environ: Optional[Dict[str, str]] = None,
+              settings: Optional[Dict[Any, Dict[str, Any]]] = None,
+              database: bool = True) -> "LocalTestEnv":
+        """
+        Point the app at a fresh SQLite database and apply overrides.
+
+        environ: variables read when they are used (os.getenv at call time)
+        settings: {module: {NAME: value}} for constants read at import time
+        """
+        self.dir = tempfile.mkdtemp(prefix=self.prefix)
+        for name, value in (environ or {}).items():
+            self.setenv(name, value)
+        for target, values in (settings or {}).items():
+            for name, value in values.items():
+                self.patch(target, name, value)
+
+        _reset_caches()
+        if database:
+            from app_v3 import app, db
+
+            self._database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+            with app.app_context():
+                db.session.remove()
+                app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{self.path('test.db')}"
+                db.create_all()
+        return self
+
+    def setenv(self, name: str, value: str) -> None:
+        """Set an environment variable until stop()."""
+        self._environ.setdefault(name, os.environ.get(name))
+        os.environ[name] = value
+
+    def patch(self, target: Any, name: str, value: Any) -> None:
+        """Replace an attribute until stop() - for settings and stubbed functions alike."""
+        self._patches.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+    def stop(self) -> None:
+        """Restore everything start() and patch() changed and remove the temporary directory."""
+        if self._database_uri is not None:
+            from app_v3 import app, db
+
+            with app.app_context():
+                db.session.remove()
+                db.get_engine().dispose()
+            app.config['SQLALCHEMY_DATABASE_URI'] = self._database_uri
+            self._database_uri = None
+
+        while self._patches:
+            target, name, original = self._patches.pop()
+            setattr(target, name, original)
+        for name, original in self._environ.items():
+            if original is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = original
+        self._environ.clear()
+        _reset_caches()
+
+        if self.dir:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.dir = None
+
+
+def _reset_caches() -> None:
+    """Drop process caches built from the environment and database of the previous script."""
+    import job_settings
+    import wordpress_integration
+
+    job_settings.invalidate_job_settings()
+    with wordpress_integration._credentials_cache_lock:
+        wordpress_integration._credentials_cache.clear()
@@ -0,0 +1,262 @@
+"""
+wordpress_client.py - Pooled, Retrying HTTP Client for WordPress Sites
+
+One article makes 6+ REST calls (media uploads, post creation, publish)
+to the same WordPress host. Each site gets one WordPressClient per
+process, holding a keep-alive requests.Session, so those calls reuse
+connections instead of paying a TCP+TLS handshake each.
+
+Transient failures (connection errors, timeouts, 429 and 5xx gateway
+errors) are retried with exponential backoff and full jitter, honoring
+Retry-After. Non-idempotent requests (creating posts, uploading media)
+are only retried when WordPress cannot have processed them - the
+connection was never established, or the server answered 429/503.
+
+Every attempt is reported to the registered request hooks (see
+add_request_hook) with its timing, so callers can log or export latency.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from provider_limits import provider_slot
+
+logger = logging.getLogger(__name__)
+
+WORDPRESS_MAX_RETRIES = int(os.getenv('WORDPRESS_MAX_RETRIES', '3'))
+WORDPRESS_BACKOFF_BASE = float(os.getenv('WORDPRESS_BACKOFF_BASE', '0.5'))
+WORDPRESS_BACKOFF_MAX = float(os.getenv('WORDPRESS_BACKOFF_MAX', '8'))
+WORDPRESS_CONNECT_TIMEOUT = float(os.getenv('WORDPRESS_CONNECT_TIMEOUT', '5'))
+WORDPRESS_READ_TIMEOUT = float(os.getenv('WORDPRESS_READ_TIMEOUT', '30'))
+WORDPRESS_POOL_SIZE = int(os.getenv('WORDPRESS_POOL_SIZE', '8'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses where the server did not act on the request - safe to retry any method
+NOT_PROCESSED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+RequestHook = Callable[[Dict[str, Any]], None]
+_request_hooks: List[RequestHook] = []
+
+
+def add_request_hook(hook: RequestHook) -> None:
+    """
+    Register a callback invoked after every WordPress request attempt.
+
+    The callback receives a dict with site, method, path, status (None on a
+    network error), seconds, attempt (1-based), will_retry and error. Hooks
+    must not raise; exceptions are logged and swallowed.
+    """
+    _request_hooks.append(hook)
+
+
+def remove_request_hook(hook: RequestHook) -> None:
+    """Unregister a callback added with add_request_hook."""
+    if hook in _request_hooks:
+        _request_hooks.remove(hook)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (1-based).
+
+    Full jitter: uniform in [0, min(max, base * 2^(attempt-1))]. A numeric
+    Retry-After header from the server takes precedence (capped at the max).
+    """
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), WORDPRESS_BACKOFF_MAX)
+        except ValueError:
+            pass  # HTTP-date form - fall back to backoff
+    ceiling = min(WORDPRESS_BACKOFF_MAX, WORDPRESS_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+def _never_sent(error: requests.exceptions.RequestException) -> bool:
+    """True if the request failed before a connection was established."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, NewConnectionError)  # Includes DNS failures
+    return False
+
+
+class WordPressClient:
+    """
+    Keep-alive HTTP client for one WordPress site.
+
+    Thread-safe for concurrent requests (the connection pool holds
+    WORDPRESS_POOL_SIZE connections). Use get_wordpress_client() rather
+    than constructing one, so the pipeline shares the pool.
+    """
+
+    def __init__(self, base_url: str, max_retries: int = WORDPRESS_MAX_RETRIES):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WORDPRESS_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        timeout: Optional[float] = None,
+        idempotent: Optional[bool] = None,
+        **kwargs: Any
+    ) -> requests.Response:
+        """
+        Send a request, retrying transient failures.
+
+        Args:
+            method: HTTP method
+            url: Full endpoint URL (see construct_api_endpoint)
+            timeout: Read timeout in seconds (defaults to WORDPRESS_READ_TIMEOUT);
+                the connect timeout is always WORDPRESS_CONNECT_TIMEOUT
+            idempotent: Whether repeating the request is harmless. Defaults
+                to True for GET/PUT/DELETE; pass True for POSTs that update
+                an existing resource (e.g. posts/{id})
+            **kwargs: Passed to requests (headers, json, data, params, ...)
+
+        Returns:
+            The last response (which may still be a 4xx/5xx status)
+
+        Raises:
+            requests.exceptions.RequestException once retries are exhausted
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs['timeout'] = (WORDPRESS_CONNECT_TIMEOUT, timeout or WORDPRESS_READ_TIMEOUT)
+
+        # Bodies that are read while sending can only be replayed if they can rewind
+        body = kwargs.get('data')
+        rewind_to = body.tell() if hasattr(body, 'seek') and hasattr(body, 'tell') else None
+        replayable = body is None or isinstance(body, (bytes, str, dict)) or rewind_to is not None
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if attempt > 1 and rewind_to is not None:
+                body.seek(rewind_to)
+
+            response: Optional[requests.Response] = None
+            error: Optional[requests.exceptions.RequestException] = None
+            started = time.monotonic()
+            try:
+                with provider_slot("wordpress", self.base_url):  # Per-site limit across concurrent articles
+                    started = time.monotonic()  # Latency excludes waiting for a slot
+                    response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = e
+            seconds = time.monotonic() - started
+
+            retryable = replayable and attempt <= self.max_retries and self._is_retryable(response, error, idempotent)
+            self._run_hooks(method, url, response, error, seconds, attempt, retryable)
+
+            if not retryable:
+                if error is not None:
+                    raise error
+                return response  # type: ignore[return-value]
+
+            delay = backoff_delay(attempt, response.headers.get('Retry-After') if response is not None else None)
+            reason = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+            logger.warning(f"[WP Client] {method} {self._path(url)} failed ({reason}), "
+                           f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            if response is not None:
+                response.close()  # Return the connection to the pool
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+    @staticmethod
+    def _is_retryable(
+        response: Optional[requests.Response],
+        error: Optional[requests.exceptions.RequestException],
+        idempotent: bool
+    ) -> bool:
+        if error is not None:
+            if idempotent:
+                return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+            return _never_sent(error)
+        if response is None or response.status_code not in RETRY_STATUSES:
+            return False
+        return idempotent or response.status_code in NOT_PROCESSED_STATUSES
+
+    def _path(self, url: str) -> str:
+        return url[len(self.base_url):] if url.startswith(self.base_url) else url
+
+    def _run_hooks(
+        self,
+        method: str,
+        url: str,
+        response: Optional[requests.Response],
+        error: Optional[Exception],
+        seconds: float,
+        attempt: int,
+        will_retry: bool
+    ) -> None:
+        if not _request_hooks:
+            return
+        event = {
+            "site": self.base_url,
+            "method": method,
+            "path": self._path(url),
+            "status": response.status_code if response is not None else None,
+            "seconds": seconds,
+            "attempt": attempt,
+            "will_retry": will_retry,
+            "error": str(error) if error is not None else None,
+        }
+        for hook in list(_request_hooks):
+            try:
+                hook(event)
+            except Exception as e:
+                logger.error(f"[WP Client] Request hook failed: {e}")
+
+
+_clients: Dict[str, WordPressClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_wordpress_client(base_url: str) -> WordPressClient:
+    """
+    Process-wide client for a WordPress site, created on first use.
+
+    Every stage of the pipeline (media uploads, post creation, publishing)
+    that talks to the same site shares this client and its connections.
+    """
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = WordPressClient(base_url)
+            _clients[base_url] = client
+        return client
+
+
+def _reset_clients_after_fork() -> None:
+    """Forked workers must not share the parent's pooled sockets."""
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
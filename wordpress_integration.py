@@ -1,13 +1,34 @@
 import os
 import requests
 import logging
-from typing import Optional, Dict, Any, Tuple
+import time
+import threading
+from typing import Optional, Dict, Any, Tuple, List
 import base64
 import json
 from datetime import datetime
+from pipeline_metrics import record_bytes
+from image_cache import fetch_image, EXTENSIONS
+from wordpress_client import get_wordpress_client, WordPressClient
 
 logger = logging.getLogger(__name__)
 
+# Seconds a resolved credential set is reused before the database is read again.
+# /api/update_integrations invalidates the web process immediately; other
+# processes (generation workers) see changes within this TTL.
+WORDPRESS_CREDENTIALS_TTL = float(os.getenv('WORDPRESS_CREDENTIALS_TTL', '300'))
+
+# Bulk post updates: sub-requests per /batch/v1 call (WordPress allows 25 by
+# default) and parallel single-post calls for sites without the batch API
+WORDPRESS_BATCH_SIZE = int(os.getenv('WORDPRESS_BATCH_SIZE', '25'))
+WORDPRESS_BULK_CONCURRENCY = int(os.getenv('WORDPRESS_BULK_CONCURRENCY', '4'))
+
+_credentials_cache: Dict[int, Tuple[float, Tuple[str, str, str]]] = {}
+_credentials_cache_lock = threading.Lock()
+
+# Sites whose REST API has no /batch/v1 route (WordPress < 5.6)
+_batch_unsupported_sites: set = set()
+
 def normalize_wordpress_url(url: str) -> str:
     """
     Normalize WordPress URL to base site URL.
@@ -51,9 +72,9 @@ def construct_api_endpoint(base_url: str, endpoint: str = '') -> str:
         return f"{base_url}/wp-json/wp/v2/{endpoint}"
     return f"{base_url}/wp-json/wp/v2"
 
-def get_wordpress_credentials(user_id: int) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+def _load_wordpress_credentials(user_id: int) -> Tuple[Optional[str], Optional[str], Optional[str]]:
     """
-    Get WordPress credentials from user database.
+    Read WordPress credentials from the user database (uncached).
 
     Args:
         user_id: User ID
@@ -93,6 +114,82 @@ def get_wordpress_credentials(user_id: int) -> Tuple[Optional[str], Optional[str
         logger.error(f"Error getting WordPress credentials for user {user_id}: {str(e)}")
         return None, None, None
 
+def get_wordpress_credentials(user_id: int) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Get WordPress credentials, cached in-process for WORDPRESS_CREDENTIALS_TTL.
+
+    Only complete credentials are cached, so a user who has just configured
+    WordPress is picked up on the next call.
+
+    Args:
+        user_id: User ID
+
+    Returns:
+        Tuple of (base_url, username, app_password) or (None, None, None) if not configured
+    """
+    now = time.monotonic()
+    with _credentials_cache_lock:
+        cached = _credentials_cache.get(user_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    credentials = _load_wordpress_credentials(user_id)
+    if all(credentials):
+        with _credentials_cache_lock:
+            _credentials_cache[user_id] = (now + WORDPRESS_CREDENTIALS_TTL, credentials)  # type: ignore[assignment]
+    return credentials
+
+def invalidate_wordpress_credentials(user_id: int) -> None:
+    """Drop a user's cached credentials (call after their WordPress settings change)."""
+    with _credentials_cache_lock:
+        _credentials_cache.pop(user_id, None)
+
+class WordPressSite:
+    """
+    A user's resolved WordPress site: credentials plus the shared pooled client.
+
+    Resolve once per article with resolve_wordpress_site() and pass it down
+    the pipeline, so uploads, post creation and publishing neither repeat
+    the credential lookup nor need a Flask app context.
+    """
+
+    def __init__(self, user_id: int, base_url: str, username: str, app_password: str):
+        self.user_id = user_id
+        self.base_url = base_url
+        self.username = username
+        self.app_password = app_password
+
+    @property
+    def client(self) -> WordPressClient:
+        return get_wordpress_client(self.base_url)
+
+    def endpoint(self, path: str = '') -> str:
+        return construct_api_endpoint(self.base_url, path)
+
+    def batch_endpoint(self) -> str:
+        return f"{self.base_url}/wp-json/batch/v1"
+
+    def auth_headers(self) -> Dict[str, str]:
+        return create_auth_header(self.username, self.app_password)
+
+    def check_auth(self, response: requests.Response) -> None:
+        """Forget cached credentials WordPress rejected, so the next article re-reads them."""
+        if response.status_code == 401:
+            invalidate_wordpress_credentials(self.user_id)
+
+def resolve_wordpress_site(user_id: int) -> Optional[WordPressSite]:
+    """
+    Resolve a user's WordPress site from the (cached) credentials.
+
+    Returns:
+        WordPressSite, or None if WordPress is not configured
+    """
+    base_url, username, app_password = get_wordpress_credentials(user_id)
+    if not all([base_url, username, app_password]):
+        logger.error(f"WordPress credentials not configured for user {user_id}")
+        return None
+    return WordPressSite(user_id, base_url, username, app_password)  # type: ignore[arg-type]
+
 def create_auth_header(username: str, app_password: str) -> Dict[str, str]:
     """
     Create Basic Authentication header for WordPress Application Password.
@@ -118,27 +215,28 @@ def create_auth_header(username: str, app_password: str) -> Dict[str, str]:
         'Content-Type': 'application/json'
     }
 
-def test_wordpress_connection(user_id: int) -> Tuple[bool, str]:
+def test_wordpress_connection(user_id: int, site: Optional[WordPressSite] = None) -> Tuple[bool, str]:
     """
     Test WordPress connection with Application Password.
 
     Args:
         user_id: User ID
+        site: Optional pre-resolved WordPressSite
 
     Returns:
         Tuple of (success: bool, message: str)
     """
-    base_url, username, app_password = get_wordpress_credentials(user_id)
-
-    if not all([base_url, username, app_password]):
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
         return False, "WordPress credentials not configured"
 
     try:
         # Test connection by fetching site info
-        endpoint = construct_api_endpoint(base_url)
-        headers = create_auth_header(username, app_password)
+        endpoint = site.endpoint()
+        headers = site.auth_headers()
 
-        response = requests.get(endpoint, headers=headers, timeout=10)
+        response = site.client.get(endpoint, headers=headers, timeout=10)
+        site.check_auth(response)
 
         if response.status_code == 200:
             return True, "WordPress connection successful!"
@@ -152,26 +250,29 @@ def test_wordpress_connection(user_id: int) -> Tuple[bool, str]:
     except requests.exceptions.RequestException as e:
         return False, f"Connection error: {str(e)}"
 
-def upload_image_to_wordpress(image_path: str, user_id: int) -> Optional[Dict[str, Any]]:
+def upload_image_to_wordpress(
+    image_path: str,
+    user_id: int,
+    site: Optional[WordPressSite] = None
+) -> Optional[Dict[str, Any]]:
     """
     Upload image to WordPress media library using Application Password.
 
     Args:
         image_path: Local path to image file
         user_id: User ID
+        site: Optional pre-resolved WordPressSite
 
     Returns:
         Media object dict with 'id' and 'source_url', or None if failed
     """
-    base_url, username, app_password = get_wordpress_credentials(user_id)
-
-    if not all([base_url, username, app_password]):
-        logger.error(f"WordPress credentials not configured for user {user_id}")
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
         return None
 
     try:
-        endpoint = construct_api_endpoint(base_url, 'media')
-        headers = create_auth_header(username, app_password)
+        endpoint = site.endpoint('media')
+        headers = site.auth_headers()
 
         # Remove Content-Type from headers for file upload
         file_headers = {
@@ -180,12 +281,13 @@ def upload_image_to_wordpress(image_path: str, user_id: int) -> Optional[Dict[st
         }
 
         with open(image_path, 'rb') as img:
-            response = requests.post(
+            response = site.client.post(
                 endpoint,
                 headers=file_headers,
                 data=img,
                 timeout=30
             )
+        site.check_auth(response)
 
         if response.status_code == 201:
             media = response.json()
@@ -199,6 +301,65 @@ def upload_image_to_wordpress(image_path: str, user_id: int) -> Optional[Dict[st
         logger.error(f"Error uploading image to WordPress: {str(e)}")
         return None
 
+def upload_image_bytes_to_wordpress(
+    image_bytes: bytes,
+    user_id: int,
+    filename: str,
+    content_type: str = 'image/jpeg',
+    site: Optional[WordPressSite] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Upload in-memory image bytes (e.g. an optimized variant) to the WordPress media library.
+
+    Requests to the same site are bounded by the "wordpress" provider limit
+    (see provider_limits.py), so this is safe to call from a thread pool.
+
+    Args:
+        image_bytes: Encoded image
+        user_id: User ID
+        filename: Media filename
+        content_type: MIME type of image_bytes
+        site: Optional pre-resolved WordPressSite, for worker threads
+            without a Flask app context
+
+    Returns:
+        Media object dict with 'id' and 'source_url', or None if failed
+    """
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
+        return None
+
+    try:
+        endpoint = site.endpoint('media')
+        headers = site.auth_headers()
+
+        file_headers = {
+            'Authorization': headers['Authorization'],
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Content-Type': content_type
+        }
+
+        response = site.client.post(
+            endpoint,
+            headers=file_headers,
+            data=image_bytes,
+            timeout=60
+        )
+
+        site.check_auth(response)
+        record_bytes(uploaded=len(image_bytes))
+        if response.status_code == 201:
+            media = response.json()
+            logger.info(f"Image uploaded to WordPress ({len(image_bytes) / 1024:.1f} KB): {media.get('source_url')}")
+            return media
+        else:
+            logger.error(f"Failed to upload image: {response.status_code} - {response.text}")
+            return None
+
+    except Exception as e:
+        logger.error(f"Error uploading image to WordPress: {str(e)}")
+        return None
+
 def download_image(image_url: str, image_path: str) -> bool:
     """
     Download image from URL to local path.
@@ -237,11 +398,41 @@ def create_media_id(image_path: str, user_id: int) -> Optional[int]:
         return media.get('id')
     return None
 
+def _upload_featured_image(
+    image_url: str,
+    user_id: int,
+    site: WordPressSite
+) -> Optional[int]:
+    """
+    Upload a featured image read through the image cache and return its media ID.
+
+    Images the pipeline already persisted are cache hits, so nothing is
+    downloaded again and no temp file is written.
+    """
+    try:
+        image_bytes, content_type = fetch_image(image_url)
+    except Exception as e:
+        logger.error(f"Error downloading featured image: {str(e)}")
+        return None
+
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    extension = EXTENSIONS.get(content_type, 'jpg')
+    media = upload_image_bytes_to_wordpress(
+        image_bytes,
+        user_id,
+        filename=f"post_image_{user_id}_{timestamp}.{extension}",
+        content_type=content_type,
+        site=site
+    )
+    return (media or {}).get('id')
+
 def create_wordpress_post(
     title: str,
     content: str,
     user_id: int,
-    image_url: Optional[str] = None
+    image_url: Optional[str] = None,
+    site: Optional[WordPressSite] = None,
+    featured_media_id: Optional[int] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Create WordPress post using Application Password.
@@ -250,33 +441,26 @@ def create_wordpress_post(
         title: Post title
         content: Post content (HTML)
         user_id: User ID
-        image_url: Optional featured image URL (will be downloaded and uploaded)
+        image_url: Optional featured image URL (read through the image cache and
+            uploaded); ignored when featured_media_id is given
+        site: Optional pre-resolved WordPressSite (the one the pipeline used)
+        featured_media_id: ID of an image already in the media library (e.g. the
+            hero the pipeline persisted) - used as-is, nothing is transferred
 
     Returns:
         Post object dict, or None if failed
     """
-    base_url, username, app_password = get_wordpress_credentials(user_id)
-
-    if not all([base_url, username, app_password]):
-        logger.error(f"WordPress credentials not configured for user {user_id}")
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
         return None
 
-    media_id = None
-    if image_url:
-        # Download and upload image
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        unique_filename = f"post_image_{user_id}_{timestamp}.jpg"
-
-        if download_image(image_url, unique_filename):
-            media_id = create_media_id(unique_filename, user_id)
-            try:
-                os.remove(unique_filename)  # Clean up
-            except:
-                pass
+    media_id = featured_media_id
+    if not media_id and image_url:
+        media_id = _upload_featured_image(image_url, user_id, site)
 
     try:
-        endpoint = construct_api_endpoint(base_url, 'posts')
-        headers = create_auth_header(username, app_password)
+        endpoint = site.endpoint('posts')
+        headers = site.auth_headers()
 
         post_data = {
             'title': title,
@@ -289,12 +473,13 @@ def create_wordpress_post(
         if media_id:
             post_data['featured_media'] = media_id
 
-        response = requests.post(
+        response = site.client.post(
             endpoint,
             headers=headers,
             json=post_data,
             timeout=30
         )
+        site.check_auth(response)
 
         if response.status_code == 201:
             post = response.json()
@@ -308,33 +493,38 @@ def create_wordpress_post(
         logger.error(f"Error creating WordPress post: {str(e)}")
         return None
 
-def publish_wordpress_post(post_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+def publish_wordpress_post(
+    post_id: int,
+    user_id: int,
+    site: Optional[WordPressSite] = None
+) -> Optional[Dict[str, Any]]:
     """
     Change post status from draft to published.
 
     Args:
         post_id: WordPress post ID
         user_id: User ID
+        site: Optional pre-resolved WordPressSite
 
     Returns:
         Updated post object dict if successful, None otherwise
     """
-    base_url, username, app_password = get_wordpress_credentials(user_id)
-
-    if not all([base_url, username, app_password]):
-        logger.error(f"WordPress credentials not configured for user {user_id}")
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
         return None
 
     try:
-        endpoint = construct_api_endpoint(base_url, f'posts/{post_id}')
-        headers = create_auth_header(username, app_password)
+        endpoint = site.endpoint(f'posts/{post_id}')
+        headers = site.auth_headers()
 
-        response = requests.post(
+        response = site.client.post(
             endpoint,
             headers=headers,
             json={'status': 'publish'},
-            timeout=30
+            timeout=30,
+            idempotent=True  # Updates an existing post
         )
+        site.check_auth(response)
 
         if response.status_code == 200:
             logger.info(f"Post {post_id} published successfully")
@@ -352,7 +542,9 @@ def update_wordpress_post(
     title: str,
     content: str,
     user_id: int,
-    image_url: Optional[str] = None
+    image_url: Optional[str] = None,
+    site: Optional[WordPressSite] = None,
+    featured_media_id: Optional[int] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Update existing WordPress post.
@@ -362,33 +554,24 @@ def update_wordpress_post(
         title: New post title
         content: New post content (HTML)
         user_id: User ID
-        image_url: Optional new featured image URL
+        image_url: Optional new featured image URL (ignored when featured_media_id is given)
+        site: Optional pre-resolved WordPressSite
+        featured_media_id: Optional ID of an existing media library image to feature
 
     Returns:
         Updated post object dict, or None if failed
     """
-    base_url, username, app_password = get_wordpress_credentials(user_id)
-
-    if not all([base_url, username, app_password]):
-        logger.error(f"WordPress credentials not configured for user {user_id}")
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
         return None
 
-    media_id = None
-    if image_url:
-        # Download and upload new image
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        unique_filename = f"post_image_{user_id}_{timestamp}.jpg"
-
-        if download_image(image_url, unique_filename):
-            media_id = create_media_id(unique_filename, user_id)
-            try:
-                os.remove(unique_filename)
-            except:
-                pass
+    media_id = featured_media_id
+    if not media_id and image_url:
+        media_id = _upload_featured_image(image_url, user_id, site)
 
     try:
-        endpoint = construct_api_endpoint(base_url, f'posts/{post_id}')
-        headers = create_auth_header(username, app_password)
+        endpoint = site.endpoint(f'posts/{post_id}')
+        headers = site.auth_headers()
 
         post_data = {
             'title': title,
@@ -398,12 +581,14 @@ def update_wordpress_post(
         if media_id:
             post_data['featured_media'] = media_id
 
-        response = requests.post(
+        response = site.client.post(
             endpoint,
             headers=headers,
             json=post_data,
-            timeout=30
+            timeout=30,
+            idempotent=True  # Updates an existing post
         )
+        site.check_auth(response)
 
         if response.status_code == 200:
             logger.info(f"WordPress post {post_id} updated successfully")
@@ -416,7 +601,160 @@ def update_wordpress_post(
         logger.error(f"Error updating WordPress post: {str(e)}")
         return None
 
-def get_wordpress_posts(user_id: int, per_page: int = 10, page: int = 1) -> Optional[list]:
+def _post_result(post_id: int, status_code: Optional[int], body: Any) -> Dict[str, Any]:
+    """Per-post outcome of a bulk update (one batch sub-response or one single call)."""
+    success = status_code == 200
+    body = body if isinstance(body, dict) else {}
+    return {
+        'post_id': post_id,
+        'success': success,
+        'status_code': status_code,
+        'post_status': body.get('status') if success else None,
+        'link': body.get('link') if success else None,
+        'error': None if success else (body.get('message') or f"HTTP {status_code}")
+    }
+
+def _batch_update_posts(
+    site: WordPressSite,
+    post_ids: List[int],
+    changes: Dict[str, Any]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Apply changes to up to WORDPRESS_BATCH_SIZE posts in one /batch/v1 call.
+
+    Returns:
+        Per-post results, or None if the batch API is unavailable (the
+        caller falls back to single-post calls)
+    """
+    body = {
+        'validation': 'normal',  # Each sub-request succeeds or fails on its own
+        'requests': [
+            {'method': 'POST', 'path': f'/wp/v2/posts/{post_id}', 'body': changes}
+            for post_id in post_ids
+        ]
+    }
+    try:
+        response = site.client.post(
+            site.batch_endpoint(),
+            headers=site.auth_headers(),
+            json=body,
+            timeout=60,
+            idempotent=True  # Re-applying the same changes is harmless
+        )
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"[WP Bulk] Batch request failed, falling back to single-post calls: {e}")
+        return None
+    site.check_auth(response)
+
+    if response.status_code == 404:
+        logger.info(f"[WP Bulk] {site.base_url} has no batch API - using single-post calls")
+        _batch_unsupported_sites.add(site.base_url)
+        return None
+
+    try:
+        responses = response.json().get('responses') if response.status_code in (200, 207) else None
+    except ValueError:
+        responses = None
+    if not isinstance(responses, list) or len(responses) != len(post_ids):
+        logger.warning(f"[WP Bulk] Unexpected batch response ({response.status_code}), "
+                       f"falling back to single-post calls")
+        return None
+
+    return [
+        _post_result(post_id, (item or {}).get('status'), (item or {}).get('body'))
+        for post_id, item in zip(post_ids, responses)
+    ]
+
+def _update_post_fields(site: WordPressSite, post_id: int, changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply changes to one post (bulk fallback for sites without the batch API)."""
+    try:
+        response = site.client.post(
+            site.endpoint(f'posts/{post_id}'),
+            headers=site.auth_headers(),
+            json=changes,
+            timeout=30,
+            idempotent=True  # Updates an existing post
+        )
+    except requests.exceptions.RequestException as e:
+        return {**_post_result(post_id, None, None), 'error': str(e)}
+    site.check_auth(response)
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    return _post_result(post_id, response.status_code, body)
+
+def bulk_update_wordpress_posts(
+    post_ids: List[int],
+    user_id: int,
+    changes: Dict[str, Any],
+    site: Optional[WordPressSite] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Apply the same changes (e.g. {'status': 'publish'}) to many posts.
+
+    Posts are sent through WordPress's /batch/v1 endpoint in chunks of
+    WORDPRESS_BATCH_SIZE. Sites without the batch API (WordPress < 5.6, or
+    hosts that block it) get concurrent single-post calls instead,
+    WORDPRESS_BULK_CONCURRENCY at a time. Either way all calls share the
+    site's pooled connections and one credential lookup.
+
+    Args:
+        post_ids: WordPress post IDs
+        user_id: User ID
+        changes: Post fields to set on every post
+        site: Optional pre-resolved WordPressSite
+
+    Returns:
+        One result per post in input order - dicts with post_id, success,
+        status_code, post_status, link and error - or None if WordPress
+        is not configured
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
+        return None
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(post_ids)
+    pending: List[int] = []  # Indexes left for single-post calls
+
+    for start in range(0, len(post_ids), WORDPRESS_BATCH_SIZE):
+        indexes = list(range(start, min(start + WORDPRESS_BATCH_SIZE, len(post_ids))))
+        batch = None
+        if site.base_url not in _batch_unsupported_sites:
+            batch = _batch_update_posts(site, [post_ids[i] for i in indexes], changes)
+        if batch is None:
+            pending.extend(indexes)
+            continue
+        for index, result in zip(indexes, batch):
+            results[index] = result
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(len(pending), WORDPRESS_BULK_CONCURRENCY)) as pool:
+            futures = {index: pool.submit(_update_post_fields, site, post_ids[index], changes) for index in pending}
+            for index, future in futures.items():
+                results[index] = future.result()
+
+    succeeded = sum(1 for result in results if result and result['success'])
+    logger.info(f"[WP Bulk] Updated {succeeded}/{len(post_ids)} posts for user {user_id} "
+                f"({len(post_ids) - len(pending)} via batch API)")
+    return results  # type: ignore[return-value]
+
+def bulk_publish_wordpress_posts(
+    post_ids: List[int],
+    user_id: int,
+    site: Optional[WordPressSite] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """Publish many drafts at once - see bulk_update_wordpress_posts."""
+    return bulk_update_wordpress_posts(post_ids, user_id, {'status': 'publish'}, site=site)
+
+def get_wordpress_posts(
+    user_id: int,
+    per_page: int = 10,
+    page: int = 1,
+    site: Optional[WordPressSite] = None
+) -> Optional[list]:
     """
     Get list of WordPress posts.
 
@@ -424,26 +762,26 @@ def get_wordpress_posts(user_id: int, per_page: int = 10, page: int = 1) -> Opti
         user_id: User ID
         per_page: Number of posts per page
         page: Page number
+        site: Optional pre-resolved WordPressSite
 
     Returns:
         List of post objects, or None if failed
     """
-    base_url, username, app_password = get_wordpress_credentials(user_id)
-
-    if not all([base_url, username, app_password]):
-        logger.error(f"WordPress credentials not configured for user {user_id}")
+    site = site or resolve_wordpress_site(user_id)
+    if site is None:
         return None
 
     try:
-        endpoint = construct_api_endpoint(base_url, 'posts')
-        headers = create_auth_header(username, app_password)
+        endpoint = site.endpoint('posts')
+        headers = site.auth_headers()
 
         params = {
             'per_page': per_page,
             'page': page
         }
 
-        response = requests.get(endpoint, headers=headers, params=params, timeout=10)
+        response = site.client.get(endpoint, headers=headers, params=params, timeout=10)
+        site.check_auth(response)
 
         if response.status_code == 200:
             return response.json()